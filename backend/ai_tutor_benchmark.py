@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Offline latency and cost benchmark for the AI tutor pipeline
+
+Replays a corpus of tutor questions against /api/ai/tutor and /api/ai/chat
+while the app talks to an in-process fake LLM upstream with configurable
+latency (median delays, log-normal jitter and a slow tail). Starts a local app
+instance on a throwaway SQLite database seeded with a course of long lessons
+(or targets --base-url, which must use --database-url and point
+OPENAI_BASE_URL at http://127.0.0.1:<--llm-port>), and reports as JSON:
+
+- per endpoint: requests, errors, time to first token and end-to-end p50/p99
+  (for non-streamed requests the first token arrives with the whole answer);
+- tutor answer cache hit rate and coalesced requests, from the admin AI stats;
+- upstream calls and prompt tokens per call, as seen by the fake upstream.
+
+The corpus is JSON lines, one recorded request per line:
+    {"endpoint": "tutor", "question": "what is a base case", "lesson": 0, "stream": true}
+    {"endpoint": "chat", "question": "and why does it matter?", "conversation": "c7"}
+"lesson" indexes the seeded lessons; "stream" defaults to --stream-fraction.
+Without --corpus a synthetic corpus with paraphrased repeats and follow-ups
+is generated.
+
+Example:
+    python ai_tutor_benchmark.py --requests 400 --concurrency 16 --jitter 0.4 --tail-rate 0.02 --output ai_bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import uvicorn
+from sqlalchemy import select
+
+from fake_llm_server import create_app
+
+BENCH_PREFIX = "bench:"
+BENCH_EMAIL_DOMAIN = "@bench.local"
+PHRASINGS = [
+    "What is {term}?",
+    "Can you explain {term}?",
+    "explain {term} please",
+    "I don't understand {term}",
+    "How does the {term} work in {topic}?",
+    "Give me an example of {term}",
+]
+FOLLOW_UPS = ["Can you give another example?", "Why does that matter?", "How would I practice this?"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="AI tutor latency and cost benchmark")
+    parser.add_argument("--base-url", help="Target an already running server instead of starting one")
+    parser.add_argument("--database-url", help="Database the target server uses (default: throwaway SQLite)")
+    parser.add_argument("--port", type=int, default=8766, help="Port for the local app instance")
+    parser.add_argument("--llm-port", type=int, default=0, help="Port for the fake upstream (default: any free port)")
+    parser.add_argument("--corpus", help="JSON lines of recorded requests (default: synthetic)")
+    parser.add_argument("--requests", type=int, default=200, help="Requests to replay (the corpus is cycled)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+    parser.add_argument("--stream-fraction", type=float, default=0.5, help="Share of requests that stream")
+    parser.add_argument("--lessons", type=int, default=6)
+    parser.add_argument("--lesson-tokens", type=int, default=2500)
+    parser.add_argument("--first-token-ms", type=float, default=300.0, help="Median upstream time to first token")
+    parser.add_argument("--token-ms", type=float, default=15.0, help="Median upstream delay between tokens")
+    parser.add_argument("--tokens", type=int, default=60, help="Tokens per upstream answer")
+    parser.add_argument("--prefill-ms", type=float, default=100.0, help="Extra first-token delay per 1000 prompt tokens")
+    parser.add_argument("--jitter", type=float, default=0.3, help="Log-normal sigma applied to upstream delays")
+    parser.add_argument("--tail-rate", type=float, default=0.01, help="Fraction of upstream calls slowed down")
+    parser.add_argument("--tail-factor", type=float, default=5.0, help="Slowdown of tail upstream calls")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON summary to this file")
+    return parser.parse_args()
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return round(ordered[index], 3)
+
+
+def distribution(values: List[float]) -> Dict:
+    return {
+        "p50": percentile(values, 50),
+        "p99": percentile(values, 99),
+        "mean": round(sum(values) / len(values), 3) if values else None,
+        "samples": len(values),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def synthetic_corpus(lessons: List[Tuple[int, str]], count: int, rng: random.Random) -> List[Dict]:
+    """Tutor questions with paraphrased repeats, plus short chat conversations with follow-ups"""
+    from tutor_prompt_benchmark import TOPICS
+
+    corpus = []
+    conversation = 0
+    while len(corpus) < count:
+        if rng.random() < 0.85:
+            lesson = rng.randrange(len(lessons))
+            topic = lessons[lesson][1]
+            term = rng.choice(TOPICS[topic])
+            corpus.append({
+                "endpoint": "tutor",
+                "lesson": lesson,
+                "question": rng.choice(PHRASINGS).format(term=term, topic=topic),
+            })
+        else:
+            conversation += 1
+            topic = rng.choice(list(TOPICS))
+            corpus.append({"endpoint": "chat", "conversation": f"c{conversation}", "question": f"Teach me {topic}"})
+            for follow_up in rng.sample(FOLLOW_UPS, rng.randint(1, 2)):
+                corpus.append({"endpoint": "chat", "conversation": f"c{conversation}", "question": follow_up})
+    return corpus[:count]
+
+
+def load_corpus(path: str) -> List[Dict]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def seed_course(database_url: str, args, rng: random.Random) -> Dict:
+    """Insert a teacher, a student enrolled in one course of long lessons, and an admin;
+    return tokens and (lesson id, topic) pairs"""
+    os.environ["DATABASE_URL"] = database_url
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app.database import Base, engine
+    from app.models.content_chunk import ContentChunk
+    from app.models.course import Course
+    from app.models.enrollment import Enrollment
+    from app.models.lesson import Lesson
+    from app.models.user import User
+    from app.services.security import create_access_token
+    import app.main  # noqa: F401  registers every model on Base.metadata
+    # Imports the app as well, so only once DATABASE_URL points at the benchmark database
+    from tutor_prompt_benchmark import TOPICS, synthetic_text
+
+    Base.metadata.create_all(bind=engine)
+    emails = {role: f"{role}{BENCH_EMAIL_DOMAIN}" for role in ("teacher", "student", "admin")}
+    with engine.begin() as conn:
+        # Remove rows left by a previous run against the same database
+        previous_users = select(User.id).where(User.email.like(f"%{BENCH_EMAIL_DOMAIN}"))
+        previous_courses = select(Course.id).where(Course.title.like(f"{BENCH_PREFIX}%"))
+        conn.execute(Enrollment.__table__.delete().where(Enrollment.student_id.in_(previous_users)))
+        conn.execute(ContentChunk.__table__.delete().where(ContentChunk.course_id.in_(previous_courses)))
+        conn.execute(Lesson.__table__.delete().where(Lesson.course_id.in_(previous_courses)))
+        conn.execute(Course.__table__.delete().where(Course.title.like(f"{BENCH_PREFIX}%")))
+        conn.execute(User.__table__.delete().where(User.email.like(f"%{BENCH_EMAIL_DOMAIN}")))
+
+        user_ids = {}
+        for role, email in emails.items():
+            user_ids[role] = conn.execute(User.__table__.insert().values(
+                email=email,
+                full_name=f"Benchmark {role.title()}",
+                hashed_password="!",
+                role="admin" if role == "admin" else ("service_provider" if role == "teacher" else "service_seeker"),
+                sub_role=None if role == "admin" else role,
+                is_active=True,
+                is_teacher=role == "teacher",
+                gyan_coins=0,
+            )).inserted_primary_key[0]
+
+        course_id = conn.execute(Course.__table__.insert().values(
+            title=f"{BENCH_PREFIX} Computer Science Foundations",
+            description=synthetic_text("recursion", 300, rng),
+            teacher_id=user_ids["teacher"], total_hours=10, difficulty="beginner",
+            rating=0.0, enrollment_count=1, is_published=True,
+        )).inserted_primary_key[0]
+        conn.execute(Enrollment.__table__.insert().values(
+            student_id=user_ids["student"], course_id=course_id, hours_completed=0, progress=0,
+        ))
+
+        topics = list(TOPICS)
+        lessons = []
+        for i in range(args.lessons):
+            topic = topics[i % len(topics)]
+            lesson_id = conn.execute(Lesson.__table__.insert().values(
+                course_id=course_id, title=topic.title(), content_type="text",
+                content_text=synthetic_text(topic, args.lesson_tokens, rng),
+                duration_minutes=30, order_index=i, is_free=False,
+            )).inserted_primary_key[0]
+            lessons.append((lesson_id, topic))
+
+    tokens = {role: create_access_token(email, expires_minutes=24 * 60) for role, email in emails.items()}
+    return {"course_id": course_id, "lessons": lessons, "tokens": tokens}
+
+
+def start_server(database_url: str, port: int, llm_url: str) -> subprocess.Popen:
+    env = dict(os.environ, DATABASE_URL=database_url, OPENAI_BASE_URL=llm_url)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+    )
+
+
+def start_fake_llm(args, port: int):
+    fake = create_app(
+        args.first_token_ms / 1000, args.token_ms / 1000, args.tokens, 0, args.prefill_ms / 1000,
+        args.jitter, args.tail_rate, args.tail_factor, args.seed,
+    )
+    server = uvicorn.Server(uvicorn.Config(fake, port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return fake, server
+
+
+async def wait_ready(base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{base_url}/healthz")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become ready")
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.streamed = 0
+        self.cached = 0
+        self.coalesced = 0
+        self.ttft_ms: List[float] = []
+        self.e2e_ms: List[float] = []
+
+    def as_dict(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "streamed": self.streamed,
+            "served_from_cache": self.cached,
+            "coalesced": self.coalesced,
+            "ttft_ms": distribution(self.ttft_ms),
+            "e2e_ms": distribution(self.e2e_ms),
+        }
+
+
+async def replay_one(client: httpx.AsyncClient, entry: Dict, seeded: Dict, stream: bool, stats: EndpointStats):
+    if entry["endpoint"] == "tutor":
+        lesson_id = seeded["lessons"][entry.get("lesson", 0) % len(seeded["lessons"])][0]
+        path = "/api/ai/tutor"
+        body = {"course_id": seeded["course_id"], "lesson_id": lesson_id, "question": entry["question"]}
+    else:
+        path = "/api/ai/chat"
+        body = {"message": entry["question"], "conversation_id": entry.get("conversation")}
+    body["stream"] = stream
+    headers = {"Authorization": f"Bearer {seeded['tokens']['student']}"}
+
+    stats.requests += 1
+    stats.streamed += stream
+    started = time.perf_counter()
+    first_token = None
+    result: Dict = {}
+    try:
+        if stream:
+            async with client.stream("POST", path, json=body, headers=headers) as response:
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    event = json.loads(line[len("data: "):])
+                    if event["type"] == "delta" and first_token is None:
+                        first_token = time.perf_counter()
+                    elif event["type"] in ("done", "error"):
+                        result = event
+        else:
+            response = await client.post(path, json=body, headers=headers)
+            result = response.json()
+    except httpx.HTTPError:
+        result = {"success": False}
+    finished = time.perf_counter()
+
+    if not result.get("success"):
+        stats.errors += 1
+        return
+    stats.cached += bool(result.get("cached"))
+    stats.coalesced += bool(result.get("coalesced"))
+    stats.ttft_ms.append(((first_token or finished) - started) * 1000)
+    stats.e2e_ms.append((finished - started) * 1000)
+
+
+async def ai_stats(client: httpx.AsyncClient, admin_token: str) -> Dict:
+    response = await client.get("/api/admin/system/ai", headers={"Authorization": f"Bearer {admin_token}"})
+    return response.json() if response.status_code == 200 else {}
+
+
+def delta(after: Dict, before: Dict, *path: str) -> Optional[float]:
+    for key in path:
+        after, before = (after or {}).get(key), (before or {}).get(key)
+    if after is None:
+        return None
+    return after - (before or 0)
+
+
+async def run_benchmark(args, corpus: List[Dict], seeded: Dict, base_url: str, fake) -> Dict:
+    rng = random.Random(args.seed)
+    stats = {"tutor": EndpointStats(), "chat": EndpointStats()}
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(args.requests):
+        entry = corpus[i % len(corpus)]
+        queue.put_nowait((entry, entry.get("stream", rng.random() < args.stream_fraction)))
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+        before = await ai_stats(client, seeded["tokens"]["admin"])
+        calls_before, prompts_before = fake.state.requests, len(fake.state.prompt_tokens)
+
+        async def worker():
+            while not queue.empty():
+                entry, stream = queue.get_nowait()
+                await replay_one(client, entry, seeded, stream, stats[entry["endpoint"]])
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        after = await ai_stats(client, seeded["tokens"]["admin"])
+
+    prompt_tokens = fake.state.prompt_tokens[prompts_before:]
+    exact = delta(after, before, "cache", "exact_hits") or 0
+    near = delta(after, before, "cache", "near_hits") or 0
+    misses = delta(after, before, "cache", "misses") or 0
+    lookups = exact + near + misses
+
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output",)},
+        "corpus_size": len(corpus),
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_rps": round(args.requests / elapsed, 2) if elapsed else None,
+        "endpoints": {name: endpoint.as_dict() for name, endpoint in stats.items()},
+        "tutor_cache": {
+            "lookups": lookups,
+            "exact_hits": exact,
+            "near_hits": near,
+            "hit_rate": round((exact + near) / lookups, 3) if lookups else None,
+            "coalesced": delta(after, before, "single_flight", "coalesced"),
+        },
+        "upstream": {
+            "calls": fake.state.requests - calls_before,
+            "calls_per_request": round((fake.state.requests - calls_before) / args.requests, 3),
+            "prompt_tokens": {**distribution(prompt_tokens), "total": sum(prompt_tokens)},
+            "circuit": (after.get("upstream") or {}).get("circuit"),
+        },
+    }
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+
+    workdir = tempfile.mkdtemp(prefix="gyanvruksh-ai-bench-")
+    database_url = args.database_url or f"sqlite:///{workdir}/bench.db"
+    seeded = seed_course(database_url, args, rng)
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(
+        [(lesson_id, topic) for lesson_id, topic in seeded["lessons"]], max(args.requests // 2, 1), rng
+    )
+
+    llm_port = args.llm_port or free_port()
+    fake, fake_server = start_fake_llm(args, llm_port)
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server = start_server(database_url, args.port, f"http://127.0.0.1:{llm_port}")
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        asyncio.run(wait_ready(base_url))
+        summary = asyncio.run(run_benchmark(args, corpus, seeded, base_url, fake))
+    finally:
+        fake_server.should_exit = True
+        if server:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    summary["target"] = base_url
+    summary["generated_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    output = json.dumps(summary, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,7 +8,26 @@ from app.models.enrollment import Enrollment
 from app.models.lesson import Lesson
 from app.models.attendance import Attendance, AttendanceSession
 from app.models.category import Category
-from app.services.deps import get_current_user
+from app.services.deps import get_current_user, get_http_clients
+from app.services.http_clients import HTTPClientRegistry
+from app.services.tutor_cache import tutor_cache, tutor_flights
+from app.services.llm import llm_metrics
+from app.services.retrieval import course_indexes
+from app.services.upstream_guard import upstream_guard
+from app.services.conversation_memory import conversation_store
+from app.services.ai_suggestions import ai_suggestions
+from app.services.push_delivery import push_delivery
+from app.services.unread_counters import unread_counters
+from app.services.notification_stream import notification_hub
+from app.services.notification_retention import notification_retention
+from app.services.class_reminders import class_reminders
+from app.services.badge_engine import badge_engine
+from app.services.leaderboard import leaderboard
+from app.services.coin_ledger import coin_ledger
+from app.services.study_activity import study_activity
+from app.services.chat_rooms import room_memberships
+from app.services.chat_read_state import read_state
+from app.api.chat import manager as chat_connections, presence as chat_presence
 from pydantic import BaseModel
 from datetime import datetime
 
@@ -156,6 +175,7 @@ def approve_teacher(
     
     teacher.is_active = request.approved
     db.commit()
+    room_memberships.invalidate(teacher.id)
     
     return {
         "message": f"Teacher {'approved' if request.approved else 'rejected'} successfully",
@@ -201,8 +221,10 @@ def assign_teacher_to_course(
     if not teacher:
         raise HTTPException(status_code=404, detail="Active teacher not found")
     
+    previous_teacher_id = course.teacher_id
     course.teacher_id = request.teacher_id
     db.commit()
+    room_memberships.invalidate(previous_teacher_id, request.teacher_id)
     
     return {
         "message": "Teacher assigned successfully",
@@ -253,6 +275,7 @@ def update_user_role(
         user.is_active = False
     
     db.commit()
+    room_memberships.invalidate(user.id)
     
     return {
         "message": "User role updated successfully",
@@ -277,6 +300,7 @@ def delete_user(
     
     user.is_active = False
     db.commit()
+    room_memberships.invalidate(user.id)
     
     return {"message": "User deactivated successfully", "user_id": user_id}
 
@@ -339,6 +363,7 @@ def bulk_user_action(
             results.append({"user_id": user.id, "status": "error", "message": str(e)})
     
     db.commit()
+    room_memberships.invalidate(*(user.id for user in users))
     return {"results": results}
 
 @router.get("/system/health")
@@ -394,3 +419,84 @@ def bulk_publish_courses(
         "message": f"Successfully {'published' if publish else 'unpublished'} {len(courses)} courses",
         "course_ids": course_ids
     }
+
+@router.get("/system/http-clients")
+def get_http_client_metrics(
+    admin: User = Depends(verify_admin),
+    http_clients: HTTPClientRegistry = Depends(get_http_clients)
+):
+    """Connection pool configuration and request metrics per outbound upstream"""
+    return http_clients.stats()
+
+@router.get("/system/chat")
+def get_chat_stats(admin: User = Depends(verify_admin)):
+    """Open chat connections, presence snapshots, read watermark writes and membership cache hits"""
+    return {
+        "connections": len(chat_connections.active_connections),
+        "presence": chat_presence.stats(),
+        "read_state": read_state.stats(),
+        "memberships": room_memberships.stats(),
+    }
+
+@router.get("/system/push")
+def get_push_stats(admin: User = Depends(verify_admin)):
+    """Push delivery queue, throughput, retries and pruned device tokens"""
+    return push_delivery.stats()
+
+@router.get("/system/badges")
+def get_badge_stats(admin: User = Depends(verify_admin)):
+    """Badge events processed, criteria evaluated and badges awarded"""
+    return badge_engine.stats()
+
+@router.get("/system/activity")
+def get_study_activity_stats(admin: User = Depends(verify_admin)):
+    """Learning activities recorded and new active days marked in the activity bitmaps"""
+    return study_activity.stats()
+
+@router.get("/system/coins")
+def get_coin_ledger_stats(admin: User = Depends(verify_admin)):
+    """Coin changes recorded in the ledger and spends rejected for insufficient balance"""
+    return coin_ledger.stats()
+
+@router.get("/system/leaderboard")
+def get_leaderboard_stats(admin: User = Depends(verify_admin)):
+    """Leaderboard backend, coin changes applied, rebuilds and scoped boards built"""
+    return leaderboard.stats()
+
+@router.post("/system/leaderboard/rebuild")
+def rebuild_leaderboard(admin: User = Depends(verify_admin)):
+    """Reload the leaderboards from balances and the coin ledger now instead of waiting for the periodic rebuild"""
+    return {"students": leaderboard.rebuild()}
+
+@router.get("/system/notifications")
+def get_notification_stats(admin: User = Depends(verify_admin)):
+    """Unread counter reads, recounts and drift corrected; live stream connections and deliveries"""
+    return {
+        "unread_counters": unread_counters.stats(),
+        "stream": notification_hub.stats(),
+        "retention": notification_retention.stats(),
+        "class_reminders": class_reminders.stats(),
+    }
+
+@router.post("/system/notifications/reconcile")
+def reconcile_unread_counters(admin: User = Depends(verify_admin)):
+    """Recompute every unread counter now instead of waiting for the periodic reconcile"""
+    return {"corrected": unread_counters.reconcile()}
+
+@router.post("/system/notifications/retention")
+def run_notification_retention(admin: User = Depends(verify_admin)):
+    """Run the notification retention pass now instead of waiting for the daily run"""
+    return notification_retention.run_once()
+
+@router.get("/system/ai")
+def get_ai_stats(admin: User = Depends(verify_admin)):
+    """AI tutor cache hit rates, upstream latency, circuit breaker state and retry budget"""
+    return {
+        "cache": tutor_cache.stats(),
+        "single_flight": tutor_flights.stats(),
+        "retrieval": course_indexes.stats(),
+        "latency": llm_metrics.stats(),
+        "upstream": upstream_guard.stats(),
+        "conversations": conversation_store.stats(),
+        "suggestions": ai_suggestions.stats(),
+    }
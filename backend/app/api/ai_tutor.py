@@ -1,24 +1,35 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import asyncio
-import httpx
 from pydantic import BaseModel
 from datetime import datetime
 
 from ..database import get_db
-from ..services.deps import get_current_user
+from ..services.deps import get_current_user, get_http_clients
+from ..services.http_clients import HTTPClientRegistry
+from ..services.tutor_cache import tutor_cache, tutor_flights, content_fingerprint
+from ..services import llm
+from ..services.conversation_memory import conversation_store
+from ..services.ai_suggestions import ai_suggestions, template_suggestions
+from ..services.retrieval import course_indexes, format_context, truncate_tokens
 from ..models.user import User
 from ..models.course import Course
 from ..models.lesson import Lesson
+from ..models.enrollment import Enrollment
 from ..utils.errors import not_found_error
 
 router = APIRouter(prefix="/api/ai", tags=["ai"])
 
+# Canned answers served when the upstream fails or is shed by the circuit breaker
+CHAT_FALLBACK = "I'm sorry, I'm having trouble responding right now. Please try again later."
+TUTOR_FALLBACK = "I'm sorry, I'm having trouble providing tutoring help right now. Please try again later."
+
 class AIChatRequest(BaseModel):
     message: str
     context: Optional[str] = None  # Course/lesson context
     conversation_id: Optional[str] = None
+    stream: bool = False  # Forward tokens as they arrive (SSE, or NDJSON via Accept)
 
 class AIChatResponse(BaseModel):
     response: str
@@ -30,18 +41,19 @@ class AITutorRequest(BaseModel):
     lesson_id: Optional[int] = None
     question: str
     difficulty_level: str = "intermediate"
+    stream: bool = False
 
 @router.post("/chat")
 async def ai_chat(
     request: AIChatRequest,
+    http_request: Request,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    http_clients: HTTPClientRegistry = Depends(get_http_clients)
 ):
     """Chat with AI tutor"""
+    conversation_id = request.conversation_id or f"conv_{current_user.id}_{datetime.now().isoformat()}"
     try:
-        # OpenAI API configuration (should be in environment variables)
-        OPENAI_API_KEY = "YOUR_OPENAI_API_KEY"  # Should be in environment variables
-
         # Prepare the context for the AI
         system_prompt = """You are an AI tutor for an educational platform called Gyanvruksh.
         You help students learn various subjects including programming, mathematics, science, and more.
@@ -51,57 +63,95 @@ async def ai_chat(
         if request.context:
             system_prompt += f"\nContext: {request.context}"
 
-        # Make request to OpenAI
-        async with httpx.AsyncClient() as client:
-            openai_response = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {OPENAI_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "gpt-3.5-turbo",
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": request.message}
-                    ],
-                    "max_tokens": 1000,
-                    "temperature": 0.7
-                },
-                timeout=30.0
-            )
-
-        if openai_response.status_code == 200:
-            result = openai_response.json()
-            ai_response = result["choices"][0]["message"]["content"]
-
-            return {
-                "response": ai_response,
-                "conversation_id": request.conversation_id or f"conv_{current_user.id}_{datetime.now().isoformat()}",
-                "success": True
-            }
-        else:
-            return {
-                "response": "I'm sorry, I'm having trouble responding right now. Please try again later.",
-                "conversation_id": request.conversation_id or f"conv_{current_user.id}_{datetime.now().isoformat()}",
-                "success": False,
-                "error": "OpenAI API error"
-            }
+        # Earlier turns of this conversation, fitted to the history token budget
+        conversation = await conversation_store.load(current_user.id, conversation_id)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            *conversation_store.prompt_history(conversation),
+            {"role": "user", "content": request.message}
+        ]
+        client = http_clients.get("openai")
+
+        if request.stream:
+            async def events():
+                yield {"type": "start", "conversation_id": conversation_id}
+                parts = []
+                try:
+                    async for delta in llm.stream_completion(client, messages, max_tokens=1000):
+                        parts.append(delta)
+                        yield {"type": "delta", "content": delta}
+                except Exception as e:
+                    yield {"type": "error", "response": CHAT_FALLBACK, "error": str(e), "success": False}
+                    return
+                ai_response = "".join(parts)
+                await conversation_store.record_exchange(conversation, request.message, ai_response)
+                yield {"type": "done", "response": ai_response, "conversation_id": conversation_id, "success": True}
+
+            return llm.streaming_response(events(), http_request.headers.get("accept"))
+
+        # Make request to OpenAI over the shared connection pool
+        ai_response = await llm.complete(client, messages, max_tokens=1000)
+        await conversation_store.record_exchange(conversation, request.message, ai_response)
+
+        return {
+            "response": ai_response,
+            "conversation_id": conversation_id,
+            "success": True
+        }
 
+    except llm.LLMError as e:
+        return {
+            "response": CHAT_FALLBACK,
+            "conversation_id": conversation_id,
+            "success": False,
+            "error": str(e)
+        }
     except Exception as e:
         return {
             "response": "I'm experiencing technical difficulties. Please try again later.",
-            "conversation_id": request.conversation_id or f"conv_{current_user.id}_{datetime.now().isoformat()}",
+            "conversation_id": conversation_id,
             "success": False,
             "error": str(e)
         }
 
 
+DESCRIPTION_TOKEN_BUDGET = 120
+
+TUTOR_SUGGESTIONS = [
+    "Can you explain this concept with a different example?",
+    "What are the most common mistakes students make with this topic?",
+    "How does this relate to real-world applications?"
+]
+
+
+def tutor_messages(request: AITutorRequest, course: Course, lesson: Optional[Lesson], lesson_context: str) -> List[dict]:
+    """System prompt with the retrieved passages, then the student's question"""
+    system_prompt = f"""You are an AI tutor helping a student with {course.title}.
+        The student is asking about: {request.question}
+        Difficulty level: {request.difficulty_level}
+        {f"Current lesson: {lesson.title}" if lesson else ""}
+
+        Course context: {truncate_tokens(course.description, DESCRIPTION_TOKEN_BUDGET)}
+
+        Relevant course material:
+        {lesson_context}
+
+        Provide a helpful, educational response that's appropriate for the student's level.
+        Include examples and explanations where appropriate."""
+
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": request.question}
+    ]
+
+
 @router.post("/tutor")
 async def ai_tutor_help(
     request: AITutorRequest,
+    http_request: Request,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    http_clients: HTTPClientRegistry = Depends(get_http_clients)
 ):
     """Get AI tutoring help for specific course/lesson"""
     try:
@@ -123,73 +173,105 @@ async def ai_tutor_help(
                 )
 
         # Get lesson context if provided
-        lesson_context = ""
+        lesson = None
         if request.lesson_id:
             lesson = db.query(Lesson).filter(
                 Lesson.id == request.lesson_id,
                 Lesson.course_id == request.course_id
             ).first()
-            if lesson:
-                lesson_context = f"Lesson: {lesson.title}\nContent: {lesson.content_text or 'No content available'}"
 
-        # OpenAI API configuration
-        OPENAI_API_KEY = "YOUR_OPENAI_API_KEY"  # Should be in environment variables
+        course_title = course.title
+        lesson_title = lesson.title if lesson else None
 
-        # Create specific prompt for tutoring
-        system_prompt = f"""You are an AI tutor helping a student with {course.title}.
-        The student is asking about: {request.question}
-        Difficulty level: {request.difficulty_level}
+        # Serve exact or near-duplicate questions answered from the same content, before any retrieval
+        cache_key = tutor_cache.key_for(request.course_id, request.lesson_id, request.difficulty_level, request.question)
+        fingerprint = content_fingerprint(course.title, course.description, course_indexes.version(db, request.course_id))
+        cached = tutor_cache.get(cache_key, fingerprint)
 
-        Course context: {course.description}
-        {lesson_context}
+        messages = None
+        if cached is None:
+            index = course_indexes.get(db, request.course_id)
+            # Content predating the chunk table is indexed on first use, which moves the version
+            fingerprint = content_fingerprint(course.title, course.description, course_indexes.version(db, request.course_id))
+            # Only the passages relevant to the question go into the prompt, not whole lessons
+            chunks = index.search(request.question, lesson_id=lesson.id if lesson else None)
+            messages = tutor_messages(request, course, lesson, format_context(chunks) or "No lesson content available")
+        flight_key = (cache_key, fingerprint)
 
-        Provide a helpful, educational response that's appropriate for the student's level.
-        Include examples and explanations where appropriate."""
+        client = http_clients.get("openai")
+
+        if request.stream:
+            # The request-scoped session is closed before the body streams; only plain values are used below
+            async def events():
+                yield {"type": "start", "course_title": course_title, "lesson_title": lesson_title}
+                if cached is not None:
+                    yield {"type": "delta", "content": cached["response"]}
+                    yield {"type": "done", **cached}
+                    return
+
+                # Someone is already asking the same thing: wait for their answer
+                in_flight = tutor_flights.join(flight_key)
+                if in_flight is not None:
+                    try:
+                        answer = await asyncio.shield(in_flight)
+                    except Exception as e:
+                        yield {"type": "error", "response": TUTOR_FALLBACK, "error": str(e), "success": False}
+                        return
+                    yield {"type": "delta", "content": answer["response"]}
+                    yield {"type": "done", **answer, "coalesced": True}
+                    return
+
+                flight = tutor_flights.lead(flight_key)
+                parts = []
+                try:
+                    async for delta in llm.stream_completion(client, messages, max_tokens=1500):
+                        parts.append(delta)
+                        yield {"type": "delta", "content": delta}
+                    answer = {
+                        "response": "".join(parts),
+                        "suggestions": TUTOR_SUGGESTIONS,
+                        "course_title": course_title,
+                        "lesson_title": lesson_title,
+                        "success": True
+                    }
+                    tutor_cache.put(cache_key, fingerprint, answer)
+                    flight.set_result(answer)
+                except Exception as e:
+                    flight.set_exception(e)
+                    yield {"type": "error", "response": TUTOR_FALLBACK, "error": str(e), "success": False}
+                    return
+                finally:
+                    # Client went away mid-stream; followers must not wait forever
+                    if not flight.done():
+                        flight.cancel()
+                yield {"type": "done", **answer}
+
+            return llm.streaming_response(events(), http_request.headers.get("accept"))
 
-        async with httpx.AsyncClient() as client:
-            openai_response = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {OPENAI_API_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "gpt-3.5-turbo",
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": request.question}
-                    ],
-                    "max_tokens": 1500,
-                    "temperature": 0.7
-                },
-                timeout=30.0
-            )
-
-        if openai_response.status_code == 200:
-            result = openai_response.json()
-            ai_response = result["choices"][0]["message"]["content"]
-
-            # Generate follow-up suggestions
-            suggestions = [
-                "Can you explain this concept with a different example?",
-                "What are the most common mistakes students make with this topic?",
-                "How does this relate to real-world applications?"
-            ]
-
-            return {
+        if cached is not None:
+            return cached
+
+        async def fetch_answer():
+            ai_response = await llm.complete(client, messages, max_tokens=1500)
+            answer = {
                 "response": ai_response,
-                "suggestions": suggestions,
-                "course_title": course.title,
-                "lesson_title": lesson.title if request.lesson_id and lesson else None,
+                "suggestions": TUTOR_SUGGESTIONS,
+                "course_title": course_title,
+                "lesson_title": lesson_title,
                 "success": True
             }
-        else:
-            return {
-                "response": "I'm sorry, I'm having trouble providing tutoring help right now. Please try again later.",
-                "success": False,
-                "error": "OpenAI API error"
-            }
+            tutor_cache.put(cache_key, fingerprint, answer)
+            return answer
+
+        # Concurrent identical requests share one upstream call
+        return await tutor_flights.do(flight_key, fetch_answer)
 
+    except llm.LLMError as e:
+        return {
+            "response": TUTOR_FALLBACK,
+            "success": False,
+            "error": str(e)
+        }
     except Exception as e:
         return {
             "response": "I'm experiencing technical difficulties. Please try again later.",
@@ -201,19 +283,15 @@ async def ai_tutor_help(
 @router.get("/suggestions/{course_id}")
 async def get_ai_suggestions(
     course_id: int,
+    lesson_id: Optional[int] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get AI-powered learning suggestions for a course"""
+    """Get AI-powered learning suggestions for a course, or one of its lessons"""
     try:
-        # Verify course exists
-        course = db.query(Course).filter(Course.id == course_id).first()
-        if not course:
-            raise not_found_error("Course")
-
         # Check if user is enrolled
         if current_user.sub_role == "student":
-            enrollment = db.query(Enrollment).filter(
+            enrollment = db.query(Enrollment.id).filter(
                 Enrollment.student_id == current_user.id,
                 Enrollment.course_id == course_id
             ).first()
@@ -223,32 +301,30 @@ async def get_ai_suggestions(
                     detail="You must be enrolled in this course to get suggestions"
                 )
 
-        # Generate suggestions based on course content and user progress
-        suggestions = [
-            {
-                "type": "practice",
-                "title": "Practice Exercises",
-                "description": f"Work on additional practice problems for {course.title}",
-                "difficulty": "intermediate"
-            },
-            {
-                "type": "review",
-                "title": "Review Session",
-                "description": "Review key concepts from recent lessons",
-                "difficulty": "beginner"
-            },
-            {
-                "type": "extension",
-                "title": "Advanced Topics",
-                "description": "Explore advanced concepts related to this course",
-                "difficulty": "advanced"
+        # Precomputed by the background builder: one indexed read, usually served from cache
+        suggestion_set = ai_suggestions.get(db, course_id, lesson_id)
+        if suggestion_set is None:
+            course = db.query(Course).filter(Course.id == course_id).first()
+            if not course:
+                raise not_found_error("Course")
+            lesson = None
+            if lesson_id:
+                lesson = db.query(Lesson).filter(Lesson.id == lesson_id, Lesson.course_id == course_id).first()
+                if not lesson:
+                    raise not_found_error("Lesson")
+            # Not built yet (content predating the builder): serve templates and build in the background
+            ai_suggestions.schedule(course_id, lesson_id)
+            suggestion_set = {
+                "course_title": course.title,
+                "lesson_title": lesson.title if lesson else None,
+                "suggestions": template_suggestions(course.title, lesson.title if lesson else None),
+                "source": "template",
+                "generated_at": None,
             }
-        ]
 
         return {
-            "course_title": course.title,
-            "suggestions": suggestions,
-            "total_suggestions": len(suggestions)
+            **suggestion_set,
+            "total_suggestions": len(suggestion_set["suggestions"])
         }
 
     except Exception as e:
@@ -5,6 +5,10 @@ from ..database import get_db
 from ..models.assignment import Assignment, Grade, AssignmentSubmission
 from ..schemas.assignment import AssignmentCreate, AssignmentRead, GradeCreate, GradeRead, AssignmentSubmissionCreate, AssignmentSubmissionRead
 from ..services.deps import get_current_user
+from ..services.badge_engine import badge_engine
+from ..services.study_activity import study_activity
+from ..services import notification_broadcasts as broadcasts
+from ..services.notification_stream import notification_hub
 from ..models.user import User
 from ..utils.errors import not_found_error, authz_error
 from pydantic import BaseModel
@@ -117,6 +121,9 @@ async def submit_assignment(
 
         attachment_url = file_path
 
+    study_activity.record(db, current_user.id, [assignment.course_id])
+    badge_engine.record(db, "lesson_studied", {current_user.id: {}})
+
     # Check if student already submitted
     existing_submission = db.query(AssignmentSubmission).filter(
         AssignmentSubmission.assignment_id == assignment_id,
@@ -245,10 +252,16 @@ def grade_assignment(
 
     if existing_grade:
         # Update existing grade
+        previous_score = existing_grade.score
         existing_grade.score = score
         existing_grade.feedback = feedback
         existing_grade.graded_at = datetime.utcnow()
+        badge_engine.record(db, "grade_posted", {student_id: {"grade_score_total": score - previous_score}})
+        items = broadcasts.create_notifications(
+            db, [student_id], "Grade updated", f"Your grade for {assignment.title} is now {score}", "assignment"
+        )
         db.commit()
+        notification_hub.publish_notifications(items)
         db.refresh(existing_grade)
         return existing_grade
     else:
@@ -268,7 +281,12 @@ def grade_assignment(
         submission.grade = score
         submission.feedback = feedback
 
+        badge_engine.record(db, "grade_posted", {student_id: {"grades_count": 1, "grade_score_total": score}})
+        items = broadcasts.create_notifications(
+            db, [student_id], "Assignment graded", f"Your assignment {assignment.title} was graded: {score}", "assignment"
+        )
         db.commit()
+        notification_hub.publish_notifications(items)
         db.refresh(grade)
         return grade
 
@@ -8,6 +8,7 @@ from ..models.enrollment import Enrollment
 from ..models.lesson import Lesson
 from ..models.attendance import Attendance, AttendanceSession
 from ..services.deps import get_current_user
+from ..services.badge_engine import badge_engine
 from ..utils.errors import authz_error, not_found_error
 from pydantic import BaseModel
 from datetime import datetime, date
@@ -127,6 +128,7 @@ def mark_attendance(
     # Mark attendance for each student
     present_count = 0
     attendance_records = []
+    badge_deltas = {}
 
     for student_attendance in request.student_attendances:
         student_id = student_attendance["student_id"]
@@ -151,6 +153,7 @@ def mark_attendance(
 
         if existing_attendance:
             # Update existing attendance
+            badge_deltas[student_id] = {"attendance_present": int(bool(is_present)) - int(bool(existing_attendance.is_present))}
             existing_attendance.is_present = is_present
             existing_attendance.notes = notes
             existing_attendance.updated_at = datetime.utcnow()
@@ -167,6 +170,7 @@ def mark_attendance(
             )
             db.add(attendance)
             attendance_records.append(attendance)
+            badge_deltas[student_id] = {"attendance_total": 1, "attendance_present": int(bool(is_present))}
 
         if is_present:
             present_count += 1
@@ -176,6 +180,7 @@ def mark_attendance(
     session.attendance_percentage = (present_count / session.total_students) * 100 if session.total_students > 0 else 0
     session.is_completed = True
 
+    badge_engine.record(db, "attendance_marked", badge_deltas)
     db.commit()
 
     return {
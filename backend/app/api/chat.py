@@ -1,13 +1,15 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from ..database import get_db
+from ..database import get_db, SessionLocal
 from ..models.chat_message import ChatMessage
 from ..models.user import User
 from ..services.deps import get_current_user
+from ..services.chat_presence import PresenceTracker
+from ..services.chat_protocol import JSONCodec, negotiate, receive_frame
+from ..services.chat_read_state import read_state
+from ..services.chat_rooms import room_memberships
 from ..utils.errors import auth_error
-from typing import List, Dict
-import json
-import asyncio
+from typing import List, Dict, Optional
 from datetime import datetime
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
@@ -17,31 +19,61 @@ class ConnectionManager:
     def __init__(self):
         self.active_connections: Dict[int, WebSocket] = {}  # user_id -> websocket
         self.user_rooms: Dict[int, str] = {}  # user_id -> room_id
+        self.user_names: Dict[int, str] = {}  # user_id -> full_name
+        self.user_codecs: Dict[int, object] = {}  # user_id -> wire codec negotiated at connect
 
-    async def connect(self, websocket: WebSocket, user_id: int, room_id: str = "general"):
-        await websocket.accept()
+    async def connect(self, websocket: WebSocket, user_id: int, room_id: str = "general", full_name: str = "", codec=None):
+        codec = codec or JSONCodec()
+        offered = websocket.scope.get("subprotocols") or []
+        await websocket.accept(subprotocol=codec.subprotocol if codec.subprotocol in offered else None)
         self.active_connections[user_id] = websocket
         self.user_rooms[user_id] = room_id
+        self.user_names[user_id] = full_name
+        self.user_codecs[user_id] = codec
 
     def disconnect(self, user_id: int):
         if user_id in self.active_connections:
             del self.active_connections[user_id]
         if user_id in self.user_rooms:
             del self.user_rooms[user_id]
+        if user_id in self.user_names:
+            del self.user_names[user_id]
+        if user_id in self.user_codecs:
+            del self.user_codecs[user_id]
 
-    async def send_personal_message(self, message: str, user_id: int):
+    def room_members(self, room_id: str) -> List[dict]:
+        """Online members of a room, read from the connection registry"""
+        return [
+            {"user_id": user_id, "full_name": self.user_names.get(user_id, "")}
+            for user_id, user_room in self.user_rooms.items()
+            if user_room == room_id and user_id in self.active_connections
+        ]
+
+    async def _send(self, user_id: int, frame: dict, cache: dict):
+        websocket = self.active_connections[user_id]
+        codec = self.user_codecs.get(user_id) or JSONCodec()
+        for payload in codec.encode(frame, cache):
+            if isinstance(payload, bytes):
+                await websocket.send_bytes(payload)
+            else:
+                await websocket.send_text(payload)
+
+    async def send_personal_message(self, frame: dict, user_id: int):
         if user_id in self.active_connections:
             try:
-                await self.active_connections[user_id].send_text(message)
+                await self._send(user_id, frame, {})
             except:
                 self.disconnect(user_id)
 
-    async def broadcast_to_room(self, message: str, room_id: str = "general"):
+    async def broadcast_to_room(self, frame: dict, room_id: str = "general"):
+        # Each protocol's encoding is computed once per broadcast and shared
+        cache = {}
         disconnected_users = []
-        for user_id, user_room in self.user_rooms.items():
-            if user_room == room_id and user_id in self.active_connections:
+        recipients = [uid for uid, user_room in self.user_rooms.items() if user_room == room_id]
+        for user_id in recipients:
+            if user_id in self.active_connections:
                 try:
-                    await self.active_connections[user_id].send_text(message)
+                    await self._send(user_id, frame, cache)
                 except:
                     disconnected_users.append(user_id)
 
@@ -49,11 +81,12 @@ class ConnectionManager:
         for user_id in disconnected_users:
             self.disconnect(user_id)
 
-    async def broadcast_to_all(self, message: str):
+    async def broadcast_to_all(self, frame: dict):
+        cache = {}
         disconnected_users = []
-        for user_id, websocket in self.active_connections.items():
+        for user_id in list(self.active_connections):
             try:
-                await websocket.send_text(message)
+                await self._send(user_id, frame, cache)
             except:
                 disconnected_users.append(user_id)
 
@@ -62,16 +95,20 @@ class ConnectionManager:
             self.disconnect(user_id)
 
 manager = ConnectionManager()
+presence = PresenceTracker(manager.broadcast_to_room, manager.room_members)
 
 @router.websocket("/ws/{room_id}")
 async def websocket_endpoint(
     websocket: WebSocket,
     room_id: str,
-    token: str,
-    db: Session = Depends(get_db)
+    token: str
 ):
     """
     WebSocket endpoint for real-time chat with authentication
+
+    Identity and room membership come from the membership cache, and each
+    message is stored with a short-lived session, so an open connection does
+    not hold a database connection.
     """
     try:
         # Authenticate user from token
@@ -86,25 +123,37 @@ async def websocket_endpoint(
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
             return
 
-        user = db.query(User).filter(User.email == user_email).first()
-        if not user:
+        user = await room_memberships.identity_async(user_email)
+        if not user or not user.is_active:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+
+        # Course rooms are limited to enrolled students, the course teacher and admins
+        if not room_memberships.can_join(user, room_id):
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
             return
 
-        # Connect user to WebSocket
-        await manager.connect(websocket, user.id, room_id)
+        # Connect user to WebSocket with the negotiated wire protocol (JSON by default)
+        codec = negotiate(websocket)
+        await manager.connect(websocket, user.user_id, room_id, user.full_name, codec)
+        presence.mark_dirty(room_id)
 
         # Send connection confirmation
-        await manager.send_personal_message(json.dumps({
+        await manager.send_personal_message({
             "type": "system",
             "message": f"Connected to room: {room_id}",
-            "timestamp": datetime.utcnow().isoformat()
-        }), user.id)
+            "protocol": codec.protocol,
+            "timestamp": datetime.utcnow()
+        }, user.user_id)
 
         try:
             while True:
-                data = await websocket.receive_text()
-                message_data = json.loads(data)
+                try:
+                    message_data = await receive_frame(websocket, codec)
+                except ValueError:
+                    # Undecodable or not a map: close as unsupported data and leave like a disconnect
+                    await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+                    raise WebSocketDisconnect(status.WS_1003_UNSUPPORTED_DATA)
 
                 # Handle different message types
                 message_type = message_data.get("type", "chat")
@@ -114,51 +163,45 @@ async def websocket_endpoint(
                     if message_text:
                         # Save message to database
                         chat_message = ChatMessage(
-                            user_id=user.id,
+                            user_id=user.user_id,
                             message=message_text,
                             room_id=room_id
                         )
-                        db.add(chat_message)
-                        db.commit()
-                        db.refresh(chat_message)
+                        db = SessionLocal()
+                        try:
+                            db.add(chat_message)
+                            db.commit()
+                            db.refresh(chat_message)
+                        finally:
+                            db.close()
+                        read_state.record_message(room_id, chat_message.id)
+                        read_state.mark_read(user.user_id, room_id, chat_message.id)
 
                         # Broadcast message to room
-                        await manager.broadcast_to_room(json.dumps({
+                        await manager.broadcast_to_room({
                             "type": "chat",
-                            "user_id": user.id,
+                            "user_id": user.user_id,
                             "full_name": user.full_name,
                             "message": message_text,
                             "room_id": room_id,
-                            "timestamp": chat_message.timestamp.isoformat(),
+                            "timestamp": chat_message.timestamp,
                             "message_id": chat_message.id
-                        }), room_id)
+                        }, room_id)
 
                 elif message_type == "typing":
-                    # Broadcast typing indicator to room (excluding sender)
-                    typing_message = json.dumps({
-                        "type": "typing",
-                        "user_id": user.id,
-                        "full_name": user.full_name,
-                        "room_id": room_id,
-                        "is_typing": message_data.get("is_typing", False)
-                    })
-
-                    for uid, connection in manager.active_connections.items():
-                        if uid != user.id and manager.user_rooms.get(uid) == room_id:
-                            try:
-                                await connection.send_text(typing_message)
-                            except:
-                                pass
+                    # Typing state is aggregated per room and sent as throttled presence snapshots
+                    presence.set_typing(room_id, user.user_id, bool(message_data.get("is_typing", False)))
 
         except WebSocketDisconnect:
-            manager.disconnect(user.id)
+            manager.disconnect(user.user_id)
+            presence.clear_user(room_id, user.user_id)
             # Broadcast user left to room
-            await manager.broadcast_to_room(json.dumps({
+            await manager.broadcast_to_room({
                 "type": "system",
                 "message": f"{user.full_name} left the chat",
                 "room_id": room_id,
-                "timestamp": datetime.utcnow().isoformat()
-            }), room_id)
+                "timestamp": datetime.utcnow()
+            }, room_id)
 
     except Exception as e:
         print(f"WebSocket error: {e}")
@@ -174,6 +217,7 @@ def get_chat_messages(
     """
     Get recent chat messages for a specific room
     """
+    _ensure_room_access(current_user, room_id)
     messages = db.query(ChatMessage).filter(
         ChatMessage.room_id == room_id
     ).order_by(ChatMessage.timestamp.desc()).limit(limit).all()
@@ -194,31 +238,71 @@ def get_chat_messages(
 
     return result
 
+def _rooms_for(user: User) -> List[dict]:
+    # Public rooms plus one room per enrolled or taught course
+    return room_memberships.rooms(room_memberships.identity(user.email))
+
+def _ensure_room_access(user: User, room_id: str):
+    if not room_memberships.can_join(room_memberships.identity(user.email), room_id):
+        raise HTTPException(status_code=403, detail="You are not a member of this chat room")
+
 @router.get("/rooms")
 def get_chat_rooms(current_user: User = Depends(get_current_user)):
     """
     Get available chat rooms
     """
-    # For now, return static rooms, but this could be dynamic based on courses/enrollments
-    return [
-        {"id": "general", "name": "General", "description": "General discussion"},
-        {"id": "help", "name": "Help & Support", "description": "Get help from teachers and admins"},
-        {"id": "announcements", "name": "Announcements", "description": "Important announcements"}
-    ]
+    return _rooms_for(current_user)
+
+@router.get("/rooms/unread")
+async def get_rooms_with_unread(current_user: User = Depends(get_current_user)):
+    """
+    Get available chat rooms with unread counts from the user's read watermarks
+    """
+    rooms = room_memberships.rooms(await room_memberships.identity_async(current_user.email))
+    counts = read_state.unread_for_rooms(current_user.id, [room["id"] for room in rooms])
+    return [{**room, **count} for room, count in zip(rooms, counts)]
+
+@router.get("/rooms/{room_id}/presence")
+def get_room_presence(room_id: str, current_user: User = Depends(get_current_user)):
+    """
+    Get online and typing members of a room from the live connection registry
+    """
+    _ensure_room_access(current_user, room_id)
+    snapshot = presence.snapshot(room_id)
+    snapshot.pop("type")
+    return snapshot
 
 @router.post("/messages/{message_id}/ack")
 async def acknowledge_message(
     message_id: int,
+    room_id: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """
-    Acknowledge receipt of a message (for reliability)
+    Acknowledge a message, advancing the user's read watermark for its room
     """
-    message = db.query(ChatMessage).filter(ChatMessage.id == message_id).first()
-    if not message:
+    # The room is always the message's own; a room_id from the client only has to agree with it
+    message_room = read_state.room_of(message_id)
+    if message_room is None:
+        # Older than the cached room indexes; resolve it once from the database
+        message_room = db.query(ChatMessage.room_id).filter(ChatMessage.id == message_id).scalar()
+    if message_room is None:
+        raise HTTPException(status_code=404, detail="Message not found")
+    if room_id is not None and room_id != message_room:
+        raise HTTPException(status_code=400, detail="Message is not in this chat room")
+    room_id = message_room
+    identity = await room_memberships.identity_async(current_user.email)
+    if identity is None or not room_memberships.can_join(identity, room_id):
+        raise HTTPException(status_code=403, detail="You are not a member of this chat room")
+    if message_id > read_state.latest_message_id(room_id):
         raise HTTPException(status_code=404, detail="Message not found")
 
-    # In a production system, you might want to track acknowledgments
-    # For now, just return success
-    return {"message": "Message acknowledged", "message_id": message_id}
+    last_read = read_state.mark_read(current_user.id, room_id, message_id)
+    return {
+        "message": "Message acknowledged",
+        "message_id": message_id,
+        "room_id": room_id,
+        "last_read_message_id": last_read,
+        "unread_count": read_state.unread(current_user.id, room_id)["unread_count"],
+    }
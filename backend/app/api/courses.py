@@ -8,8 +8,16 @@ from app.models.course_video import CourseVideo
 from app.models.course_note import CourseNote
 from app.models.lesson import Lesson
 from app.models.chat_message import ChatMessage
-from app.schemas.course import CourseCreate, CourseOut, EnrollmentCreate, EnrollmentOut, CourseDetailOut
+from app.schemas.course import CourseCreate, CourseUpdate, CourseOut, EnrollmentCreate, EnrollmentOut, CourseDetailOut
 from app.services.deps import get_current_user
+from app.services.chat_rooms import room_memberships
+from app.services.retrieval import index_note, remove_source
+from app.services.ai_suggestions import ai_suggestions
+from app.services.coin_ledger import coin_ledger
+from app.services.badge_engine import badge_engine
+from app.services.study_activity import study_activity
+from app.models.content_chunk import ContentChunk
+from app.models.ai_suggestion import AISuggestionSet
 from typing import List, Optional
 from datetime import datetime, timedelta
 
@@ -41,6 +49,8 @@ def create_course(payload: CourseCreate, db: Session = Depends(get_db), user: Us
     db.add(c)
     db.commit()
     db.refresh(c)
+    room_memberships.invalidate(teacher_id)
+    ai_suggestions.schedule(c.id)
     return c
 
 @router.get("/", response_model=List[CourseOut])
@@ -207,6 +217,7 @@ def enroll_student(payload: EnrollmentCreate, db: Session = Depends(get_db), use
     db.add(enrollment)
     db.commit()
     db.refresh(enrollment)
+    room_memberships.invalidate(user.id)
     return enrollment
 
 @router.get("/enrolled", response_model=List[CourseOut])
@@ -235,6 +246,7 @@ def unenroll_student(course_id: int, db: Session = Depends(get_db), user: User =
 
     db.delete(enrollment)
     db.commit()
+    room_memberships.invalidate(user.id)
     return {"message": "Successfully unenrolled from course"}
 
 @router.get("/available-for-enrollment", response_model=List[CourseOut])
@@ -287,6 +299,25 @@ def get_course_details(course_id: int, db: Session = Depends(get_db)):
         created_at=course.created_at
     )
 
+@router.put("/{course_id}", response_model=CourseOut)
+def update_course(course_id: int, payload: CourseUpdate, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+    """Update a course (its teacher or an admin)"""
+    course = db.query(Course).filter(Course.id == course_id).first()
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+    if user.role != "admin" and course.teacher_id != user.id:
+        raise HTTPException(status_code=403, detail="Not authorized to update this course")
+
+    updates = payload.model_dump(exclude_unset=True)
+    for key, value in updates.items():
+        setattr(course, key, value)
+
+    db.commit()
+    db.refresh(course)
+    if updates.keys() & {"title", "description"}:
+        ai_suggestions.schedule(course.id)
+    return course
+
 @router.put("/enrollment/{enrollment_id}/hours")
 def update_hours_completed(enrollment_id: int, hours: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
     """Update hours completed for a student's enrollment and award gyan coins"""
@@ -307,10 +338,12 @@ def update_hours_completed(enrollment_id: int, hours: int, db: Session = Depends
     coins_to_award = hours_added // 10  # 1 coin per 10 hours
 
     if coins_to_award > 0:
-        user.gyan_coins += coins_to_award
-        db.commit()
+        coin_ledger.change(db, user, coins_to_award, "study_hours", f"{hours_added} study hours logged")
 
     enrollment.hours_completed = new_hours
+    if hours_added > 0:
+        study_activity.record(db, user.id, [enrollment.course_id])
+        badge_engine.record(db, "lesson_studied", {user.id: {}})
     db.commit()
     db.refresh(enrollment)
 
@@ -332,9 +365,11 @@ def assign_teacher_to_course(course_id: int, teacher_id: int, db: Session = Depe
     if not teacher:
         raise HTTPException(status_code=404, detail="Teacher not found")
 
+    previous_teacher_id = course.teacher_id
     course.teacher_id = teacher_id
     db.commit()
     db.refresh(course)
+    room_memberships.invalidate(previous_teacher_id, teacher_id)
     return {"message": f"Teacher {teacher.full_name} assigned to course {course.title}"}
 
 @router.post("/admin/{course_id}/upload-video")
@@ -367,6 +402,8 @@ def upload_course_note(course_id: int, title: str, content: str, db: Session = D
     db.add(note)
     db.commit()
     db.refresh(note)
+    index_note(db, note)
+    ai_suggestions.schedule(course_id)
     return {"message": "Note uploaded successfully", "note_id": note.id}
 
 @router.get("/admin/courses")
@@ -405,8 +442,13 @@ def admin_delete_course(course_id: int, db: Session = Depends(get_db), user: Use
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
 
+    # Derived AI data goes with the course
+    db.query(ContentChunk).filter(ContentChunk.course_id == course_id).delete(synchronize_session=False)
+    db.query(AISuggestionSet).filter(AISuggestionSet.course_id == course_id).delete(synchronize_session=False)
     db.delete(course)
     db.commit()
+    room_memberships.invalidate_course(course_id)
+    ai_suggestions.invalidate_course(course_id)
     return {"message": "Course deleted successfully"}
 
 @router.get("/admin/course-videos")
@@ -474,8 +516,11 @@ def admin_delete_course_note(note_id: int, db: Session = Depends(get_db), user:
     if not note:
         raise HTTPException(status_code=404, detail="Course note not found")
 
+    course_id = note.course_id
     db.delete(note)
     db.commit()
+    remove_source(db, course_id, "note", note_id)
+    ai_suggestions.schedule(course_id)
     return {"message": "Course note deleted successfully"}
 
 @router.get("/{course_id}/videos")
@@ -633,6 +678,8 @@ def upload_course_note(
     db.add(note)
     db.commit()
     db.refresh(note)
+    index_note(db, note)
+    ai_suggestions.schedule(course_id)
 
     return {
         "message": "Note uploaded successfully",
@@ -802,8 +849,10 @@ def assign_teacher_to_course_frontend(
     if not teacher:
         raise HTTPException(status_code=404, detail="Active teacher not found")
 
+    previous_teacher_id = course.teacher_id
     course.teacher_id = teacher_id
     db.commit()
+    room_memberships.invalidate(previous_teacher_id, teacher_id)
 
     return {
         "message": "Teacher assigned successfully",
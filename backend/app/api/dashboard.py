@@ -7,6 +7,8 @@ from ..models.enrollment import Enrollment
 from ..models.lesson import Lesson
 from ..models.progress import UserProgress
 from ..services.deps import get_current_user
+from ..services.notification_broadcasts import list_notifications
+from ..services.study_activity import ALL_COURSES, study_activity
 from typing import List, Dict, Any
 from datetime import datetime, timedelta
 
@@ -35,14 +37,8 @@ def get_student_dashboard_stats(db: Session = Depends(get_db), user: User = Depe
     total_minutes = sum([p.time_spent_minutes or 0 for p in total_study_hours])
     total_hours = total_minutes // 60
     
-    # Get current streak (simplified - days with activity in last 30 days)
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    recent_activity = db.query(UserProgress).filter(
-        UserProgress.user_id == user.id,
-        UserProgress.last_accessed >= thirty_days_ago
-    ).count()
-    
-    current_streak = min(recent_activity, 30)  # Cap at 30 days
+    # Get current streak from the daily activity bitmap
+    current_streak = study_activity.streaks(db, user.id)[ALL_COURSES]["current_streak"]
     
     return {
         "enrolled_courses": enrolled_courses_count,
@@ -152,20 +148,19 @@ def get_dashboard_recommendations(db: Session = Depends(get_db), user: User = De
 @router.get("/notifications")
 def get_dashboard_notifications(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
     """Get recent notifications for the dashboard"""
-    # Get recent notifications for the user
-    notifications = db.query(Notification).filter(
-        Notification.user_id == user.id
-    ).order_by(Notification.created_at.desc()).limit(5).all()
+    # Get recent notifications for the user, broadcasts included
+    notifications = list_notifications(db, user, limit=5)
 
     dashboard_notifications = []
     for notification in notifications:
         dashboard_notifications.append({
-            "id": notification.id,
-            "title": notification.title,
-            "message": notification.message,
-            "type": notification.notification_type,
-            "is_read": notification.is_read,
-            "created_at": notification.created_at.isoformat()
+            "id": notification["id"],
+            "title": notification["title"],
+            "message": notification["message"],
+            "type": notification["notification_type"],
+            "is_read": notification["is_read"],
+            "created_at": notification["created_at"].isoformat(),
+            "source": notification["source"]
         })
 
     return dashboard_notifications
@@ -11,6 +11,10 @@ from ..models.assignment import Assignment, Grade
 from ..models.quiz import Quiz
 from ..models.attendance import Attendance
 from ..services.deps import get_current_user
+from ..services.badge_engine import badge_engine
+from ..services.coin_ledger import InsufficientCoins, coin_ledger, transaction_item
+from ..services.leaderboard import WINDOWS as LEADERBOARD_WINDOWS, leaderboard
+from ..services.study_activity import ALL_COURSES, study_activity
 from ..utils.errors import not_found_error
 from typing import List, Dict, Optional
 from datetime import datetime, timedelta, date
@@ -71,11 +75,22 @@ class LeaderboardEntry(BaseModel):
     rank: int
     badges_count: int
 
+class LeaderboardRankResponse(BaseModel):
+    timeframe: str
+    rank: Optional[int]
+    gyan_coins: int
+    total: int
+    neighbors: List[LeaderboardEntry]
+
 class PointsResponse(BaseModel):
     current_points: int
     total_earned: int
     points_history: List[Dict]
 
+class PointsHistoryResponse(BaseModel):
+    items: List[Dict]
+    next_before_id: Optional[int]
+
 # Points system endpoints
 @router.get("/points", response_model=PointsResponse)
 def get_user_points(
@@ -83,46 +98,25 @@ def get_user_points(
     current_user: User = Depends(get_current_user)
 ):
     """Get user's current points and points history"""
-    # Get points history from various activities
-    points_history = []
-
-    # Points from completed challenges
-    completed_challenges = db.query(UserChallenge).filter(
-        UserChallenge.user_id == current_user.id,
-        UserChallenge.completed == True
-    ).all()
-
-    for challenge in completed_challenges:
-        daily_challenge = db.query(DailyChallenge).filter(
-            DailyChallenge.id == challenge.challenge_id
-        ).first()
-        if daily_challenge:
-            points_history.append({
-                "type": "challenge_completed",
-                "description": f"Completed: {daily_challenge.title}",
-                "points": daily_challenge.gyan_coins_reward,
-                "earned_at": challenge.completed_at.isoformat() if challenge.completed_at else None
-            })
-
-    # Points from badges earned
-    user_badges = db.query(UserBadge).filter(UserBadge.user_id == current_user.id).all()
-    for user_badge in user_badges:
-        badge = db.query(Badge).filter(Badge.id == user_badge.badge_id).first()
-        if badge:
-            points_history.append({
-                "type": "badge_earned",
-                "description": f"Earned badge: {badge.name}",
-                "points": badge.gyan_coins_reward,
-                "earned_at": user_badge.earned_at.isoformat()
-            })
-
-    # Calculate total points earned
-    total_earned = sum(entry["points"] for entry in points_history)
-
     return {
         "current_points": current_user.gyan_coins,
-        "total_earned": total_earned,
-        "points_history": points_history[-20:]  # Last 20 entries
+        "total_earned": coin_ledger.total_earned(db, current_user.id),
+        "points_history": [transaction_item(t) for t in coin_ledger.history(db, current_user.id, limit=20)]
+    }
+
+@router.get("/points/history", response_model=PointsHistoryResponse)
+def get_points_history(
+    limit: int = 50,
+    before_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Page through the user's coin transactions, newest first; pass next_before_id to get the next page"""
+    limit = max(min(limit, 100), 1)
+    transactions = coin_ledger.history(db, current_user.id, limit=limit, before_id=before_id)
+    return {
+        "items": [transaction_item(t) for t in transactions],
+        "next_before_id": transactions[-1].id if len(transactions) == limit else None
     }
 
 @router.post("/points/add")
@@ -141,7 +135,7 @@ def add_points(
         raise HTTPException(status_code=400, detail="Points must be positive")
 
     # Add points to user
-    current_user.gyan_coins += points
+    coin_ledger.change(db, current_user, points, "points_added", reason)
     db.commit()
 
     return {
@@ -157,7 +151,8 @@ def check_achievements(
     current_user: User = Depends(get_current_user)
 ):
     """Check and award any new achievements for the current user"""
-    _check_and_award_badges(current_user.id, db)
+    badge_engine.recheck(db, current_user.id)
+    db.commit()
 
     # Check for new badges since last check
     recent_badges = db.query(UserBadge).filter(
@@ -248,13 +243,12 @@ def freeze_streak(
     current_user: User = Depends(get_current_user)
 ):
     """Freeze a streak to prevent it from being broken (costs points)"""
-    if current_user.gyan_coins < 10:
+    # Deduct points for freezing; committed together with the freeze below
+    try:
+        coin_ledger.change(db, current_user, -10, "streak_freeze", f"Froze {streak_type} streak")
+    except InsufficientCoins:
         raise HTTPException(status_code=400, detail="Insufficient points to freeze streak (costs 10 points)")
 
-    # Deduct points for freezing
-    current_user.gyan_coins -= 10
-    db.commit()
-
     # Update streak freeze status (extend freeze by 1 day)
     streak = db.query(Streak).filter(
         Streak.user_id == current_user.id,
@@ -324,13 +318,10 @@ def complete_challenge(
     user_challenge.completed_at = datetime.utcnow()
     user_challenge.progress = challenge.target_value
 
-    # Award gyan coins
-    current_user.gyan_coins += challenge.gyan_coins_reward
+    # Award gyan coins; no badge criteria depend on challenges, so nothing to evaluate
+    coin_ledger.change(db, current_user, challenge.gyan_coins_reward, "challenge_completed", f"Completed: {challenge.title}")
     db.commit()
 
-    # Check for new badges
-    _check_and_award_badges(current_user.id, db)
-
     return {
         "message": "Challenge completed successfully!",
         "challenge_title": challenge.title,
@@ -407,11 +398,11 @@ def claim_reward(
         raise HTTPException(status_code=404, detail="Reward not found")
 
     reward = rewards[reward_id]
-    if current_user.gyan_coins < reward["cost"]:
-        raise HTTPException(status_code=400, detail="Insufficient points")
-
     # Deduct points
-    current_user.gyan_coins -= reward["cost"]
+    try:
+        coin_ledger.change(db, current_user, -reward["cost"], "reward_claimed", f"Claimed: {reward['name']}")
+    except InsufficientCoins:
+        raise HTTPException(status_code=400, detail="Insufficient points")
     db.commit()
 
     # Award the reward (in a real system, this would create a reward record)
@@ -586,7 +577,7 @@ def update_challenge_progress(
         user_challenge.completed_at = datetime.utcnow()
 
         # Award gyan coins
-        current_user.gyan_coins += challenge.gyan_coins_reward
+        coin_ledger.change(db, current_user, challenge.gyan_coins_reward, "challenge_completed", f"Completed: {challenge.title}")
         db.commit()
 
         return {
@@ -607,41 +598,74 @@ def update_challenge_progress(
     }
 
 # Leaderboard endpoints
+def _leaderboard_entries(db: Session, rows: List[Dict]) -> List[Dict]:
+    """Names and badge counts for board rows, one query each"""
+    user_ids = [row["user_id"] for row in rows]
+    if not user_ids:
+        return []
+    names = dict(db.query(User.id, User.full_name).filter(User.id.in_(user_ids)).all())
+    badges = dict(db.query(UserBadge.user_id, func.count(UserBadge.id)).filter(
+        UserBadge.user_id.in_(user_ids)
+    ).group_by(UserBadge.user_id).all())
+    return [{
+        "user_id": row["user_id"],
+        "user_name": names.get(row["user_id"], ""),
+        "gyan_coins": row["score"],
+        "rank": row["rank"],
+        "badges_count": badges.get(row["user_id"], 0)
+    } for row in rows]
+
 @router.get("/leaderboard", response_model=List[LeaderboardEntry])
 def get_gamification_leaderboard(
     limit: int = 20,
     timeframe: str = "all_time",  # all_time, monthly, weekly
+    course_id: Optional[int] = None,
+    category: Optional[str] = None,
+    offset: int = 0,
     db: Session = Depends(get_db)
 ):
-    """Get gamification leaderboard"""
-    query = db.query(User).filter(User.sub_role == "student")
-
-    # Apply timeframe filter
-    if timeframe == "weekly":
-        week_ago = datetime.utcnow() - timedelta(days=7)
-        # Filter by recent activity (simplified - would need proper activity tracking)
-        pass
-    elif timeframe == "monthly":
-        month_ago = datetime.utcnow() - timedelta(days=30)
-        # Filter by recent activity
-        pass
-
-    users = query.order_by(User.gyan_coins.desc()).limit(limit).all()
-
-    result = []
-    for idx, user in enumerate(users, 1):
-        # Count user's badges
-        badges_count = db.query(UserBadge).filter(UserBadge.user_id == user.id).count()
-
-        result.append({
-            "user_id": user.id,
-            "user_name": user.full_name,
-            "gyan_coins": user.gyan_coins,
-            "rank": idx,
-            "badges_count": badges_count
-        })
+    """Get gamification leaderboard; weekly and monthly boards rank coins earned in the current week/month"""
+    if timeframe not in LEADERBOARD_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"timeframe must be one of {', '.join(LEADERBOARD_WINDOWS)}")
+    scope = leaderboard.scope_for(db, course_id=course_id, category=category)
+    if scope is None:
+        return []
+    rows = leaderboard.top(db, timeframe, scope, limit=max(min(limit, 100), 1), offset=max(offset, 0))
+    return _leaderboard_entries(db, rows)
+
+@router.get("/leaderboard/me/rank", response_model=LeaderboardRankResponse)
+def get_my_leaderboard_rank(
+    timeframe: str = "all_time",
+    course_id: Optional[int] = None,
+    category: Optional[str] = None,
+    neighbors: int = 2,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """The current user's rank and score, with the students ranked just above and below them"""
+    if timeframe not in LEADERBOARD_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"timeframe must be one of {', '.join(LEADERBOARD_WINDOWS)}")
+    scope = leaderboard.scope_for(db, course_id=course_id, category=category)
+    if scope is None:
+        raise not_found_error("Category")
+    result = leaderboard.around(db, current_user.id, timeframe, scope, neighbors=max(min(neighbors, 10), 0))
+    return {
+        "timeframe": timeframe,
+        "rank": result["rank"],
+        "gyan_coins": result["score"],
+        "total": result["total"],
+        "neighbors": _leaderboard_entries(db, result["neighbors"])
+    }
 
-    return result
+@router.get("/user/activity")
+def get_user_activity(
+    days: int = 365,
+    course_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Daily activity heatmap (1/0 per day, oldest first) with current and longest study streaks"""
+    return study_activity.heatmap(db, current_user.id, course_id or ALL_COURSES, days=days)
 
 @router.get("/user/stats")
 def get_user_gamification_stats(
@@ -650,7 +674,7 @@ def get_user_gamification_stats(
 ):
     """Get comprehensive gamification stats for the current user"""
     # Calculate streaks
-    daily_study_streak = _calculate_daily_study_streak(current_user.id, db)
+    study = study_activity.streaks(db, current_user.id)[ALL_COURSES]
 
     # Get badges earned
     badges_earned = db.query(UserBadge).filter(UserBadge.user_id == current_user.id).count()
@@ -682,129 +706,23 @@ def get_user_gamification_stats(
         "badges_earned": badges_earned,
         "challenges_completed": challenges_completed,
         "challenge_coins_earned": challenge_coins,
-        "daily_study_streak": daily_study_streak,
+        "daily_study_streak": study["current_streak"],
+        "longest_study_streak": study["longest_streak"],
         "recent_achievements": recent_badges,
         "total_achievements": badges_earned + challenges_completed
     }
 
-# Utility functions
-def _calculate_daily_study_streak(user_id: int, db: Session) -> int:
-    """Calculate current daily study streak"""
-    # Get user's recent progress records
-    recent_progress = db.query(UserProgress).filter(
-        UserProgress.user_id == user_id,
-        UserProgress.last_accessed >= datetime.utcnow() - timedelta(days=30)
-    ).order_by(UserProgress.last_accessed.desc()).all()
-
-    if not recent_progress:
-        return 0
-
-    # Group by date and check consecutive days
-    study_dates = set()
-    for progress in recent_progress:
-        if progress.last_accessed:
-            study_dates.add(progress.last_accessed.date())
-
-    # Sort dates and check for consecutive days
-    sorted_dates = sorted(study_dates)
-
-    if not sorted_dates:
-        return 0
-
-    current_streak = 1
-    for i in range(len(sorted_dates) - 1, 0, -1):
-        current_date = sorted_dates[i]
-        previous_date = sorted_dates[i - 1]
-
-        if (current_date - previous_date).days == 1:
-            current_streak += 1
-        else:
-            break
-
-    return current_streak
-
-def _check_and_award_badges(user_id: int, db: Session):
-    """Check if user qualifies for any badges and award them"""
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        return
-
-    # Check various badge criteria
-    badge_criteria = {
-        "First Course": lambda u: _get_completed_courses_count(u.id, db) >= 1,
-        "Course Collector": lambda u: _get_completed_courses_count(u.id, db) >= 5,
-        "Dedicated Learner": lambda u: _get_daily_study_streak(u.id, db) >= 7,
-        "Perfect Attendance": lambda u: _get_attendance_rate(u.id, db) >= 0.95,
-        "Quiz Master": lambda u: _get_average_quiz_score(u.id, db) >= 90,
-        "Assignment Ace": lambda u: _get_average_assignment_score(u.id, db) >= 90,
-    }
-
-    for badge_name, criteria_func in badge_criteria.items():
-        if criteria_func(user):
-            # Check if user already has this badge
-            badge = db.query(Badge).filter(Badge.name == badge_name).first()
-            if badge:
-                existing_user_badge = db.query(UserBadge).filter(
-                    UserBadge.user_id == user_id,
-                    UserBadge.badge_id == badge.id
-                ).first()
-
-                if not existing_user_badge:
-                    # Award the badge
-                    user_badge = UserBadge(
-                        user_id=user_id,
-                        badge_id=badge.id
-                    )
-                    db.add(user_badge)
-
-                    # Award gyan coins
-                    user.gyan_coins += badge.gyan_coins_reward
-
-    db.commit()
-
-def _get_completed_courses_count(user_id: int, db: Session) -> int:
-    """Get count of completed courses for a user"""
-    return db.query(UserProgress).filter(
-        UserProgress.user_id == user_id,
-        UserProgress.completed == True,
-        UserProgress.lesson_id.is_(None)  # Course-level progress
-    ).count()
-
-def _get_daily_study_streak(user_id: int, db: Session) -> int:
-    """Get current daily study streak"""
-    return _calculate_daily_study_streak(user_id, db)
-
-def _get_attendance_rate(user_id: int, db: Session) -> float:
-    """Calculate attendance rate for a user"""
-    attendance_records = db.query(Attendance).filter(Attendance.student_id == user_id).all()
-    if not attendance_records:
-        return 0.0
-
-    present_count = sum(1 for record in attendance_records if record.is_present)
-    return present_count / len(attendance_records)
-
-def _get_average_quiz_score(user_id: int, db: Session) -> float:
-    """Calculate average quiz score for a user"""
-    # This would need to be implemented based on quiz attempt results
-    # For now, return a placeholder
-    return 85.0
-
-def _get_average_assignment_score(user_id: int, db: Session) -> float:
-    """Calculate average assignment score for a user"""
-    grades = db.query(Grade).filter(Grade.student_id == user_id).all()
-    if not grades:
-        return 0.0
-
-    return sum(grade.score for grade in grades) / len(grades)
-
 # Auto-badge checking (can be called after progress updates)
 @router.post("/check-badges")
 def check_and_award_badges_endpoint(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Manually trigger badge checking for the current user"""
-    _check_and_award_badges(current_user.id, db)
+    """Manually trigger badge checking for the current user
+
+    Recounts the user's achievement counters from the tables, so it also repairs any drift."""
+    badge_engine.recheck(db, current_user.id)
+    db.commit()
 
     new_badges = db.query(UserBadge).filter(
         UserBadge.user_id == current_user.id,
@@ -985,46 +903,10 @@ def get_user_points(
     current_user: User = Depends(get_current_user)
 ):
     """Get user's current points and points history"""
-    # Get points history from various activities
-    points_history = []
-
-    # Points from completed challenges
-    completed_challenges = db.query(UserChallenge).filter(
-        UserChallenge.user_id == current_user.id,
-        UserChallenge.completed == True
-    ).all()
-
-    for challenge in completed_challenges:
-        daily_challenge = db.query(DailyChallenge).filter(
-            DailyChallenge.id == challenge.challenge_id
-        ).first()
-        if daily_challenge:
-            points_history.append({
-                "type": "challenge_completed",
-                "description": f"Completed: {daily_challenge.title}",
-                "points": daily_challenge.gyan_coins_reward,
-                "earned_at": challenge.completed_at.isoformat() if challenge.completed_at else None
-            })
-
-    # Points from badges earned
-    user_badges = db.query(UserBadge).filter(UserBadge.user_id == current_user.id).all()
-    for user_badge in user_badges:
-        badge = db.query(Badge).filter(Badge.id == user_badge.badge_id).first()
-        if badge:
-            points_history.append({
-                "type": "badge_earned",
-                "description": f"Earned badge: {badge.name}",
-                "points": badge.gyan_coins_reward,
-                "earned_at": user_badge.earned_at.isoformat()
-            })
-
-    # Calculate total points earned
-    total_earned = sum(entry["points"] for entry in points_history)
-
     return {
         "current_points": current_user.gyan_coins,
-        "total_earned": total_earned,
-        "points_history": points_history[-20:]  # Last 20 entries
+        "total_earned": coin_ledger.total_earned(db, current_user.id),
+        "points_history": [transaction_item(t) for t in coin_ledger.history(db, current_user.id, limit=20)]
     }
 
 @router.post("/points/add")
@@ -1043,7 +925,7 @@ def add_points(
         raise HTTPException(status_code=400, detail="Points must be positive")
 
     # Add points to user
-    current_user.gyan_coins += points
+    coin_ledger.change(db, current_user, points, "points_added", reason)
     db.commit()
 
     return {
@@ -1059,7 +941,8 @@ def check_achievements(
     current_user: User = Depends(get_current_user)
 ):
     """Check and award any new achievements for the current user"""
-    _check_and_award_badges(current_user.id, db)
+    badge_engine.recheck(db, current_user.id)
+    db.commit()
 
     # Check for new badges since last check
     recent_badges = db.query(UserBadge).filter(
@@ -1150,13 +1033,12 @@ def freeze_streak(
     current_user: User = Depends(get_current_user)
 ):
     """Freeze a streak to prevent it from being broken (costs points)"""
-    if current_user.gyan_coins < 10:
+    # Deduct points for freezing; committed together with the freeze below
+    try:
+        coin_ledger.change(db, current_user, -10, "streak_freeze", f"Froze {streak_type} streak")
+    except InsufficientCoins:
         raise HTTPException(status_code=400, detail="Insufficient points to freeze streak (costs 10 points)")
 
-    # Deduct points for freezing
-    current_user.gyan_coins -= 10
-    db.commit()
-
     # Update streak freeze status (extend freeze by 1 day)
     streak = db.query(Streak).filter(
         Streak.user_id == current_user.id,
@@ -1226,13 +1108,10 @@ def complete_challenge(
     user_challenge.completed_at = datetime.utcnow()
     user_challenge.progress = challenge.target_value
 
-    # Award gyan coins
-    current_user.gyan_coins += challenge.gyan_coins_reward
+    # Award gyan coins; no badge criteria depend on challenges, so nothing to evaluate
+    coin_ledger.change(db, current_user, challenge.gyan_coins_reward, "challenge_completed", f"Completed: {challenge.title}")
     db.commit()
 
-    # Check for new badges
-    _check_and_award_badges(current_user.id, db)
-
     return {
         "message": "Challenge completed successfully!",
         "challenge_title": challenge.title,
@@ -1309,11 +1188,11 @@ def claim_reward(
         raise HTTPException(status_code=404, detail="Reward not found")
 
     reward = rewards[reward_id]
-    if current_user.gyan_coins < reward["cost"]:
-        raise HTTPException(status_code=400, detail="Insufficient points")
-
     # Deduct points
-    current_user.gyan_coins -= reward["cost"]
+    try:
+        coin_ledger.change(db, current_user, -reward["cost"], "reward_claimed", f"Claimed: {reward['name']}")
+    except InsufficientCoins:
+        raise HTTPException(status_code=400, detail="Insufficient points")
     db.commit()
 
     # Award the reward (in a real system, this would create a reward record)
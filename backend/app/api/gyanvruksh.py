@@ -8,6 +8,7 @@ from ..models.enrollment import Enrollment
 from ..models.progress import UserProgress
 from ..models.category import Category
 from ..services.deps import get_current_user
+from ..services.leaderboard import WINDOWS as LEADERBOARD_WINDOWS, leaderboard
 from ..utils.errors import auth_error
 from typing import List, Dict, Optional
 from datetime import datetime, timedelta
@@ -18,22 +19,22 @@ router = APIRouter(prefix="/api/gyanvruksh", tags=["gyanvruksh"])
 def get_leaderboard(
     category: Optional[str] = None,
     limit: int = 20,
+    timeframe: str = "all_time",
     db: Session = Depends(get_db)
 ):
     """
     Returns top students ordered by gyan_coins descending.
-    Optionally filter by category.
+    Optionally filter by category, or rank coins earned this week/month.
     """
-    query = db.query(User).filter(User.sub_role == "student")
-
-    if category:
-        # Get courses in the category and their enrolled students
-        category_courses = db.query(Course.id).join(Category).filter(Category.name == category).subquery()
-        enrolled_users = db.query(Enrollment.student_id).filter(Enrollment.course_id.in_(category_courses)).subquery()
-        query = query.filter(User.id.in_(enrolled_users))
+    if timeframe not in LEADERBOARD_WINDOWS:
+        raise HTTPException(status_code=400, detail=f"timeframe must be one of {', '.join(LEADERBOARD_WINDOWS)}")
+    scope = leaderboard.scope_for(db, category=category)
+    if scope is None:
+        return []
 
-    users = query.order_by(User.gyan_coins.desc()).limit(limit).all()
-    return [{"id": u.id, "full_name": u.full_name, "gyan_coins": u.gyan_coins} for u in users]
+    rows = leaderboard.top(db, timeframe, scope, limit=max(min(limit, 100), 1))
+    names = dict(db.query(User.id, User.full_name).filter(User.id.in_([row["user_id"] for row in rows])).all())
+    return [{"id": row["user_id"], "full_name": names.get(row["user_id"]), "gyan_coins": row["score"]} for row in rows]
 
 @router.get("/profile")
 def get_profile(user: User = Depends(get_current_user)):
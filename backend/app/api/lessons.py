@@ -7,6 +7,10 @@ from app.models.course import Course
 from app.schemas.lesson import LessonOut as LessonSchema, LessonCreate, LessonUpdate
 from app.services.deps import get_current_user
 from app.models.user import User
+from app.services.tutor_cache import tutor_cache
+from app.services.retrieval import index_lesson, remove_source
+from app.services.ai_suggestions import ai_suggestions
+from app.services.class_reminders import class_reminders
 
 router = APIRouter(prefix="/api/lessons", tags=["lessons"])
 
@@ -47,6 +51,10 @@ def create_lesson(lesson: LessonCreate, db: Session = Depends(get_db), current_u
     db.add(db_lesson)
     db.commit()
     db.refresh(db_lesson)
+    index_lesson(db, db_lesson)
+    ai_suggestions.schedule(db_lesson.course_id, db_lesson.id)
+    if db_lesson.scheduled_at:
+        class_reminders.schedule(db_lesson.id, db_lesson.scheduled_at)
     return db_lesson
 
 @router.put("/{lesson_id}", response_model=LessonSchema)
@@ -62,11 +70,19 @@ def update_lesson(lesson_id: int, lesson_update: LessonUpdate, db: Session = Dep
     if current_user.role != "admin" and course.teacher_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to update this lesson")
     
-    for key, value in lesson_update.model_dump(exclude_unset=True).items():
+    updates = lesson_update.model_dump(exclude_unset=True)
+    for key, value in updates.items():
         setattr(lesson, key, value)
     
     db.commit()
     db.refresh(lesson)
+    if "content_text" in updates or "title" in updates:
+        index_lesson(db, lesson)
+        tutor_cache.invalidate_lesson(lesson.course_id, lesson.id)
+    if updates.keys() & {"content_text", "title", "description"}:
+        ai_suggestions.schedule(lesson.course_id, lesson.id)
+    if "scheduled_at" in updates:
+        class_reminders.schedule(lesson.id, lesson.scheduled_at)
     return lesson
 
 @router.delete("/{lesson_id}")
@@ -82,6 +98,11 @@ def delete_lesson(lesson_id: int, db: Session = Depends(get_db), current_user: U
     if current_user.role != "admin" and course.teacher_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this lesson")
     
+    course_id = lesson.course_id
     db.delete(lesson)
     db.commit()
+    remove_source(db, course_id, "lesson", lesson_id)
+    ai_suggestions.schedule(course_id, lesson_id)
+    tutor_cache.invalidate_lesson(course_id, lesson_id)
+    class_reminders.cancel(lesson_id)
     return {"message": "Lesson deleted successfully"}
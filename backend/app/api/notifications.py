@@ -1,15 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import asyncio
-import httpx
 from pydantic import BaseModel
 from datetime import datetime
 
 from ..database import get_db
-from ..models.notification import Notification
+from ..models.notification import Notification, BroadcastNotification
 from ..schemas.notification import NotificationRead, NotificationCreate
-from ..services.deps import get_current_user
+from ..services.deps import get_current_user, get_http_clients
+from ..services.http_clients import HTTPClientRegistry
+from ..services import notification_broadcasts as broadcasts
+from ..services.chat_protocol import negotiate, receive_frame
+from ..services.notification_stream import notification_hub
+from ..services.push_delivery import push_delivery, push_payload
+from ..services.unread_counters import unread_counters
 from ..models.user import User
 from ..utils.errors import not_found_error
 
@@ -21,6 +27,12 @@ class FCMNotificationRequest(BaseModel):
     body: str
     data: Optional[dict] = None
 
+class FCMBatchNotificationRequest(BaseModel):
+    user_ids: List[int]
+    title: str
+    body: str
+    data: Optional[dict] = None
+
 class FCMTokenUpdateRequest(BaseModel):
     fcm_token: str
 
@@ -38,25 +50,29 @@ def get_notifications(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """Get user notifications with filtering options"""
-    query = db.query(Notification).filter(Notification.user_id == current_user.id)
+    """Get user notifications with filtering options
 
-    if unread_only:
-        query = query.filter(Notification.is_read == False)
-
-    if notification_type:
-        query = query.filter(Notification.notification_type == notification_type)
-
-    notifications = query.order_by(Notification.created_at.desc()).limit(limit).all()
-    return notifications
+    Personal notifications and broadcasts targeting the user are merged, newest first;
+    ``source`` tells them apart."""
+    return broadcasts.list_notifications(db, current_user, unread_only, notification_type, limit)
 
 @router.post("/{notification_id}/read")
 def mark_as_read(
     notification_id: int,
+    source: str = "personal",
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """Mark a specific notification as read"""
+    if source == "broadcast":
+        broadcast = broadcasts.get_visible_broadcast(db, current_user, notification_id)
+        if not broadcast:
+            raise not_found_error("Notification")
+        broadcasts.mark_broadcast_read(db, current_user, broadcast)
+        db.commit()
+        notification_hub.publish_unread([current_user.id])
+        return {"message": "Notification marked as read"}
+
     notification = db.query(Notification).filter(
         Notification.id == notification_id,
         Notification.user_id == current_user.id
@@ -65,8 +81,11 @@ def mark_as_read(
     if not notification:
         raise not_found_error("Notification")
 
-    notification.is_read = True
+    if not notification.is_read:
+        notification.is_read = True
+        unread_counters.personal_read(db, current_user.id)
     db.commit()
+    notification_hub.publish_unread([current_user.id])
     return {"message": "Notification marked as read"}
 
 @router.post("/mark-all-read")
@@ -75,21 +94,29 @@ def mark_all_as_read(
     current_user: User = Depends(get_current_user),
 ):
     """Mark all user notifications as read"""
-    db.query(Notification).filter(
-        Notification.user_id == current_user.id,
-        Notification.is_read == False
-    ).update({"is_read": True})
-
+    broadcasts.mark_all_read(db, current_user)
     db.commit()
+    notification_hub.publish_unread([current_user.id])
     return {"message": "All notifications marked as read"}
 
 @router.delete("/{notification_id}")
 def delete_notification(
     notification_id: int,
+    source: str = "personal",
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
     """Delete a specific notification"""
+    if source == "broadcast":
+        # Broadcasts are shared; deleting hides it for this user only
+        broadcast = broadcasts.get_visible_broadcast(db, current_user, notification_id)
+        if not broadcast:
+            raise not_found_error("Notification")
+        broadcasts.dismiss_broadcast(db, current_user, broadcast)
+        db.commit()
+        notification_hub.publish_unread([current_user.id])
+        return {"message": "Notification deleted"}
+
     notification = db.query(Notification).filter(
         Notification.id == notification_id,
         Notification.user_id == current_user.id
@@ -98,8 +125,11 @@ def delete_notification(
     if not notification:
         raise not_found_error("Notification")
 
+    if not notification.is_read:
+        unread_counters.personal_read(db, current_user.id)
     db.delete(notification)
     db.commit()
+    notification_hub.publish_unread([current_user.id])
     return {"message": "Notification deleted"}
 
 @router.get("/unread-count")
@@ -108,12 +138,36 @@ def get_unread_count(
     current_user: User = Depends(get_current_user),
 ):
     """Get count of unread notifications"""
-    count = db.query(Notification).filter(
-        Notification.user_id == current_user.id,
-        Notification.is_read == False
-    ).count()
-
-    return {"unread_count": count}
+    return {"unread_count": broadcasts.unread_count(db, current_user)}
+
+@router.websocket("/ws")
+async def notification_stream(websocket: WebSocket, token: str):
+    """
+    Live notifications and unread count for the signed-in user
+
+    Sends the current unread count on connect, then a ``notification`` frame
+    for every new notification and an ``unread_count`` frame whenever the
+    count changes. Uses the chat wire codecs (JSON, or msgpack when offered).
+    """
+    from ..services.security import decode_token, get_token_subject
+    user_email = get_token_subject(token) if decode_token(token) else None
+    user = await asyncio.to_thread(notification_hub.load_user, user_email) if user_email else None
+    if not user:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    connection = await notification_hub.connect(websocket, user, negotiate(websocket))
+    try:
+        counts = await asyncio.to_thread(notification_hub.unread_counts, [user])
+        await notification_hub.send(connection, {"type": "unread_count", "unread_count": counts[user.id]})
+        while True:
+            frame = await receive_frame(websocket, connection.codec)
+            if frame.get("type") == "ping":
+                await notification_hub.send(connection, {"type": "pong"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        notification_hub.disconnect(connection)
 
 # Admin/Teacher endpoints for creating notifications
 @router.post("/create")
@@ -135,21 +189,15 @@ def create_notification(
     if not target_user:
         raise not_found_error("User")
 
-    notification = Notification(
-        user_id=request.user_id,
-        title=request.title,
-        message=request.message,
-        notification_type=request.notification_type,
-        is_read=False
+    items = broadcasts.create_notifications(
+        db, [request.user_id], request.title, request.message, request.notification_type
     )
-
-    db.add(notification)
     db.commit()
-    db.refresh(notification)
+    notification_hub.publish_notifications(items)
 
     return {
         "message": "Notification created successfully",
-        "notification_id": notification.id
+        "notification_id": items[0]["id"]
     }
 
 @router.post("/broadcast")
@@ -159,46 +207,64 @@ def broadcast_notification(
     notification_type: str = "general",
     target_role: Optional[str] = None,
     target_sub_role: Optional[str] = None,
+    push: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
 ):
-    """Broadcast notification to multiple users (admin only)"""
+    """Broadcast notification to multiple users (admin only)
+
+    Stored once; target users see it among their notifications. With ``push``,
+    target users with a registered device also get a push in the background."""
     if current_user.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only admins can broadcast notifications"
         )
 
-    # Build query for target users
-    query = db.query(User)
-
-    if target_role:
-        query = query.filter(User.role == target_role)
-
-    if target_sub_role:
-        query = query.filter(User.sub_role == target_sub_role)
+    broadcast = broadcasts.create_broadcast(
+        db,
+        created_by=current_user.id,
+        title=title,
+        message=message,
+        notification_type=notification_type,
+        target_role=target_role,
+        target_sub_role=target_sub_role,
+    )
+    db.commit()
+    notification_hub.publish_broadcast(broadcast)
+    recipients_count = broadcasts.recipient_count(db, broadcast)
 
-    target_users = query.all()
+    response = {
+        "message": f"Notification broadcast to {recipients_count} users",
+        "broadcast_id": broadcast.id,
+        "recipients_count": recipients_count
+    }
+    if push:
+        job = push_delivery.enqueue(
+            title, message, {"broadcast_id": str(broadcast.id)},
+            target_role=broadcast.target_role, target_sub_role=broadcast.target_sub_role
+        )
+        response["push_job_id"] = job.id
+    return response
 
-    # Create notifications for all target users
-    notifications_created = 0
-    for user in target_users:
-        notification = Notification(
-            user_id=user.id,
-            title=title,
-            message=message,
-            notification_type=notification_type,
-            is_read=False
+@router.get("/broadcast/{broadcast_id}")
+def get_broadcast(
+    broadcast_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Get a broadcast and its audience size (admin only)"""
+    if current_user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins can view broadcasts"
         )
-        db.add(notification)
-        notifications_created += 1
 
-    db.commit()
+    broadcast = db.query(BroadcastNotification).filter(BroadcastNotification.id == broadcast_id).first()
+    if not broadcast:
+        raise not_found_error("Broadcast")
 
-    return {
-        "message": f"Notification broadcast to {notifications_created} users",
-        "recipients_count": notifications_created
-    }
+    return broadcasts.broadcast_details(db, broadcast)
 
 
 # FCM (Firebase Cloud Messaging) endpoints
@@ -206,7 +272,8 @@ def broadcast_notification(
 async def send_fcm_notification(
     request: FCMNotificationRequest,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    http_clients: HTTPClientRegistry = Depends(get_http_clients)
 ):
     """Send FCM push notification to a user"""
     # Check if user has permission to send notifications
@@ -224,52 +291,34 @@ async def send_fcm_notification(
     if not target_user.fcm_token:
         return {"message": "User has no FCM token registered", "success": False}
 
-    # FCM server configuration (you would get these from environment variables)
-    FCM_SERVER_KEY = "YOUR_FCM_SERVER_KEY"  # Should be in environment variables
-
     try:
-        async with httpx.AsyncClient() as client:
-            fcm_response = await client.post(
-                "https://fcm.googleapis.com/fcm/send",
-                headers={
-                    "Authorization": f"key={FCM_SERVER_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "to": target_user.fcm_token,
-                    "notification": {
-                        "title": request.title,
-                        "body": request.body,
-                        "click_action": "FLUTTER_NOTIFICATION_CLICK"
-                    },
-                    "data": request.data or {}
-                },
-                timeout=10.0
-            )
-
-        if fcm_response.status_code == 200:
-            result = fcm_response.json()
+        # Same path as batched delivery, without retries: the caller is waiting
+        result = await push_delivery.send_batch(
+            http_clients.get("fcm"),
+            [target_user.fcm_token],
+            push_payload(request.title, request.body, request.data),
+            max_attempts=1
+        )
+        await push_delivery.prune(result)
 
+        if result.sent:
             # Create notification record in database
-            notification = Notification(
-                user_id=request.user_id,
-                title=request.title,
-                message=request.body,
-                notification_type="push_notification",
-                is_read=False
+            items = broadcasts.create_notifications(
+                db, [request.user_id], request.title, request.body, "push_notification"
             )
-            db.add(notification)
             db.commit()
+            notification_hub.publish_notifications(items)
 
             return {
                 "message": "FCM notification sent successfully",
-                "fcm_result": result,
-                "notification_id": notification.id
+                "fcm_result": result.as_dict(),
+                "notification_id": items[0]["id"]
             }
         else:
             return {
                 "message": "Failed to send FCM notification",
-                "error": fcm_response.text,
+                "error": "FCM token is no longer valid" if result.invalid else "FCM delivery failed",
+                "fcm_result": result.as_dict(),
                 "success": False
             }
 
@@ -280,6 +329,52 @@ async def send_fcm_notification(
         }
 
 
+@router.post("/fcm/send-batch", status_code=status.HTTP_202_ACCEPTED)
+def send_fcm_batch(
+    request: FCMBatchNotificationRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Queue a push to many users; delivery is batched and runs in the background"""
+    if current_user.role not in ["admin"] and current_user.sub_role not in ["teacher"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins and teachers can send FCM notifications"
+        )
+
+    # In-app record for every target user, in one statement
+    items = broadcasts.create_notifications_for(
+        db, select(User.id).where(User.id.in_(request.user_ids)), request.title, request.body, "push_notification"
+    )
+    db.commit()
+    notification_hub.publish_notifications(items)
+
+    job = push_delivery.enqueue(request.title, request.body, request.data, user_ids=request.user_ids)
+    return {
+        "message": "FCM notifications queued",
+        "job_id": job.id,
+        "recipients_count": len(items)
+    }
+
+
+@router.get("/fcm/jobs/{job_id}")
+def get_fcm_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user)
+):
+    """Delivery progress of a queued push (recent jobs of the worker that queued it)"""
+    if current_user.role not in ["admin"] and current_user.sub_role not in ["teacher"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only admins and teachers can view FCM jobs"
+        )
+
+    job = push_delivery.job(job_id)
+    if not job:
+        raise not_found_error("Push job")
+    return job.as_dict()
+
+
 @router.post("/fcm/token")
 def update_fcm_token(
     request: FCMTokenUpdateRequest,
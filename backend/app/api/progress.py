@@ -5,6 +5,9 @@ from app.database import get_db
 from app.models.progress import UserProgress, UserPreferences
 from app.schemas.progress import UserProgress as UserProgressSchema, UserProgressCreate, UserProgressUpdate, UserPreferencesOut, UserPreferencesUpdate
 from app.services.deps import get_current_user
+from app.services.badge_engine import badge_engine
+from app.services.coin_ledger import coin_ledger
+from app.services.study_activity import ALL_COURSES, study_activity
 from app.models.user import User
 from app.models.course import Course
 from app.models.lesson import Lesson
@@ -70,6 +73,8 @@ def update_lesson_progress(course_id: int, lesson_id: int, progress_data: UserPr
         )
         db.add(progress)
     
+    study_activity.record(db, current_user.id, [course_id])
+    badge_engine.record(db, "lesson_studied", {current_user.id: {}})
     db.commit()
     db.refresh(progress)
     
@@ -150,6 +155,7 @@ def _update_course_progress(db: Session, user_id: int, course_id: int):
         UserProgress.lesson_id.is_(None)
     ).first()
 
+    was_completed = bool(course_progress and course_progress.completed)
     if course_progress:
         course_progress.progress_percentage = avg_progress
         course_progress.completed = course_completed
@@ -165,6 +171,8 @@ def _update_course_progress(db: Session, user_id: int, course_id: int):
         )
         db.add(course_progress)
 
+    if course_completed != was_completed:
+        badge_engine.record(db, "course_completed", {user_id: {"courses_completed": 1 if course_completed else -1}})
     db.commit()
 
     # Also update enrollment progress for consistency
@@ -363,11 +371,10 @@ def get_gamification_data(db: Session = Depends(get_db), current_user: User = De
     """
     Get gamification data including streaks, points, badges
     """
-    # Current streak (placeholder - would need proper streak calculation)
-    current_streak = 5  # Placeholder
-
-    # Longest streak
-    longest_streak = 12  # Placeholder
+    # Current and longest streak from the daily activity bitmap
+    study = study_activity.streaks(db, current_user.id)[ALL_COURSES]
+    current_streak = study["current_streak"]
+    longest_streak = study["longest_streak"]
 
     # Total points (using gyan_coins)
     total_points = current_user.gyan_coins
@@ -402,8 +409,12 @@ def update_streak(learning_activity: bool, db: Session = Depends(get_db), curren
     """
     Update user's learning streak
     """
-    # Placeholder implementation - would need proper streak tracking
-    return {"message": "Streak updated", "current_streak": 5}
+    if learning_activity:
+        study_activity.record(db, current_user.id)
+        badge_engine.record(db, "lesson_studied", {current_user.id: {}})
+        db.commit()
+    study = study_activity.streaks(db, current_user.id)[ALL_COURSES]
+    return {"message": "Streak updated", "current_streak": study["current_streak"], "longest_streak": study["longest_streak"]}
 
 # Additional missing endpoints that frontend expects
 
@@ -554,7 +565,7 @@ def reset_progress(
         })
 
         # Reset gyan coins
-        current_user.gyan_coins = 0
+        coin_ledger.reset(db, current_user, "progress_reset", "All progress reset")
 
         db.commit()
 
@@ -6,6 +6,9 @@ from app.models.quiz import Quiz, Question, QuizAttempt
 from app.models.course import Course
 from app.schemas.quiz import QuizOut as QuizSchema, QuizCreate, QuizUpdate, QuestionOut, QuizAttemptOut, QuizAttemptCreate
 from app.services.deps import get_current_user
+from app.services.badge_engine import badge_engine
+from app.services.coin_ledger import coin_ledger
+from app.services.study_activity import study_activity
 from app.models.user import User
 import json
 
@@ -126,13 +129,15 @@ def submit_quiz_attempt(quiz_id: int, attempt: QuizAttemptCreate, db: Session =
         passed=score >= quiz.passing_score
     )
     db.add(db_attempt)
-    db.commit()
-    db.refresh(db_attempt)
     
     # Award gyan_coins if passed
     if score >= quiz.passing_score:
-        current_user.gyan_coins += 10  # Reward for passing
-        db.commit()
+        coin_ledger.change(db, current_user, 10, "quiz_passed", f"Passed quiz: {quiz.title}")  # Reward for passing
+
+    study_activity.record(db, current_user.id, [quiz.course_id])
+    badge_engine.record(db, "quiz_attempted", {current_user.id: {"quiz_attempts": 1, "quiz_score_total": score}})
+    db.commit()
+    db.refresh(db_attempt)
     
     return db_attempt
 
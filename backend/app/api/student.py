@@ -11,6 +11,8 @@ from app.models.assignment import Assignment, Grade
 from app.models.quiz import Quiz
 from app.models.attendance import Attendance
 from app.services.deps import get_current_user
+from app.services.chat_rooms import room_memberships
+from app.services.study_activity import ALL_COURSES, study_activity
 from pydantic import BaseModel
 from datetime import datetime, timedelta
 
@@ -301,6 +303,7 @@ async def get_progress_report(
     db: Session = Depends(get_db)
 ):
     """Get detailed progress report for student"""
+    study_streak = study_activity.streaks(db, current_user.id)[ALL_COURSES]["current_streak"]
     try:
         # Get all enrollments
         enrollments = db.query(Enrollment).filter(
@@ -340,7 +343,7 @@ async def get_progress_report(
             },
             "course_progress": course_progress,
             "recent_activity": recent_activity,
-            "study_streak": 7,  # Mock data
+            "study_streak": study_streak,
             "total_study_hours": sum([e.hours_completed or 0 for e in enrollments])
         }
 
@@ -355,7 +358,7 @@ async def get_progress_report(
             },
             "course_progress": [],
             "recent_activity": [],
-            "study_streak": 0,
+            "study_streak": study_streak,
             "total_study_hours": 0
         }
 
@@ -516,6 +519,7 @@ async def enroll_in_course(
         db.add(new_enrollment)
         db.commit()
         db.refresh(new_enrollment)
+        room_memberships.invalidate(current_user.id)
         
         return {
             "message": "Successfully enrolled in course",
@@ -667,6 +671,7 @@ def get_student_progress_report(
     try:
         # Get all enrollments for the student
         enrollments = db.query(Enrollment).filter(Enrollment.student_id == student.id).all()
+        streaks = study_activity.streaks(db, student.id, [enrollment.course_id for enrollment in enrollments])
 
         progress_data = []
 
@@ -722,7 +727,7 @@ def get_student_progress_report(
                 "average_lesson_progress": average_lesson_progress,
                 "attendance_rate": attendance_rate,
                 "hours_completed": enrollment.hours_completed,
-                "current_streak": _calculate_study_streak(student.id, course.id, db),
+                "current_streak": streaks[course.id]["current_streak"],
                 "recent_assignments": [
                     {
                         "id": assignment.id,
@@ -763,42 +768,6 @@ def get_student_progress_report(
         raise HTTPException(status_code=500, detail=f"Error generating progress report: {str(e)}")
 
 
-def _calculate_study_streak(student_id: int, course_id: int, db: Session) -> int:
-    """Calculate current study streak for a specific course"""
-    # Get recent progress records for this course
-    recent_progress = db.query(UserProgress).filter(
-        UserProgress.user_id == student_id,
-        UserProgress.course_id == course_id,
-        UserProgress.last_accessed >= datetime.utcnow() - timedelta(days=30)
-    ).order_by(UserProgress.last_accessed.desc()).all()
-
-    if not recent_progress:
-        return 0
-
-    # Group by date and check consecutive days
-    study_dates = set()
-    for progress in recent_progress:
-        if progress.last_accessed:
-            study_dates.add(progress.last_accessed.date())
-
-    # Sort dates and check for consecutive days
-    sorted_dates = sorted(study_dates)
-
-    if not sorted_dates:
-        return 0
-
-    current_streak = 1
-    for i in range(len(sorted_dates) - 1, 0, -1):
-        current_date = sorted_dates[i]
-        previous_date = sorted_dates[i - 1]
-
-        if (current_date - previous_date).days == 1:
-            current_streak += 1
-        else:
-            break
-
-    return current_streak
-
 # Additional missing endpoints that frontend expects
 
 class DoubtRequest(BaseModel):
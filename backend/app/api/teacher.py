@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy import func, select
 from datetime import datetime, timedelta
 from typing import List, Optional
 
@@ -9,6 +9,8 @@ from ..models.user import User
 from ..models.course import Course
 from ..models.enrollment import Enrollment
 from ..models.attendance import Attendance, AttendanceSession
+from ..services import notification_broadcasts as broadcasts
+from ..services.notification_stream import notification_hub
 from .attendance import verify_teacher
 from ..schemas.course import CourseCreate, CourseOut
 
@@ -203,15 +205,26 @@ async def create_announcement(
         if not course:
             raise HTTPException(status_code=404, detail="Course not found or not authorized")
         
-        # Mock announcement creation
+        # Every enrolled student gets it as a notification, inserted in one statement
+        items = broadcasts.create_notifications_for(
+            db,
+            select(Enrollment.student_id).where(Enrollment.course_id == course_id),
+            title,
+            message,
+            "announcement"
+        )
+        db.commit()
+        notification_hub.publish_notifications(items)
+
         announcement = {
-            "id": 1,
+            "id": items[0]["id"] if items else None,
+            "notification_ids": [item["id"] for item in items],
             "course_id": course_id,
             "title": title,
             "message": message,
-            "created_at": datetime.now().isoformat(),
+            "created_at": items[0]["created_at"] if items else datetime.utcnow().isoformat(),
             "created_by": current_user.full_name,
-            "recipients_count": db.query(Enrollment).filter(Enrollment.course_id == course_id).count()
+            "recipients_count": len(items)
         }
         
         return {
@@ -324,13 +337,23 @@ async def grade_assignment(
         
         # Verify student is enrolled
         enrollment = db.query(Enrollment).filter(
-            Enrollment.user_id == student_id,
+            Enrollment.student_id == student_id,
             Enrollment.course_id == course_id
         ).first()
         
         if not enrollment:
             raise HTTPException(status_code=404, detail="Student not enrolled in course")
         
+        items = broadcasts.create_notifications(
+            db,
+            [student_id],
+            "Assignment graded",
+            f"Your assignment in {course.title} was graded: {grade}",
+            "assignment"
+        )
+        db.commit()
+        notification_hub.publish_notifications(items)
+
         # Mock grading
         graded_assignment = {
             "assignment_id": assignment_id,
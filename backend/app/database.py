@@ -14,15 +14,21 @@ if settings.DATABASE_URL.startswith("postgresql"):
         "keepalives_count": 5,
     }
 
+# PostgreSQL connection pool settings (SQLite uses SQLAlchemy's defaults)
+pool_args = {}
+if settings.DATABASE_URL.startswith("postgresql"):
+    pool_args = {
+        "pool_size": 5,
+        "max_overflow": 10,
+        "pool_timeout": 30,
+        "pool_recycle": 1800,
+    }
+
 engine = create_engine(
     settings.DATABASE_URL, 
     pool_pre_ping=True, 
     connect_args=connect_args,
-    # PostgreSQL connection pool settings
-    pool_size=5 if settings.DATABASE_URL.startswith("postgresql") else None,
-    max_overflow=10 if settings.DATABASE_URL.startswith("postgresql") else None,
-    pool_timeout=30 if settings.DATABASE_URL.startswith("postgresql") else None,
-    pool_recycle=1800 if settings.DATABASE_URL.startswith("postgresql") else None,
+    **pool_args,
 )
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
@@ -17,24 +17,34 @@ from .api.ai_tutor import router as ai_tutor_router
 from .api.search import router as search_router
 from .api.personalization import router as personalization_router
 from .utils.errors import custom_http_exception_handler
+from .services.chat_read_state import read_state
+from .services.http_clients import HTTPClientRegistry
+from .services.conversation_memory import conversation_store
+from .services.ai_suggestions import ai_suggestions
+from .services.push_delivery import push_delivery
+from .services.unread_counters import unread_counters
+from .services.notification_stream import notification_hub
+from .services.notification_retention import notification_retention
+from .services.class_reminders import class_reminders
+from .services.leaderboard import leaderboard
 from contextlib import asynccontextmanager
 import asyncio
-import httpx
 from .database import Base, engine
+from .settings import settings
 # Import models to ensure they are registered
-from .models import user, course, enrollment, chat_message, course_video, course_note
+from .models import user, course, enrollment, chat_message, course_video, course_note, content_chunk, ai_suggestion
 from .models.category import Category
-from .models.lesson import Lesson
+from .models.lesson import Lesson, LessonReminder
 from .models.quiz import Quiz
-from .models.progress import UserProgress, UserPreferences
-from .models.gamification import Badge, Streak, DailyChallenge, UserBadge, UserChallenge
+from .models.progress import UserProgress, UserPreferences, UserActivity
+from .models.gamification import Badge, Streak, DailyChallenge, UserBadge, UserChallenge, UserAchievementStats, CoinTransaction
 from .models.download import Download
 from .models.assignment import Assignment, Grade, AssignmentSubmission
-from .models.notification import Notification
+from .models.notification import Notification, BroadcastNotification, NotificationReadState, BroadcastReceipt
 from .models.analytics import Analytics, ParentDashboard
 from .models.attendance import Attendance, AttendanceSession
 
-APP_URL = "https://gyanvruksh.onrender.com"
+APP_URL = settings.APP_URL
 PING_INTERVAL = 5 * 60  # 5 minutes
 
 @asynccontextmanager
@@ -42,21 +52,61 @@ async def lifespan(app: FastAPI):
     # Create DB tables
     Base.metadata.create_all(bind=engine)
 
+    # Pooled outbound HTTP clients shared by every request
+    http_clients = HTTPClientRegistry()
+    app.state.http_clients = http_clients
+
     # Start self-ping loop in background
     async def self_ping():
         await asyncio.sleep(5)  # small delay to let server start fully
         while True:
             try:
-                async with httpx.AsyncClient() as client:
-                    res = await client.get(APP_URL)
+                res = await http_clients.get("self").get("/")
             except Exception as e:
                 pass
             await asyncio.sleep(PING_INTERVAL)
 
     asyncio.create_task(self_ping())
 
+    # Persist chat read watermarks in coalesced batches
+    read_state_flusher = asyncio.create_task(read_state.run_flusher())
+
+    # Rebuild precomputed AI suggestion sets after content changes
+    suggestion_worker = asyncio.create_task(ai_suggestions.run_worker(http_clients))
+
+    # Deliver queued push notifications in rate-limited multicast batches
+    push_worker = asyncio.create_task(push_delivery.run_worker(http_clients))
+
+    # Correct any drift in the incrementally maintained unread counters
+    unread_reconciler = asyncio.create_task(unread_counters.run_reconciler())
+
+    # Push new notifications and unread counts to open notification sockets
+    notification_stream = asyncio.create_task(notification_hub.run())
+
+    # Expire old read notifications and cap per-user history in small batches
+    retention_worker = asyncio.create_task(notification_retention.run_worker())
+
+    # Send class reminders ahead of scheduled lessons
+    reminder_scheduler = asyncio.create_task(class_reminders.run())
+
+    # Load the coin leaderboards and rebuild them periodically
+    leaderboard_rebuilder = asyncio.create_task(leaderboard.run())
+
     yield  # 👈 App runs here
 
+    read_state_flusher.cancel()
+    suggestion_worker.cancel()
+    push_worker.cancel()
+    unread_reconciler.cancel()
+    notification_stream.cancel()
+    retention_worker.cancel()
+    reminder_scheduler.cancel()
+    leaderboard_rebuilder.cancel()
+    read_state.flush()
+    await http_clients.aclose()
+    await conversation_store.aclose()
+    await notification_hub.aclose()
+
 app = FastAPI(title="Gyanvruksh API", version="0.1.0", lifespan=lifespan)
 
 # Add custom exception handler
@@ -102,5 +152,6 @@ app.include_router(ai_tutor_router)
 app.include_router(search_router)
 app.include_router(personalization_router)
 
+@app.get("/healthz")
 def health():
     return {"status": "ok"}
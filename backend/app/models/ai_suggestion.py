@@ -0,0 +1,21 @@
+from sqlalchemy import String, Text, Integer, DateTime, ForeignKey, Index
+from sqlalchemy.orm import Mapped, mapped_column
+from typing import Optional
+from datetime import datetime
+from app.database import Base
+
+class AISuggestionSet(Base):
+    """Precomputed AI learning suggestions for a course, or one of its lessons"""
+    __tablename__ = "ai_suggestion_sets"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    course_id: Mapped[int] = mapped_column(Integer, ForeignKey("courses.id"), nullable=False)
+    lesson_id: Mapped[int] = mapped_column(Integer, default=0, nullable=False)  # 0 for the course-level set
+    course_title: Mapped[str] = mapped_column(String(255), nullable=False)
+    lesson_title: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    suggestions: Mapped[str] = mapped_column(Text, nullable=False)  # JSON list of suggestion objects
+    source: Mapped[str] = mapped_column(String(20), default="llm")  # llm, template
+    generated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_ai_suggestion_sets_course_lesson", "course_id", "lesson_id", unique=True),
+    )
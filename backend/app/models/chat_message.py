@@ -1,4 +1,4 @@
-from sqlalchemy import String, Integer, DateTime, ForeignKey
+from sqlalchemy import String, Integer, DateTime, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from datetime import datetime
 from ..database import Base
@@ -13,3 +13,14 @@ class ChatMessage(Base):
 
     # Relationship to User
     user: Mapped["User"] = relationship("User")
+
+    __table_args__ = (Index("ix_chat_messages_room_id_id", "room_id", "id"),)
+
+class ChatReadState(Base):
+    __tablename__ = "chat_read_states"
+    __table_args__ = (UniqueConstraint("user_id", "room_id", name="uq_chat_read_state_user_room"),)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    room_id: Mapped[str] = mapped_column(String(50), nullable=False)
+    last_read_message_id: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
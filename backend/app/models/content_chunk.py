@@ -0,0 +1,23 @@
+from sqlalchemy import String, Text, Integer, DateTime, ForeignKey, Index
+from sqlalchemy.orm import Mapped, mapped_column
+from datetime import datetime
+from app.database import Base
+
+class ContentChunk(Base):
+    """A passage of lesson or course note text indexed for tutor retrieval"""
+    __tablename__ = "content_chunks"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    course_id: Mapped[int] = mapped_column(Integer, ForeignKey("courses.id"), nullable=False)
+    source_type: Mapped[str] = mapped_column(String(20), nullable=False)  # lesson, note
+    source_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    position: Mapped[int] = mapped_column(Integer, default=0)  # Order within the source
+    title: Mapped[str] = mapped_column(String(255), nullable=False)  # Source title
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    token_count: Mapped[int] = mapped_column(Integer, default=0)
+    term_counts: Mapped[str] = mapped_column(Text, nullable=False)  # JSON object of term -> count
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_content_chunks_course_id", "course_id"),
+        Index("ix_content_chunks_source", "source_type", "source_id"),
+    )
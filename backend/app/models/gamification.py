@@ -1,4 +1,4 @@
-from sqlalchemy import String, Text, ForeignKey, DateTime, Integer, Boolean
+from sqlalchemy import String, Text, ForeignKey, DateTime, Integer, Boolean, Float, Index
 from sqlalchemy.orm import Mapped, mapped_column
 from typing import Optional
 from datetime import datetime
@@ -24,6 +24,32 @@ class UserBadge(Base):
     badge_id: Mapped[int] = mapped_column(ForeignKey("badges.id"))
     earned_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
+class UserAchievementStats(Base):
+    """Per-user aggregates badge criteria are evaluated against, updated as events happen"""
+    __tablename__ = "user_achievement_stats"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), unique=True)
+    courses_completed: Mapped[int] = mapped_column(Integer, default=0)
+    quiz_attempts: Mapped[int] = mapped_column(Integer, default=0)
+    quiz_score_total: Mapped[float] = mapped_column(Float, default=0.0)
+    attendance_total: Mapped[int] = mapped_column(Integer, default=0)
+    attendance_present: Mapped[int] = mapped_column(Integer, default=0)
+    grades_count: Mapped[int] = mapped_column(Integer, default=0)
+    grade_score_total: Mapped[float] = mapped_column(Float, default=0.0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class CoinTransaction(Base):
+    """Append-only record of every gyan coin change; users.gyan_coins is the running balance"""
+    __tablename__ = "coin_transactions"
+    __table_args__ = (Index("ix_coin_transactions_user_id_id", "user_id", "id"),)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    delta: Mapped[int] = mapped_column(Integer)
+    balance_after: Mapped[int] = mapped_column(Integer)
+    reason: Mapped[str] = mapped_column(String(50))  # challenge_completed, badge_earned, reward_claimed, etc.
+    description: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+
 class Streak(Base):
     __tablename__ = "streaks"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
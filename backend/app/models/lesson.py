@@ -1,4 +1,4 @@
-from sqlalchemy import String, Text, ForeignKey, DateTime, Integer, Boolean
+from sqlalchemy import String, Text, ForeignKey, DateTime, Integer, Boolean, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column
 from typing import Optional
 from datetime import datetime
@@ -16,5 +16,16 @@ class Lesson(Base):
     duration_minutes: Mapped[int] = mapped_column(Integer, default=0)
     order_index: Mapped[int] = mapped_column(Integer, default=0)  # Order in course
     is_free: Mapped[bool] = mapped_column(Boolean, default=False)  # Preview lesson
-    scheduled_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)  # When lesson is scheduled
+    scheduled_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True, index=True)  # When lesson is scheduled
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+class LessonReminder(Base):
+    """A class reminder that was sent; the unique key lets one worker claim each reminder"""
+    __tablename__ = "lesson_reminders"
+    __table_args__ = (UniqueConstraint("lesson_id", "offset_minutes", "scheduled_at", name="uq_lesson_reminder"),)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    lesson_id: Mapped[int] = mapped_column(ForeignKey("lessons.id", ondelete="CASCADE"))
+    offset_minutes: Mapped[int] = mapped_column(Integer)
+    scheduled_at: Mapped[datetime] = mapped_column(DateTime)  # lesson time the reminder was for
+    recipients: Mapped[int] = mapped_column(Integer, default=0)
+    sent_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -1,10 +1,15 @@
-from sqlalchemy import String, Text, ForeignKey, DateTime, Integer, Boolean
+from sqlalchemy import String, Text, ForeignKey, DateTime, Integer, Boolean, Index, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
+from typing import Optional
 from datetime import datetime
 from app.database import Base
 
 class Notification(Base):
     __tablename__ = "notifications"
+    __table_args__ = (
+        Index("ix_notifications_user_id_created_at", "user_id", "created_at"),
+        Index("ix_notifications_is_read_created_at", "is_read", "created_at"),  # retention of read notifications
+    )
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     title: Mapped[str] = mapped_column(String(255))
@@ -15,3 +20,37 @@ class Notification(Base):
 
     # Relationships
     user = relationship("User")
+
+class BroadcastNotification(Base):
+    """One row per broadcast; users matching the target see it when they read their notifications"""
+    __tablename__ = "broadcast_notifications"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    created_by: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    title: Mapped[str] = mapped_column(String(255))
+    message: Mapped[str] = mapped_column(Text)
+    notification_type: Mapped[str] = mapped_column(String(50), default="general")
+    target_role: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)  # None targets every role
+    target_sub_role: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
+
+class NotificationReadState(Base):
+    """Per-user watermark: every broadcast up to this id has been read"""
+    __tablename__ = "notification_read_states"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False, unique=True)
+    last_read_broadcast_id: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # Unread counters, kept up to date incrementally; recomputed when reconciled_at is NULL
+    unread_personal: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    read_broadcasts_above: Mapped[int] = mapped_column(Integer, default=0, nullable=False)  # receipts above the watermark
+    counters_reconciled_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class BroadcastReceipt(Base):
+    """A broadcast above the user's watermark that they read one by one, or deleted"""
+    __tablename__ = "broadcast_receipts"
+    __table_args__ = (UniqueConstraint("user_id", "broadcast_id", name="uq_broadcast_receipt_user_broadcast"),)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id"), nullable=False)
+    broadcast_id: Mapped[int] = mapped_column(Integer, ForeignKey("broadcast_notifications.id"), nullable=False)
+    dismissed: Mapped[bool] = mapped_column(Boolean, default=False)  # hidden from the user's list
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
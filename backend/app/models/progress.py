@@ -1,7 +1,7 @@
-from sqlalchemy import String, Text, ForeignKey, DateTime, Integer, Boolean, Float
+from sqlalchemy import String, Text, ForeignKey, DateTime, Date, Integer, Boolean, Float, LargeBinary, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, date
 from app.database import Base
 
 class UserProgress(Base):
@@ -16,6 +16,19 @@ class UserProgress(Base):
     last_accessed: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
+class UserActivity(Base):
+    """One bit per day the user did any learning activity; course_id 0 covers all their courses"""
+    __tablename__ = "user_activity"
+    __table_args__ = (UniqueConstraint("user_id", "course_id", name="uq_user_activity_user_course"),)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    course_id: Mapped[int] = mapped_column(Integer, default=0)
+    first_day: Mapped[date] = mapped_column(Date)  # the day of bit 0
+    days: Mapped[bytes] = mapped_column(LargeBinary, default=b"")  # little-endian bitmap, bit i = first_day + i
+    last_active_on: Mapped[date] = mapped_column(Date)
+    longest_streak: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class UserPreferences(Base):
     __tablename__ = "user_preferences"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
@@ -1,6 +1,12 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from typing import Optional
-from datetime import datetime
+from datetime import datetime, timezone
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Lesson times are stored as naive UTC; aware values are converted, naive ones taken as UTC"""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
 
 class LessonBase(BaseModel):
     title: str
@@ -11,6 +17,12 @@ class LessonBase(BaseModel):
     duration_minutes: int = 0
     order_index: int = 0
     is_free: bool = False
+    scheduled_at: Optional[datetime] = None
+
+    @field_validator('scheduled_at')
+    @classmethod
+    def validate_scheduled_at(cls, v):
+        return naive_utc(v)
 
 class LessonCreate(LessonBase):
     course_id: int
@@ -24,6 +36,12 @@ class LessonUpdate(BaseModel):
     duration_minutes: Optional[int] = None
     order_index: Optional[int] = None
     is_free: Optional[bool] = None
+    scheduled_at: Optional[datetime] = None
+
+    @field_validator('scheduled_at')
+    @classmethod
+    def validate_scheduled_at(cls, v):
+        return naive_utc(v)
 
 class LessonOut(LessonBase):
     id: int
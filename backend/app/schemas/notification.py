@@ -14,6 +14,7 @@ class NotificationRead(NotificationBase):
     user_id: int
     is_read: bool
     created_at: datetime
+    source: str = "personal"  # personal, broadcast (ids are per source)
 
     class Config:
         from_attributes = True
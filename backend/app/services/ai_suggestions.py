@@ -0,0 +1,274 @@
+"""
+Precomputed AI learning suggestions per course and per lesson.
+
+Generating suggestions is an LLM call, far too slow for a page load, so sets
+are built ahead of time: content writes (course creation, lesson and note
+changes) schedule a rebuild, and a background worker started in the app
+lifespan debounces the burst, asks the upstream for suggestions and stores
+them in ``ai_suggestion_sets``. If the upstream fails or answers with
+something unusable, the template suggestions are stored instead.
+
+Serving is one lookup on the unique (course_id, lesson_id) index, fronted by
+an in-process cache that the worker refreshes when it stores a new set.
+"""
+import asyncio
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from ..database import SessionLocal
+from ..models.ai_suggestion import AISuggestionSet
+from ..models.course import Course
+from ..models.lesson import Lesson
+from . import llm
+from .http_clients import HTTPClientRegistry
+from .retrieval import truncate_tokens
+
+DEBOUNCE_SECONDS = 5.0
+CACHE_TTL = 300.0
+SUGGESTION_COUNT = 3
+MATERIAL_TOKEN_BUDGET = 400
+SUGGESTION_TYPES = {"practice", "review", "extension", "project", "quiz"}
+DIFFICULTIES = {"beginner", "intermediate", "advanced"}
+
+SetKey = Tuple[int, int]  # (course_id, lesson_id or 0)
+
+
+def template_suggestions(course_title: str, lesson_title: Optional[str] = None) -> List[Dict]:
+    """Generic suggestions used until (or instead of) generated ones"""
+    subject = lesson_title or course_title
+    return [
+        {
+            "type": "practice",
+            "title": "Practice Exercises",
+            "description": f"Work on additional practice problems for {subject}",
+            "difficulty": "intermediate"
+        },
+        {
+            "type": "review",
+            "title": "Review Session",
+            "description": "Review key concepts from recent lessons",
+            "difficulty": "beginner"
+        },
+        {
+            "type": "extension",
+            "title": "Advanced Topics",
+            "description": "Explore advanced concepts related to this course",
+            "difficulty": "advanced"
+        }
+    ]
+
+
+def parse_suggestions(text: str) -> Optional[List[Dict]]:
+    """Validated suggestions from an upstream answer, or None if it is not usable"""
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end <= start:
+        return None
+    try:
+        items = json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+
+    suggestions = []
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict) or not item.get("title") or not item.get("description"):
+            continue
+        suggestion_type = str(item.get("type", "practice")).lower()
+        difficulty = str(item.get("difficulty", "intermediate")).lower()
+        suggestions.append({
+            "type": suggestion_type if suggestion_type in SUGGESTION_TYPES else "practice",
+            "title": str(item["title"])[:120],
+            "description": str(item["description"])[:500],
+            "difficulty": difficulty if difficulty in DIFFICULTIES else "intermediate",
+        })
+    return suggestions[:SUGGESTION_COUNT] or None
+
+
+class SuggestionService:
+    def __init__(self, session_factory=SessionLocal, debounce: float = DEBOUNCE_SECONDS, cache_ttl: float = CACHE_TTL):
+        self._session_factory = session_factory
+        self.debounce = debounce
+        self.cache_ttl = cache_ttl
+        self._cache: Dict[SetKey, Tuple[Dict, float]] = {}
+        self._pending: Set[SetKey] = set()
+        self._lock = threading.Lock()  # schedule() is called from sync endpoints in the threadpool
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.cache_hits = 0
+        self.reads = 0
+        self.builds = 0
+        self.fallbacks = 0
+
+    # Serving
+
+    def get(self, db, course_id: int, lesson_id: Optional[int] = None) -> Optional[Dict]:
+        key = (course_id, lesson_id or 0)
+        cached = self._cache.get(key)
+        if cached is not None and time.monotonic() - cached[1] < self.cache_ttl:
+            self.cache_hits += 1
+            return cached[0]
+
+        self.reads += 1
+        row = db.query(AISuggestionSet).filter(
+            AISuggestionSet.course_id == key[0],
+            AISuggestionSet.lesson_id == key[1],
+        ).first()
+        if row is None:
+            return None
+        suggestion_set = {
+            "course_title": row.course_title,
+            "lesson_title": row.lesson_title,
+            "suggestions": json.loads(row.suggestions),
+            "source": row.source,
+            "generated_at": row.generated_at.isoformat(),
+        }
+        self._cache[key] = (suggestion_set, time.monotonic())
+        return suggestion_set
+
+    def invalidate_course(self, course_id: int):
+        for key in [key for key in self._cache if key[0] == course_id]:
+            del self._cache[key]
+
+    # Scheduling
+
+    def schedule(self, course_id: int, lesson_id: Optional[int] = None):
+        """Queue a rebuild of the course set (and the lesson's set); safe to call from any thread"""
+        with self._lock:
+            self._pending.add((course_id, 0))
+            if lesson_id:
+                self._pending.add((course_id, lesson_id))
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def run_worker(self, http_clients: HTTPClientRegistry):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        if self._pending:
+            self._wakeup.set()
+        while True:
+            await self._wakeup.wait()
+            # Let a burst of edits settle so each set is rebuilt once
+            await asyncio.sleep(self.debounce)
+            self._wakeup.clear()
+            with self._lock:
+                batch, self._pending = self._pending, set()
+            for course_id, lesson_id in sorted(batch):
+                try:
+                    await self.build(http_clients, course_id, lesson_id)
+                except Exception as e:
+                    print(f"AI suggestion build failed for course {course_id} lesson {lesson_id}: {e}")
+
+    # Building
+
+    async def build(self, http_clients: HTTPClientRegistry, course_id: int, lesson_id: int = 0):
+        context = await asyncio.to_thread(self._load_context, course_id, lesson_id)
+        if context is None:
+            # The course or lesson is gone
+            await asyncio.to_thread(self._delete, course_id, lesson_id)
+            self._cache.pop((course_id, lesson_id), None)
+            return
+
+        suggestions = await self._generate(http_clients, context)
+        source = "llm"
+        if suggestions is None:
+            suggestions, source = template_suggestions(context["course_title"], context["lesson_title"]), "template"
+            self.fallbacks += 1
+        await asyncio.to_thread(self._store, course_id, lesson_id, context, suggestions, source)
+        self._cache.pop((course_id, lesson_id), None)
+        self.builds += 1
+
+    def _load_context(self, course_id: int, lesson_id: int) -> Optional[Dict]:
+        db = self._session_factory()
+        try:
+            course = db.query(Course).filter(Course.id == course_id).first()
+            if not course:
+                return None
+            lesson = None
+            if lesson_id:
+                lesson = db.query(Lesson).filter(Lesson.id == lesson_id, Lesson.course_id == course_id).first()
+                if not lesson:
+                    return None
+            lesson_titles = [
+                row[0] for row in db.query(Lesson.title).filter(
+                    Lesson.course_id == course_id
+                ).order_by(Lesson.order_index, Lesson.id).limit(30).all()
+            ]
+            return {
+                "course_title": course.title,
+                "course_description": course.description,
+                "lesson_title": lesson.title if lesson else None,
+                "lesson_text": (lesson.content_text or lesson.description) if lesson else None,
+                "lesson_titles": lesson_titles,
+            }
+        finally:
+            db.close()
+
+    async def _generate(self, http_clients: HTTPClientRegistry, context: Dict) -> Optional[List[Dict]]:
+        material = [f"Course: {context['course_title']}", truncate_tokens(context["course_description"], 120)]
+        if context["lesson_titles"]:
+            material.append("Lessons: " + "; ".join(context["lesson_titles"]))
+        if context["lesson_title"]:
+            material.append(f"Current lesson: {context['lesson_title']}")
+            material.append(truncate_tokens(context["lesson_text"], MATERIAL_TOKEN_BUDGET))
+
+        messages = [
+            {
+                "role": "system",
+                "content": f"""You suggest next learning activities for students on Gyanvruksh.
+                Answer only with a JSON array of {SUGGESTION_COUNT} objects with keys
+                "type" (practice, review, extension, project or quiz), "title", "description"
+                and "difficulty" (beginner, intermediate or advanced)."""
+            },
+            {"role": "user", "content": "\n".join(part for part in material if part)},
+        ]
+        try:
+            answer = await llm.complete(http_clients.get("openai"), messages, max_tokens=400, temperature=0.4)
+        except Exception as e:
+            print(f"AI suggestion generation failed: {e}")
+            return None
+        return parse_suggestions(answer)
+
+    def _store(self, course_id: int, lesson_id: int, context: Dict, suggestions: List[Dict], source: str):
+        db = self._session_factory()
+        try:
+            row = db.query(AISuggestionSet).filter(
+                AISuggestionSet.course_id == course_id,
+                AISuggestionSet.lesson_id == lesson_id,
+            ).first()
+            if row is None:
+                row = AISuggestionSet(course_id=course_id, lesson_id=lesson_id)
+                db.add(row)
+            row.course_title = context["course_title"]
+            row.lesson_title = context["lesson_title"]
+            row.suggestions = json.dumps(suggestions)
+            row.source = source
+            row.generated_at = datetime.utcnow()
+            db.commit()
+        finally:
+            db.close()
+
+    def _delete(self, course_id: int, lesson_id: int):
+        db = self._session_factory()
+        try:
+            query = db.query(AISuggestionSet).filter(AISuggestionSet.course_id == course_id)
+            if lesson_id:
+                query = query.filter(AISuggestionSet.lesson_id == lesson_id)
+            query.delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def stats(self) -> Dict:
+        return {
+            "cached_sets": len(self._cache),
+            "pending_builds": len(self._pending),
+            "cache_hits": self.cache_hits,
+            "reads": self.reads,
+            "builds": self.builds,
+            "template_fallbacks": self.fallbacks,
+        }
+
+
+ai_suggestions = SuggestionService()
@@ -0,0 +1,207 @@
+"""
+Event-driven badge awards.
+
+Badge checks used to re-run every criterion on every call: counting
+completed courses, loading all of the user's attendance rows and grades, and
+looking up each badge and award one by one. Endpoints now report domain
+events to the engine, inside their own transaction:
+
+- the event's counter deltas are applied to the users' row in
+  ``user_achievement_stats`` (a row is materialized from the tables the first
+  time a user is seen, after which only deltas touch it);
+- only the active badges whose ``criteria_type`` depends on the event are
+  evaluated, against those counters; study streaks are read from the
+  ``study_activity`` bitmaps, so every caller of ``study_activity.record``
+  reports one event covering ``daily_streak``: ``lesson_studied``, or its
+  own event if that covers it. A second event in the same transaction would
+  find counters materialized with the first event's rows already in them, and
+  add its deltas on top;
+- new ``UserBadge`` rows and their coin rewards are written in the same
+  transaction, with one query for the users' existing awards.
+
+Badges are data: ``criteria_type`` names the aggregate and ``criteria_value``
+the threshold, so badges added through the admin seed endpoint need no code.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import case, func, update
+from sqlalchemy.exc import IntegrityError
+
+from ..models.assignment import Grade
+from ..models.attendance import Attendance
+from ..models.gamification import Badge, UserAchievementStats, UserBadge
+from ..models.progress import UserProgress
+from ..models.quiz import QuizAttempt
+from ..models.user import User
+from .coin_ledger import coin_ledger
+from .study_activity import study_activity
+
+# Event -> badge criteria types it can satisfy
+EVENT_CRITERIA = {
+    "lesson_studied": {"daily_streak"},
+    "course_completed": {"courses_completed"},
+    "quiz_attempted": {"quiz_average", "daily_streak"},  # attempts also mark the day studied
+    "attendance_marked": {"attendance_rate"},
+    "grade_posted": {"assignment_average"},
+}
+ALL_CRITERIA = set().union(*EVENT_CRITERIA.values())
+
+COUNTERS = {
+    "courses_completed",
+    "quiz_attempts",
+    "quiz_score_total",
+    "attendance_total",
+    "attendance_present",
+    "grades_count",
+    "grade_score_total",
+}
+
+
+def _average(total: float, count: int) -> float:
+    return total / count if count else 0.0
+
+
+def criterion_met(stats: UserAchievementStats, criteria_type: str, value: int, study_streak: int = 0) -> bool:
+    if criteria_type == "courses_completed":
+        return stats.courses_completed >= value
+    if criteria_type == "daily_streak":
+        return study_streak >= value
+    if criteria_type == "attendance_rate":
+        return stats.attendance_total > 0 and stats.attendance_present * 100 >= value * stats.attendance_total
+    if criteria_type == "quiz_average":
+        return stats.quiz_attempts > 0 and _average(stats.quiz_score_total, stats.quiz_attempts) >= value
+    if criteria_type == "assignment_average":
+        return stats.grades_count > 0 and _average(stats.grade_score_total, stats.grades_count) >= value
+    return False
+
+
+class BadgeEngine:
+    def __init__(self):
+        self.events = 0
+        self.evaluations = 0
+        self.awarded = 0
+        self.materialized = 0
+
+    # Events
+
+    def record(self, db, event: str, deltas: Dict[int, Dict[str, float]]) -> Dict[int, List[Badge]]:
+        """Apply an event's counter deltas per user and award the badges it unlocks; caller commits"""
+        if event not in EVENT_CRITERIA:
+            raise ValueError(f"Unknown badge event: {event}")
+        if not deltas:
+            return {}
+        self.events += 1
+        db.flush()  # so first-time materialization counts the event's own rows
+
+        # Users with counters get the deltas; the others are counted from the tables below
+        by_delta: Dict[tuple, List[int]] = {}
+        for user_id, delta in deltas.items():
+            key = tuple(sorted((name, amount) for name, amount in delta.items() if name in COUNTERS and amount))
+            by_delta.setdefault(key, []).append(user_id)
+        for key, user_ids in by_delta.items():
+            values = {name: getattr(UserAchievementStats, name) + amount for name, amount in key}
+            if values:
+                db.execute(update(UserAchievementStats).where(
+                    UserAchievementStats.user_id.in_(user_ids)
+                ).values(**values).execution_options(synchronize_session=False))
+
+        return self.evaluate(db, list(deltas), EVENT_CRITERIA[event])
+
+    # Evaluation
+
+    def evaluate(self, db, user_ids: Iterable[int], criteria_types: Optional[Iterable[str]] = None) -> Dict[int, List[Badge]]:
+        """Award the users every unearned active badge of the given criteria types they now meet"""
+        user_ids = list(user_ids)
+        criteria_types = set(criteria_types or ALL_CRITERIA)
+        badges = db.query(Badge).filter(Badge.is_active == True, Badge.criteria_type.in_(criteria_types)).all()
+        if not badges or not user_ids:
+            return {}
+        stats = self.stats_for(db, user_ids)
+        earned = set(db.query(UserBadge.user_id, UserBadge.badge_id).filter(
+            UserBadge.user_id.in_(user_ids),
+            UserBadge.badge_id.in_([badge.id for badge in badges])
+        ).all())
+        self.evaluations += len(user_ids) * len(badges)
+        streaks = {}
+        if any(badge.criteria_type == "daily_streak" for badge in badges):
+            streaks = study_activity.current_streaks(db, user_ids, datetime.utcnow().date())
+
+        awarded: Dict[int, List[Badge]] = {}
+        for user_id in user_ids:
+            for badge in badges:
+                met = criterion_met(stats[user_id], badge.criteria_type, badge.criteria_value, streaks.get(user_id, 0))
+                if (user_id, badge.id) not in earned and met:
+                    awarded.setdefault(user_id, []).append(badge)
+        if not awarded:
+            return {}
+
+        db.add_all(UserBadge(user_id=user_id, badge_id=badge.id) for user_id, user_badges in awarded.items() for badge in user_badges)
+        for user_id, user_badges in awarded.items():
+            reward = sum(badge.gyan_coins_reward for badge in user_badges)
+            if reward:
+                coin_ledger.change(
+                    db, db.get(User, user_id), reward, "badge_earned",
+                    "Earned badge: " + ", ".join(badge.name for badge in user_badges)
+                )
+        self.awarded += sum(len(user_badges) for user_badges in awarded.values())
+        return awarded
+
+    def stats_for(self, db, user_ids: List[int]) -> Dict[int, UserAchievementStats]:
+        rows = {
+            row.user_id: row
+            # populate_existing: counters were just updated in SQL, bypassing loaded objects
+            for row in db.query(UserAchievementStats).filter(
+                UserAchievementStats.user_id.in_(user_ids)
+            ).populate_existing().all()
+        }
+        for user_id in user_ids:
+            if user_id not in rows:
+                rows[user_id] = self._materialize(db, user_id)
+        return rows
+
+    def _materialize(self, db, user_id: int, stats: Optional[UserAchievementStats] = None) -> UserAchievementStats:
+        """Count a user's aggregates from the tables"""
+        self.materialized += 1
+        if stats is None:
+            stats = UserAchievementStats(user_id=user_id)
+            try:
+                # Savepoint: losing the race must not roll back the caller's transaction
+                with db.begin_nested():
+                    db.add(stats)
+            except IntegrityError:
+                # Another request materialized the row first; recount into theirs
+                stats = db.query(UserAchievementStats).filter(UserAchievementStats.user_id == user_id).one()
+        stats.courses_completed = db.query(func.count(UserProgress.id)).filter(
+            UserProgress.user_id == user_id,
+            UserProgress.completed == True,
+            UserProgress.lesson_id.is_(None)
+        ).scalar()
+        stats.quiz_attempts, stats.quiz_score_total = db.query(
+            func.count(QuizAttempt.id), func.coalesce(func.sum(QuizAttempt.score), 0)
+        ).filter(QuizAttempt.user_id == user_id).one()
+        stats.attendance_total, stats.attendance_present = db.query(
+            func.count(Attendance.id), func.coalesce(func.sum(case((Attendance.is_present == True, 1), else_=0)), 0)
+        ).filter(Attendance.student_id == user_id).one()
+        stats.grades_count, stats.grade_score_total = db.query(
+            func.count(Grade.id), func.coalesce(func.sum(Grade.score), 0)
+        ).filter(Grade.student_id == user_id).one()
+        db.flush()
+        return stats
+
+    def recheck(self, db, user_id: int) -> List[Badge]:
+        """Recount the user's aggregates from the tables and award anything they meet; caller commits"""
+        stats = db.query(UserAchievementStats).filter(UserAchievementStats.user_id == user_id).first()
+        self._materialize(db, user_id, stats)
+        return self.evaluate(db, [user_id]).get(user_id, [])
+
+    def stats(self) -> Dict:
+        return {
+            "events": self.events,
+            "criteria_evaluations": self.evaluations,
+            "badges_awarded": self.awarded,
+            "counters_materialized": self.materialized,
+        }
+
+
+badge_engine = BadgeEngine()
@@ -0,0 +1,130 @@
+"""
+Per-room presence and typing aggregation for the chat WebSocket.
+
+Typing events are folded into per-room state and emitted as snapshot frames,
+at most once per ``min_interval`` seconds per room, instead of being re-sent
+to every member for every keystroke.
+"""
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Typing state is dropped if the client never sends is_typing=false
+TYPING_TTL = 6.0
+# Two snapshot frames per second per room at most
+SNAPSHOT_INTERVAL = 0.5
+
+
+class PresenceTracker:
+    def __init__(
+        self,
+        broadcast: Callable[[Dict, str], Awaitable[None]],
+        online_members: Callable[[str], List[Dict]],
+        min_interval: float = SNAPSHOT_INTERVAL,
+        typing_ttl: float = TYPING_TTL,
+    ):
+        self._broadcast = broadcast  # (frame, room_id) -> None
+        self._online_members = online_members  # room_id -> [{"user_id", "full_name"}]
+        self.min_interval = min_interval
+        self.typing_ttl = typing_ttl
+        self._typing: Dict[str, Dict[int, float]] = {}  # room_id -> user_id -> expires_at
+        self._last_emit: Dict[str, float] = {}  # room_id -> monotonic time of last snapshot
+        self._pending: Dict[str, Tuple[asyncio.Task, float]] = {}  # room_id -> scheduled flush, due time
+        self.snapshots_sent = 0
+        self.events_coalesced = 0
+
+    def set_typing(self, room_id: str, user_id: int, is_typing: bool):
+        """Record a typing event and schedule a room snapshot"""
+        room = self._typing.setdefault(room_id, {})
+        if is_typing:
+            room[user_id] = time.monotonic() + self.typing_ttl
+        else:
+            room.pop(user_id, None)
+        self.mark_dirty(room_id)
+
+    def clear_user(self, room_id: str, user_id: int):
+        """Forget typing state for a user leaving the room"""
+        room = self._typing.get(room_id)
+        if room:
+            room.pop(user_id, None)
+        self.mark_dirty(room_id)
+
+    def mark_dirty(self, room_id: str):
+        """Schedule a snapshot for the room, coalescing with one already pending"""
+        due = time.monotonic()
+        last = self._last_emit.get(room_id)
+        if last is not None:
+            due = max(due, last + self.min_interval)
+
+        pending = self._pending.get(room_id)
+        if pending is not None:
+            task, pending_due = pending
+            if pending_due <= due:
+                self.events_coalesced += 1
+                return
+            # Only a later expiry snapshot is pending; the change goes out at the throttled time instead
+            task.cancel()
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._schedule(loop, room_id, due)
+
+    def _schedule(self, loop: asyncio.AbstractEventLoop, room_id: str, due: float):
+        self._pending[room_id] = (loop.create_task(self._flush_later(room_id, due)), due)
+
+    def typing_users(self, room_id: str) -> List[int]:
+        """User ids currently typing in the room, dropping expired entries"""
+        room = self._typing.get(room_id)
+        if not room:
+            return []
+        now = time.monotonic()
+        for user_id in [uid for uid, expires_at in room.items() if expires_at <= now]:
+            del room[user_id]
+        if not room:
+            self._typing.pop(room_id, None)
+        return sorted(room)
+
+    def snapshot(self, room_id: str) -> Dict:
+        """Current presence state of a room"""
+        online = self._online_members(room_id)
+        typing_ids = set(self.typing_users(room_id))
+        return {
+            "type": "presence",
+            "room_id": room_id,
+            "online": online,
+            "online_count": len(online),
+            "typing": [member for member in online if member["user_id"] in typing_ids],
+        }
+
+    async def _flush_later(self, room_id: str, due: float):
+        delay = due - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)  # if cancelled, its replacement is already registered
+        self._pending.pop(room_id, None)
+
+        self._last_emit[room_id] = time.monotonic()
+        snapshot = self.snapshot(room_id)
+        self.snapshots_sent += 1
+        await self._broadcast(snapshot, room_id)
+
+        # Emit one more snapshot once the remaining typing entries expire
+        next_expiry = self._next_expiry(room_id)
+        if next_expiry is not None and room_id not in self._pending:
+            due = max(time.monotonic() + self.min_interval, next_expiry)
+            self._schedule(asyncio.get_running_loop(), room_id, due)
+
+    def _next_expiry(self, room_id: str) -> Optional[float]:
+        room = self._typing.get(room_id)
+        if not room:
+            return None
+        return min(room.values())
+
+    def stats(self) -> Dict:
+        return {
+            "rooms_tracked": len(self._typing),
+            "pending_flushes": len(self._pending),
+            "snapshots_sent": self.snapshots_sent,
+            "events_coalesced": self.events_coalesced,
+        }
@@ -0,0 +1,149 @@
+"""
+Wire codecs for the chat WebSocket.
+
+Frames are built once as plain dicts and encoded per protocol. JSON text frames
+stay the default; clients that offer the ``gyanvruksh.chat.v2+msgpack``
+subprotocol (or pass ``?protocol=msgpack``) get compact msgpack binary frames:
+short keys, integer millisecond timestamps, no repeated room_id, and sender
+names sent once per session in a ``names`` frame instead of on every message.
+
+Compression is negotiated by the server, not here: uvicorn's ``websockets``
+implementation offers permessage-deflate by default (``uvicorn app.main:app
+--ws websockets``; ``--ws-per-message-deflate false`` turns it off).
+"""
+import json
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Union
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; without it every client speaks JSON
+    msgpack = None
+
+SUBPROTOCOL_MSGPACK = "gyanvruksh.chat.v2+msgpack"
+
+# Long field names -> compact msgpack keys
+_COMPACT_KEYS = {
+    "type": "t",
+    "user_id": "u",
+    "message": "m",
+    "timestamp": "ts",
+    "message_id": "id",
+    "is_typing": "ty",
+}
+_EXPANDED_KEYS = {short: long for long, short in _COMPACT_KEYS.items()}
+
+Payload = Union[str, bytes]
+
+
+def _epoch_ms(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class JSONCodec:
+    """Protocol v1: verbose JSON text frames"""
+    protocol = "json"
+    subprotocol: Optional[str] = None
+
+    def encode(self, frame: Dict, cache: Dict[str, Payload]) -> List[Payload]:
+        if self.protocol not in cache:
+            cache[self.protocol] = json.dumps(frame, default=_json_default)
+        return [cache[self.protocol]]
+
+    def decode(self, data: Payload) -> Dict:
+        return _frame(json.loads(data))
+
+
+class MsgpackCodec:
+    """Protocol v2: msgpack binary frames with a per-session sender-name dictionary"""
+    protocol = "msgpack"
+    subprotocol = SUBPROTOCOL_MSGPACK
+
+    def __init__(self):
+        self._known_names: Dict[int, str] = {}
+
+    def encode(self, frame: Dict, cache: Dict[str, Payload]) -> List[Payload]:
+        payloads: List[Payload] = []
+        unknown = {
+            user_id: name
+            for user_id, name in _names_in(frame).items()
+            if self._known_names.get(user_id) != name
+        }
+        if unknown:
+            self._known_names.update(unknown)
+            payloads.append(msgpack.packb({"t": "names", "n": unknown}))
+
+        if self.protocol not in cache:
+            cache[self.protocol] = msgpack.packb(_compact(frame))
+        payloads.append(cache[self.protocol])
+        return payloads
+
+    def decode(self, data: Payload) -> Dict:
+        if isinstance(data, str):
+            return _frame(json.loads(data))
+        raw = _frame(msgpack.unpackb(data))
+        return {_EXPANDED_KEYS.get(key, key): value for key, value in raw.items()}
+
+
+def _frame(value) -> Dict:
+    """Client frames are maps; anything else is rejected like undecodable data"""
+    if not isinstance(value, dict):
+        raise ValueError(f"Chat frame must be a map, not {type(value).__name__}")
+    return value
+
+
+def _names_in(frame: Dict) -> Dict[int, str]:
+    """Sender names referenced by a frame"""
+    if frame.get("type") == "presence":
+        return {member["user_id"]: member["full_name"] for member in frame.get("online", [])}
+    if "user_id" in frame and "full_name" in frame:
+        return {frame["user_id"]: frame["full_name"]}
+    return {}
+
+
+def _compact(frame: Dict) -> Dict:
+    if frame.get("type") == "presence":
+        return {
+            "t": "presence",
+            "on": [member["user_id"] for member in frame.get("online", [])],
+            "ty": [member["user_id"] for member in frame.get("typing", [])],
+        }
+
+    compact = {}
+    for key, value in frame.items():
+        # Room is implied by the connection and names come from the dictionary
+        if key in ("room_id", "full_name"):
+            continue
+        if isinstance(value, datetime):
+            value = _epoch_ms(value)
+        compact[_COMPACT_KEYS.get(key, key)] = value
+    return compact
+
+
+def negotiate(websocket: WebSocket):
+    """Pick a codec from the offered subprotocols or the ``protocol`` query param"""
+    if msgpack is not None:
+        offered = websocket.scope.get("subprotocols") or []
+        if SUBPROTOCOL_MSGPACK in offered or websocket.query_params.get("protocol") == "msgpack":
+            return MsgpackCodec()
+    return JSONCodec()
+
+
+async def receive_frame(websocket: WebSocket, codec) -> Dict:
+    """Receive one text or binary frame and decode it with the session codec"""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+    if message.get("bytes") is not None:
+        return codec.decode(message["bytes"])
+    return codec.decode(message.get("text") or "{}")
@@ -0,0 +1,170 @@
+"""
+Per-user read watermarks and unread counts for chat rooms.
+
+Watermarks (the last message id a user has read in a room) live in memory and
+are written to ``chat_read_states`` in coalesced batches by a background flush,
+so acknowledging a message never touches the database on the request path.
+Unread counts come from the watermark and a small per-room index of recent
+message ids; counts beyond the index size are reported as capped.
+"""
+import asyncio
+from bisect import bisect_right
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+from ..database import SessionLocal
+from ..models.chat_message import ChatMessage, ChatReadState
+
+# Recent message ids kept per room; unread counts above this are capped
+ROOM_INDEX_SIZE = 200
+FLUSH_INTERVAL = 5.0
+
+
+class ReadStateStore:
+    def __init__(self, session_factory=SessionLocal, index_size: int = ROOM_INDEX_SIZE):
+        self._session_factory = session_factory
+        self.index_size = index_size
+        self._room_ids: Dict[str, Deque[int]] = {}  # room_id -> recent message ids, ascending
+        self._watermarks: Dict[int, Dict[str, int]] = {}  # user_id -> room_id -> last read id
+        self._pending: Dict[Tuple[int, str], int] = {}  # dirty watermarks awaiting flush
+        self.acks = 0
+        self.flushes = 0
+        self.rows_written = 0
+
+    # Room message index
+
+    def record_message(self, room_id: str, message_id: int):
+        """Track a newly stored message in the room's recent-id index"""
+        ids = self._room_index(room_id)
+        if not ids or message_id > ids[-1]:
+            ids.append(message_id)
+
+    def latest_message_id(self, room_id: str) -> int:
+        ids = self._room_index(room_id)
+        return ids[-1] if ids else 0
+
+    def room_of(self, message_id: int) -> Optional[str]:
+        """Resolve a message's room from the cached indexes, if it is recent"""
+        for room_id, ids in self._room_ids.items():
+            position = bisect_right(ids, message_id)
+            if position and ids[position - 1] == message_id:
+                return room_id
+        return None
+
+    def _room_index(self, room_id: str) -> Deque[int]:
+        ids = self._room_ids.get(room_id)
+        if ids is None:
+            db = self._session_factory()
+            try:
+                rows = db.query(ChatMessage.id).filter(
+                    ChatMessage.room_id == room_id
+                ).order_by(ChatMessage.id.desc()).limit(self.index_size).all()
+            finally:
+                db.close()
+            ids = deque(sorted(row[0] for row in rows), maxlen=self.index_size)
+            self._room_ids[room_id] = ids
+        return ids
+
+    # Watermarks
+
+    def mark_read(self, user_id: int, room_id: str, message_id: int) -> int:
+        """Advance a user's watermark; it never moves backwards"""
+        watermarks = self._user_watermarks(user_id)
+        current = watermarks.get(room_id, 0)
+        if message_id > current:
+            watermarks[room_id] = message_id
+            self._pending[(user_id, room_id)] = message_id
+            current = message_id
+        self.acks += 1
+        return current
+
+    def last_read(self, user_id: int, room_id: str) -> int:
+        return self._user_watermarks(user_id).get(room_id, 0)
+
+    def unread(self, user_id: int, room_id: str) -> Dict:
+        ids = self._room_index(room_id)
+        last_read = self.last_read(user_id, room_id)
+        count = len(ids) - bisect_right(ids, last_read)
+        # The watermark predates the index window, so there may be more
+        capped = bool(ids) and len(ids) == self.index_size and last_read < ids[0]
+        return {
+            "room_id": room_id,
+            "last_message_id": ids[-1] if ids else 0,
+            "last_read_message_id": last_read,
+            "unread_count": count,
+            "unread_capped": capped,
+        }
+
+    def unread_for_rooms(self, user_id: int, room_ids: Iterable[str]) -> List[Dict]:
+        return [self.unread(user_id, room_id) for room_id in room_ids]
+
+    def _user_watermarks(self, user_id: int) -> Dict[str, int]:
+        watermarks = self._watermarks.get(user_id)
+        if watermarks is None:
+            db = self._session_factory()
+            try:
+                rows = db.query(ChatReadState.room_id, ChatReadState.last_read_message_id).filter(
+                    ChatReadState.user_id == user_id
+                ).all()
+            finally:
+                db.close()
+            watermarks = {room_id: last_read for room_id, last_read in rows}
+            self._watermarks[user_id] = watermarks
+        return watermarks
+
+    # Coalesced persistence
+
+    def flush(self) -> int:
+        """Write all dirty watermarks in one transaction"""
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        db = self._session_factory()
+        try:
+            user_ids = {user_id for user_id, _ in pending}
+            existing = {
+                (row.user_id, row.room_id): row
+                for row in db.query(ChatReadState).filter(ChatReadState.user_id.in_(user_ids)).all()
+            }
+            for (user_id, room_id), message_id in pending.items():
+                row = existing.get((user_id, room_id))
+                if row is None:
+                    db.add(ChatReadState(user_id=user_id, room_id=room_id, last_read_message_id=message_id))
+                elif message_id > row.last_read_message_id:
+                    row.last_read_message_id = message_id
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Keep the newer of the failed and any freshly acknowledged values for the next flush
+            for key, message_id in pending.items():
+                if message_id > self._pending.get(key, 0):
+                    self._pending[key] = message_id
+            raise
+        finally:
+            db.close()
+
+        self.flushes += 1
+        self.rows_written += len(pending)
+        return len(pending)
+
+    async def run_flusher(self, interval: float = FLUSH_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception as e:
+                print(f"Chat read state flush failed: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "rooms_indexed": len(self._room_ids),
+            "users_cached": len(self._watermarks),
+            "pending_writes": len(self._pending),
+            "acks": self.acks,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+        }
+
+
+read_state = ReadStateStore()
@@ -0,0 +1,173 @@
+"""
+Chat room catalogue and per-user membership cache.
+
+Besides the public rooms every user can join, each course has a room
+``course-{course_id}`` open to its enrolled students, its teacher and admins.
+Memberships and the identity needed to authorize a WebSocket handshake are
+cached per user, so connecting does not query the database. Enrollment,
+teacher-assignment and admin role/activation endpoints invalidate the affected
+users; a TTL bounds staleness across worker processes. The WebSocket handshake
+loads misses in a worker thread, off the event loop.
+"""
+import asyncio
+import time
+from typing import Dict, List, Optional
+
+from ..database import SessionLocal
+from ..models.course import Course
+from ..models.enrollment import Enrollment
+from ..models.user import User
+
+PUBLIC_ROOMS = [
+    {"id": "general", "name": "General", "description": "General discussion"},
+    {"id": "help", "name": "Help & Support", "description": "Get help from teachers and admins"},
+    {"id": "announcements", "name": "Announcements", "description": "Important announcements"},
+]
+PUBLIC_ROOM_IDS = {room["id"] for room in PUBLIC_ROOMS}
+COURSE_ROOM_PREFIX = "course-"
+MEMBERSHIP_TTL = 60.0
+
+
+def course_room_id(course_id: int) -> str:
+    return f"{COURSE_ROOM_PREFIX}{course_id}"
+
+
+def course_id_from_room(room_id: str) -> Optional[int]:
+    if not room_id.startswith(COURSE_ROOM_PREFIX):
+        return None
+    try:
+        return int(room_id[len(COURSE_ROOM_PREFIX):])
+    except ValueError:
+        return None
+
+
+class ChatIdentity:
+    def __init__(
+        self,
+        user_id: int,
+        email: str,
+        full_name: str,
+        role: Optional[str],
+        is_active: bool,
+        course_rooms: Dict[int, str],
+    ):
+        self.user_id = user_id
+        self.email = email
+        self.full_name = full_name
+        self.role = role
+        self.is_active = is_active
+        self.course_rooms = course_rooms  # course_id -> course title
+        self.loaded_at = time.monotonic()
+
+    @property
+    def is_admin(self) -> bool:
+        return self.role == "admin"
+
+
+class RoomMembershipCache:
+    def __init__(self, session_factory=SessionLocal, ttl: float = MEMBERSHIP_TTL):
+        self._session_factory = session_factory
+        self.ttl = ttl
+        self._by_email: Dict[str, ChatIdentity] = {}
+        self._email_by_user: Dict[int, str] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self, email: str) -> Optional[ChatIdentity]:
+        cached = self._by_email.get(email)
+        if cached is not None and time.monotonic() - cached.loaded_at < self.ttl:
+            return cached
+        return None
+
+    def identity(self, email: str) -> Optional[ChatIdentity]:
+        """Cached identity and course memberships for a token subject"""
+        cached = self._fresh(email)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        identity = self._load(email)
+        if identity is None:
+            self._by_email.pop(email, None)
+            return None
+        self._by_email[email] = identity
+        self._email_by_user[identity.user_id] = email
+        return identity
+
+    async def identity_async(self, email: str) -> Optional[ChatIdentity]:
+        """``identity`` for async handlers: hits are served inline, misses query in a worker thread"""
+        cached = self._fresh(email)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        return await asyncio.to_thread(self.identity, email)
+
+    def _load(self, email: str) -> Optional[ChatIdentity]:
+        db = self._session_factory()
+        try:
+            user = db.query(User.id, User.full_name, User.role, User.is_active).filter(
+                User.email == email
+            ).first()
+            if not user:
+                return None
+
+            enrolled = db.query(Course.id, Course.title).join(
+                Enrollment, Enrollment.course_id == Course.id
+            ).filter(Enrollment.student_id == user.id)
+            taught = db.query(Course.id, Course.title).filter(Course.teacher_id == user.id)
+            course_rooms = {course_id: title for course_id, title in enrolled.union(taught).all()}
+        finally:
+            db.close()
+
+        return ChatIdentity(
+            user_id=user.id,
+            email=email,
+            full_name=user.full_name,
+            role=user.role,
+            is_active=user.is_active is not False,
+            course_rooms=course_rooms,
+        )
+
+    def can_join(self, identity: ChatIdentity, room_id: str) -> bool:
+        if room_id in PUBLIC_ROOM_IDS:
+            return True
+        course_id = course_id_from_room(room_id)
+        if course_id is None:
+            return False
+        return identity.is_admin or course_id in identity.course_rooms
+
+    def rooms(self, identity: ChatIdentity) -> List[Dict]:
+        course_rooms = [
+            {
+                "id": course_room_id(course_id),
+                "name": title,
+                "description": f"Discussion for {title}",
+                "course_id": course_id,
+            }
+            for course_id, title in sorted(identity.course_rooms.items())
+        ]
+        return PUBLIC_ROOMS + course_rooms
+
+    def invalidate(self, *user_ids: Optional[int]):
+        """Drop cached memberships, e.g. after enrolling, reassigning a teacher or deactivating a user"""
+        for user_id in user_ids:
+            if user_id is None:
+                continue
+            email = self._email_by_user.pop(user_id, None)
+            if email is not None:
+                self._by_email.pop(email, None)
+
+    def invalidate_course(self, course_id: int):
+        """Drop every cached user who belongs to a course room"""
+        affected = [
+            identity.user_id for identity in self._by_email.values()
+            if course_id in identity.course_rooms
+        ]
+        self.invalidate(*affected)
+
+    def stats(self) -> Dict:
+        return {"cached_users": len(self._by_email), "hits": self.hits, "misses": self.misses}
+
+
+room_memberships = RoomMembershipCache()
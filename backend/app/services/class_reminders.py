@@ -0,0 +1,229 @@
+"""
+Class reminders for scheduled lessons.
+
+Enrolled students get a ``class_reminder`` notification (and a push) at each
+of ``CLASS_REMINDER_OFFSETS_MINUTES`` before a lesson's ``scheduled_at``. A
+scheduler started in the app lifespan keeps the pending reminders in a
+min-heap keyed by fire time and sleeps until the earliest one:
+
+- lessons starting within ``LOOKAHEAD`` are loaded at startup, and the window
+  is extended as time passes, one indexed range query on ``scheduled_at``;
+- creating, rescheduling or deleting a lesson updates the scheduler in place;
+  superseded heap entries are dropped lazily when they come up;
+- firing re-reads the lesson (another worker may have rescheduled it), claims
+  the reminder with a unique ``lesson_reminders`` row so only one worker
+  sends it, and creates every recipient's notification with one
+  ``INSERT .. SELECT`` over the course's enrollments.
+
+Reminders that came due while no worker was running are still sent if they
+are less than ``LATE_GRACE`` overdue and the lesson has not started.
+"""
+import asyncio
+import heapq
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from ..database import SessionLocal
+from ..models.enrollment import Enrollment
+from ..models.lesson import Lesson, LessonReminder
+from ..settings import settings
+from . import notification_broadcasts as broadcasts
+from .notification_stream import notification_hub
+from .push_delivery import push_delivery
+
+LOOKAHEAD = timedelta(days=2)
+REFRESH_INTERVAL = 60 * 60
+LATE_GRACE = timedelta(minutes=10)
+
+Reminder = Tuple[datetime, int, int, datetime]  # fire_at, lesson_id, offset_minutes, scheduled_at
+
+
+def describe_offset(minutes: int) -> str:
+    if minutes % (24 * 60) == 0:
+        days = minutes // (24 * 60)
+        return f"{days} day{'s' if days != 1 else ''}"
+    if minutes % 60 == 0:
+        hours = minutes // 60
+        return f"{hours} hour{'s' if hours != 1 else ''}"
+    return f"{minutes} minute{'s' if minutes != 1 else ''}"
+
+
+class ClassReminderScheduler:
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        offsets_minutes: Optional[List[int]] = None,
+        lookahead: timedelta = LOOKAHEAD,
+    ):
+        self._session_factory = session_factory
+        self.offsets = sorted(set(offsets_minutes or settings.CLASS_REMINDER_OFFSETS_MINUTES), reverse=True)
+        self.lookahead = lookahead
+        self._heap: List[Reminder] = []
+        self._scheduled: Dict[int, datetime] = {}  # lesson_id -> scheduled_at the heap entries must match
+        self._loaded_until: Optional[datetime] = None
+        self._lock = threading.Lock()  # schedule() is called from sync endpoints in the threadpool
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.loaded = 0
+        self.fired = 0
+        self.skipped = 0
+        self.notified = 0
+
+    # Keeping the heap in step with lessons
+
+    def schedule(self, lesson_id: int, scheduled_at: Optional[datetime], now: Optional[datetime] = None):
+        """Lesson created or rescheduled (None clears it); safe from any thread"""
+        now = now or datetime.utcnow()
+        with self._lock:
+            if scheduled_at is None or scheduled_at <= now:
+                self._scheduled.pop(lesson_id, None)
+            elif self._scheduled.get(lesson_id) != scheduled_at:
+                self._scheduled[lesson_id] = scheduled_at
+                for offset in self.offsets:
+                    fire_at = scheduled_at - timedelta(minutes=offset)
+                    if fire_at > now - LATE_GRACE:
+                        heapq.heappush(self._heap, (fire_at, lesson_id, offset, scheduled_at))
+        self._wake()
+
+    def cancel(self, lesson_id: int):
+        """Lesson deleted; its heap entries are discarded when they come up"""
+        with self._lock:
+            self._scheduled.pop(lesson_id, None)
+
+    def _wake(self):
+        if self._loop is not None and not self._loop.is_closed() and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def load_window(self, now: Optional[datetime] = None):
+        """Schedule lessons starting up to ``lookahead`` from now that are not loaded yet"""
+        now = now or datetime.utcnow()
+        until = now + self.lookahead
+        since = max(now, self._loaded_until) if self._loaded_until else now
+        db = self._session_factory()
+        try:
+            rows = db.query(Lesson.id, Lesson.scheduled_at).filter(
+                Lesson.scheduled_at > since,
+                Lesson.scheduled_at <= until
+            ).all()
+        finally:
+            db.close()
+        for lesson_id, scheduled_at in rows:
+            self.schedule(lesson_id, scheduled_at, now)
+        self._loaded_until = until
+        self.loaded += len(rows)
+
+    def due(self, now: Optional[datetime] = None) -> List[Reminder]:
+        """Pop the reminders whose time has come, skipping superseded ones"""
+        now = now or datetime.utcnow()
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                reminder = heapq.heappop(self._heap)
+                if self._scheduled.get(reminder[1]) == reminder[3]:
+                    due.append(reminder)
+        return due
+
+    def next_fire_at(self) -> Optional[datetime]:
+        with self._lock:
+            return self._heap[0][0] if self._heap else None
+
+    # Firing
+
+    def fire(self, reminder: Reminder, now: Optional[datetime] = None) -> int:
+        """Send one reminder; returns how many students were notified"""
+        _, lesson_id, offset, scheduled_at = reminder
+        db = self._session_factory()
+        try:
+            lesson = db.query(Lesson.id, Lesson.course_id, Lesson.title, Lesson.scheduled_at).filter(
+                Lesson.id == lesson_id
+            ).first()
+            if lesson is None or lesson.scheduled_at != scheduled_at:
+                # Deleted or rescheduled elsewhere: follow the lesson as stored
+                self.skipped += 1
+                if lesson is None:
+                    self.cancel(lesson_id)
+                else:
+                    self.schedule(lesson_id, lesson.scheduled_at)
+                return 0
+
+            claim = LessonReminder(lesson_id=lesson_id, offset_minutes=offset, scheduled_at=scheduled_at)
+            db.add(claim)
+            try:
+                db.flush()
+            except IntegrityError:
+                db.rollback()  # another worker already sent it
+                self.skipped += 1
+                return 0
+
+            # A late reminder says how long is actually left, not its nominal offset
+            remaining = round((scheduled_at - (now or datetime.utcnow())).total_seconds() / 60)
+            title = f"Class reminder: {lesson.title}"
+            message = f"{lesson.title} starts in {describe_offset(max(remaining, 1))}, at {scheduled_at:%Y-%m-%d %H:%M} UTC"
+            items = broadcasts.create_notifications_for(
+                db,
+                select(Enrollment.student_id).where(Enrollment.course_id == lesson.course_id),
+                title,
+                message,
+                "class_reminder"
+            )
+            claim.recipients = len(items)
+            db.commit()
+        finally:
+            db.close()
+
+        notification_hub.publish_notifications(items)
+        if items:
+            push_delivery.enqueue(
+                title, message, {"lesson_id": str(lesson_id), "type": "class_reminder"},
+                user_ids=[item["user_id"] for item in items]
+            )
+        self.fired += 1
+        self.notified += len(items)
+        return len(items)
+
+    async def run(self, refresh_interval: float = REFRESH_INTERVAL):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        next_refresh = datetime.utcnow()
+        while True:
+            self._wakeup.clear()
+            try:
+                if datetime.utcnow() >= next_refresh:
+                    await asyncio.to_thread(self.load_window)
+                    next_refresh = datetime.utcnow() + timedelta(seconds=refresh_interval)
+                for reminder in self.due():
+                    await asyncio.to_thread(self.fire, reminder)
+            except Exception as e:
+                print(f"Class reminder failed: {e}")
+
+            next_fire_at = self.next_fire_at()
+            wake_at = min(next_fire_at, next_refresh) if next_fire_at else next_refresh
+            timeout = max((wake_at - datetime.utcnow()).total_seconds(), 0.0)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict:
+        next_fire_at = self.next_fire_at()
+        with self._lock:
+            pending = len(self._heap)
+            lessons = len(self._scheduled)
+        return {
+            "offsets_minutes": self.offsets,
+            "scheduled_lessons": lessons,
+            "pending_reminders": pending,
+            "next_fire_at": next_fire_at.isoformat() if next_fire_at else None,
+            "loaded_until": self._loaded_until.isoformat() if self._loaded_until else None,
+            "lessons_loaded": self.loaded,
+            "fired": self.fired,
+            "skipped": self.skipped,
+            "students_notified": self.notified,
+        }
+
+
+class_reminders = ClassReminderScheduler()
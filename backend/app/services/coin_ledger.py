@@ -0,0 +1,149 @@
+"""
+Gyan coin ledger.
+
+Coins used to be changed by read-modify-write on ``user.gyan_coins``, so two
+concurrent requests could both read the old balance and one change was lost,
+and two spends could both pass the balance check. Every change now goes
+through ``coin_ledger.change`` inside the caller's transaction:
+
+- the balance moves with one ``UPDATE users SET gyan_coins = gyan_coins + :delta``;
+  for spends the statement only matches while the balance covers them, so a
+  spend that does not fit raises ``InsufficientCoins`` and changes nothing;
+- the new balance is read back from the same statement, and an append-only
+  ``coin_transactions`` row records the change, its reason and the balance
+  after it;
+- ``coin_ledger.reset`` zeroes a balance with an ``UPDATE`` that only matches
+  while the balance is still the one it read, retrying if a concurrent
+  change got in between, and records the whole old balance as spent;
+- the leaderboards are updated once the transaction commits, so a
+  rolled-back change never reaches them.
+
+Point history is served from the ledger with one query on its
+``(user_id, id)`` index, paged by id.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, func, update
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+
+from ..models.gamification import CoinTransaction
+from ..models.user import User
+from .leaderboard import leaderboard
+
+PENDING_KEY = "coin_ledger.pending"  # Session.info entry of changes awaiting commit
+
+
+class InsufficientCoins(Exception):
+    def __init__(self, balance: int, cost: int):
+        super().__init__(f"Balance {balance} does not cover {cost} coins")
+        self.balance = balance
+        self.cost = cost
+
+
+def transaction_item(transaction: CoinTransaction) -> Dict:
+    return {
+        "id": transaction.id,
+        "type": transaction.reason,
+        "description": transaction.description,
+        "points": transaction.delta,
+        "balance_after": transaction.balance_after,
+        "earned_at": transaction.created_at.isoformat() if transaction.created_at else None,
+    }
+
+
+class CoinLedger:
+    def __init__(self):
+        self.changes = 0
+        self.rejected = 0
+        self.published = 0
+
+    def change(self, db, user: User, delta: int, reason: str, description: Optional[str] = None) -> CoinTransaction:
+        """Add ``delta`` coins (negative to spend) to the user's balance and record it; caller commits"""
+        statement = update(User).where(User.id == user.id)
+        if delta < 0:
+            statement = statement.where(User.gyan_coins >= -delta)
+        balance = db.execute(
+            statement.values(gyan_coins=User.gyan_coins + delta).returning(User.gyan_coins).execution_options(
+                synchronize_session=False
+            )
+        ).scalar()
+        if balance is None:
+            self.rejected += 1
+            current = db.query(User.gyan_coins).filter(User.id == user.id).scalar()
+            raise InsufficientCoins(current or 0, -delta)
+        # The loaded user shows the balance as stored, not its possibly stale value plus delta
+        set_committed_value(user, "gyan_coins", balance)
+        return self._record(db, user, delta, balance, reason, description)
+
+    def reset(self, db, user: User, reason: str, description: Optional[str] = None) -> Optional[CoinTransaction]:
+        """Set the user's balance to zero and record it; None if it already was. Caller commits"""
+        while True:
+            old = db.query(User.gyan_coins).filter(User.id == user.id).scalar()
+            if not old:
+                set_committed_value(user, "gyan_coins", old)
+                return None
+            # Compare-and-set: matches only while no other change moved the balance since it was read
+            zeroed = db.execute(
+                update(User).where(User.id == user.id, User.gyan_coins == old).values(gyan_coins=0).returning(
+                    User.id
+                ).execution_options(synchronize_session=False)
+            ).scalar()
+            if zeroed is not None:
+                break
+        set_committed_value(user, "gyan_coins", 0)
+        return self._record(db, user, -old, 0, reason, description)
+
+    def _record(self, db, user: User, delta: int, balance: int, reason: str, description: Optional[str]) -> CoinTransaction:
+        transaction = CoinTransaction(
+            user_id=user.id,
+            delta=delta,
+            balance_after=balance,
+            reason=reason,
+            description=description[:255] if description else None,
+            created_at=datetime.utcnow()
+        )
+        db.add(transaction)
+        db.info.setdefault(PENDING_KEY, []).append((user.id, user.sub_role, delta, transaction.created_at))
+        self.changes += 1
+        return transaction
+
+    def history(self, db, user_id: int, limit: int = 20, before_id: Optional[int] = None) -> List[CoinTransaction]:
+        """The user's transactions, newest first, older than ``before_id``"""
+        query = db.query(CoinTransaction).filter(CoinTransaction.user_id == user_id)
+        if before_id is not None:
+            query = query.filter(CoinTransaction.id < before_id)
+        return query.order_by(CoinTransaction.id.desc()).limit(limit).all()
+
+    def total_earned(self, db, user_id: int) -> int:
+        return db.query(func.coalesce(func.sum(CoinTransaction.delta), 0)).filter(
+            CoinTransaction.user_id == user_id,
+            CoinTransaction.delta > 0
+        ).scalar()
+
+    def _publish(self, session):
+        for user_id, sub_role, delta, at in session.info.pop(PENDING_KEY, ()):
+            leaderboard.record(user_id, sub_role, delta, at)
+            self.published += 1
+
+    def stats(self) -> Dict:
+        return {
+            "changes": self.changes,
+            "rejected_spends": self.rejected,
+            "published_to_leaderboard": self.published,
+        }
+
+
+coin_ledger = CoinLedger()
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed_changes(session):
+    if PENDING_KEY in session.info:
+        coin_ledger._publish(session)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back_changes(session):
+    session.info.pop(PENDING_KEY, None)
@@ -0,0 +1,235 @@
+"""
+Conversation memory for AI chat.
+
+Recent turns are kept per (user, conversation_id) in an in-process LRU so a
+follow-up question is answered with its context, without the student pasting
+it again. Before each upstream call the history is fitted to a token budget:
+the newest turns are sent (each truncated), and older turns are reduced to
+one-line notes in a running summary. Conversations idle for longer than the
+TTL are evicted.
+
+When ``REDIS_URL`` is set and the ``redis`` package is installed,
+conversations are also written to Redis with the idle TTL as expiry, so any
+worker can continue a conversation and memory survives restarts. Every load
+then reads the Redis copy, so turns recorded by another worker are never
+hidden behind a stale local one; the in-process copy is only served when Redis
+has none (e.g. a failed write) or errors.
+"""
+import json
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from app.settings import settings
+from .retrieval import estimate_tokens, truncate_tokens
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+MAX_CONVERSATIONS = 5000
+IDLE_TTL = 30 * 60
+MAX_TURNS = 12  # older turns are folded into the summary
+HISTORY_TOKEN_BUDGET = 800
+TURN_TOKEN_LIMIT = 300
+SUMMARY_TOKEN_BUDGET = 200
+NOTE_TOKENS = 30
+REDIS_KEY_PREFIX = "ai:conversation:"
+
+ConversationKey = Tuple[int, str]
+
+_SPEAKERS = {"user": "Student", "assistant": "Tutor"}
+
+
+class Turn:
+    def __init__(self, role: str, content: str):
+        self.role = role
+        self.content = content
+        self.tokens = estimate_tokens(content)
+
+    def note(self) -> str:
+        return f"{_SPEAKERS.get(self.role, self.role)}: {truncate_tokens(' '.join(self.content.split()), NOTE_TOKENS)}"
+
+
+class Conversation:
+    def __init__(self, key: ConversationKey, turns: Optional[List[Turn]] = None, summary: Optional[List[str]] = None):
+        self.key = key
+        self.turns: Deque[Turn] = deque(turns or [])
+        self.summary: List[str] = summary or []  # one note per folded turn, oldest first
+        self.last_active = time.monotonic()
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "turns": [[turn.role, turn.content] for turn in self.turns],
+            "summary": self.summary,
+        })
+
+    @classmethod
+    def from_json(cls, key: ConversationKey, raw: str) -> "Conversation":
+        data = json.loads(raw)
+        return cls(key, [Turn(role, content) for role, content in data.get("turns", [])], data.get("summary", []))
+
+
+def _fit_notes(notes: List[str], budget: int) -> List[str]:
+    """Newest notes that fit the budget, in chronological order"""
+    kept: List[str] = []
+    used = 0
+    for note in reversed(notes):
+        used += estimate_tokens(note)
+        if used > budget:
+            break
+        kept.append(note)
+    return list(reversed(kept))
+
+
+class ConversationStore:
+    def __init__(
+        self,
+        max_conversations: int = MAX_CONVERSATIONS,
+        idle_ttl: float = IDLE_TTL,
+        redis_url: Optional[str] = None,
+    ):
+        self.max_conversations = max_conversations
+        self.idle_ttl = idle_ttl
+        self.redis_url = redis_url
+        self._redis = None
+        self._conversations: "OrderedDict[ConversationKey, Conversation]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.backend_loads = 0
+        self.backend_errors = 0
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+
+    @property
+    def backend(self) -> str:
+        return "redis" if self.redis_url and aioredis is not None else "memory"
+
+    def _client(self):
+        if self._redis is None and self.backend == "redis":
+            self._redis = aioredis.from_url(self.redis_url, decode_responses=True)
+        return self._redis
+
+    @staticmethod
+    def _redis_key(key: ConversationKey) -> str:
+        return f"{REDIS_KEY_PREFIX}{key[0]}:{key[1]}"
+
+    async def load(self, user_id: int, conversation_id: str) -> Conversation:
+        """The user's conversation, or a new empty one; ids are scoped per user"""
+        self.evict_idle()
+        key = (user_id, conversation_id)
+        stored = await self._load_backend(key)
+        if stored is not None:
+            self._remember(stored)
+            return stored
+
+        conversation = self._conversations.get(key)
+        if conversation is not None:
+            self.hits += 1
+            self._conversations.move_to_end(key)
+            conversation.last_active = time.monotonic()
+            return conversation
+
+        self.misses += 1
+        conversation = Conversation(key)
+        self._remember(conversation)
+        return conversation
+
+    async def record_exchange(self, conversation: Conversation, message: str, answer: str):
+        """Append a question and its answer, folding the oldest turns into the summary"""
+        conversation.turns.append(Turn("user", message))
+        conversation.turns.append(Turn("assistant", answer))
+        while len(conversation.turns) > MAX_TURNS:
+            conversation.summary.append(conversation.turns.popleft().note())
+        conversation.summary = _fit_notes(conversation.summary, SUMMARY_TOKEN_BUDGET)
+        conversation.last_active = time.monotonic()
+        await self._save_backend(conversation)
+
+    def prompt_history(self, conversation: Conversation, token_budget: int = HISTORY_TOKEN_BUDGET) -> List[Dict]:
+        """Messages to send before the new question, within the token budget"""
+        recent: List[Dict] = []
+        used = 0
+        older: List[str] = []
+        for turn in reversed(conversation.turns):
+            content = truncate_tokens(turn.content, TURN_TOKEN_LIMIT)
+            tokens = estimate_tokens(content)
+            if older or used + tokens > token_budget:
+                older.append(turn.note())
+                continue
+            recent.append({"role": turn.role, "content": content})
+            used += tokens
+        recent.reverse()
+
+        notes = _fit_notes(conversation.summary + list(reversed(older)), SUMMARY_TOKEN_BUDGET)
+        if not notes:
+            return recent
+        summary = "Earlier in this conversation:\n" + "\n".join(f"- {note}" for note in notes)
+        return [{"role": "system", "content": summary}] + recent
+
+    def forget(self, user_id: int, conversation_id: str):
+        self._conversations.pop((user_id, conversation_id), None)
+
+    def evict_idle(self):
+        """Drop conversations idle past the TTL; the LRU order keeps the oldest first"""
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._conversations:
+            key, conversation = next(iter(self._conversations.items()))
+            if conversation.last_active > cutoff:
+                break
+            del self._conversations[key]
+            self.evicted_idle += 1
+
+    def _remember(self, conversation: Conversation):
+        self._conversations.pop(conversation.key, None)
+        self._conversations[conversation.key] = conversation
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+            self.evicted_lru += 1
+
+    async def _load_backend(self, key: ConversationKey) -> Optional[Conversation]:
+        client = self._client()
+        if client is None:
+            return None
+        try:
+            raw = await client.get(self._redis_key(key))
+        except Exception as e:
+            self.backend_errors += 1
+            print(f"Conversation store read failed: {e}")
+            return None
+        if raw is None:
+            return None
+        self.backend_loads += 1
+        return Conversation.from_json(key, raw)
+
+    async def _save_backend(self, conversation: Conversation):
+        client = self._client()
+        if client is None:
+            return
+        try:
+            await client.set(self._redis_key(conversation.key), conversation.to_json(), ex=int(self.idle_ttl))
+        except Exception as e:
+            self.backend_errors += 1
+            print(f"Conversation store write failed: {e}")
+
+    async def aclose(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.backend,
+            "conversations": len(self._conversations),
+            "max_conversations": self.max_conversations,
+            "idle_ttl_seconds": self.idle_ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "backend_loads": self.backend_loads,
+            "backend_errors": self.backend_errors,
+            "evicted_idle": self.evicted_idle,
+            "evicted_lru": self.evicted_lru,
+        }
+
+
+conversation_store = ConversationStore(redis_url=settings.REDIS_URL or None)
@@ -1,9 +1,10 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.services.security import decode_token
 from app.models.user import User
+from app.services.http_clients import HTTPClientRegistry
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
@@ -15,3 +16,11 @@ def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found")
     return user
+
+def get_http_clients(request: Request) -> HTTPClientRegistry:
+    """Shared outbound HTTP clients created in the app lifespan"""
+    registry = getattr(request.app.state, "http_clients", None)
+    if registry is None:
+        registry = HTTPClientRegistry()
+        request.app.state.http_clients = registry
+    return registry
@@ -0,0 +1,148 @@
+"""
+App-scoped pooled HTTP clients for outbound calls.
+
+One ``httpx.AsyncClient`` per upstream is created in the app lifespan and
+shared by every request, so calls reuse keep-alive connections instead of
+paying TCP and TLS setup each time. Each upstream has its own connection
+limits and timeouts, negotiates HTTP/2 when the ``h2`` package is installed,
+and records request counts and latency for the admin metrics endpoint.
+"""
+import importlib.util
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from app.settings import settings
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class UpstreamConfig:
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float,
+        max_connections: int,
+        max_keepalive_connections: int,
+        connect_timeout: float = 5.0,
+        keepalive_expiry: float = 30.0,
+    ):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+
+
+def default_upstreams() -> Dict[str, UpstreamConfig]:
+    return {
+        "openai": UpstreamConfig(settings.OPENAI_BASE_URL, timeout=30.0, max_connections=20, max_keepalive_connections=10),
+        "fcm": UpstreamConfig(settings.FCM_BASE_URL, timeout=10.0, max_connections=50, max_keepalive_connections=20),
+        "self": UpstreamConfig(settings.APP_URL, timeout=10.0, max_connections=2, max_keepalive_connections=1),
+    }
+
+
+class UpstreamMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.status_counts: Dict[str, int] = {}
+
+    def as_dict(self) -> Dict:
+        completed = self.requests - self.in_flight
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "avg_ms": round(self.total_seconds / completed * 1000, 2) if completed else None,
+            "max_ms": round(self.max_seconds * 1000, 2),
+            "status_counts": dict(self.status_counts),
+        }
+
+
+class MeteredTransport(httpx.AsyncBaseTransport):
+    """Wraps the pooled transport to count requests, errors and latency"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, metrics: UpstreamMetrics):
+        self._transport = transport
+        self.metrics = metrics
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.metrics.requests += 1
+        self.metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except Exception:
+            self.metrics.errors += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.metrics.in_flight -= 1
+            self.metrics.total_seconds += elapsed
+            self.metrics.max_seconds = max(self.metrics.max_seconds, elapsed)
+
+        bucket = f"{response.status_code // 100}xx"
+        self.metrics.status_counts[bucket] = self.metrics.status_counts.get(bucket, 0) + 1
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class HTTPClientRegistry:
+    def __init__(self, upstreams: Optional[Dict[str, UpstreamConfig]] = None):
+        self.upstreams = upstreams or default_upstreams()
+        self.metrics: Dict[str, UpstreamMetrics] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def get(self, upstream: str) -> httpx.AsyncClient:
+        """Shared client for an upstream, created on first use"""
+        client = self._clients.get(upstream)
+        if client is None or client.is_closed:
+            client = self._create(upstream)
+            self._clients[upstream] = client
+        return client
+
+    def _create(self, upstream: str) -> httpx.AsyncClient:
+        config = self.upstreams[upstream]
+        limits = httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry,
+        )
+        metrics = self.metrics.setdefault(upstream, UpstreamMetrics())
+        transport = MeteredTransport(
+            httpx.AsyncHTTPTransport(http2=HTTP2_AVAILABLE, limits=limits, retries=1),
+            metrics,
+        )
+        return httpx.AsyncClient(
+            base_url=config.base_url,
+            timeout=httpx.Timeout(config.timeout, connect=config.connect_timeout),
+            transport=transport,
+        )
+
+    async def aclose(self):
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients.clear()
+
+    def stats(self) -> Dict:
+        return {
+            "http2": HTTP2_AVAILABLE,
+            "upstreams": {
+                name: {
+                    "base_url": config.base_url,
+                    "timeout": config.timeout,
+                    "max_connections": config.max_connections,
+                    "open": name in self._clients,
+                    **self.metrics.get(name, UpstreamMetrics()).as_dict(),
+                }
+                for name, config in self.upstreams.items()
+            },
+        }
@@ -0,0 +1,605 @@
+"""
+Gyan coin leaderboards kept in sorted sets.
+
+Leaderboards used to sort every student by ``gyan_coins`` on each request,
+ignored the weekly/monthly timeframe, and counted badges one query per row.
+Scores now live in sorted sets, updated as coin changes commit:
+
+- ``all_time``: each student's coin balance, loaded from ``users``;
+- ``weekly`` / ``monthly``: coins earned in the current ISO week / calendar
+  month, summed from ``coin_transactions``, one set per period expiring a
+  day after the period ends;
+- course and category boards are derived on first read by intersecting a
+  window's set with the scope's enrolled students, kept for ``SCOPE_TTL``
+  (empty ones included), and follow the window's set as coins change,
+  taking in scope members who had no score when the board was derived.
+
+The boards are loaded at startup and rebuilt periodically, which corrects any
+drift. Ranks, a page of the board and the neighbours around a student are
+logarithmic lookups. Without Redis the sets are in-process indexable
+skiplists; when ``REDIS_URL`` is set and the ``redis`` package is installed
+they are Redis sorted sets shared by every worker.
+"""
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func
+
+from ..database import SessionLocal
+from ..models.category import Category
+from ..models.course import Course
+from ..models.enrollment import Enrollment
+from ..models.gamification import CoinTransaction
+from ..models.user import User
+from ..settings import settings
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+WINDOWS = ("all_time", "monthly", "weekly")
+GLOBAL_SCOPE = "global"
+SCOPE_TTL = 60
+REBUILD_INTERVAL = 10 * 60
+KEY_PREFIX = "leaderboard:"
+OPENING_BALANCE = "opening_balance"  # ledger reason of balances held before the ledger existed
+
+# KEYS: the source, then (board, members, built marker) per derived board; ARGV: delta, member, ttl.
+# Sets every derived board whose scope holds the member to the source's new score; returns expired boards.
+INCR_SCRIPT = """
+local score = redis.call('ZINCRBY', KEYS[1], ARGV[1], ARGV[2])
+if tonumber(ARGV[3]) > 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+local expired = {}
+for i = 2, #KEYS, 3 do
+    local left = redis.call('PTTL', KEYS[i + 2])
+    if left < 0 then
+        table.insert(expired, KEYS[i])
+    elseif redis.call('SISMEMBER', KEYS[i + 1], ARGV[2]) == 1 then
+        redis.call('ZADD', KEYS[i], score, ARGV[2])
+        redis.call('PEXPIRE', KEYS[i], left)
+    end
+end
+return expired
+"""
+
+_MAX_LEVEL = 32
+_P = 0.25
+
+Entry = Tuple[int, float]  # member, score
+
+
+class _Node:
+    __slots__ = ("key", "forward", "span")
+
+    def __init__(self, key, level: int):
+        self.key = key
+        self.forward: List[Optional["_Node"]] = [None] * level
+        self.span: List[int] = [0] * level
+
+
+class SkipList:
+    """Indexable skiplist: each link records how many nodes it skips, so rank and nth are O(log n)"""
+
+    def __init__(self):
+        self._head = _Node(None, _MAX_LEVEL)
+        self._level = 1
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _random_level(self) -> int:
+        level = 1
+        while level < _MAX_LEVEL and random.random() < _P:
+            level += 1
+        return level
+
+    def insert(self, key):
+        update: List[_Node] = [self._head] * _MAX_LEVEL
+        rank = [0] * _MAX_LEVEL
+        node = self._head
+        for i in reversed(range(self._level)):
+            rank[i] = 0 if i == self._level - 1 else rank[i + 1]
+            while node.forward[i] is not None and node.forward[i].key < key:
+                rank[i] += node.span[i]
+                node = node.forward[i]
+            update[i] = node
+
+        level = self._random_level()
+        if level > self._level:
+            for i in range(self._level, level):
+                rank[i] = 0
+                update[i] = self._head
+                self._head.span[i] = self._length
+            self._level = level
+
+        new = _Node(key, level)
+        for i in range(level):
+            new.forward[i] = update[i].forward[i]
+            update[i].forward[i] = new
+            new.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+        for i in range(level, self._level):
+            update[i].span[i] += 1
+        self._length += 1
+
+    def remove(self, key) -> bool:
+        update: List[_Node] = [self._head] * _MAX_LEVEL
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.forward[i] is not None and node.forward[i].key < key:
+                node = node.forward[i]
+            update[i] = node
+        node = node.forward[0]
+        if node is None or node.key != key:
+            return False
+        for i in range(self._level):
+            if update[i].forward[i] is node:
+                update[i].span[i] += node.span[i] - 1
+                update[i].forward[i] = node.forward[i]
+            else:
+                update[i].span[i] -= 1
+        while self._level > 1 and self._head.forward[self._level - 1] is None:
+            self._level -= 1
+        self._length -= 1
+        return True
+
+    def rank(self, key) -> Optional[int]:
+        """0-based position of the key, or None"""
+        traversed = 0
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.forward[i] is not None and node.forward[i].key <= key:
+                traversed += node.span[i]
+                node = node.forward[i]
+            if node is not self._head and node.key == key:
+                return traversed - 1
+        return None
+
+    def slice(self, start: int, stop: int) -> List:
+        """Keys at positions [start, stop)"""
+        start = max(start, 0)
+        stop = min(stop, self._length)
+        if start >= stop:
+            return []
+        traversed = 0
+        node = self._head
+        for i in reversed(range(self._level)):
+            while node.forward[i] is not None and traversed + node.span[i] <= start + 1:
+                traversed += node.span[i]
+                node = node.forward[i]
+        keys = []
+        while node is not None and len(keys) < stop - start:
+            keys.append(node.key)
+            node = node.forward[0]
+        return keys
+
+
+class SortedSet:
+    """Members ordered by score, highest first; ties go to the lower member"""
+
+    def __init__(self):
+        self._scores: Dict[int, float] = {}
+        self._list = SkipList()
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def __contains__(self, member: int) -> bool:
+        return member in self._scores
+
+    def score(self, member: int) -> Optional[float]:
+        return self._scores.get(member)
+
+    def add(self, member: int, score: float):
+        old = self._scores.get(member)
+        if old == score:
+            return
+        if old is not None:
+            self._list.remove((-old, member))
+        self._scores[member] = score
+        self._list.insert((-score, member))
+
+    def incr(self, member: int, delta: float) -> float:
+        score = self._scores.get(member, 0) + delta
+        self.add(member, score)
+        return score
+
+    def remove(self, member: int):
+        old = self._scores.pop(member, None)
+        if old is not None:
+            self._list.remove((-old, member))
+
+    def rank(self, member: int) -> Optional[int]:
+        score = self._scores.get(member)
+        return None if score is None else self._list.rank((-score, member))
+
+    def range(self, start: int, stop: int) -> List[Entry]:
+        return [(member, -negated) for negated, member in self._list.slice(start, stop)]
+
+
+class MemoryBoards:
+    """Sorted sets by key in this process, with expiry and derived (scoped) sets"""
+
+    def __init__(self):
+        self._sets: Dict[str, SortedSet] = {}
+        self._expires: Dict[str, float] = {}
+        self._derived: Dict[str, set] = {}  # source key -> keys derived from it
+        self._scopes: Dict[str, set] = {}  # derived key -> members of its scope
+        self._lock = threading.Lock()  # sync endpoints run in the threadpool
+
+    def _get(self, key: str) -> Optional[SortedSet]:
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.time():
+            self._drop(key)
+        return self._sets.get(key)
+
+    def _drop(self, key: str):
+        self._sets.pop(key, None)
+        self._expires.pop(key, None)
+        self._scopes.pop(key, None)
+        for derived in self._derived.pop(key, ()):
+            self._drop(derived)
+
+    def replace(self, key: str, scores: Dict[int, float], ttl: Optional[float] = None):
+        board = SortedSet()
+        for member, score in scores.items():
+            board.add(member, score)
+        with self._lock:
+            self._drop(key)
+            self._sets[key] = board
+            if ttl:
+                self._expires[key] = time.time() + ttl
+
+    def incr(self, key: str, member: int, delta: float, ttl: Optional[float] = None):
+        with self._lock:
+            board = self._get(key)
+            if board is None:
+                board = self._sets[key] = SortedSet()
+                if ttl:
+                    self._expires[key] = time.time() + ttl
+            score = board.incr(member, delta)
+            for derived in list(self._derived.get(key, ())):
+                scoped = self._get(derived)
+                if scoped is None:
+                    self._derived[key].discard(derived)
+                elif member in self._scopes[derived]:
+                    scoped.add(member, score)
+
+    def derive(self, dest: str, source: str, members: Iterable[int], ttl: float):
+        with self._lock:
+            board = self._get(source) or SortedSet()
+            scoped = SortedSet()
+            members = set(members)
+            for member in members:
+                score = board.score(member)
+                if score is not None:
+                    scoped.add(member, score)
+            self._sets[dest] = scoped
+            self._expires[dest] = time.time() + ttl
+            self._scopes[dest] = members
+            self._derived.setdefault(source, set()).add(dest)
+
+    def derived(self, dest: str) -> bool:
+        """Whether the derived board is built and has not expired"""
+        with self._lock:
+            return self._get(dest) is not None
+
+    def rank(self, key: str, member: int) -> Tuple[Optional[int], Optional[float]]:
+        with self._lock:
+            board = self._get(key)
+            if board is None:
+                return None, None
+            return board.rank(member), board.score(member)
+
+    def range(self, key: str, start: int, stop: int) -> List[Entry]:
+        with self._lock:
+            board = self._get(key)
+            return board.range(start, stop) if board is not None else []
+
+    def size(self, key: str) -> int:
+        with self._lock:
+            board = self._get(key)
+            return len(board) if board is not None else 0
+
+    def sweep(self):
+        with self._lock:
+            for key in [key for key, expires in self._expires.items() if expires <= time.time()]:
+                self._drop(key)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {"sets": len(self._sets), "members": sum(len(board) for board in self._sets.values())}
+
+
+class RedisBoards:
+    """
+    The same operations on Redis sorted sets. Derived keys are listed in a set
+    per source; each keeps its scope's members in ``<key>:members`` and a
+    ``<key>:built`` marker, so an empty board is not rebuilt on every read.
+    """
+
+    def __init__(self, url: str):
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._incr = self._redis.register_script(INCR_SCRIPT)
+
+    def replace(self, key: str, scores: Dict[int, float], ttl: Optional[float] = None):
+        staging = f"{key}:staging"
+        pipe = self._redis.pipeline()
+        pipe.delete(staging)
+        items = list(scores.items())
+        for start in range(0, len(items), 1000):
+            pipe.zadd(staging, dict(items[start:start + 1000]))
+        pipe.execute()
+        derived = self._redis.smembers(f"{key}:derived")
+        pipe = self._redis.pipeline()
+        if items:
+            pipe.rename(staging, key)
+            if ttl:
+                pipe.expire(key, int(ttl))
+        else:
+            pipe.delete(key)
+        pipe.delete(f"{key}:derived", *derived)
+        for scoped in derived:
+            pipe.delete(f"{scoped}:members", f"{scoped}:built")
+        pipe.execute()
+
+    def incr(self, key: str, member: int, delta: float, ttl: Optional[float] = None):
+        derived = list(self._redis.smembers(f"{key}:derived"))
+        keys = [key] + [f"{scoped}{part}" for scoped in derived for part in ("", ":members", ":built")]
+        expired = self._incr(keys=keys, args=[delta, member, int(ttl or 0)])
+        if expired:
+            self._redis.srem(f"{key}:derived", *expired)
+
+    def derive(self, dest: str, source: str, members: Iterable[int], ttl: float):
+        members = list(members)
+        scope = f"{dest}:members"
+        pipe = self._redis.pipeline()
+        pipe.delete(scope, dest)
+        for start in range(0, len(members), 1000):
+            pipe.sadd(scope, *members[start:start + 1000])
+        if members:
+            pipe.zinterstore(dest, {source: 1, scope: 0})
+            pipe.expire(dest, int(ttl))
+            pipe.expire(scope, int(ttl))
+        pipe.set(f"{dest}:built", 1, ex=int(ttl))
+        pipe.sadd(f"{source}:derived", dest)
+        pipe.expire(f"{source}:derived", int(ttl))  # refreshed by each derive, so it outlives them
+        pipe.execute()
+
+    def derived(self, dest: str) -> bool:
+        return bool(self._redis.exists(f"{dest}:built"))
+
+    def rank(self, key: str, member: int) -> Tuple[Optional[int], Optional[float]]:
+        pipe = self._redis.pipeline()
+        pipe.zrevrank(key, member)
+        pipe.zscore(key, member)
+        return tuple(pipe.execute())
+
+    def range(self, key: str, start: int, stop: int) -> List[Entry]:
+        if stop <= start:
+            return []
+        return [(int(member), score) for member, score in self._redis.zrevrange(key, start, stop - 1, withscores=True)]
+
+    def size(self, key: str) -> int:
+        return self._redis.zcard(key)
+
+    def sweep(self):
+        pass  # Redis expires keys itself
+
+    def stats(self) -> Dict:
+        return {"sets": None, "members": None}
+
+
+def period(window: str, at: Optional[datetime] = None) -> str:
+    at = at or datetime.utcnow()
+    if window == "weekly":
+        year, week, _ = at.isocalendar()
+        return f"week:{year}-W{week:02d}"
+    if window == "monthly":
+        return f"month:{at:%Y-%m}"
+    return "all_time"
+
+
+def period_bounds(window: str, at: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """Start and end of the window's current period"""
+    at = at or datetime.utcnow()
+    if window == "weekly":
+        start = datetime.combine(at.date() - timedelta(days=at.weekday()), datetime.min.time())
+        return start, start + timedelta(days=7)
+    if window == "monthly":
+        return datetime(at.year, at.month, 1), datetime(at.year + (at.month == 12), at.month % 12 + 1, 1)
+    raise ValueError(f"{window} has no periods")
+
+
+def period_ttl(window: str, at: Optional[datetime] = None) -> Optional[float]:
+    """Seconds until a day after the window's current period ends"""
+    if window == "all_time":
+        return None
+    at = at or datetime.utcnow()
+    return (period_bounds(window, at)[1] - at).total_seconds() + 24 * 60 * 60
+
+
+class Leaderboard:
+    def __init__(self, session_factory=SessionLocal, redis_url: Optional[str] = None, scope_ttl: float = SCOPE_TTL):
+        self._session_factory = session_factory
+        self.redis_url = redis_url
+        self.scope_ttl = scope_ttl
+        self._boards = None
+        self._warm_lock = threading.Lock()
+        self._warmed = False
+        self.recorded = 0
+        self.rebuilds = 0
+        self.scoped_builds = 0
+        self.reads = 0
+        self.errors = 0
+
+    @property
+    def backend(self) -> str:
+        return "redis" if self.redis_url and redis is not None else "memory"
+
+    def boards(self):
+        if self._boards is None:
+            self._boards = RedisBoards(self.redis_url) if self.backend == "redis" else MemoryBoards()
+        return self._boards
+
+    @staticmethod
+    def key(window: str, scope: str = GLOBAL_SCOPE, at: Optional[datetime] = None) -> str:
+        return f"{KEY_PREFIX}{period(window, at)}:{scope}"
+
+    # Coin changes; call after the transaction commits
+
+    def record(self, user_id: int, sub_role: Optional[str], delta: int, at: Optional[datetime] = None):
+        """A committed coin change of ``delta`` (negative for spends)"""
+        if not delta or sub_role != "student":
+            return
+        at = at or datetime.utcnow()
+        try:
+            boards = self.boards()
+            boards.incr(self.key("all_time"), user_id, delta)
+            if delta > 0:
+                # Windows rank coins earned, so spending does not lower them
+                for window in ("weekly", "monthly"):
+                    boards.incr(self.key(window, at=at), user_id, delta, period_ttl(window, at))
+            self.recorded += 1
+        except Exception as e:
+            # The periodic rebuild brings the boards back in line
+            self.errors += 1
+            print(f"Leaderboard update failed: {e}")
+
+    def rebuild(self, now: Optional[datetime] = None) -> int:
+        """Reload the boards from balances and the coin ledger; returns how many students are ranked"""
+        now = now or datetime.utcnow()
+        boards = self.boards()
+        db = self._session_factory()
+        try:
+            rows = db.query(User.id, User.gyan_coins).filter(User.sub_role == "student").all()
+            earned = {}
+            for window in ("weekly", "monthly"):
+                start, _ = period_bounds(window, now)
+                # Served by the created_at index; opening balances were not earned in the period
+                earned[window] = db.query(CoinTransaction.user_id, func.sum(CoinTransaction.delta)).join(
+                    User, User.id == CoinTransaction.user_id
+                ).filter(
+                    CoinTransaction.created_at >= start,
+                    CoinTransaction.delta > 0,
+                    CoinTransaction.reason != OPENING_BALANCE,
+                    User.sub_role == "student"
+                ).group_by(CoinTransaction.user_id).all()
+        finally:
+            db.close()
+        boards.replace(self.key("all_time"), {user_id: coins or 0 for user_id, coins in rows})
+        for window, totals in earned.items():
+            boards.replace(self.key(window, at=now), dict(totals), period_ttl(window, now))
+        self._warmed = True
+        self.rebuilds += 1
+        return len(rows)
+
+    def _ensure_warm(self):
+        if not self._warmed:
+            with self._warm_lock:
+                if not self._warmed:
+                    self.rebuild()
+
+    # Scopes
+
+    @staticmethod
+    def scope_for(db, course_id: Optional[int] = None, category: Optional[str] = None) -> Optional[str]:
+        """Scope of a course id or category name; None for an unknown category"""
+        if course_id is not None:
+            return f"course:{course_id}"
+        if category:
+            category_id = db.query(Category.id).filter(Category.name == category).scalar()
+            return f"category:{category_id}" if category_id is not None else None
+        return GLOBAL_SCOPE
+
+    def scope_members(self, db, scope: str) -> List[int]:
+        kind, _, value = scope.partition(":")
+        query = db.query(Enrollment.student_id).distinct()
+        if kind == "course":
+            query = query.filter(Enrollment.course_id == int(value))
+        elif kind == "category":
+            query = query.join(Course, Course.id == Enrollment.course_id).filter(Course.category_id == int(value))
+        else:
+            raise ValueError(f"Unknown leaderboard scope: {scope}")
+        return [row[0] for row in query.all()]
+
+    def _board_key(self, db, window: str, scope: str) -> str:
+        if window not in WINDOWS:
+            raise ValueError(f"Unknown leaderboard window: {window}")
+        self._ensure_warm()
+        source = self.key(window)
+        if scope == GLOBAL_SCOPE:
+            return source
+        key = self.key(window, scope)
+        boards = self.boards()
+        if not boards.derived(key):
+            boards.derive(key, source, self.scope_members(db, scope), self.scope_ttl)
+            self.scoped_builds += 1
+        return key
+
+    # Reads
+
+    def top(self, db, window: str = "all_time", scope: str = GLOBAL_SCOPE, limit: int = 20, offset: int = 0) -> List[Dict]:
+        """A page of the board: user_id, score and 1-based rank"""
+        self.reads += 1
+        key = self._board_key(db, window, scope)
+        entries = self.boards().range(key, offset, offset + limit)
+        return [
+            {"user_id": int(member), "score": int(score), "rank": offset + position + 1}
+            for position, (member, score) in enumerate(entries)
+        ]
+
+    def around(self, db, user_id: int, window: str = "all_time", scope: str = GLOBAL_SCOPE, neighbors: int = 2) -> Dict:
+        """The user's rank and score, the board's size and the entries ``neighbors`` either side of them"""
+        self.reads += 1
+        key = self._board_key(db, window, scope)
+        boards = self.boards()
+        position, score = boards.rank(key, user_id)
+        total = boards.size(key)
+        if position is None:
+            return {"rank": None, "score": 0, "total": total, "neighbors": []}
+        start = max(position - neighbors, 0)
+        entries = boards.range(key, start, position + neighbors + 1)
+        return {
+            "rank": position + 1,
+            "score": int(score),
+            "total": total,
+            "neighbors": [
+                {"user_id": int(member), "score": int(member_score), "rank": start + offset + 1}
+                for offset, (member, member_score) in enumerate(entries)
+            ],
+        }
+
+    async def run(self, interval: float = REBUILD_INTERVAL):
+        """Load the boards at startup, then rebuild them and drop expired boards periodically"""
+        while True:
+            try:
+                await asyncio.to_thread(self.rebuild)
+                self.boards().sweep()
+            except Exception as e:
+                self.errors += 1
+                print(f"Leaderboard rebuild failed: {e}")
+            await asyncio.sleep(interval)
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.backend,
+            "scope_ttl": self.scope_ttl,
+            "coin_changes": self.recorded,
+            "rebuilds": self.rebuilds,
+            "scoped_builds": self.scoped_builds,
+            "reads": self.reads,
+            "errors": self.errors,
+            **(self.boards().stats() if self._boards is not None else {}),
+        }
+
+
+leaderboard = Leaderboard(redis_url=settings.REDIS_URL or None)
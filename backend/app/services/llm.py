@@ -0,0 +1,211 @@
+"""
+Calls to the OpenAI-compatible chat completions API and response streaming.
+
+``complete`` waits for the whole answer; ``stream_completion`` requests
+``stream: true`` and yields content deltas as the upstream emits them, so the
+AI endpoints can forward tokens to the app as Server-Sent Events or newline
+delimited JSON. Both go through the upstream guard (concurrency limit, circuit
+breaker, retry budget). Time to first token and total latency are recorded for
+both paths and reported on the admin AI status endpoint.
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional
+
+import httpx
+from fastapi.responses import StreamingResponse
+
+from app.settings import settings
+from app.services.upstream_guard import LLMError, upstream_guard
+
+CHAT_MODEL = "gpt-3.5-turbo"
+COMPLETIONS_PATH = "/v1/chat/completions"
+SAMPLE_SIZE = 500
+
+SSE_MEDIA_TYPE = "text/event-stream"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def _percentile(samples: List[float], fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return round(ordered[index] * 1000, 2)
+
+
+class LatencyStats:
+    def __init__(self, size: int = SAMPLE_SIZE):
+        self.count = 0
+        self.errors = 0
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def record(self, seconds: float):
+        self.count += 1
+        self._samples.append(seconds)
+
+    def as_dict(self) -> Dict:
+        samples = list(self._samples)
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "p50_ms": _percentile(samples, 0.5),
+            "p99_ms": _percentile(samples, 0.99),
+        }
+
+
+class LLMMetrics:
+    def __init__(self):
+        self.completion = LatencyStats()  # non-streaming: full answer latency
+        self.first_token = LatencyStats()  # streaming: time to first content delta
+        self.stream_total = LatencyStats()  # streaming: time to last delta
+
+    def stats(self) -> Dict:
+        return {
+            "completion": self.completion.as_dict(),
+            "stream_first_token": self.first_token.as_dict(),
+            "stream_total": self.stream_total.as_dict(),
+        }
+
+
+llm_metrics = LLMMetrics()
+
+
+def _payload(messages: List[Dict], max_tokens: int, temperature: float, stream: bool) -> Dict:
+    payload = {
+        "model": CHAT_MODEL,
+        "messages": messages,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+    }
+    if stream:
+        payload["stream"] = True
+    return payload
+
+
+def _headers() -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {settings.OPENAI_API_KEY}",
+        "Content-Type": "application/json",
+    }
+
+
+async def complete(
+    client: httpx.AsyncClient,
+    messages: List[Dict],
+    max_tokens: int = 1000,
+    temperature: float = 0.7,
+) -> str:
+    """Request a completion and return the whole answer"""
+    async def attempt() -> str:
+        response = await client.post(
+            COMPLETIONS_PATH,
+            headers=_headers(),
+            json=_payload(messages, max_tokens, temperature, stream=False),
+        )
+        if response.status_code != 200:
+            raise LLMError(response.status_code)
+        return response.json()["choices"][0]["message"]["content"]
+
+    started = time.perf_counter()
+    try:
+        content = await upstream_guard.call(attempt)
+    except Exception:
+        llm_metrics.completion.errors += 1
+        raise
+    llm_metrics.completion.record(time.perf_counter() - started)
+    return content
+
+
+async def _stream_deltas(client: httpx.AsyncClient, payload: Dict) -> AsyncIterator[str]:
+    async with client.stream("POST", COMPLETIONS_PATH, headers=_headers(), json=payload) as response:
+        if response.status_code != 200:
+            await response.aread()
+            raise LLMError(response.status_code)
+
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+            choices = json.loads(data).get("choices") or [{}]
+            delta = (choices[0].get("delta") or {}).get("content")
+            if delta:
+                yield delta
+
+
+async def stream_completion(
+    client: httpx.AsyncClient,
+    messages: List[Dict],
+    max_tokens: int = 1000,
+    temperature: float = 0.7,
+) -> AsyncIterator[str]:
+    """Request a streamed completion and yield content deltas as they arrive.
+
+    Failures before the first token are retried under the upstream guard;
+    once tokens have been forwarded the error is raised to the caller.
+    """
+    payload = _payload(messages, max_tokens, temperature, stream=True)
+    started = time.perf_counter()
+    first_token = True
+    probe = await upstream_guard.acquire()
+    try:
+        attempt = 0
+        while True:
+            deltas = _stream_deltas(client, payload)
+            try:
+                while True:
+                    try:
+                        if first_token:
+                            delta = await asyncio.wait_for(deltas.__anext__(), upstream_guard.attempt_timeout)
+                        else:
+                            delta = await deltas.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    if first_token:
+                        llm_metrics.first_token.record(time.perf_counter() - started)
+                        first_token = False
+                    yield delta
+            except Exception as e:
+                await deltas.aclose()
+                upstream_guard.record_failure(e)
+                if first_token and await upstream_guard.should_retry(e, attempt):
+                    attempt += 1
+                    continue
+                llm_metrics.first_token.errors += 1
+                raise
+            upstream_guard.record_success()
+            break
+    finally:
+        upstream_guard.release(probe)
+    llm_metrics.stream_total.record(time.perf_counter() - started)
+
+
+def sse_event(event: Dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+def ndjson_line(event: Dict) -> str:
+    return json.dumps(event) + "\n"
+
+
+def streaming_response(events: AsyncIterator[Dict], accept: Optional[str]) -> StreamingResponse:
+    """Encode events as newline-delimited JSON when asked for, Server-Sent Events otherwise"""
+    if accept and NDJSON_MEDIA_TYPE in accept:
+        encode, media_type = ndjson_line, NDJSON_MEDIA_TYPE
+    else:
+        encode, media_type = sse_event, SSE_MEDIA_TYPE
+
+    async def body():
+        async for event in events:
+            yield encode(event)
+
+    # Proxies such as nginx buffer responses unless told otherwise
+    return StreamingResponse(
+        body(),
+        media_type=media_type,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
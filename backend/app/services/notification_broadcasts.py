@@ -0,0 +1,318 @@
+"""
+Fan-out-on-read broadcast notifications.
+
+A broadcast is stored once, in ``broadcast_notifications``, with the role and
+sub-role it targets, instead of one ``Notification`` row per recipient. When a
+user reads their notifications, the broadcasts that target them (and were sent
+after they joined) are merged with their personal notifications.
+
+Read state is a per-user watermark: "mark all as read" moves it to the newest
+broadcast, so it is one row whatever the number of broadcasts. Broadcasts
+above the watermark that the user reads or deletes one by one get a receipt
+row; receipts under the watermark are dropped when it moves, except for
+deletions, which must keep hiding the broadcast.
+
+Personal notifications are created through ``create_notifications`` and
+``create_notifications_for``, which keep the unread counters in step and
+return the new items for the caller to publish on the live stream once its
+transaction commits.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import Boolean, DateTime, String, Text, exists, func, insert, literal, or_, select
+
+from ..models.notification import BroadcastNotification, BroadcastReceipt, Notification, NotificationReadState
+from ..models.user import User
+from .notification_stream import notification_item
+from .unread_counters import unread_counters
+
+
+def create_notifications(
+    db,
+    user_ids: Iterable[int],
+    title: str,
+    message: str,
+    notification_type: str = "general",
+) -> List[Dict]:
+    """One personal notification per user id"""
+    user_ids = list(user_ids)
+    notifications = [
+        Notification(user_id=user_id, title=title, message=message, notification_type=notification_type, is_read=False)
+        for user_id in user_ids
+    ]
+    db.add_all(notifications)
+    unread_counters.personal_created(db, user_ids)
+    db.flush()
+    return [notification_item(n) for n in notifications]
+
+
+def create_notifications_for(
+    db,
+    users_query,
+    title: str,
+    message: str,
+    notification_type: str = "general",
+) -> List[Dict]:
+    """One personal notification for every user id selected by a query, in one statement"""
+    created_at = datetime.utcnow()
+    rows = select(
+        User.id,
+        literal(title, String),
+        literal(message, Text),
+        literal(notification_type, String),
+        literal(False, Boolean),
+        literal(created_at, DateTime)
+    ).where(User.id.in_(users_query))
+    inserted = db.execute(insert(Notification).from_select(
+        ["user_id", "title", "message", "notification_type", "is_read", "created_at"], rows
+    ).returning(Notification.id, Notification.user_id)).all()
+    unread_counters.personal_created_for(db, users_query)
+    return [
+        {
+            "id": notification_id,
+            "user_id": user_id,
+            "title": title,
+            "message": message,
+            "notification_type": notification_type,
+            "is_read": False,
+            "created_at": created_at.isoformat(),
+            "source": "personal",
+        }
+        for notification_id, user_id in inserted
+    ]
+
+
+def target_filters(target_role: Optional[str], target_sub_role: Optional[str]) -> List:
+    """Filters selecting the users a broadcast targets"""
+    filters = []
+    if target_role:
+        filters.append(User.role == target_role)
+    if target_sub_role:
+        filters.append(User.sub_role == target_sub_role)
+    return filters
+
+
+def create_broadcast(
+    db,
+    created_by: int,
+    title: str,
+    message: str,
+    notification_type: str = "general",
+    target_role: Optional[str] = None,
+    target_sub_role: Optional[str] = None,
+) -> BroadcastNotification:
+    broadcast = BroadcastNotification(
+        created_by=created_by,
+        title=title,
+        message=message,
+        notification_type=notification_type,
+        target_role=target_role or None,
+        target_sub_role=target_sub_role or None,
+    )
+    db.add(broadcast)
+    db.flush()
+    return broadcast
+
+
+def recipient_count(db, broadcast: BroadcastNotification) -> int:
+    """Users the broadcast is shown to: those matching the target who had joined when it was sent"""
+    return db.query(func.count(User.id)).filter(
+        *target_filters(broadcast.target_role, broadcast.target_sub_role),
+        or_(User.created_at.is_(None), User.created_at <= broadcast.created_at)
+    ).scalar()
+
+
+def unread_by_anyone():
+    """Correlated filter: some user the broadcast targets has neither a receipt for it nor a watermark past it"""
+    return exists().where(
+        or_(BroadcastNotification.target_role.is_(None), BroadcastNotification.target_role == User.role),
+        or_(BroadcastNotification.target_sub_role.is_(None), BroadcastNotification.target_sub_role == User.sub_role),
+        or_(User.created_at.is_(None), User.created_at <= BroadcastNotification.created_at),
+        ~exists().where(
+            NotificationReadState.user_id == User.id,
+            NotificationReadState.last_read_broadcast_id >= BroadcastNotification.id
+        ),
+        ~exists().where(
+            BroadcastReceipt.user_id == User.id,
+            BroadcastReceipt.broadcast_id == BroadcastNotification.id
+        )
+    )
+
+
+def _dismissed(user_id: int):
+    return exists().where(
+        BroadcastReceipt.user_id == user_id,
+        BroadcastReceipt.broadcast_id == BroadcastNotification.id,
+        BroadcastReceipt.dismissed == True
+    )
+
+
+def _received(user_id: int):
+    return exists().where(
+        BroadcastReceipt.user_id == user_id,
+        BroadcastReceipt.broadcast_id == BroadcastNotification.id
+    )
+
+
+def visible_broadcasts(db, user: User):
+    """Broadcasts targeting the user, sent after they joined, that they have not deleted"""
+    query = db.query(BroadcastNotification).filter(
+        or_(BroadcastNotification.target_role.is_(None), BroadcastNotification.target_role == user.role),
+        or_(BroadcastNotification.target_sub_role.is_(None), BroadcastNotification.target_sub_role == user.sub_role),
+        ~_dismissed(user.id)
+    )
+    if user.created_at is not None:
+        query = query.filter(BroadcastNotification.created_at >= user.created_at)
+    return query
+
+
+def read_watermark(db, user_id: int) -> int:
+    watermark = db.query(NotificationReadState.last_read_broadcast_id).filter(
+        NotificationReadState.user_id == user_id
+    ).scalar()
+    return watermark or 0
+
+
+def _unread_broadcasts(db, user: User, watermark: int):
+    return visible_broadcasts(db, user).filter(
+        BroadcastNotification.id > watermark,
+        ~_received(user.id)
+    )
+
+
+def list_notifications(
+    db,
+    user: User,
+    unread_only: bool = False,
+    notification_type: Optional[str] = None,
+    limit: int = 50,
+) -> List[Dict]:
+    """The user's personal and broadcast notifications, newest first"""
+    personal = db.query(Notification).filter(Notification.user_id == user.id)
+    if unread_only:
+        personal = personal.filter(Notification.is_read == False)
+    if notification_type:
+        personal = personal.filter(Notification.notification_type == notification_type)
+    personal = personal.order_by(Notification.created_at.desc()).limit(limit).all()
+
+    watermark = read_watermark(db, user.id)
+    broadcasts = _unread_broadcasts(db, user, watermark) if unread_only else visible_broadcasts(db, user)
+    if notification_type:
+        broadcasts = broadcasts.filter(BroadcastNotification.notification_type == notification_type)
+    broadcasts = broadcasts.order_by(BroadcastNotification.created_at.desc()).limit(limit).all()
+
+    # Broadcasts above the watermark are read only if they have a receipt
+    above = [b.id for b in broadcasts if b.id > watermark]
+    receipted = set()
+    if above:
+        receipted = {row[0] for row in db.query(BroadcastReceipt.broadcast_id).filter(
+            BroadcastReceipt.user_id == user.id,
+            BroadcastReceipt.broadcast_id.in_(above)
+        ).all()}
+
+    items = [
+        {
+            "id": n.id,
+            "user_id": n.user_id,
+            "title": n.title,
+            "message": n.message,
+            "notification_type": n.notification_type,
+            "is_read": n.is_read,
+            "created_at": n.created_at,
+            "source": "personal",
+        }
+        for n in personal
+    ]
+    items.extend(
+        {
+            "id": b.id,
+            "user_id": user.id,
+            "title": b.title,
+            "message": b.message,
+            "notification_type": b.notification_type,
+            "is_read": b.id <= watermark or b.id in receipted,
+            "created_at": b.created_at,
+            "source": "broadcast",
+        }
+        for b in broadcasts
+    )
+    items.sort(key=lambda item: item["created_at"], reverse=True)
+    return items[:limit]
+
+
+def unread_count(db, user: User) -> int:
+    """Served from the user's incrementally maintained counters"""
+    return unread_counters.unread_count(db, user)
+
+
+def mark_all_read(db, user: User):
+    """Mark personal notifications read and move the broadcast watermark to the newest broadcast"""
+    db.query(Notification).filter(
+        Notification.user_id == user.id,
+        Notification.is_read == False
+    ).update({"is_read": True})
+
+    state = db.query(NotificationReadState).filter(NotificationReadState.user_id == user.id).first()
+    if state is None:
+        state = NotificationReadState(user_id=user.id, last_read_broadcast_id=0)
+        db.add(state)
+    newest = db.query(func.max(BroadcastNotification.id)).scalar() or 0
+    if newest > state.last_read_broadcast_id:
+        state.last_read_broadcast_id = newest
+        state.updated_at = datetime.utcnow()
+    # Read receipts under the watermark say nothing the watermark doesn't; deletions still count
+    db.query(BroadcastReceipt).filter(
+        BroadcastReceipt.user_id == user.id,
+        BroadcastReceipt.broadcast_id <= state.last_read_broadcast_id,
+        BroadcastReceipt.dismissed == False
+    ).delete(synchronize_session=False)
+
+    # Nothing is unread now, whether or not the counters were materialized before
+    state.unread_personal = 0
+    state.read_broadcasts_above = 0
+    if state.counters_reconciled_at is None:
+        state.counters_reconciled_at = datetime.utcnow()
+
+
+def get_visible_broadcast(db, user: User, broadcast_id: int) -> Optional[BroadcastNotification]:
+    return visible_broadcasts(db, user).filter(BroadcastNotification.id == broadcast_id).first()
+
+
+def mark_broadcast_read(db, user: User, broadcast: BroadcastNotification):
+    if broadcast.id <= read_watermark(db, user.id):
+        return
+    receipt = db.query(BroadcastReceipt).filter(
+        BroadcastReceipt.user_id == user.id,
+        BroadcastReceipt.broadcast_id == broadcast.id
+    ).first()
+    if receipt is None:
+        db.add(BroadcastReceipt(user_id=user.id, broadcast_id=broadcast.id, dismissed=False))
+        unread_counters.broadcast_receipted(db, user.id)
+
+
+def dismiss_broadcast(db, user: User, broadcast: BroadcastNotification):
+    receipt = db.query(BroadcastReceipt).filter(
+        BroadcastReceipt.user_id == user.id,
+        BroadcastReceipt.broadcast_id == broadcast.id
+    ).first()
+    if receipt is None:
+        db.add(BroadcastReceipt(user_id=user.id, broadcast_id=broadcast.id, dismissed=True))
+        if broadcast.id > read_watermark(db, user.id):
+            # It was unread; deleting takes it out of the unread count
+            unread_counters.broadcast_receipted(db, user.id)
+    else:
+        receipt.dismissed = True
+
+
+def broadcast_details(db, broadcast: BroadcastNotification) -> Dict:
+    return {
+        "broadcast_id": broadcast.id,
+        "title": broadcast.title,
+        "message": broadcast.message,
+        "notification_type": broadcast.notification_type,
+        "target_role": broadcast.target_role,
+        "target_sub_role": broadcast.target_sub_role,
+        "recipients_count": recipient_count(db, broadcast),
+        "created_at": broadcast.created_at,
+    }
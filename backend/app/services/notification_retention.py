@@ -0,0 +1,235 @@
+"""
+Retention for the notifications tables.
+
+``notifications`` only ever grew. A job started in the app lifespan now runs
+periodically and:
+
+- removes read personal notifications older than ``NOTIFICATION_RETENTION_DAYS``
+  (unread ones are kept whatever their age), found through the
+  ``(is_read, created_at)`` index;
+- caps each user's history at ``NOTIFICATION_MAX_PER_USER``, dropping their
+  oldest notifications beyond it and taking dropped unread ones off the
+  user's unread counter;
+- removes broadcasts older than the retention age that every user they
+  target has read (by receipt or watermark), with their receipts; like
+  personal ones, broadcasts someone has not read yet are kept.
+
+Every batch is its own short transaction of at most ``BATCH_SIZE`` rows, with
+a pause between batches, so the job never holds long locks against the
+endpoints. With ``NOTIFICATION_ARCHIVE_DIR`` set, rows are appended to a
+gzip-compressed JSONL file there (one per run) before they are deleted.
+"""
+import asyncio
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, func
+
+from ..database import SessionLocal
+from ..models.notification import BroadcastNotification, BroadcastReceipt, Notification
+from ..settings import settings
+from .notification_broadcasts import unread_by_anyone
+from .unread_counters import unread_counters
+
+RUN_INTERVAL = 24 * 60 * 60
+BATCH_SIZE = 500
+BATCH_PAUSE = 0.05  # seconds between batches, to let endpoint transactions through
+
+
+def _row(kind: str, row) -> Dict:
+    record = {"kind": kind}
+    for column in row.__table__.columns:
+        value = getattr(row, column.key)
+        record[column.key] = value.isoformat() if isinstance(value, datetime) else value
+    return record
+
+
+class NotificationArchive:
+    """gzip-compressed JSONL file a run appends its deleted rows to"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path: Optional[str] = None
+        self.rows = 0
+
+    def write(self, kind: str, rows: List):
+        if not rows:
+            return
+        if self.path is None:
+            os.makedirs(self.directory, exist_ok=True)
+            stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+            self.path = os.path.join(self.directory, f"notifications-{stamp}.jsonl.gz")
+        with gzip.open(self.path, "at", encoding="utf-8") as archive:
+            for row in rows:
+                archive.write(json.dumps(_row(kind, row)) + "\n")
+        self.rows += len(rows)
+
+
+class NotificationRetention:
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        retention_days: int = settings.NOTIFICATION_RETENTION_DAYS,
+        max_per_user: int = settings.NOTIFICATION_MAX_PER_USER,
+        archive_dir: str = settings.NOTIFICATION_ARCHIVE_DIR,
+        batch_size: int = BATCH_SIZE,
+        batch_pause: float = BATCH_PAUSE,
+    ):
+        self._session_factory = session_factory
+        self.retention_days = retention_days
+        self.max_per_user = max_per_user
+        self.archive_dir = archive_dir
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self._lock = threading.Lock()  # one run at a time (scheduled or admin-triggered)
+        self.runs = 0
+        self.expired = 0
+        self.capped = 0
+        self.broadcasts_expired = 0
+        self.archived = 0
+        self.last_run: Optional[Dict] = None
+
+    def run_once(self, now: Optional[datetime] = None) -> Dict:
+        """One retention pass; returns what it removed"""
+        with self._lock:
+            started = time.perf_counter()
+            archive = NotificationArchive(self.archive_dir) if self.archive_dir else None
+            result = {"expired": 0, "capped": 0, "broadcasts_expired": 0, "archived": 0, "archive": None}
+            if self.retention_days > 0:
+                cutoff = (now or datetime.utcnow()) - timedelta(days=self.retention_days)
+                result["expired"] = self._expire_read(cutoff, archive)
+                result["broadcasts_expired"] = self._expire_broadcasts(cutoff, archive)
+            if self.max_per_user > 0:
+                result["capped"] = self._cap_per_user(archive)
+            if archive is not None:
+                result["archived"] = archive.rows
+                result["archive"] = archive.path
+            result["seconds"] = round(time.perf_counter() - started, 3)
+
+            self.runs += 1
+            self.expired += result["expired"]
+            self.capped += result["capped"]
+            self.broadcasts_expired += result["broadcasts_expired"]
+            self.archived += result["archived"]
+            self.last_run = {**result, "finished_at": datetime.utcnow().isoformat()}
+            return result
+
+    def _expire_read(self, cutoff: datetime, archive: Optional[NotificationArchive]) -> int:
+        """Read notifications created before the cutoff"""
+        removed = 0
+        while True:
+            db = self._session_factory()
+            try:
+                # Served by the (is_read, created_at) index; read rows never become unread again
+                rows = db.query(Notification).filter(
+                    Notification.is_read == True,
+                    Notification.created_at < cutoff
+                ).order_by(Notification.created_at, Notification.id).limit(self.batch_size).all()
+                if not rows:
+                    break
+                if archive is not None:
+                    archive.write("notification", rows)
+                db.execute(delete(Notification).where(Notification.id.in_([row.id for row in rows])))
+                db.commit()
+                removed += len(rows)
+            finally:
+                db.close()
+            if len(rows) < self.batch_size:
+                break
+            time.sleep(self.batch_pause)
+        return removed
+
+    def _cap_per_user(self, archive: Optional[NotificationArchive]) -> int:
+        """Oldest notifications of users holding more than the cap"""
+        db = self._session_factory()
+        try:
+            over = db.query(Notification.user_id).group_by(Notification.user_id).having(
+                func.count(Notification.id) > self.max_per_user
+            ).all()
+        finally:
+            db.close()
+
+        removed = 0
+        for (user_id,) in over:
+            while True:
+                db = self._session_factory()
+                try:
+                    # Served by the (user_id, created_at) index
+                    rows = db.query(Notification).filter(Notification.user_id == user_id).order_by(
+                        Notification.created_at.desc(), Notification.id.desc()
+                    ).offset(self.max_per_user).limit(self.batch_size).all()
+                    if not rows:
+                        break
+                    if archive is not None:
+                        archive.write("notification", rows)
+                    db.execute(delete(Notification).where(Notification.id.in_([row.id for row in rows])))
+                    unread = sum(1 for row in rows if not row.is_read)
+                    if unread:
+                        unread_counters.personal_read(db, user_id, unread)
+                    db.commit()
+                    removed += len(rows)
+                finally:
+                    db.close()
+                time.sleep(self.batch_pause)
+        return removed
+
+    def _expire_broadcasts(self, cutoff: datetime, archive: Optional[NotificationArchive]) -> int:
+        """Broadcasts sent before the cutoff that no targeted user still has unread"""
+        removed = 0
+        after_id = 0
+        while True:
+            db = self._session_factory()
+            try:
+                rows = db.query(BroadcastNotification).filter(
+                    BroadcastNotification.id > after_id,
+                    BroadcastNotification.created_at < cutoff,
+                    ~unread_by_anyone()
+                ).order_by(BroadcastNotification.id).limit(self.batch_size).all()
+                if not rows:
+                    break
+                ids = [row.id for row in rows]
+                after_id = ids[-1]
+                if archive is not None:
+                    archive.write("broadcast", rows)
+                db.execute(delete(BroadcastReceipt).where(BroadcastReceipt.broadcast_id.in_(ids)))
+                db.execute(delete(BroadcastNotification).where(BroadcastNotification.id.in_(ids)))
+                db.commit()
+                removed += len(rows)
+            finally:
+                db.close()
+            time.sleep(self.batch_pause)
+        if removed:
+            # Receipts of deleted broadcasts fed read_broadcasts_above; recount and rebuild the index
+            unread_counters.reconcile()
+        return removed
+
+    async def run_worker(self, interval: float = RUN_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                result = await asyncio.to_thread(self.run_once)
+                if result["expired"] or result["capped"] or result["broadcasts_expired"]:
+                    print(f"Notification retention: {result}")
+            except Exception as e:
+                print(f"Notification retention failed: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "retention_days": self.retention_days,
+            "max_per_user": self.max_per_user,
+            "archive_dir": self.archive_dir or None,
+            "runs": self.runs,
+            "expired": self.expired,
+            "capped": self.capped,
+            "broadcasts_expired": self.broadcasts_expired,
+            "archived": self.archived,
+            "last_run": self.last_run,
+        }
+
+
+notification_retention = NotificationRetention()
@@ -0,0 +1,277 @@
+"""
+Live notification stream over WebSocket.
+
+Clients keep one socket open at ``/api/notifications/ws`` instead of polling:
+new notifications are pushed as ``notification`` frames, and every change to
+the user's unread count (new items, reads, deletes, mark-all) as an
+``unread_count`` frame. Frames use the chat wire codecs, so clients get JSON
+or msgpack exactly as on the chat socket, and a user may have several
+devices connected at once.
+
+Endpoints publish events after their transaction commits. With ``REDIS_URL``
+set (and the ``redis`` package installed) events go through a Redis pub/sub
+channel that every worker subscribes to, so a notification created on one
+worker reaches sockets held by any other; without Redis they are dispatched
+in-process. Each worker resolves the recipients among its own connections and
+reads their unread counts with one batched query.
+"""
+import asyncio
+import json
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from fastapi import WebSocket
+
+from ..database import SessionLocal
+from ..models.user import User
+from ..settings import settings
+from .chat_protocol import JSONCodec
+from .unread_counters import unread_counters
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+CHANNEL = "notifications:events"
+RESUBSCRIBE_DELAY = 5.0
+
+
+class StreamUser:
+    """What targeting and unread counts need to know about a connected user"""
+
+    def __init__(self, user_id: int, role: Optional[str], sub_role: Optional[str], created_at: Optional[datetime]):
+        self.id = user_id
+        self.role = role
+        self.sub_role = sub_role
+        self.created_at = created_at
+
+
+def notification_item(notification, source: str = "personal", user_id: Optional[int] = None, is_read: bool = False) -> Dict:
+    """A notification as sent on the stream; plain JSON types so it crosses the bus unchanged"""
+    return {
+        "id": notification.id,
+        "user_id": user_id if user_id is not None else notification.user_id,
+        "title": notification.title,
+        "message": notification.message,
+        "notification_type": notification.notification_type,
+        "is_read": is_read,
+        "created_at": notification.created_at.isoformat() if notification.created_at else None,
+        "source": source,
+    }
+
+
+class StreamConnection:
+    def __init__(self, websocket: WebSocket, user: StreamUser, codec):
+        self.websocket = websocket
+        self.user = user
+        self.codec = codec
+
+
+class NotificationHub:
+    def __init__(self, session_factory=SessionLocal, redis_url: Optional[str] = None):
+        self._session_factory = session_factory
+        self.redis_url = redis_url
+        self._redis = None
+        self._connections: Dict[int, List[StreamConnection]] = {}  # user_id -> open sockets
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: Set[asyncio.Task] = set()  # strong references until each publish finishes
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dispatched = 0
+        self.frames_sent = 0
+        self.send_errors = 0
+        self.bus_errors = 0
+
+    @property
+    def backend(self) -> str:
+        return "redis" if self.redis_url and aioredis is not None else "memory"
+
+    def _client(self):
+        if self._redis is None and self.backend == "redis":
+            self._redis = aioredis.from_url(self.redis_url, decode_responses=True)
+        return self._redis
+
+    # Connections
+
+    def load_user(self, email: str) -> Optional[StreamUser]:
+        db = self._session_factory()
+        try:
+            user = db.query(User.id, User.role, User.sub_role, User.created_at, User.is_active).filter(
+                User.email == email
+            ).first()
+        finally:
+            db.close()
+        if not user or user.is_active is False:
+            return None
+        return StreamUser(user.id, user.role, user.sub_role, user.created_at)
+
+    async def connect(self, websocket: WebSocket, user: StreamUser, codec=None) -> StreamConnection:
+        codec = codec or JSONCodec()
+        offered = websocket.scope.get("subprotocols") or []
+        await websocket.accept(subprotocol=codec.subprotocol if codec.subprotocol in offered else None)
+        connection = StreamConnection(websocket, user, codec)
+        with self._lock:
+            self._connections.setdefault(user.id, []).append(connection)
+        return connection
+
+    def disconnect(self, connection: StreamConnection):
+        with self._lock:
+            connections = self._connections.get(connection.user.id, [])
+            if connection in connections:
+                connections.remove(connection)
+            if not connections:
+                self._connections.pop(connection.user.id, None)
+
+    async def send(self, connection: StreamConnection, frame: Dict, cache: Optional[Dict] = None) -> bool:
+        """Whether the frame was sent; a failed socket is disconnected"""
+        try:
+            for payload in connection.codec.encode(frame, {} if cache is None else cache):
+                if isinstance(payload, bytes):
+                    await connection.websocket.send_bytes(payload)
+                else:
+                    await connection.websocket.send_text(payload)
+            self.frames_sent += 1
+            return True
+        except Exception:
+            self.send_errors += 1
+            self.disconnect(connection)
+            return False
+
+    # Publishing; safe to call from sync endpoints in the threadpool, after commit
+
+    def publish_notifications(self, items: Iterable[Dict]):
+        """New personal notifications, as built by ``notification_item``"""
+        items = list(items)
+        if items:
+            self._publish({"kind": "notifications", "items": items})
+
+    def publish_broadcast(self, broadcast):
+        self._publish({
+            "kind": "broadcast",
+            "target_role": broadcast.target_role,
+            "target_sub_role": broadcast.target_sub_role,
+            "item": notification_item(broadcast, source="broadcast", user_id=0),
+        })
+
+    def publish_unread(self, user_ids: Iterable[int]):
+        """The users' unread counts changed (reads, deletes)"""
+        user_ids = list(user_ids)
+        if user_ids:
+            self._publish({"kind": "unread", "user_ids": user_ids})
+
+    def _publish(self, event: Dict):
+        if self._loop is None or self._loop.is_closed():
+            return  # stream not started (e.g. scripts); nothing can be listening
+        self.published += 1
+        target = self._publish_redis if self.backend == "redis" else self.dispatch
+        self._loop.call_soon_threadsafe(lambda: self._track(target(event)))
+
+    def _track(self, coroutine):
+        # The loop only keeps weak references to tasks; an untracked one can be collected mid-send
+        task = asyncio.ensure_future(coroutine)
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _publish_redis(self, event: Dict):
+        try:
+            await self._client().publish(CHANNEL, json.dumps(event))
+        except Exception as e:
+            # The bus is down: at least reach the sockets on this worker
+            self.bus_errors += 1
+            print(f"Notification bus publish failed: {e}")
+            await self.dispatch(event)
+
+    async def run(self):
+        """Bind to the app's event loop and, with Redis, relay events from every worker"""
+        self._loop = asyncio.get_running_loop()
+        if self.backend != "redis":
+            return
+        while True:
+            try:
+                pubsub = self._client().pubsub()
+                await pubsub.subscribe(CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        await self.dispatch(json.loads(message["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.bus_errors += 1
+                print(f"Notification bus subscription failed: {e}")
+                await asyncio.sleep(RESUBSCRIBE_DELAY)
+
+    # Delivery to this worker's sockets
+
+    async def dispatch(self, event: Dict):
+        self.dispatched += 1
+        with self._lock:
+            connected = {user_id: list(connections) for user_id, connections in self._connections.items()}
+        if not connected:
+            return
+
+        frames: Dict[int, List[Dict]] = {}
+        kind = event.get("kind")
+        if kind == "notifications":
+            for item in event["items"]:
+                if item["user_id"] in connected:
+                    frames.setdefault(item["user_id"], []).append({"type": "notification", "notification": item})
+        elif kind == "broadcast":
+            item = event["item"]
+            sent_at = datetime.fromisoformat(item["created_at"]) if item["created_at"] else None
+            frame = {"type": "notification", "notification": item}
+            for user_id, connections in connected.items():
+                user = connections[0].user
+                if (event["target_role"] is None or event["target_role"] == user.role) \
+                        and (event["target_sub_role"] is None or event["target_sub_role"] == user.sub_role) \
+                        and (user.created_at is None or sent_at is None or sent_at >= user.created_at):
+                    frames[user_id] = [{**frame, "notification": {**item, "user_id": user_id}}]
+        elif kind == "unread":
+            for user_id in event["user_ids"]:
+                if user_id in connected:
+                    frames[user_id] = []
+
+        if not frames:
+            return
+        users = [connected[user_id][0].user for user_id in frames]
+        counts = await asyncio.to_thread(self.unread_counts, users)
+        for user_id, user_frames in frames.items():
+            unread = {"type": "unread_count", "unread_count": counts.get(user_id, 0)}
+            for connection in connected[user_id]:
+                for frame in user_frames + [unread]:
+                    if not await self.send(connection, frame):
+                        break
+
+    def unread_counts(self, users: List[StreamUser]) -> Dict[int, int]:
+        db = self._session_factory()
+        try:
+            return unread_counters.unread_counts(db, users)
+        finally:
+            db.close()
+
+    async def aclose(self):
+        for task in list(self._pending):
+            task.cancel()
+        self._pending.clear()
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            users = len(self._connections)
+            sockets = sum(len(connections) for connections in self._connections.values())
+        return {
+            "backend": self.backend,
+            "connected_users": users,
+            "connected_sockets": sockets,
+            "published": self.published,
+            "dispatched": self.dispatched,
+            "frames_sent": self.frames_sent,
+            "send_errors": self.send_errors,
+            "bus_errors": self.bus_errors,
+        }
+
+
+notification_hub = NotificationHub(redis_url=settings.REDIS_URL or None)
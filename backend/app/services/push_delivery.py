@@ -0,0 +1,376 @@
+"""
+Batched push delivery over FCM.
+
+Pushing to many users used to mean one request per user from the request
+handler. Pushes are now queued as jobs describing the audience (a list of user
+ids, or a role/sub-role target like a broadcast) and delivered by a worker
+started in the app lifespan:
+
+- registered tokens are read from ``users`` in keyset pages and grouped into
+  multicast requests (``registration_ids``) of up to ``MULTICAST_SIZE``;
+- a few batches are in flight at once over the pooled ``fcm`` client, under a
+  token-bucket limit on messages per second;
+- failed requests (transport errors, 429, 5xx) and per-token ``Unavailable``
+  results are retried with full-jitter exponential backoff, honouring
+  ``Retry-After``;
+- tokens FCM reports as no longer valid are cleared from ``User.fcm_token``,
+  and canonical ids it returns replace the stale token.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+import httpx
+from sqlalchemy import update
+
+from ..database import SessionLocal
+from ..models.user import User
+from ..settings import settings
+from .http_clients import HTTPClientRegistry
+
+FCM_SEND_PATH = "/fcm/send"
+MULTICAST_SIZE = 500  # FCM accepts up to 1000 registration ids per request
+MAX_CONCURRENT_BATCHES = 4
+RATE_LIMIT = 2000  # messages per second
+MAX_ATTEMPTS = 4
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+RECENT_JOBS = 100
+
+INVALID_TOKEN_ERRORS = {"NotRegistered", "InvalidRegistration", "MismatchSenderId"}
+RETRYABLE_TOKEN_ERRORS = {"Unavailable", "InternalServerError"}
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def push_payload(title: str, body: str, data: Optional[Dict] = None) -> Dict:
+    return {
+        "notification": {
+            "title": title,
+            "body": body,
+            "click_action": "FLUTTER_NOTIFICATION_CLICK"
+        },
+        "data": data or {}
+    }
+
+
+def retry_after_seconds(response: Optional[httpx.Response]) -> float:
+    if response is None:
+        return 0.0
+    try:
+        return float(response.headers.get("retry-after", 0))
+    except ValueError:
+        return 0.0
+
+
+class RateLimiter:
+    """Token bucket: ``rate`` messages per second, bursts up to ``burst``"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self.waits = 0
+
+    async def acquire(self, count: int):
+        count = min(count, self.burst)
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= count:
+                self._tokens -= count
+                return
+            self.waits += 1
+            await asyncio.sleep((count - self._tokens) / self.rate)
+
+
+class BatchResult:
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.invalid: List[str] = []
+        self.replacements: Dict[str, str] = {}  # stale token -> canonical token
+        self.attempts = 0
+
+    def as_dict(self) -> Dict:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "invalid_tokens": len(self.invalid),
+            "replaced_tokens": len(self.replacements),
+            "attempts": self.attempts,
+        }
+
+
+class PushJob:
+    def __init__(
+        self,
+        job_id: int,
+        title: str,
+        body: str,
+        data: Optional[Dict] = None,
+        user_ids: Optional[List[int]] = None,
+        target_role: Optional[str] = None,
+        target_sub_role: Optional[str] = None,
+    ):
+        self.id = job_id
+        self.payload = push_payload(title, body, data)
+        self.user_ids = sorted(set(user_ids)) if user_ids is not None else None
+        self.target_role = target_role
+        self.target_sub_role = target_sub_role
+        self.status = "queued"  # queued, running, completed, failed
+        self.tokens = 0
+        self.sent = 0
+        self.failed = 0
+        self.pruned = 0
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+
+    def record(self, result: BatchResult):
+        self.sent += result.sent
+        self.failed += result.failed
+        self.pruned += len(result.invalid)
+
+    def as_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "tokens": self.tokens,
+            "sent": self.sent,
+            "failed": self.failed,
+            "pruned_tokens": self.pruned,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class PushDeliveryService:
+    def __init__(
+        self,
+        session_factory=SessionLocal,
+        multicast_size: int = MULTICAST_SIZE,
+        max_concurrency: int = MAX_CONCURRENT_BATCHES,
+        rate_limit: float = RATE_LIMIT,
+        max_attempts: int = MAX_ATTEMPTS,
+        backoff_base: float = BACKOFF_BASE,
+    ):
+        self._session_factory = session_factory
+        self.multicast_size = multicast_size
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.limiter = RateLimiter(rate_limit, burst=max(rate_limit, multicast_size))
+        self._pending: Deque[PushJob] = deque()
+        self._jobs: Dict[int, PushJob] = {}  # recent jobs, for status lookups on this worker
+        self._next_id = 1
+        self._lock = threading.Lock()  # enqueue() is called from sync endpoints in the threadpool
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.jobs_completed = 0
+        self.requests = 0
+        self.retries = 0
+        self.sent = 0
+        self.failed = 0
+        self.pruned = 0
+        self.replaced = 0
+
+    # Queueing
+
+    def enqueue(
+        self,
+        title: str,
+        body: str,
+        data: Optional[Dict] = None,
+        user_ids: Optional[List[int]] = None,
+        target_role: Optional[str] = None,
+        target_sub_role: Optional[str] = None,
+    ) -> PushJob:
+        """Queue a push to the given users, or to every user matching the target; safe from any thread"""
+        with self._lock:
+            job = PushJob(self._next_id, title, body, data, user_ids, target_role, target_sub_role)
+            self._next_id += 1
+            self._pending.append(job)
+            self._jobs[job.id] = job
+            while len(self._jobs) > RECENT_JOBS:
+                self._jobs.pop(next(iter(self._jobs)))
+        if self._loop is not None and not self._loop.is_closed() and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return job
+
+    def job(self, job_id: int) -> Optional[PushJob]:
+        return self._jobs.get(job_id)
+
+    async def run_worker(self, http_clients: HTTPClientRegistry):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        if self._pending:
+            self._wakeup.set()
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending:
+                with self._lock:
+                    job = self._pending.popleft()
+                try:
+                    await self.deliver(http_clients.get("fcm"), job)
+                except Exception as e:
+                    job.status = "failed"
+                    job.finished_at = datetime.utcnow()
+                    print(f"Push job {job.id} failed: {e}")
+
+    # Delivery
+
+    async def deliver(self, client: httpx.AsyncClient, job: PushJob):
+        job.status = "running"
+        page_size = self.multicast_size * self.max_concurrency
+        after_user_id = 0
+        while True:
+            rows = await asyncio.to_thread(self._load_tokens, job, after_user_id, page_size)
+            if not rows:
+                break
+            after_user_id = rows[-1][0]
+            tokens = [token for _, token in rows]
+            job.tokens += len(tokens)
+            batches = [tokens[i:i + self.multicast_size] for i in range(0, len(tokens), self.multicast_size)]
+            results = await asyncio.gather(*(self.send_batch(client, batch, job.payload) for batch in batches))
+            for result in results:
+                job.record(result)
+                await self.prune(result)
+        job.status = "completed"
+        job.finished_at = datetime.utcnow()
+        self.jobs_completed += 1
+
+    def _load_tokens(self, job: PushJob, after_user_id: int, limit: int) -> List[Tuple[int, str]]:
+        db = self._session_factory()
+        try:
+            query = db.query(User.id, User.fcm_token).filter(
+                User.fcm_token.isnot(None),
+                User.fcm_token != "",
+                User.id > after_user_id
+            )
+            if job.user_ids is not None:
+                # The id list is sorted, so each page only needs the ids past the keyset position
+                remaining = [user_id for user_id in job.user_ids if user_id > after_user_id][:limit]
+                if not remaining:
+                    return []
+                query = query.filter(User.id.in_(remaining))
+            else:
+                if job.target_role:
+                    query = query.filter(User.role == job.target_role)
+                if job.target_sub_role:
+                    query = query.filter(User.sub_role == job.target_sub_role)
+            return [tuple(row) for row in query.order_by(User.id).limit(limit).all()]
+        finally:
+            db.close()
+
+    async def send_batch(
+        self,
+        client: httpx.AsyncClient,
+        tokens: List[str],
+        payload: Dict,
+        max_attempts: Optional[int] = None,
+    ) -> BatchResult:
+        """Send one multicast, retrying failed requests and temporarily unavailable tokens"""
+        max_attempts = max_attempts or self.max_attempts
+        result = BatchResult()
+        pending = list(tokens)
+        while pending:
+            result.attempts += 1
+            await self.limiter.acquire(len(pending))
+            self.requests += 1
+            response = None
+            try:
+                response = await client.post(
+                    FCM_SEND_PATH,
+                    headers={
+                        "Authorization": f"key={settings.FCM_SERVER_KEY}",
+                        "Content-Type": "application/json"
+                    },
+                    json={**payload, "registration_ids": pending}
+                )
+            except httpx.HTTPError as e:
+                print(f"FCM request failed: {e}")
+
+            results = None
+            if response is not None and response.status_code == 200:
+                try:
+                    results = response.json()["results"]
+                except (ValueError, KeyError, TypeError):
+                    # Truncated or garbled body: nothing says which tokens were delivered, send them again
+                    print(f"FCM returned an unreadable response for a batch of {len(pending)}")
+
+            if results is not None:
+                retry = []
+                for token, item in zip(pending, results):
+                    error = item.get("error")
+                    if "message_id" in item:
+                        result.sent += 1
+                        if item.get("registration_id"):
+                            result.replacements[token] = item["registration_id"]
+                    elif error in INVALID_TOKEN_ERRORS:
+                        result.invalid.append(token)
+                    elif error in RETRYABLE_TOKEN_ERRORS:
+                        retry.append(token)
+                    else:
+                        result.failed += 1
+                if len(results) < len(pending):
+                    # Tokens the response has no result for were not confirmed; retry them
+                    retry.extend(pending[len(results):])
+                pending = retry
+            elif response is not None and response.status_code != 200 and response.status_code not in RETRYABLE_STATUSES:
+                # Malformed request or bad server key: retrying cannot help
+                print(f"FCM rejected a batch of {len(pending)}: {response.status_code} {response.text[:200]}")
+                result.failed += len(pending)
+                pending = []
+
+            if pending:
+                if result.attempts >= max_attempts:
+                    result.failed += len(pending)
+                    break
+                self.retries += 1
+                # Full jitter, but never sooner than the server asked
+                backoff = random.uniform(0, min(BACKOFF_MAX, self.backoff_base * 2 ** result.attempts))
+                await asyncio.sleep(max(backoff, retry_after_seconds(response)))
+
+        self.sent += result.sent
+        self.failed += result.failed
+        return result
+
+    async def prune(self, result: BatchResult):
+        if result.invalid or result.replacements:
+            await asyncio.to_thread(self._prune_tokens, result.invalid, result.replacements)
+
+    def _prune_tokens(self, invalid: List[str], replacements: Dict[str, str]):
+        db = self._session_factory()
+        try:
+            if invalid:
+                db.execute(update(User).where(User.fcm_token.in_(invalid)).values(fcm_token=None))
+            for stale, canonical in replacements.items():
+                db.execute(update(User).where(User.fcm_token == stale).values(fcm_token=canonical))
+            db.commit()
+        finally:
+            db.close()
+        self.pruned += len(invalid)
+        self.replaced += len(replacements)
+
+    def stats(self) -> Dict:
+        return {
+            "queued_jobs": len(self._pending),
+            "jobs_completed": self.jobs_completed,
+            "requests": self.requests,
+            "retries": self.retries,
+            "sent": self.sent,
+            "failed": self.failed,
+            "pruned_tokens": self.pruned,
+            "replaced_tokens": self.replaced,
+            "rate_limit_per_second": self.limiter.rate,
+            "rate_limited_waits": self.limiter.waits,
+        }
+
+
+push_delivery = PushDeliveryService()
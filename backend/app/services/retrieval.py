@@ -0,0 +1,273 @@
+"""
+BM25 retrieval over lesson and course note text for tutor prompts.
+
+Lesson ``content_text`` and ``CourseNote`` content are split into passages of
+roughly ``CHUNK_TOKENS`` tokens when they are written, and stored with their
+term counts in ``content_chunks``. At question time the chunks of the course
+are scored with BM25 (chunks of the lesson being asked about get a boost) and
+the best ones that fit the token budget go into the prompt, instead of the
+whole lesson. Per-course indexes are built from the stored chunks, cached, and
+dropped when a lesson or note of the course changes; a TTL bounds staleness
+across worker processes. ``version`` summarizes a course's stored chunks with
+one aggregate query, so cached tutor answers can be checked without loading
+or building an index.
+"""
+import json
+import math
+import re
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..models.content_chunk import ContentChunk
+from ..models.course_note import CourseNote
+from ..models.lesson import Lesson
+
+CHUNK_TOKENS = 160
+TOP_K = 4
+CONTEXT_TOKEN_BUDGET = 600
+INDEX_TTL = 300.0
+BM25_K1 = 1.5
+BM25_B = 0.75
+LESSON_BOOST = 1.5
+
+_WORD = re.compile(r"[a-z0-9]+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+_STOPWORDS = {
+    "a", "an", "the", "of", "to", "in", "on", "for", "is", "are", "was", "were", "be", "and", "or",
+    "it", "this", "that", "with", "as", "by", "at", "from", "what", "how", "why", "do", "does",
+    "can", "you", "i", "me", "my", "we", "explain", "please", "tell", "about",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English)"""
+    return max(1, len(text) // 4) if text else 0
+
+
+def tokenize(text: str) -> List[str]:
+    terms = []
+    for word in _WORD.findall(text.lower()):
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def truncate_tokens(text: Optional[str], budget: int) -> str:
+    if not text or estimate_tokens(text) <= budget:
+        return text or ""
+    return text[:budget * 4].rsplit(" ", 1)[0] + " ..."
+
+
+def chunk_text(text: Optional[str], chunk_tokens: int = CHUNK_TOKENS) -> List[str]:
+    """Pack whole sentences into passages of about ``chunk_tokens`` tokens"""
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for sentence in _SENTENCE_END.split(text or ""):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        # A single overlong sentence is split on word boundaries
+        while estimate_tokens(sentence) > chunk_tokens:
+            head = truncate_tokens(sentence, chunk_tokens)[:-len(" ...")]
+            if not head:
+                break
+            if current:
+                chunks.append(" ".join(current))
+                current, size = [], 0
+            chunks.append(head)
+            sentence = sentence[len(head):].strip()
+        if size + estimate_tokens(sentence) > chunk_tokens and current:
+            chunks.append(" ".join(current))
+            current, size = [], 0
+        current.append(sentence)
+        size += estimate_tokens(sentence)
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+class Chunk:
+    def __init__(self, source_type: str, source_id: int, title: str, position: int, text: str, terms: Dict[str, int]):
+        self.source_type = source_type
+        self.source_id = source_id
+        self.title = title
+        self.position = position
+        self.text = text
+        self.terms = terms
+        self.length = sum(terms.values())
+        self.token_count = estimate_tokens(text)
+
+    @classmethod
+    def from_row(cls, row: ContentChunk) -> "Chunk":
+        return cls(row.source_type, row.source_id, row.title, row.position, row.text, json.loads(row.term_counts))
+
+    def label(self) -> str:
+        return f"{'Lesson' if self.source_type == 'lesson' else 'Note'}: {self.title}"
+
+
+def make_chunks(source_type: str, source_id: int, title: str, text: Optional[str]) -> List[Chunk]:
+    return [
+        Chunk(source_type, source_id, title, position, passage, dict(Counter(tokenize(f"{title} {passage}"))))
+        for position, passage in enumerate(chunk_text(text))
+    ]
+
+
+class CourseIndex:
+    def __init__(self, chunks: List[Chunk]):
+        self.chunks = chunks
+        self.loaded_at = time.monotonic()
+        self.avg_length = sum(c.length for c in chunks) / len(chunks) if chunks else 0.0
+        document_frequency: Counter = Counter()
+        for chunk in chunks:
+            document_frequency.update(chunk.terms.keys())
+        n = len(chunks)
+        self.idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in document_frequency.items()
+        }
+
+    def _score(self, chunk: Chunk, query_terms: Iterable[str]) -> float:
+        score = 0.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * chunk.length / self.avg_length) if self.avg_length else BM25_K1
+        for term in query_terms:
+            tf = chunk.terms.get(term)
+            if tf:
+                score += self.idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+        return score
+
+    def search(
+        self,
+        query: str,
+        lesson_id: Optional[int] = None,
+        top_k: int = TOP_K,
+        token_budget: int = CONTEXT_TOKEN_BUDGET,
+    ) -> List[Chunk]:
+        """Best-scoring chunks for a question that together fit the token budget"""
+        query_terms = set(tokenize(query))
+        scored = []
+        for chunk in self.chunks:
+            score = self._score(chunk, query_terms)
+            if lesson_id is not None and chunk.source_type == "lesson" and chunk.source_id == lesson_id:
+                # Prefer the lesson being asked about; its opening is the fallback when nothing matches
+                score = score * LESSON_BOOST if score else 1e-6 / (1 + chunk.position)
+            if score > 0:
+                scored.append((score, chunk))
+        scored.sort(key=lambda item: item[0], reverse=True)
+
+        selected: List[Chunk] = []
+        used = 0
+        for _, chunk in scored:
+            if len(selected) == top_k:
+                break
+            if used + chunk.token_count > token_budget:
+                continue
+            selected.append(chunk)
+            used += chunk.token_count
+        return selected
+
+
+def format_context(chunks: List[Chunk]) -> str:
+    return "\n\n".join(f"[{chunk.label()}]\n{chunk.text}" for chunk in chunks)
+
+
+# Write-time indexing
+
+def index_source(db: Session, course_id: int, source_type: str, source_id: int, title: str, text: Optional[str]) -> int:
+    """Replace the stored chunks of one lesson or note"""
+    db.query(ContentChunk).filter(
+        ContentChunk.source_type == source_type,
+        ContentChunk.source_id == source_id,
+    ).delete(synchronize_session=False)
+    chunks = make_chunks(source_type, source_id, title, text)
+    db.add_all([
+        ContentChunk(
+            course_id=course_id,
+            source_type=source_type,
+            source_id=source_id,
+            position=chunk.position,
+            title=title,
+            text=chunk.text,
+            token_count=chunk.token_count,
+            term_counts=json.dumps(chunk.terms),
+        )
+        for chunk in chunks
+    ])
+    db.commit()
+    course_indexes.invalidate(course_id)
+    return len(chunks)
+
+
+def index_lesson(db: Session, lesson: Lesson) -> int:
+    return index_source(db, lesson.course_id, "lesson", lesson.id, lesson.title, lesson.content_text)
+
+
+def index_note(db: Session, note: CourseNote) -> int:
+    return index_source(db, note.course_id, "note", note.id, note.title, note.content)
+
+
+def remove_source(db: Session, course_id: int, source_type: str, source_id: int):
+    index_source(db, course_id, source_type, source_id, "", None)
+
+
+def index_course(db: Session, course_id: int) -> int:
+    """(Re)index every lesson and note of a course, e.g. for content written before indexing existed"""
+    lessons = db.query(Lesson).filter(Lesson.course_id == course_id).all()
+    notes = db.query(CourseNote).filter(CourseNote.course_id == course_id).all()
+    return sum(index_lesson(db, lesson) for lesson in lessons) + sum(index_note(db, note) for note in notes)
+
+
+class CourseIndexCache:
+    def __init__(self, ttl: float = INDEX_TTL):
+        self.ttl = ttl
+        self._indexes: Dict[int, CourseIndex] = {}
+        self.hits = 0
+        self.builds = 0
+
+    def get(self, db: Session, course_id: int) -> CourseIndex:
+        index = self._indexes.get(course_id)
+        if index is not None and time.monotonic() - index.loaded_at < self.ttl:
+            self.hits += 1
+            return index
+
+        rows = db.query(ContentChunk).filter(ContentChunk.course_id == course_id).order_by(
+            ContentChunk.source_type, ContentChunk.source_id, ContentChunk.position
+        ).all()
+        if not rows and course_id not in self._indexes and index_course(db, course_id):
+            # Content predating the chunk table is indexed on first use
+            return self.get(db, course_id)
+
+        index = CourseIndex([Chunk.from_row(row) for row in rows])
+        self._indexes[course_id] = index
+        self.builds += 1
+        return index
+
+    @staticmethod
+    def version(db: Session, course_id: int) -> str:
+        """Changes whenever any passage of the course is (re)indexed or removed; keys cached tutor answers"""
+        count, last_id, last_written = db.query(
+            func.count(ContentChunk.id), func.max(ContentChunk.id), func.max(ContentChunk.created_at)
+        ).filter(ContentChunk.course_id == course_id).one()
+        # Sources are replaced wholesale, so new rows move the newest id and write time
+        return f"{count}:{last_id}:{last_written}"
+
+    def invalidate(self, course_id: int):
+        self._indexes.pop(course_id, None)
+
+    def stats(self) -> Dict:
+        return {
+            "courses_cached": len(self._indexes),
+            "chunks_cached": sum(len(index.chunks) for index in self._indexes.values()),
+            "hits": self.hits,
+            "builds": self.builds,
+        }
+
+
+course_indexes = CourseIndexCache()
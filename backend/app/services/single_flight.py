@@ -0,0 +1,60 @@
+"""
+In-flight deduplication of identical concurrent calls.
+
+The first caller for a key leads: its call runs once and every caller that
+arrives with the same key before it finishes awaits the same future instead of
+making its own. The leader's call is shielded, so a leader whose client
+disconnects does not cancel the result its followers are waiting for.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.failures = 0
+
+    def join(self, key: Hashable) -> Optional[asyncio.Future]:
+        """The in-flight call for a key, if any; joining counts as a coalesced request"""
+        future = self._calls.get(key)
+        if future is None or future.done():
+            return None
+        self.coalesced += 1
+        return future
+
+    def lead(self, key: Hashable, call: Optional[Awaitable] = None) -> asyncio.Future:
+        """Register the leader for a key.
+
+        With ``call`` the returned task runs it; without, the caller resolves the
+        returned future itself (e.g. once a streamed answer is complete).
+        """
+        future = asyncio.ensure_future(call) if call is not None else asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        self.leaders += 1
+        future.add_done_callback(lambda done: self._finish(key, done))
+        return future
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        """Run ``fn`` once for concurrent callers sharing a key and return its result to all of them"""
+        future = self.join(key) or self.lead(key, fn())
+        return await asyncio.shield(future)
+
+    def _finish(self, key: Hashable, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        # Mark the outcome as retrieved even if every waiter went away
+        if future.cancelled() or future.exception() is not None:
+            self.failures += 1
+
+    def stats(self) -> Dict:
+        calls = self.leaders + self.coalesced
+        return {
+            "in_flight": len(self._calls),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced / calls, 3) if calls else None,
+            "failures": self.failures,
+        }
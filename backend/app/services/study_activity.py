@@ -0,0 +1,182 @@
+"""
+Daily learning activity as per-user bitmaps.
+
+Study streaks used to be recomputed on every stats call by loading up to 30
+days of ``user_progress`` rows, building a set of dates and walking it. Each
+user now has a ``user_activity`` row holding one bit per day since their
+first activity (about 46 bytes a year), plus one row per course they were
+active in. Learning endpoints (lesson progress, quiz attempts, assignment
+submissions, logged study hours) set today's bit in their own transaction;
+a day already marked is not written again. Existing rows are read with
+``FOR UPDATE`` so two requests setting different bits do not overwrite each
+other, and a first insert that loses the race marks the winner's row instead.
+
+The current streak is the run of set bits ending today or yesterday, found
+with a mask and ``bit_length`` on the bitmap as an integer; the longest
+streak is kept on the row and updated as bits are set. Heatmaps are a slice
+of the same bitmap.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from ..models.progress import UserActivity
+
+ALL_COURSES = 0
+MAX_HEATMAP_DAYS = 366
+
+
+def to_int(days: Optional[bytes]) -> int:
+    return int.from_bytes(days or b"", "little")
+
+
+def to_bytes(bits: int) -> bytes:
+    return bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+
+
+def run_ending(bits: int, index: int) -> int:
+    """Length of the run of set bits ending at ``index``"""
+    if index < 0 or not (bits >> index) & 1:
+        return 0
+    gaps = ~bits & ((1 << (index + 1)) - 1)  # unset days up to index; the highest one ends the run
+    return index + 1 - gaps.bit_length()
+
+
+def run_through(bits: int, index: int) -> int:
+    """Length of the run of set bits containing ``index``"""
+    if index < 0 or not (bits >> index) & 1:
+        return 0
+    above = bits >> (index + 1)
+    return run_ending(bits, index) + (above ^ (above + 1)).bit_length() - 1  # trailing ones above index
+
+
+def current_streak(row: UserActivity, today: date) -> int:
+    """Consecutive active days ending today, or yesterday if today has no activity yet"""
+    bits = to_int(row.days)
+    index = (today - row.first_day).days
+    return run_ending(bits, index) or run_ending(bits, index - 1)
+
+
+def summary(row: Optional[UserActivity], today: date) -> Dict:
+    if row is None:
+        return {"current_streak": 0, "longest_streak": 0, "last_active_on": None}
+    return {
+        "current_streak": current_streak(row, today),
+        "longest_streak": row.longest_streak,
+        "last_active_on": row.last_active_on,
+    }
+
+
+def window(row: Optional[UserActivity], start: date, days: int) -> List[int]:
+    """1/0 per day from ``start``, oldest first"""
+    if row is None:
+        return [0] * days
+    bits = to_int(row.days)
+    offset = (start - row.first_day).days
+    bits = bits >> offset if offset >= 0 else bits << -offset
+    bits &= (1 << days) - 1
+    return [(bits >> day) & 1 for day in range(days)]
+
+
+class StudyActivity:
+    def __init__(self):
+        self.recorded = 0
+        self.marked = 0
+
+    def record(self, db, user_id: int, course_ids: Iterable[int] = (), on: Optional[date] = None):
+        """Mark the day active for the user overall and in the given courses; caller commits"""
+        on = on or datetime.utcnow().date()
+        scopes = {ALL_COURSES, *(course_id for course_id in course_ids if course_id)}
+        rows = {
+            row.course_id: row for row in self._locked(db, user_id, scopes).order_by(UserActivity.course_id).all()
+        }
+        self.recorded += 1
+        for course_id in sorted(scopes):
+            row = rows.get(course_id)
+            if row is None:
+                row = UserActivity(user_id=user_id, course_id=course_id, first_day=on, days=b"", last_active_on=on, longest_streak=0)
+                self._mark(row, on)
+                try:
+                    # Savepoint: losing the race must not roll back the caller's transaction
+                    with db.begin_nested():
+                        db.add(row)
+                except IntegrityError:
+                    # Another request inserted the row first; set our bit on theirs
+                    row = self._locked(db, user_id, [course_id]).one()
+                    if not self._mark(row, on):
+                        continue
+                self.marked += 1
+            elif self._mark(row, on):
+                self.marked += 1
+
+    @staticmethod
+    def _locked(db, user_id: int, course_ids: Iterable[int]):
+        return db.query(UserActivity).filter(
+            UserActivity.user_id == user_id,
+            UserActivity.course_id.in_(list(course_ids))
+        ).with_for_update()
+
+    @staticmethod
+    def _mark(row: UserActivity, day: date) -> bool:
+        bits = to_int(row.days)
+        if day < row.first_day:
+            bits <<= (row.first_day - day).days
+            row.first_day = day
+        index = (day - row.first_day).days
+        if (bits >> index) & 1:
+            return False
+        bits |= 1 << index
+        row.days = to_bytes(bits)
+        row.longest_streak = max(row.longest_streak or 0, run_through(bits, index))
+        row.last_active_on = max(row.last_active_on, day) if row.last_active_on else day
+        return True
+
+    # Reads
+
+    def rows(self, db, user_id: int, course_ids: Iterable[int] = (ALL_COURSES,)) -> Dict[int, UserActivity]:
+        return {
+            row.course_id: row for row in db.query(UserActivity).filter(
+                UserActivity.user_id == user_id,
+                UserActivity.course_id.in_(list(course_ids))
+            ).all()
+        }
+
+    def current_streaks(self, db, user_ids: Iterable[int], today: Optional[date] = None) -> Dict[int, int]:
+        """Current streak across all courses of several users, one query"""
+        today = today or datetime.utcnow().date()
+        user_ids = list(user_ids)
+        rows = db.query(UserActivity).filter(
+            UserActivity.user_id.in_(user_ids),
+            UserActivity.course_id == ALL_COURSES
+        ).all()
+        streaks = {user_id: 0 for user_id in user_ids}
+        streaks.update((row.user_id, current_streak(row, today)) for row in rows)
+        return streaks
+
+    def streaks(self, db, user_id: int, course_ids: Iterable[int] = (ALL_COURSES,), today: Optional[date] = None) -> Dict[int, Dict]:
+        """Current and longest streak per course (``ALL_COURSES`` for any course), one query"""
+        today = today or datetime.utcnow().date()
+        course_ids = list(course_ids)
+        rows = self.rows(db, user_id, course_ids)
+        return {course_id: summary(rows.get(course_id), today) for course_id in course_ids}
+
+    def heatmap(self, db, user_id: int, course_id: int = ALL_COURSES, days: int = 365, today: Optional[date] = None) -> Dict:
+        today = today or datetime.utcnow().date()
+        days = max(min(days, MAX_HEATMAP_DAYS), 1)
+        start = today - timedelta(days=days - 1)
+        row = self.rows(db, user_id, [course_id]).get(course_id)
+        active = window(row, start, days)
+        return {
+            "start": start.isoformat(),
+            "end": today.isoformat(),
+            "days": active,
+            "active_days": sum(active),
+            **summary(row, today),
+        }
+
+    def stats(self) -> Dict:
+        return {"activities_recorded": self.recorded, "days_marked": self.marked}
+
+
+study_activity = StudyActivity()
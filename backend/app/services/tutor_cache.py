@@ -0,0 +1,258 @@
+"""
+Answer cache for the AI tutor.
+
+Answers are keyed by (course_id, lesson_id, difficulty_level, normalized
+question). Besides exact matches on the normalized text, near-duplicate
+questions ("what is recursion" / "explain recursion?") are matched with
+MinHash signatures over character shingles, bucketed with LSH bands so a
+lookup only compares a handful of candidates. Character shingles cannot tell
+"solve 2x + 3 = 7" from "solve 2x + 3 = 9", or "celsius to fahrenheit" from
+"fahrenheit to celsius", so a near match is only served when both questions
+have the same numbers and operators and their shared words in the same order.
+The cache is an LRU bounded by
+entry count and TTL; entries remember a fingerprint of the lesson content they
+were generated from and are dropped when the lesson changes.
+"""
+import hashlib
+import re
+import struct
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from .single_flight import SingleFlight
+
+MAX_ENTRIES = 2000
+TTL_SECONDS = 24 * 60 * 60
+SIMILARITY_THRESHOLD = 0.8
+NUM_PERMUTATIONS = 64
+BANDS = 16  # 16 bands x 4 rows: pairs above ~0.75 Jaccard almost always share a band
+SHINGLE_SIZE = 3
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# Phrasing that does not change what is being asked
+_FILLER_PHRASES = [
+    "can you please", "could you please", "can you", "could you", "please",
+    "explain to me", "explain", "tell me about", "tell me", "help me understand",
+    "i want to know", "i dont understand", "what is meant by", "what is", "what are",
+    "what does", "whats", "define", "describe", "meaning of", "the concept of",
+]
+_STOPWORDS = {"a", "an", "the", "of", "to", "me", "in", "is", "are", "do", "does", "about", "and"}
+
+CacheKey = Tuple[int, Optional[int], str, str]
+
+
+# Numbers (with any attached variable, e.g. "2x"), words, and math operators kept as tokens
+_TOKEN = re.compile(r"\d+(?:\.\d+)?[a-z]*|[a-z0-9]+|[-+*/=^<>%]")
+_OPERATORS = set("-+*/=^<>%")
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation, filler phrasing and stopwords; numbers and operators are kept"""
+    text = " " + " ".join(_TOKEN.findall(question.lower().replace("'", ""))) + " "
+    for phrase in _FILLER_PHRASES:
+        text = text.replace(f" {phrase} ", " ")
+    words = [_singular(word) for word in text.split() if word not in _STOPWORDS]
+    return " ".join(words)
+
+
+def _operands(words: List[str]) -> List[str]:
+    return [word for word in words if word in _OPERATORS or any(char.isdigit() for char in word)]
+
+
+def same_terms(left: str, right: str) -> bool:
+    """Whether two normalized questions share their numbers and operators, and their common words in order"""
+    left_words, right_words = left.split(), right.split()
+    if _operands(left_words) != _operands(right_words):
+        return False
+    shared = set(left_words) & set(right_words)
+    return [word for word in left_words if word in shared] == [word for word in right_words if word in shared]
+
+
+def _singular(word: str) -> str:
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def content_fingerprint(*parts: Optional[str]) -> str:
+    """Stable fingerprint of the lesson/course text an answer was generated from"""
+    digest = hashlib.blake2b(digest_size=12)
+    for part in parts:
+        digest.update((part or "").encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def _shingles(text: str) -> Set[bytes]:
+    padded = f" {text} "
+    if len(padded) <= SHINGLE_SIZE:
+        return {padded.encode("utf-8")}
+    return {padded[i:i + SHINGLE_SIZE].encode("utf-8") for i in range(len(padded) - SHINGLE_SIZE + 1)}
+
+
+def _permutations(count: int) -> List[Tuple[int, int]]:
+    # Derived deterministically so signatures agree across processes and restarts
+    params = []
+    for i in range(count):
+        seed = hashlib.blake2b(f"tutor-minhash-{i}".encode(), digest_size=16).digest()
+        a, b = struct.unpack("<QQ", seed)
+        params.append((a % (_MERSENNE_PRIME - 1) + 1, b % _MERSENNE_PRIME))
+    return params
+
+
+_PERMUTATIONS = _permutations(NUM_PERMUTATIONS)
+
+
+def minhash(text: str) -> Tuple[int, ...]:
+    hashes = [
+        struct.unpack("<I", hashlib.blake2b(shingle, digest_size=4).digest())[0]
+        for shingle in _shingles(text)
+    ]
+    return tuple(
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def similarity(left: Tuple[int, ...], right: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return sum(1 for x, y in zip(left, right) if x == y) / len(left)
+
+
+class CacheEntry:
+    def __init__(self, key: CacheKey, signature: Tuple[int, ...], fingerprint: str, value: Dict, expires_at: float):
+        self.key = key
+        self.signature = signature
+        self.fingerprint = fingerprint
+        self.value = value
+        self.expires_at = expires_at
+        self.hits = 0
+
+
+class TutorAnswerCache:
+    def __init__(
+        self,
+        max_entries: int = MAX_ENTRIES,
+        ttl: float = TTL_SECONDS,
+        threshold: float = SIMILARITY_THRESHOLD,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries: "OrderedDict[CacheKey, CacheEntry]" = OrderedDict()
+        self._bands: Dict[Tuple, Set[CacheKey]] = {}  # (scope, band index, band values) -> keys
+        self._by_lesson: Dict[Tuple[int, Optional[int]], Set[CacheKey]] = {}
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key_for(course_id: int, lesson_id: Optional[int], difficulty: str, question: str) -> CacheKey:
+        return (course_id, lesson_id, difficulty.lower(), normalize_question(question))
+
+    def get(self, key: CacheKey, fingerprint: str) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is not None and self._usable(entry, fingerprint):
+            self.exact_hits += 1
+            return self._hit(entry, exact=True)
+
+        signature = minhash(key[3])
+        best, best_score = None, 0.0
+        for candidate_key in self._candidates(key, signature):
+            candidate = self._entries.get(candidate_key)
+            if candidate is None or not self._usable(candidate, fingerprint):
+                continue
+            score = similarity(signature, candidate.signature)
+            if score > best_score and score >= self.threshold and same_terms(key[3], candidate_key[3]):
+                best, best_score = candidate, score
+
+        if best is not None:
+            self.near_hits += 1
+            return self._hit(best, exact=False, score=best_score)
+
+        self.misses += 1
+        return None
+
+    def put(self, key: CacheKey, fingerprint: str, value: Dict):
+        self._remove(key)
+        signature = minhash(key[3])
+        self._entries[key] = CacheEntry(key, signature, fingerprint, value, time.monotonic() + self.ttl)
+        for band in self._band_keys(key, signature):
+            self._bands.setdefault(band, set()).add(key)
+        self._by_lesson.setdefault(key[:2], set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate_lesson(self, course_id: int, lesson_id: Optional[int]):
+        """Drop answers generated from a lesson whose content changed"""
+        for key in list(self._by_lesson.get((course_id, lesson_id), ())):
+            self._remove(key)
+            self.invalidations += 1
+
+    def invalidate_course(self, course_id: int):
+        for scope in [scope for scope in self._by_lesson if scope[0] == course_id]:
+            self.invalidate_lesson(*scope)
+
+    def _usable(self, entry: CacheEntry, fingerprint: str) -> bool:
+        if entry.expires_at <= time.monotonic() or entry.fingerprint != fingerprint:
+            self._remove(entry.key)
+            return False
+        return True
+
+    def _hit(self, entry: CacheEntry, exact: bool, score: float = 1.0) -> Dict:
+        entry.hits += 1
+        self._entries.move_to_end(entry.key)
+        return {**entry.value, "cached": True, "cache_match": "exact" if exact else "near", "cache_similarity": round(score, 3)}
+
+    def _band_keys(self, key: CacheKey, signature: Tuple[int, ...]) -> List[Tuple]:
+        rows = NUM_PERMUTATIONS // BANDS
+        scope = key[:3]
+        return [(scope, i, signature[i * rows:(i + 1) * rows]) for i in range(BANDS)]
+
+    def _candidates(self, key: CacheKey, signature: Tuple[int, ...]) -> Set[CacheKey]:
+        candidates: Set[CacheKey] = set()
+        for band in self._band_keys(key, signature):
+            candidates.update(self._bands.get(band, ()))
+        return candidates
+
+    def _remove(self, key: CacheKey):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band in self._band_keys(key, entry.signature):
+            keys = self._bands.get(band)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._bands[band]
+        lesson_keys = self._by_lesson.get(key[:2])
+        if lesson_keys is not None:
+            lesson_keys.discard(key)
+            if not lesson_keys:
+                del self._by_lesson[key[:2]]
+
+    def stats(self) -> Dict:
+        lookups = self.exact_hits + self.near_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.exact_hits + self.near_hits) / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+tutor_cache = TutorAnswerCache()
+# Identical tutor requests already waiting on the upstream share its answer
+tutor_flights = SingleFlight()
@@ -0,0 +1,243 @@
+"""
+Incrementally maintained unread-notification counts.
+
+The unread badge is polled constantly, so it is served from counters instead
+of counting rows. Each user's ``notification_read_states`` row carries:
+
+- ``unread_personal``: unread personal notifications, adjusted in the same
+  transaction as every create, read and delete;
+- ``read_broadcasts_above``: broadcasts above the read watermark the user has
+  read or deleted one by one (they have a receipt), reset when the watermark
+  moves.
+
+Broadcasts are few and shared, so the unread broadcast count is derived from
+an in-process index kept in sync with one primary-key ``max(id)`` probe per
+read: broadcasts above the watermark that target the user, minus
+``read_broadcasts_above``. The index keeps sorted ids and send times per
+audience (target role and sub-role), so a count is two bisects in each of the
+at most four audiences that include the user.
+
+Counters of users without a state row, or not yet reconciled, are computed
+from the tables on first read. A periodic reconcile recomputes every counter
+with set-based statements, correcting any drift.
+"""
+import asyncio
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from ..database import SessionLocal
+from ..models.notification import BroadcastNotification, BroadcastReceipt, Notification, NotificationReadState
+from ..models.user import User
+
+RECONCILE_INTERVAL = 10 * 60
+
+Audience = Tuple[Optional[str], Optional[str]]  # target_role, target_sub_role; None targets everyone
+
+
+class BroadcastIndex:
+    """Broadcast ids and send times per audience, ascending by id"""
+
+    def __init__(self):
+        self._newest = 0
+        self._size = 0
+        # audience -> (ids, running max of send times); both sorted, so counts are two bisects
+        self._audiences: Dict[Audience, Tuple[List[int], List[datetime]]] = {}
+        self._lock = threading.Lock()  # sync endpoints run in the threadpool
+
+    def sync(self, db):
+        newest = db.query(func.max(BroadcastNotification.id)).scalar() or 0
+        if newest == self._newest:
+            return
+        if newest < self._newest:
+            # Broadcasts were deleted: reload from scratch
+            self.reset()
+        with self._lock:
+            rows = db.query(
+                BroadcastNotification.id,
+                BroadcastNotification.created_at,
+                BroadcastNotification.target_role,
+                BroadcastNotification.target_sub_role
+            ).filter(BroadcastNotification.id > self._newest).order_by(BroadcastNotification.id).all()
+            for broadcast_id, created_at, role, sub_role in rows:
+                ids, sent = self._audiences.setdefault((role, sub_role), ([], []))
+                ids.append(broadcast_id)
+                sent.append(max(sent[-1], created_at) if sent else created_at)
+                self._newest = broadcast_id
+                self._size += 1
+
+    def reset(self):
+        with self._lock:
+            self._newest = 0
+            self._size = 0
+            self._audiences = {}
+
+    def count_above(self, watermark: int, user: User) -> int:
+        """Broadcasts newer than the watermark that target the user and were sent after they joined"""
+        audiences = {(None, None), (None, user.sub_role), (user.role, None), (user.role, user.sub_role)}
+        count = 0
+        with self._lock:
+            for audience in audiences:
+                indexed = self._audiences.get(audience)
+                if indexed is None:
+                    continue
+                ids, sent = indexed
+                start = bisect_right(ids, watermark)
+                if user.created_at is not None:
+                    start = max(start, bisect_left(sent, user.created_at))
+                count += len(ids) - start
+        return count
+
+    def __len__(self):
+        return self._size
+
+
+class UnreadCounters:
+    def __init__(self, session_factory=SessionLocal):
+        self._session_factory = session_factory
+        self.broadcasts = BroadcastIndex()
+        self.reads = 0
+        self.recounts = 0
+        self.reconciles = 0
+        self.drift_corrected = 0
+
+    # Serving
+
+    def unread_count(self, db, user: User) -> int:
+        return self.unread_counts(db, [user])[user.id]
+
+    def unread_counts(self, db, users: List) -> Dict[int, int]:
+        """Unread counts of several users with one query; users need id, role, sub_role and created_at"""
+        if not users:
+            return {}
+        states = {
+            state.user_id: state
+            for state in db.query(NotificationReadState).filter(
+                NotificationReadState.user_id.in_([user.id for user in users])
+            ).all()
+        }
+        self.broadcasts.sync(db)
+        counts = {}
+        for user in users:
+            state = states.get(user.id)
+            if state is None or state.counters_reconciled_at is None:
+                state = self._recount(db, user.id, state)
+            broadcast = self.broadcasts.count_above(state.last_read_broadcast_id, user) - state.read_broadcasts_above
+            counts[user.id] = state.unread_personal + max(broadcast, 0)
+        self.reads += len(users)
+        return counts
+
+    def _recount(self, db, user_id: int, state: Optional[NotificationReadState]) -> NotificationReadState:
+        """Materialize the user's counters from the tables"""
+        self.recounts += 1
+        if state is None:
+            state = NotificationReadState(user_id=user_id, last_read_broadcast_id=0)
+            db.add(state)
+        state.unread_personal = db.query(func.count(Notification.id)).filter(
+            Notification.user_id == user_id,
+            Notification.is_read == False
+        ).scalar()
+        state.read_broadcasts_above = db.query(func.count(BroadcastReceipt.id)).filter(
+            BroadcastReceipt.user_id == user_id,
+            BroadcastReceipt.broadcast_id > state.last_read_broadcast_id
+        ).scalar()
+        state.counters_reconciled_at = datetime.utcnow()
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another request materialized the row first; its counts are as fresh as ours
+            db.rollback()
+            state = db.query(NotificationReadState).filter(NotificationReadState.user_id == user_id).one()
+        return state
+
+    # Incremental updates; each runs in the caller's transaction. Users without
+    # materialized counters are skipped: their first read counts from the tables.
+
+    def personal_created(self, db, user_ids: Iterable[int]):
+        counts: Dict[int, int] = {}
+        for user_id in user_ids:
+            counts[user_id] = counts.get(user_id, 0) + 1
+        by_count: Dict[int, List[int]] = {}
+        for user_id, count in counts.items():
+            by_count.setdefault(count, []).append(user_id)
+        for count, ids in by_count.items():
+            db.execute(update(NotificationReadState).where(
+                NotificationReadState.user_id.in_(ids)
+            ).values(unread_personal=NotificationReadState.unread_personal + count))
+
+    def personal_created_for(self, db, users_query):
+        """Increment users selected by a query, for notifications inserted set-based from the same selection"""
+        db.execute(update(NotificationReadState).where(
+            NotificationReadState.user_id.in_(users_query)
+        ).values(unread_personal=NotificationReadState.unread_personal + 1))
+
+    def personal_read(self, db, user_id: int, count: int = 1):
+        db.execute(update(NotificationReadState).where(
+            NotificationReadState.user_id == user_id
+        ).values(unread_personal=case(
+            (NotificationReadState.unread_personal > count, NotificationReadState.unread_personal - count),
+            else_=0
+        )))
+
+    def broadcast_receipted(self, db, user_id: int):
+        """A broadcast above the watermark was read or deleted individually"""
+        db.execute(update(NotificationReadState).where(
+            NotificationReadState.user_id == user_id
+        ).values(read_broadcasts_above=NotificationReadState.read_broadcasts_above + 1))
+
+    # Reconciliation
+
+    def reconcile(self) -> int:
+        """Recompute every materialized counter; returns how many were off"""
+        db = self._session_factory()
+        try:
+            personal = select(func.count(Notification.id)).where(
+                Notification.user_id == NotificationReadState.user_id,
+                Notification.is_read == False
+            ).scalar_subquery()
+            receipts = select(func.count(BroadcastReceipt.id)).where(
+                BroadcastReceipt.user_id == NotificationReadState.user_id,
+                BroadcastReceipt.broadcast_id > NotificationReadState.last_read_broadcast_id
+            ).scalar_subquery()
+            drifted = db.query(func.count(NotificationReadState.id)).filter(
+                NotificationReadState.counters_reconciled_at.isnot(None),
+                (NotificationReadState.unread_personal != personal) | (NotificationReadState.read_broadcasts_above != receipts)
+            ).scalar()
+            db.execute(update(NotificationReadState).values(
+                unread_personal=personal,
+                read_broadcasts_above=receipts,
+                counters_reconciled_at=datetime.utcnow()
+            ))
+            db.commit()
+        finally:
+            db.close()
+        self.broadcasts.reset()
+        self.reconciles += 1
+        self.drift_corrected += drifted
+        return drifted
+
+    async def run_reconciler(self, interval: float = RECONCILE_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                drifted = await asyncio.to_thread(self.reconcile)
+                if drifted:
+                    print(f"Unread counters reconciled, {drifted} corrected")
+            except Exception as e:
+                print(f"Unread counter reconcile failed: {e}")
+
+    def stats(self) -> Dict:
+        return {
+            "broadcasts_indexed": len(self.broadcasts),
+            "reads": self.reads,
+            "recounts": self.recounts,
+            "reconciles": self.reconciles,
+            "drift_corrected": self.drift_corrected,
+        }
+
+
+unread_counters = UnreadCounters()
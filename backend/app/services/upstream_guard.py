@@ -0,0 +1,263 @@
+"""
+Protection for the API against a slow or failing AI upstream.
+
+``UpstreamGuard`` wraps every upstream call with:
+
+- a per-process concurrency limit; callers queue briefly for a slot and are
+  shed with ``UpstreamUnavailable`` rather than piling up worker time;
+- a circuit breaker that opens after consecutive failures or timeouts, fails
+  fast while open, and lets a single probe through after a cool-down;
+- retries with full-jitter exponential backoff, drawn from a global retry
+  budget that earns a fraction of a retry per call, so retries cannot
+  multiply load during an outage.
+
+Callers catch ``UpstreamUnavailable`` (an ``LLMError``) and serve the canned
+fallback answer.
+"""
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+
+T = TypeVar("T")
+
+MAX_CONCURRENCY = 8
+QUEUE_TIMEOUT = 2.0
+ATTEMPT_TIMEOUT = 20.0
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30.0
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.2
+BACKOFF_MAX = 2.0
+RETRY_RATIO = 0.1  # each call earns this much retry budget
+RETRY_BUDGET_MAX = 10.0
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class LLMError(Exception):
+    """The upstream answered with a non-200 status"""
+
+    def __init__(self, status_code: int, message: Optional[str] = None):
+        super().__init__(message or f"OpenAI API error ({status_code})")
+        self.status_code = status_code
+
+
+class UpstreamUnavailable(LLMError):
+    """Shed without calling the upstream: circuit open or no free slot"""
+
+    def __init__(self, reason: str):
+        super().__init__(503, f"AI upstream unavailable ({reason})")
+        self.reason = reason
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, UpstreamUnavailable):
+        return False
+    if isinstance(error, LLMError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.state = CLOSED
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.times_opened += 1
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """A half-open probe that never reached the upstream must not block the next one"""
+        self._probe_in_flight = False
+
+    def retry_after(self) -> Optional[float]:
+        if self.state != OPEN:
+            return None
+        return max(0.0, round(self.reset_timeout - (time.monotonic() - self.opened_at), 1))
+
+
+class RetryBudget:
+    def __init__(self, ratio: float = RETRY_RATIO, max_tokens: float = RETRY_BUDGET_MAX):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+
+    def deposit(self):
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class UpstreamGuard:
+    def __init__(
+        self,
+        max_concurrency: int = MAX_CONCURRENCY,
+        queue_timeout: float = QUEUE_TIMEOUT,
+        attempt_timeout: float = ATTEMPT_TIMEOUT,
+        max_retries: int = MAX_RETRIES,
+    ):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.attempt_timeout = attempt_timeout
+        self.max_retries = max_retries
+        self.breaker = CircuitBreaker()
+        self.retry_budget = RetryBudget()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop = None
+        self.in_flight = 0
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.retries_denied = 0
+        self.rejected_open = 0
+        self.rejected_busy = 0
+
+    def _slots(self) -> asyncio.Semaphore:
+        # asyncio primitives belong to one loop; test clients and reloads start new ones
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    async def acquire(self) -> bool:
+        """Take a concurrency slot, or fail fast when the circuit is open or the queue is too slow.
+
+        Returns True when this caller holds the half-open probe; pass it back to ``release``.
+        """
+        if not self.breaker.allow():
+            self.rejected_open += 1
+            raise UpstreamUnavailable("circuit open")
+        probe = self.breaker.state == HALF_OPEN
+        slots = self._slots()
+        try:
+            await asyncio.wait_for(slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected_busy += 1
+            if probe:
+                self.breaker.release_probe()
+            raise UpstreamUnavailable("too many concurrent requests")
+        self.in_flight += 1
+        self.calls += 1
+        self.retry_budget.deposit()
+        return probe
+
+    def release(self, probe: bool = False):
+        self.in_flight -= 1
+        self._slots().release()
+        # A probe abandoned mid-stream (client disconnected) or answered with a client error must
+        # not keep the circuit half-open; only its owner may free it
+        if probe and self.breaker.state == HALF_OPEN:
+            self.breaker.release_probe()
+
+    def record_success(self):
+        self.successes += 1
+        self.breaker.record_success()
+
+    def record_failure(self, error: BaseException):
+        if not is_retryable(error):
+            # Client errors (bad request, auth) say nothing about upstream health either way
+            return
+        self.failures += 1
+        if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException)):
+            self.timeouts += 1
+        self.breaker.record_failure()
+
+    async def should_retry(self, error: BaseException, attempt: int) -> bool:
+        """Back off and return True when another attempt is allowed"""
+        if not is_retryable(error) or attempt >= self.max_retries or self.breaker.state == OPEN:
+            return False
+        if not self.retry_budget.withdraw():
+            self.retries_denied += 1
+            return False
+        self.retries += 1
+        # Full jitter keeps retrying clients from synchronizing
+        await asyncio.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+        return True
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run one upstream request under the concurrency limit, breaker and retry budget"""
+        probe = await self.acquire()
+        try:
+            attempt = 0
+            while True:
+                try:
+                    result = await asyncio.wait_for(fn(), self.attempt_timeout)
+                except Exception as e:
+                    self.record_failure(e)
+                    if await self.should_retry(e, attempt):
+                        attempt += 1
+                        continue
+                    raise
+                self.record_success()
+                return result
+        finally:
+            self.release(probe)
+
+    def stats(self) -> Dict:
+        return {
+            "circuit": {
+                "state": self.breaker.state,
+                "consecutive_failures": self.breaker.consecutive_failures,
+                "times_opened": self.breaker.times_opened,
+                "retry_after_seconds": self.breaker.retry_after(),
+            },
+            "concurrency": {
+                "limit": self.max_concurrency,
+                "in_flight": self.in_flight,
+                "queue_timeout_seconds": self.queue_timeout,
+            },
+            "retry_budget": {
+                "available": round(self.retry_budget.tokens, 2),
+                "max": self.retry_budget.max_tokens,
+                "ratio": self.retry_budget.ratio,
+            },
+            "calls": self.calls,
+            "successes": self.successes,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "retries": self.retries,
+            "retries_denied": self.retries_denied,
+            "rejected_open": self.rejected_open,
+            "rejected_busy": self.rejected_busy,
+        }
+
+
+upstream_guard = UpstreamGuard()
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+Chat WebSocket load generator for Gyanvruksh
+
+Starts a local app instance on a throwaway SQLite database (or targets --base-url
+together with the --database-url it uses, so seeded users and tokens are valid),
+opens a swarm of authenticated clients on /api/chat/ws/{room_id} and reports
+connection capacity, server memory per connection and fan-out latency as JSON.
+
+Example:
+    python chat_load_test.py --clients 2000 --rooms 20 --duration 30 --output chat_load.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import websockets
+from sqlalchemy import select
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_SUBPROTOCOL = "gyanvruksh.chat.v2+msgpack"
+LOAD_PREFIX = "lt:"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Chat WebSocket load test")
+    parser.add_argument("--base-url", help="Target an already running server instead of starting one")
+    parser.add_argument("--database-url", help="Database the target server uses (default: throwaway SQLite)")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the local app instance")
+    parser.add_argument("--clients", type=int, default=500, help="Concurrent WebSocket clients")
+    parser.add_argument("--rooms", type=int, default=10, help="Rooms the clients are spread across")
+    parser.add_argument("--senders", type=float, default=0.1, help="Fraction of clients that send messages")
+    parser.add_argument("--message-rate", type=float, default=0.5, help="Messages per second per sender")
+    parser.add_argument("--typing-rate", type=float, default=1.0, help="Typing events per second per sender")
+    parser.add_argument("--slow", type=float, default=0.05, help="Fraction of clients that read slowly")
+    parser.add_argument("--slow-delay", type=float, default=0.25, help="Seconds a slow client sleeps per frame")
+    parser.add_argument("--abrupt", type=float, default=0.05, help="Fraction of clients that drop the TCP connection")
+    parser.add_argument("--connect-rate", type=float, default=200.0, help="New connections per second during ramp-up")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of steady-state traffic")
+    parser.add_argument("--protocol", choices=["json", "msgpack"], default="json")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON summary to this file")
+    return parser.parse_args()
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return round(ordered[index], 3)
+
+
+def raise_fd_limit():
+    """Thousands of sockets need more than the default 1024 descriptors"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def rss_kb(pid: Optional[int]) -> Optional[int]:
+    """Resident set size of a process from /proc (Linux only)"""
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def seed_users(database_url: str, count: int, room_count: int) -> Tuple[List[str], List[str]]:
+    """Insert load-test users, one course per room with every user enrolled in its room,
+    and return (access tokens, room ids)"""
+    os.environ["DATABASE_URL"] = database_url
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app.database import Base, engine
+    from app.models.course import Course
+    from app.models.enrollment import Enrollment
+    from app.models.user import User
+    from app.services.chat_rooms import course_room_id
+    from app.services.security import create_access_token
+    import app.main  # noqa: F401  registers every model on Base.metadata
+
+    Base.metadata.create_all(bind=engine)
+    emails = [f"load{i}@loadtest.local" for i in range(count)]
+    with engine.begin() as conn:
+        # Remove rows left by a previous run against the same database
+        previous_users = select(User.id).where(User.email.like("%@loadtest.local"))
+        conn.execute(Enrollment.__table__.delete().where(Enrollment.student_id.in_(previous_users)))
+        conn.execute(Course.__table__.delete().where(Course.title.like("Load Course %")))
+        conn.execute(User.__table__.delete().where(User.email.like("%@loadtest.local")))
+        conn.execute(User.__table__.insert(), [
+            {
+                "email": email,
+                "full_name": f"Load Student {i}",
+                "hashed_password": "!",
+                "role": "service_seeker",
+                "sub_role": "student",
+                "is_active": True,
+                "is_teacher": False,
+                "gyan_coins": 0,
+            }
+            for i, email in enumerate(emails)
+        ])
+        user_ids = [row[0] for row in conn.execute(
+            select(User.id).where(User.email.like("%@loadtest.local")).order_by(User.id)
+        )]
+        course_ids = [
+            conn.execute(Course.__table__.insert().values(
+                title=f"Load Course {i}", description="Load test room", total_hours=0,
+                difficulty="beginner", rating=0.0, enrollment_count=0, is_published=True,
+            )).inserted_primary_key[0]
+            for i in range(room_count)
+        ]
+        conn.execute(Enrollment.__table__.insert(), [
+            {"student_id": user_id, "course_id": course_ids[i % room_count], "hours_completed": 0, "progress": 0}
+            for i, user_id in enumerate(user_ids)
+        ])
+    tokens = [create_access_token(email, expires_minutes=24 * 60) for email in emails]
+    return tokens, [course_room_id(course_id) for course_id in course_ids]
+
+
+def start_server(database_url: str, port: int) -> subprocess.Popen:
+    env = dict(os.environ, DATABASE_URL=database_url)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--log-level", "warning", "--ws", "websockets"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+    )
+
+
+async def wait_ready(base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(f"{base_url}/healthz")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become ready")
+
+
+class Stats:
+    def __init__(self):
+        self.established = 0
+        self.failed = 0
+        self.abrupt = 0
+        self.closed_by_server = 0
+        self.sent = 0
+        self.received = 0
+        self.frames = 0
+        self.latencies_ms: List[float] = []
+        self.connect_ms: List[float] = []
+        self.errors: Dict[str, int] = {}
+
+    def error(self, exc: Exception):
+        key = type(exc).__name__
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+
+class LoadClient:
+    def __init__(self, index: int, token: str, room: str, args, stats: Stats, rng: random.Random):
+        self.index = index
+        self.token = token
+        self.room = room
+        self.args = args
+        self.stats = stats
+        self.sender = rng.random() < args.senders
+        self.slow = rng.random() < args.slow
+        self.abrupt = rng.random() < args.abrupt
+        self.rng = random.Random(rng.random())
+        self.ws = None
+        self.aborted = False
+
+    def encode(self, frame: Dict):
+        if self.args.protocol == "msgpack":
+            return msgpack.packb(frame)
+        return json.dumps(frame)
+
+    def decode(self, data) -> Dict:
+        if isinstance(data, bytes):
+            frame = msgpack.unpackb(data, strict_map_key=False)
+            return {"type": frame.get("t"), "message": frame.get("m")}
+        return json.loads(data)
+
+    async def connect(self, ws_url: str) -> bool:
+        subprotocols = [MSGPACK_SUBPROTOCOL] if self.args.protocol == "msgpack" else None
+        started = time.perf_counter()
+        try:
+            self.ws = await websockets.connect(
+                f"{ws_url}/api/chat/ws/{self.room}?token={self.token}",
+                subprotocols=subprotocols,
+                open_timeout=30,
+                max_queue=None,
+            )
+        except Exception as e:
+            self.stats.failed += 1
+            self.stats.error(e)
+            return False
+        self.stats.connect_ms.append((time.perf_counter() - started) * 1000)
+        self.stats.established += 1
+        return True
+
+    async def receive_loop(self, stop: asyncio.Event):
+        try:
+            async for data in self.ws:
+                frame = self.decode(data)
+                self.stats.frames += 1
+                text = frame.get("message") or ""
+                if frame.get("type") == "chat" and text.startswith(LOAD_PREFIX):
+                    sent_at = float(text.split(":")[2])
+                    self.stats.latencies_ms.append((time.perf_counter() - sent_at) * 1000)
+                    self.stats.received += 1
+                if self.slow:
+                    await asyncio.sleep(self.args.slow_delay)
+                if stop.is_set():
+                    break
+        except websockets.ConnectionClosed:
+            if not stop.is_set() and not self.aborted:
+                self.stats.closed_by_server += 1
+        except Exception as e:
+            self.stats.error(e)
+
+    async def send_loop(self, stop: asyncio.Event):
+        seq = 0
+        try:
+            while not stop.is_set():
+                await asyncio.sleep(self.rng.expovariate(self.args.message_rate + self.args.typing_rate))
+                if stop.is_set():
+                    break
+                if self.rng.random() < self.args.typing_rate / (self.args.message_rate + self.args.typing_rate):
+                    await self.ws.send(self.encode({"type": "typing", "is_typing": True}))
+                    continue
+                seq += 1
+                message = f"{LOAD_PREFIX}{self.index}:{time.perf_counter()}:{seq}"
+                await self.ws.send(self.encode({"type": "chat", "message": message}))
+                self.stats.sent += 1
+        except websockets.ConnectionClosed:
+            pass
+        except Exception as e:
+            self.stats.error(e)
+
+    async def run(self, stop: asyncio.Event):
+        tasks = [asyncio.create_task(self.receive_loop(stop))]
+        if self.sender:
+            tasks.append(asyncio.create_task(self.send_loop(stop)))
+
+        if self.abrupt:
+            # Drop the socket mid-run without a close frame
+            await asyncio.sleep(self.rng.uniform(0, self.args.duration))
+            if not stop.is_set():
+                self.aborted = True
+                self.ws.transport.abort()
+                self.stats.abrupt += 1
+        await stop.wait()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await asyncio.wait_for(self.ws.close(), timeout=2)
+        except Exception:
+            pass
+
+
+async def run_load(args, tokens: List[str], rooms: List[str], base_url: str, server_pid: Optional[int]) -> Dict:
+    rng = random.Random(args.seed)
+    ws_url = base_url.replace("http://", "ws://").replace("https://", "wss://")
+    stats = Stats()
+    clients = [LoadClient(i, token, rooms[i % len(rooms)], args, stats, rng) for i, token in enumerate(tokens)]
+
+    rss_before = rss_kb(server_pid)
+    ramp_started = time.perf_counter()
+    connected: List[LoadClient] = []
+    interval = 1.0 / args.connect_rate
+    pending = []
+    for client in clients:
+        pending.append(asyncio.create_task(client.connect(ws_url)))
+        await asyncio.sleep(interval)
+    for client, ok in zip(clients, await asyncio.gather(*pending)):
+        if ok:
+            connected.append(client)
+    ramp_seconds = time.perf_counter() - ramp_started
+
+    # Let the server settle before sampling memory
+    await asyncio.sleep(1.0)
+    rss_connected = rss_kb(server_pid)
+
+    stop = asyncio.Event()
+    runners = [asyncio.create_task(client.run(stop)) for client in connected]
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*runners, return_exceptions=True)
+    rss_after = rss_kb(server_pid)
+
+    per_connection_kb = None
+    if rss_before is not None and rss_connected is not None and connected:
+        per_connection_kb = round((rss_connected - rss_before) / len(connected), 2)
+
+    return {
+        "config": {
+            "clients": args.clients,
+            "rooms": args.rooms,
+            "senders": args.senders,
+            "message_rate": args.message_rate,
+            "typing_rate": args.typing_rate,
+            "slow": args.slow,
+            "abrupt": args.abrupt,
+            "duration": args.duration,
+            "protocol": args.protocol,
+            "seed": args.seed,
+        },
+        "connections": {
+            "attempted": len(clients),
+            "established": stats.established,
+            "failed": stats.failed,
+            "abrupt_disconnects": stats.abrupt,
+            "closed_by_server": stats.closed_by_server,
+            "ramp_seconds": round(ramp_seconds, 2),
+            "connect_ms_p50": percentile(stats.connect_ms, 50),
+            "connect_ms_p99": percentile(stats.connect_ms, 99),
+        },
+        "server_memory_kb": {
+            "before": rss_before,
+            "connected": rss_connected,
+            "after": rss_after,
+            "per_connection": per_connection_kb,
+        },
+        "messages": {
+            "sent": stats.sent,
+            "delivered": stats.received,
+            "frames_received": stats.frames,
+            "fanout_per_message": round(stats.received / stats.sent, 2) if stats.sent else None,
+        },
+        "fanout_latency_ms": {
+            "p50": percentile(stats.latencies_ms, 50),
+            "p99": percentile(stats.latencies_ms, 99),
+            "max": round(max(stats.latencies_ms), 3) if stats.latencies_ms else None,
+            "samples": len(stats.latencies_ms),
+        },
+        "errors": stats.errors,
+    }
+
+
+def main():
+    args = parse_args()
+    if args.protocol == "msgpack" and msgpack is None:
+        sys.exit("msgpack is not installed")
+    raise_fd_limit()
+
+    server = None
+    workdir = tempfile.mkdtemp(prefix="gyanvruksh-load-")
+    database_url = args.database_url or f"sqlite:///{workdir}/load.db"
+    tokens, rooms = seed_users(database_url, args.clients, args.rooms)
+
+    base_url = args.base_url
+    if not base_url:
+        server = start_server(database_url, args.port)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        asyncio.run(wait_ready(base_url))
+        summary = asyncio.run(run_load(args, tokens, rooms, base_url, server.pid if server else None))
+    finally:
+        if server:
+            server.terminate()
+            try:
+                server.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    summary["target"] = base_url
+    summary["generated_at"] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    output = json.dumps(summary, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the FCM legacy HTTP send API
+
+Serves POST /fcm/send for a single "to" token or a multicast "registration_ids"
+list and answers in the FCM format, one result per token. Tokens starting with
+"invalid-" are answered NotRegistered, tokens starting with "stale-" succeed
+with a canonical registration_id and tokens starting with "flaky-" are
+Unavailable on their first delivery, so pruning and retries can be tested
+exactly. Per-token Unavailable results, whole-request 503s (with Retry-After)
+and a request rate limit (429) exercise retries at scale; which tokens and
+requests fail is a hash of the seed with the token and its delivery count, or
+with the request number, so a run fails the same way whatever the order its
+concurrent requests arrive in. Point the backend at it with FCM_BASE_URL.
+
+Example:
+    python fake_fcm_server.py --port 8798 --latency-ms 40 --unavailable-rate 0.01
+    FCM_BASE_URL=http://127.0.0.1:8798 uvicorn app.main:app
+"""
+
+import argparse
+import asyncio
+import time
+import zlib
+from typing import Iterable, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+MAX_REGISTRATION_IDS = 1000
+
+
+def chance(seed: Optional[int], *key) -> float:
+    """A stable value in [0, 1) for the key; the same across runs and processes"""
+    return zlib.crc32(repr((seed, *key)).encode()) / 2 ** 32
+
+
+def create_app(
+    latency: float = 0.03,
+    per_token_latency: float = 0.0,
+    unavailable_rate: float = 0.0,
+    failure_rate: float = 0.0,
+    max_requests_per_second: float = 0.0,
+    retry_after: float = 0.1,
+    seed: Optional[int] = None,
+    fail_requests: Iterable[int] = (),
+) -> FastAPI:
+    """Fake FCM; ``failure_rate`` of requests and the 1-based request numbers in
+    ``fail_requests`` get a 503, ``unavailable_rate`` of token deliveries an
+    Unavailable result, and requests above ``max_requests_per_second`` a 429"""
+    app = FastAPI(title="Fake FCM")
+    app.state.requests = 0
+    app.state.messages = 0  # tokens that got a message_id
+    app.state.batch_sizes = []
+    app.state.rejected = 0
+    app.state.deliveries = {}  # token -> requests it was answered in
+    fail_requests = set(fail_requests)
+    window = {"second": 0, "count": 0}
+
+    @app.post("/fcm/send")
+    async def send(request: Request):
+        app.state.requests += 1
+        number = app.state.requests
+        if not request.headers.get("authorization", "").startswith("key="):
+            return JSONResponse({"error": "missing server key"}, status_code=401)
+
+        if max_requests_per_second:
+            second = int(time.monotonic())
+            if window["second"] != second:
+                window["second"], window["count"] = second, 0
+            window["count"] += 1
+            if window["count"] > max_requests_per_second:
+                app.state.rejected += 1
+                return JSONResponse({"error": "QuotaExceeded"}, status_code=429, headers={"Retry-After": "1"})
+
+        body = await request.json()
+        tokens = body.get("registration_ids") or ([body["to"]] if body.get("to") else [])
+        if not tokens or len(tokens) > MAX_REGISTRATION_IDS:
+            return JSONResponse({"error": "InvalidParameters"}, status_code=400)
+        app.state.batch_sizes.append(len(tokens))
+
+        await asyncio.sleep(latency + per_token_latency * len(tokens))
+        if number in fail_requests or (failure_rate and chance(seed, "request", number) < failure_rate):
+            app.state.rejected += 1
+            return JSONResponse({"error": "Unavailable"}, status_code=503, headers={"Retry-After": str(retry_after)})
+
+        results = []
+        for i, token in enumerate(tokens):
+            delivery = app.state.deliveries[token] = app.state.deliveries.get(token, 0) + 1
+            if token.startswith("invalid-"):
+                results.append({"error": "NotRegistered"})
+            elif (token.startswith("flaky-") and delivery == 1) or \
+                    (unavailable_rate and chance(seed, token, delivery) < unavailable_rate):
+                results.append({"error": "Unavailable"})
+            else:
+                result = {"message_id": f"0:{number}.{i}"}
+                if token.startswith("stale-"):
+                    result["registration_id"] = "fresh-" + token[len("stale-"):]
+                results.append(result)
+        success = sum(1 for r in results if "message_id" in r)
+        app.state.messages += success
+        return {
+            "multicast_id": number,
+            "success": success,
+            "failure": len(results) - success,
+            "canonical_ids": sum(1 for r in results if "registration_id" in r),
+            "results": results,
+        }
+
+    return app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fake FCM send server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8798)
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="delay per request")
+    parser.add_argument("--per-token-us", type=float, default=0.0, help="extra delay per token in a multicast")
+    parser.add_argument("--unavailable-rate", type=float, default=0.0, help="fraction of tokens answered Unavailable")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of requests answered 503")
+    parser.add_argument("--max-rps", type=float, default=0.0, help="requests per second before answering 429")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    app = create_app(
+        args.latency_ms / 1000,
+        args.per_token_us / 1_000_000,
+        args.unavailable_rate,
+        args.failure_rate,
+        args.max_rps,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI chat completions API
+
+Serves POST /v1/chat/completions with deterministic answers and configurable
+latency: a delay before the first token, optionally growing with prompt size,
+and a delay between tokens. Requests with "stream": true get Server-Sent Events
+chunks in the OpenAI format, others get one JSON body after the whole answer is
+"generated". Point the backend at it with OPENAI_BASE_URL to exercise the AI
+endpoints and measure time to first token without calling the real API.
+
+Example:
+    python fake_llm_server.py --port 8799 --first-token-ms 400 --token-ms 25
+    OPENAI_BASE_URL=http://127.0.0.1:8799 uvicorn app.main:app
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from typing import Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = [
+    "let", "us", "break", "this", "down", "step", "by", "with", "an", "example",
+    "first", "consider", "the", "idea", "then", "apply", "it", "to", "a", "problem",
+    "notice", "how", "each", "part", "builds", "on", "previous", "one", "so", "practice",
+]
+
+
+def answer_tokens(messages: List[Dict], count: int) -> List[str]:
+    """Deterministic pseudo-answer derived from the last user message"""
+    question = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    seed = hashlib.sha256(question.encode("utf-8")).digest()
+    tokens = []
+    for i in range(count):
+        word = WORDS[(seed[i % len(seed)] + i) % len(WORDS)]
+        tokens.append(word if i == 0 else f" {word}")
+    return tokens
+
+
+def prompt_tokens(messages: List[Dict]) -> int:
+    # Roughly four characters per token, like the tokenizer's English average
+    return sum(len(m.get("content") or "") for m in messages) // 4 + 4 * len(messages)
+
+
+def create_app(
+    first_token_delay: float = 0.3,
+    token_delay: float = 0.02,
+    tokens: int = 40,
+    fail_status: int = 0,
+    prefill_delay: float = 0.0,
+    jitter: float = 0.0,
+    tail_rate: float = 0.0,
+    tail_factor: float = 5.0,
+    seed: Optional[int] = None,
+) -> FastAPI:
+    """Fake upstream; delays are medians, spread log-normally by ``jitter`` (sigma)
+    with a ``tail_rate`` fraction of requests slowed down by ``tail_factor``"""
+    app = FastAPI(title="Fake LLM")
+    app.state.requests = 0
+    app.state.prompt_tokens = []  # per request, for benchmarks
+    rng = random.Random(seed)
+
+    def sample(delay: float) -> float:
+        if jitter:
+            delay *= rng.lognormvariate(0.0, jitter)
+        return delay
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        app.state.requests += 1
+        body = await request.json()
+        if fail_status:
+            return JSONResponse({"error": {"message": "fake upstream failure"}}, status_code=fail_status)
+
+        messages = body.get("messages", [])
+        max_tokens = int(body.get("max_tokens") or tokens)
+        parts = answer_tokens(messages, min(tokens, max_tokens))
+        completion_id = f"chatcmpl-fake-{app.state.requests}"
+        created = int(time.time())
+        prompt_size = prompt_tokens(messages)
+        usage = {
+            "prompt_tokens": prompt_size,
+            "completion_tokens": len(parts),
+            "total_tokens": prompt_size + len(parts),
+        }
+        app.state.prompt_tokens.append(prompt_size)
+        # Reading the prompt costs time before the first token, like a real model's prefill
+        first_delay = sample(first_token_delay) + prefill_delay * prompt_size / 1000
+        slowdown = tail_factor if tail_rate and rng.random() < tail_rate else 1.0
+        first_delay *= slowdown
+
+        if not body.get("stream"):
+            await asyncio.sleep(first_delay + sum(sample(token_delay) * slowdown for _ in parts[1:]))
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(parts)}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        async def chunks():
+            def chunk(delta: Dict, finish_reason=None) -> str:
+                data = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+                return f"data: {json.dumps(data)}\n\n"
+
+            yield chunk({"role": "assistant"})
+            await asyncio.sleep(first_delay)
+            for i, part in enumerate(parts):
+                if i:
+                    await asyncio.sleep(sample(token_delay) * slowdown)
+                yield chunk({"content": part})
+            yield chunk({}, finish_reason="stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fake streaming LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8799)
+    parser.add_argument("--first-token-ms", type=float, default=300.0, help="delay before the first token")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="delay between tokens")
+    parser.add_argument("--tokens", type=int, default=40, help="tokens per answer (capped by max_tokens)")
+    parser.add_argument("--prefill-ms", type=float, default=0.0, help="extra first-token delay per 1000 prompt tokens")
+    parser.add_argument("--jitter", type=float, default=0.0, help="log-normal sigma applied to every delay")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="fraction of requests slowed down")
+    parser.add_argument("--tail-factor", type=float, default=5.0, help="slowdown of tail requests")
+    parser.add_argument("--fail-status", type=int, default=0, help="answer every request with this HTTP status")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    app = create_app(
+        args.first_token_ms / 1000,
+        args.token_ms / 1000,
+        args.tokens,
+        args.fail_status,
+        args.prefill_ms / 1000,
+        args.jitter,
+        args.tail_rate,
+        args.tail_factor,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+import sys
+sys.path.append('..')
+from app.database import engine
+from app.models.notification import Notification
+
+def add_notification_retention_index():
+    """Create the (is_read, created_at) index the retention job finds expired read notifications with"""
+    try:
+        for index in Notification.__table__.indexes:
+            if index.name == "ix_notifications_is_read_created_at":
+                index.create(bind=engine, checkfirst=True)
+    except Exception as e:
+        print(f"Error creating notification retention index: {e}")
+
+if __name__ == "__main__":
+    add_notification_retention_index()
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine, text
+from app.settings import settings
+
+COLUMNS = [
+    ("unread_personal", "INTEGER NOT NULL DEFAULT 0"),
+    ("read_broadcasts_above", "INTEGER NOT NULL DEFAULT 0"),
+    # NULL makes the counters be recomputed from the tables on the next read
+    ("counters_reconciled_at", "TIMESTAMP NULL"),
+]
+
+def run_migration():
+    engine = create_engine(settings.DATABASE_URL)
+
+    with engine.connect() as conn:
+        for column, definition in COLUMNS:
+            try:
+                conn.execute(text(f"ALTER TABLE notification_read_states ADD COLUMN {column} {definition}"))
+                conn.commit()
+                print(f"✅ Added {column} column to notification_read_states table")
+            except Exception as e:
+                conn.rollback()
+                if "already exists" in str(e).lower() or "duplicate column" in str(e).lower():
+                    print(f"⚠️  Column {column} already exists in notification_read_states table")
+                else:
+                    print(f"❌ Error adding {column} column: {e}")
+                    raise
+
+if __name__ == "__main__":
+    run_migration()
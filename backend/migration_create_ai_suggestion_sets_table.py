@@ -0,0 +1,14 @@
+import sys
+sys.path.append('..')
+from app.database import Base, engine
+from app.models.ai_suggestion import AISuggestionSet
+
+def create_ai_suggestion_sets_table():
+    """Create ai_suggestion_sets table; sets are built by the app's background worker"""
+    try:
+        AISuggestionSet.__table__.create(bind=engine, checkfirst=True)
+    except Exception as e:
+        print(f"Error creating ai_suggestion_sets table: {e}")
+
+if __name__ == "__main__":
+    create_ai_suggestion_sets_table()
@@ -0,0 +1,19 @@
+import sys
+sys.path.append('..')
+from app.database import Base, engine
+from app.models.notification import Notification, BroadcastNotification, NotificationReadState, BroadcastReceipt
+
+def create_broadcast_notifications_tables():
+    """Create the fan-out-on-read broadcast tables and the (user_id, created_at) notifications index"""
+    try:
+        BroadcastNotification.__table__.create(bind=engine, checkfirst=True)
+        NotificationReadState.__table__.create(bind=engine, checkfirst=True)
+        BroadcastReceipt.__table__.create(bind=engine, checkfirst=True)
+        for index in Notification.__table__.indexes:
+            if index.name == "ix_notifications_user_id_created_at":
+                index.create(bind=engine, checkfirst=True)
+    except Exception as e:
+        print(f"Error creating broadcast notification tables: {e}")
+
+if __name__ == "__main__":
+    create_broadcast_notifications_tables()
@@ -0,0 +1,17 @@
+import sys
+sys.path.append('..')
+from app.database import Base, engine
+from app.models.chat_message import ChatMessage, ChatReadState
+
+def create_chat_read_states_table():
+    """Create chat_read_states table and the (room_id, id) index used for unread counts"""
+    try:
+        ChatReadState.__table__.create(bind=engine, checkfirst=True)
+        for index in ChatMessage.__table__.indexes:
+            if index.name == "ix_chat_messages_room_id_id":
+                index.create(bind=engine, checkfirst=True)
+    except Exception as e:
+        print(f"Error creating chat_read_states table: {e}")
+
+if __name__ == "__main__":
+    create_chat_read_states_table()
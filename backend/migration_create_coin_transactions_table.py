@@ -0,0 +1,26 @@
+import sys
+sys.path.append('..')
+from sqlalchemy import insert, literal, select
+from app.database import Base, engine
+from app.models.gamification import CoinTransaction
+from app.models.user import User
+from app.services.leaderboard import OPENING_BALANCE
+
+def create_coin_transactions_table():
+    """Create the coin ledger and open it with each user's current balance"""
+    try:
+        CoinTransaction.__table__.create(bind=engine, checkfirst=True)
+        with engine.begin() as conn:
+            if conn.execute(select(CoinTransaction.id).limit(1)).first() is None:
+                conn.execute(insert(CoinTransaction).from_select(
+                    ["user_id", "delta", "balance_after", "reason", "description", "created_at"],
+                    select(
+                        User.id, User.gyan_coins, User.gyan_coins,
+                        literal(OPENING_BALANCE), literal("Balance before the coin ledger"), User.created_at
+                    ).where(User.gyan_coins != 0)
+                ))
+    except Exception as e:
+        print(f"Error creating coin transactions table: {e}")
+
+if __name__ == "__main__":
+    create_coin_transactions_table()
@@ -0,0 +1,23 @@
+import sys
+sys.path.append('..')
+from app.database import Base, engine, SessionLocal
+from app.models.course import Course
+from app.models.content_chunk import ContentChunk
+from app.services.retrieval import index_course
+
+def create_content_chunks_table():
+    """Create content_chunks table and index existing lessons and course notes"""
+    try:
+        ContentChunk.__table__.create(bind=engine, checkfirst=True)
+        db = SessionLocal()
+        try:
+            course_ids = [row[0] for row in db.query(Course.id).all()]
+            chunks = sum(index_course(db, course_id) for course_id in course_ids)
+            print(f"Indexed {chunks} chunks across {len(course_ids)} courses")
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"Error creating content_chunks table: {e}")
+
+if __name__ == "__main__":
+    create_content_chunks_table()
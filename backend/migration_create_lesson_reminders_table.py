@@ -0,0 +1,17 @@
+import sys
+sys.path.append('..')
+from app.database import Base, engine
+from app.models.lesson import Lesson, LessonReminder
+
+def create_lesson_reminders_table():
+    """Create the sent class reminders table and the lessons.scheduled_at index"""
+    try:
+        LessonReminder.__table__.create(bind=engine, checkfirst=True)
+        for index in Lesson.__table__.indexes:
+            if index.name == "ix_lessons_scheduled_at":
+                index.create(bind=engine, checkfirst=True)
+    except Exception as e:
+        print(f"Error creating lesson reminders table: {e}")
+
+if __name__ == "__main__":
+    create_lesson_reminders_table()
@@ -0,0 +1,15 @@
+import sys
+sys.path.append('..')
+from app.database import Base, engine
+from app.models.gamification import UserAchievementStats
+from app.models.user import User  # noqa: F401 (resolves the users foreign key)
+
+def create_user_achievement_stats_table():
+    """Create the per-user badge counters table; rows are filled in on first use"""
+    try:
+        UserAchievementStats.__table__.create(bind=engine, checkfirst=True)
+    except Exception as e:
+        print(f"Error creating user achievement stats table: {e}")
+
+if __name__ == "__main__":
+    create_user_achievement_stats_table()
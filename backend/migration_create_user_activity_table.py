@@ -0,0 +1,28 @@
+import sys
+sys.path.append('..')
+from app.database import Base, SessionLocal, engine
+from app.models.progress import UserActivity, UserProgress
+from app.models.user import User  # noqa: F401 (resolves the users foreign key)
+from app.services.study_activity import study_activity
+
+def create_user_activity_table():
+    """Create the daily activity bitmaps and mark the days recorded in user_progress"""
+    try:
+        UserActivity.__table__.create(bind=engine, checkfirst=True)
+        db = SessionLocal()
+        try:
+            if db.query(UserActivity.id).first() is None:
+                rows = db.query(UserProgress.user_id, UserProgress.course_id, UserProgress.last_accessed).filter(
+                    UserProgress.last_accessed.isnot(None)
+                ).order_by(UserProgress.user_id).all()
+                for user_id, course_id, last_accessed in rows:
+                    study_activity.record(db, user_id, [course_id], on=last_accessed.date())
+                    db.flush()
+                db.commit()
+        finally:
+            db.close()
+    except Exception as e:
+        print(f"Error creating user activity table: {e}")
+
+if __name__ == "__main__":
+    create_user_activity_table()
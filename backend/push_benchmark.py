@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Push delivery throughput benchmark
+
+Seeds users with device tokens (a share of them invalid) in a throwaway SQLite
+database and delivers one push to all of them through the batched push
+delivery worker, against an in-process fake FCM server. Reports messages per
+second, FCM requests, retries and pruned tokens for each multicast size, as
+JSON. Compare --multicast-sizes 1 against larger batches to see what batching
+buys; raise --latency-ms or --failure-rate to see the effect of a slow or
+flaky FCM.
+
+Example:
+    python push_benchmark.py --users 20000 --multicast-sizes 1,100,500 --latency-ms 30 --output push_bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import socket
+import tempfile
+import threading
+import time
+
+import httpx
+import uvicorn
+from sqlalchemy import create_engine, insert, update
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models.user import User
+from app.services.push_delivery import PushDeliveryService
+from fake_fcm_server import create_app
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Push delivery throughput benchmark")
+    parser.add_argument("--users", type=int, default=10000, help="Users with a registered device token")
+    parser.add_argument("--invalid-rate", type=float, default=0.02, help="Share of tokens FCM reports NotRegistered")
+    parser.add_argument("--multicast-sizes", default="10,100,500", help="Comma separated batch sizes to compare")
+    parser.add_argument("--concurrency", type=int, default=4, help="Batches in flight at once")
+    parser.add_argument("--rate-limit", type=float, default=100000.0, help="Messages per second allowed by the worker")
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="Fake FCM delay per request")
+    parser.add_argument("--per-token-us", type=float, default=20.0, help="Fake FCM extra delay per token")
+    parser.add_argument("--unavailable-rate", type=float, default=0.0, help="Share of tokens answered Unavailable")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of requests answered 503")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON summary to this file")
+    return parser.parse_args()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def seed_tokens(session_factory, users: int, invalid_rate: float, rng: random.Random):
+    """(Re)assign every benchmark user a token; returns how many are invalid"""
+    db = session_factory()
+    try:
+        if not db.query(User.id).first():
+            db.execute(insert(User), [
+                {"email": f"push{i}@bench.local", "full_name": "Push", "hashed_password": "!",
+                 "role": "service_seeker", "sub_role": "student", "is_active": True}
+                for i in range(users)
+            ])
+        invalid = 0
+        for user_id, in db.query(User.id).all():
+            bad = rng.random() < invalid_rate
+            invalid += bad
+            db.execute(update(User).where(User.id == user_id).values(
+                fcm_token=f"{'invalid' if bad else 'token'}-{user_id}"
+            ))
+        db.commit()
+        return invalid
+    finally:
+        db.close()
+
+
+def start_fake_fcm(args, port: int):
+    fake = create_app(
+        args.latency_ms / 1000, args.per_token_us / 1_000_000,
+        args.unavailable_rate, args.failure_rate, seed=args.seed,
+    )
+    server = uvicorn.Server(uvicorn.Config(fake, port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return fake, server
+
+
+async def run_once(session_factory, base_url: str, multicast_size: int, args) -> dict:
+    service = PushDeliveryService(
+        session_factory,
+        multicast_size=multicast_size,
+        max_concurrency=args.concurrency,
+        rate_limit=args.rate_limit,
+    )
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30.0) as client:
+        job = service.enqueue("Benchmark", "Push delivery benchmark")
+        started = time.perf_counter()
+        await service.deliver(client, job)
+        elapsed = time.perf_counter() - started
+    stats = service.stats()
+    return {
+        "multicast_size": multicast_size,
+        "seconds": round(elapsed, 2),
+        "messages_per_second": round(job.sent / elapsed, 1) if elapsed else None,
+        "tokens": job.tokens,
+        "sent": job.sent,
+        "failed": job.failed,
+        "pruned_tokens": job.pruned,
+        "fcm_requests": stats["requests"],
+        "retries": stats["retries"],
+        "rate_limited_waits": stats["rate_limited_waits"],
+    }
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="gyanvruksh-push-bench-")
+    engine = create_engine(f"sqlite:///{workdir}/push.db")
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(bind=engine)
+
+    port = free_port()
+    fake, server = start_fake_fcm(args, port)
+    runs = []
+    try:
+        for size in (int(s) for s in args.multicast_sizes.split(",")):
+            # Every run starts from the same token set, since pruning clears invalid tokens
+            invalid = seed_tokens(session_factory, args.users, args.invalid_rate, random.Random(args.seed))
+            result = asyncio.run(run_once(session_factory, f"http://127.0.0.1:{port}", size, args))
+            result["invalid_seeded"] = invalid
+            runs.append(result)
+    finally:
+        server.should_exit = True
+
+    summary = {
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "runs": runs,
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    output = json.dumps(summary, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+import pytest
+import uvicorn
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models.category import Category  # noqa: F401 (courses reference categories)
+from app.models.course import Course
+from app.models.enrollment import Enrollment
+from app.models.lesson import Lesson  # noqa: F401 (attendance and progress reference lessons)
+from app.models.user import User
+
+
+@dataclass
+class Seeded:
+    teacher_id: int
+    course_id: int
+    student_ids: List[int]
+
+
+@pytest.fixture
+def serve():
+    """Run ASGI apps (fake upstreams) on free local ports; returns a function giving their base URL"""
+    servers = []
+
+    def start(asgi_app) -> str:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        server = uvicorn.Server(uvicorn.Config(asgi_app, port=port, log_level="warning"))
+        threading.Thread(target=server.run, daemon=True).start()
+        while not server.started:
+            time.sleep(0.01)
+        servers.append(server)
+        return f"http://127.0.0.1:{port}"
+
+    yield start
+    for server in servers:
+        server.should_exit = True
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Sessions on a fresh SQLite file with every table created"""
+    engine = create_engine(f"sqlite:///{tmp_path}/test.db")
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def seed_course(session_factory):
+    """A teacher, one of their courses and students; all students are enrolled unless ``enrolled`` says which"""
+    def seed(
+        students: int = 3,
+        enrolled: Optional[Iterable[int]] = None,
+        gyan_coins: Optional[List[int]] = None,
+        title: str = "Algebra",
+    ) -> Seeded:
+        db = session_factory()
+        teacher = User(email="t@x", full_name="t", hashed_password="x", role="service_provider", sub_role="teacher")
+        db.add(teacher)
+        db.flush()
+        course = Course(title=title, description="d", teacher_id=teacher.id)
+        db.add(course)
+        db.flush()
+        enrolled = set(range(students) if enrolled is None else enrolled)
+        student_ids = []
+        for i in range(students):
+            student = User(email=f"s{i}@x", full_name="s", hashed_password="x", role="service_seeker",
+                           sub_role="student", gyan_coins=gyan_coins[i] if gyan_coins else 0)
+            db.add(student)
+            db.flush()
+            student_ids.append(student.id)
+            if i in enrolled:
+                db.add(Enrollment(student_id=student.id, course_id=course.id))
+        db.commit()
+        seeded = Seeded(teacher.id, course.id, student_ids)
+        db.close()
+        return seeded
+
+    return seed
@@ -0,0 +1,97 @@
+import asyncio
+import json
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import ai_tutor
+from app.database import get_db
+from app.models.lesson import Lesson
+from app.models.user import User
+from app.services.retrieval import CourseIndexCache
+from app.services.deps import get_current_user, get_http_clients
+from app.services.http_clients import HTTPClientRegistry, UpstreamConfig
+from app.services.tutor_cache import TutorAnswerCache
+from fake_llm_server import create_app
+
+
+class _User:
+    id = 1
+    sub_role = "student"
+
+
+def _db(session_factory):
+    def get_test_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+    return get_test_db
+
+
+def test_chat_streams_tokens(serve, session_factory):
+    # Only the AI router: the full app's lifespan would start every background worker on the dev database
+    app = FastAPI()
+    app.include_router(ai_tutor.router)
+    registry = HTTPClientRegistry({
+        "openai": UpstreamConfig(serve(create_app(0.05, 0.005, 12)), timeout=5.0, max_connections=2,
+                                 max_keepalive_connections=1)
+    })
+    app.dependency_overrides[get_current_user] = lambda: _User()
+    app.dependency_overrides[get_http_clients] = lambda: registry
+    app.dependency_overrides[get_db] = _db(session_factory)
+    with TestClient(app) as c:
+        try:
+            full = c.post("/api/ai/chat", json={"message": "what is a loop"}).json()
+            assert full["success"]
+
+            with c.stream("POST", "/api/ai/chat", json={"message": "what is a loop", "stream": True}) as r:
+                assert r.headers["content-type"].startswith("text/event-stream")
+                events = [json.loads(line[len("data: "):]) for line in r.iter_lines() if line.startswith("data: ")]
+            assert events[0]["type"] == "start"
+            deltas = [e["content"] for e in events if e["type"] == "delta"]
+            assert len(deltas) == 12
+            assert events[-1]["type"] == "done"
+            assert events[-1]["response"] == "".join(deltas) == full["response"]
+
+            headers = {"Accept": "application/x-ndjson"}
+            with c.stream("POST", "/api/ai/chat", json={"message": "hi", "stream": True}, headers=headers) as r:
+                assert r.headers["content-type"].startswith("application/x-ndjson")
+                events = [json.loads(line) for line in r.iter_lines() if line]
+            assert events[-1]["type"] == "done"
+        finally:
+            c.portal.call(registry.aclose)
+
+
+def test_tutor_cache_hits_skip_retrieval(serve, session_factory, seed_course, monkeypatch):
+    seeded = seed_course(students=1)
+    db = session_factory()
+    db.add(Lesson(course_id=seeded.course_id, title="Loops", content_type="text",
+                  content_text="A loop repeats a block of code while a condition holds."))
+    db.commit()
+    indexes = CourseIndexCache()
+    monkeypatch.setattr(ai_tutor, "course_indexes", indexes)
+    monkeypatch.setattr(ai_tutor, "tutor_cache", TutorAnswerCache())
+    registry = HTTPClientRegistry({"openai": UpstreamConfig(serve(create_app(0.0, 0.0, 3)), timeout=5.0, max_connections=2,
+                                                             max_keepalive_connections=1)})
+    student = db.get(User, seeded.student_ids[0])
+
+    async def ask(question):
+        request = ai_tutor.AITutorRequest(course_id=seeded.course_id, question=question)
+        return await ai_tutor.ai_tutor_help(request, None, db=db, current_user=student, http_clients=registry)
+
+    async def run():
+        try:
+            first = await ask("what is a loop")
+            assert indexes.builds == 1  # content predating the chunk table was indexed on the miss
+            again = await ask("what is a loop?")
+            assert again["cached"] and again["response"] == first["response"]
+            assert (indexes.builds, indexes.hits) == (1, 0)  # the hit never touched the index
+            await ask("when does a loop stop")
+            assert (indexes.builds, indexes.hits) == (1, 1)
+        finally:
+            await registry.aclose()
+
+    asyncio.run(run())
+    db.close()
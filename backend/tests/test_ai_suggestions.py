@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+from fastapi import FastAPI, Request
+
+from app.api import courses as courses_api
+from app.models.lesson import Lesson
+from app.models.user import User
+from app.schemas.course import CourseUpdate
+from app.services.ai_suggestions import SuggestionService
+from app.services.http_clients import HTTPClientRegistry, UpstreamConfig
+
+
+def _fake_llm(prompts):
+    fake = FastAPI()
+
+    @fake.post("/v1/chat/completions")
+    async def complete(request: Request):
+        prompt = (await request.json())["messages"][-1]["content"]
+        prompts.append(prompt)
+        if "Current lesson:" in prompt:
+            content = "Sorry, I cannot help with that."  # unusable: templates are stored instead
+        else:
+            content = "Here you go: " + json.dumps([
+                {"type": "quiz", "title": "Fractions quiz", "description": "Ten questions", "difficulty": "expert"},
+                {"type": "poem", "title": "Number story", "description": "Write one"},
+                {"title": "missing description"},
+            ])
+        return {"choices": [{"message": {"content": content}}]}
+
+    return fake
+
+
+def test_worker_debounces_edits_and_stores_generated_or_template_sets(session_factory, seed_course, serve):
+    prompts = []
+    registry = HTTPClientRegistry({
+        "openai": UpstreamConfig(serve(_fake_llm(prompts)), timeout=5.0, max_connections=2, max_keepalive_connections=1)
+    })
+    course_id = seed_course(students=0, title="Fractions").course_id
+    db = session_factory()
+    lesson = Lesson(course_id=course_id, title="Adding fractions", content_type="text", content_text="Common denominators.")
+    db.add(lesson)
+    db.commit()
+    service = SuggestionService(session_factory, debounce=0.05)
+
+    async def run():
+        worker = asyncio.create_task(service.run_worker(registry))
+        for _ in range(5):  # a burst of edits
+            service.schedule(course_id, lesson.id)
+            await asyncio.sleep(0.005)
+        for _ in range(500):
+            if service.builds == 2:
+                break
+            await asyncio.sleep(0.01)
+        worker.cancel()
+        await registry.aclose()
+
+    asyncio.run(run())
+    assert len(prompts) == 2
+    assert "Lessons: Adding fractions" in prompts[0]
+
+    course_set = service.get(db, course_id)
+    assert course_set["source"] == "llm"
+    assert [(s["type"], s["difficulty"]) for s in course_set["suggestions"]] == [
+        ("quiz", "intermediate"), ("practice", "intermediate")
+    ]
+    lesson_set = service.get(db, course_id, lesson.id)
+    assert (lesson_set["source"], lesson_set["lesson_title"]) == ("template", "Adding fractions")
+    assert "Adding fractions" in lesson_set["suggestions"][0]["description"]
+    assert service.get(db, course_id) is course_set  # served from the cache
+    assert service.stats()["template_fallbacks"] == 1
+    db.close()
+
+
+def test_course_edits_to_title_or_description_queue_a_rebuild(session_factory, seed_course, monkeypatch):
+    seeded = seed_course(students=0)
+    service = SuggestionService(session_factory)
+    monkeypatch.setattr(courses_api, "ai_suggestions", service)
+    db = session_factory()
+    teacher = db.get(User, seeded.teacher_id)
+
+    courses_api.update_course(seeded.course_id, CourseUpdate(total_hours=12), db=db, user=teacher)
+    assert service.stats()["pending_builds"] == 0
+    course = courses_api.update_course(seeded.course_id, CourseUpdate(description="Now with proofs"), db=db, user=teacher)
+    assert course.description == "Now with proofs" and course.total_hours == 12
+    assert service._pending == {(seeded.course_id, 0)}
+    db.close()
@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta
+
+from app.api.quizzes import submit_quiz_attempt
+from app.models.attendance import Attendance
+from app.models.gamification import Badge, UserAchievementStats, UserBadge
+from app.models.quiz import Question, Quiz
+from app.models.user import User
+from app.schemas.quiz import QuizAttemptCreate
+from app.services.badge_engine import BadgeEngine
+from app.services.study_activity import study_activity
+
+
+def _seed(session_factory, seed_course):
+    db = session_factory()
+    db.add_all([
+        Badge(name="Perfect Attendance", description="d", category="general", criteria_type="attendance_rate",
+              criteria_value=95, gyan_coins_reward=150),
+        Badge(name="Assignment Ace", description="d", category="academics", criteria_type="assignment_average",
+              criteria_value=90, gyan_coins_reward=100),
+    ])
+    db.commit()
+    db.close()
+    seeded = seed_course(students=3)
+    return seeded.course_id, seeded.teacher_id, seeded.student_ids
+
+
+def _mark(db, engine, course_id, teacher_id, lesson_id, attendance):
+    deltas = {}
+    for student_id, present in attendance.items():
+        db.add(Attendance(student_id=student_id, lesson_id=lesson_id, course_id=course_id, is_present=present,
+                          marked_by=teacher_id, attendance_date=datetime.utcnow()))
+        deltas[student_id] = {"attendance_total": 1, "attendance_present": int(present)}
+    awarded = engine.record(db, "attendance_marked", deltas)
+    db.commit()
+    return awarded
+
+
+def test_attendance_event_awards_in_batch_and_counters_match_recount(session_factory, seed_course):
+    course_id, teacher_id, students = _seed(session_factory, seed_course)
+    engine = BadgeEngine()
+    db = session_factory()
+
+    awarded = _mark(db, engine, course_id, teacher_id, 1, {students[0]: True, students[1]: True, students[2]: False})
+    assert sorted(awarded) == students[:2]
+    assert all([badge.name for badge in badges] == ["Perfect Attendance"] for badges in awarded.values())
+    # Only the attendance badge was evaluated for the event
+    assert engine.evaluations == 3
+
+    # Counters now exist, so the next event only applies deltas
+    awarded = _mark(db, engine, course_id, teacher_id, 2, {students[0]: False, students[2]: True})
+    assert awarded == {}
+    assert engine.materialized == 3
+
+    incremental = {row.user_id: (row.attendance_total, row.attendance_present)
+                   for row in db.query(UserAchievementStats).all()}
+    for student_id in students:
+        engine.recheck(db, student_id)
+    db.commit()
+    recounted = {row.user_id: (row.attendance_total, row.attendance_present)
+                 for row in db.query(UserAchievementStats).populate_existing().all()}
+    assert incremental == recounted == {students[0]: (2, 1), students[1]: (1, 1), students[2]: (2, 1)}
+
+    assert db.query(UserBadge).count() == 2
+    assert {u.id: u.gyan_coins for u in db.query(User).filter(User.id.in_(students))} == {
+        students[0]: 150, students[1]: 150, students[2]: 0
+    }
+    db.close()
+
+
+def test_streak_badges_follow_the_study_activity_bitmaps(session_factory, seed_course):
+    students = seed_course(students=2).student_ids
+    db = session_factory()
+    db.add(Badge(name="On a Roll", description="d", category="general", criteria_type="daily_streak",
+                 criteria_value=3, gyan_coins_reward=20))
+    db.commit()
+    engine = BadgeEngine()
+    today = datetime.utcnow().date()
+    for days_ago in (3, 2, 1):
+        study_activity.record(db, students[0], on=today - timedelta(days=days_ago))
+    for days_ago in (4, 3, 1):
+        study_activity.record(db, students[1], on=today - timedelta(days=days_ago))
+
+    # Either student studying today: the first reaches four days in a row, the second two
+    awarded = engine.record(db, "lesson_studied", {students[0]: {}, students[1]: {}})
+    assert {user_id: [badge.name for badge in badges] for user_id, badges in awarded.items()} == {
+        students[0]: ["On a Roll"]
+    }
+    study_activity.record(db, students[1], on=today)
+    assert engine.record(db, "lesson_studied", {students[1]: {}}) == {}
+    db.commit()
+    assert db.get(User, students[0]).gyan_coins == 20
+    db.close()
+
+
+def test_first_quiz_attempt_is_counted_once(session_factory, seed_course):
+    seeded = seed_course(students=1)
+    db = session_factory()
+    db.add_all([
+        Badge(name="On a Roll", description="d", category="general", criteria_type="daily_streak",
+              criteria_value=7, gyan_coins_reward=20),
+        Badge(name="Quiz Whiz", description="d", category="academics", criteria_type="quiz_average",
+              criteria_value=95, gyan_coins_reward=50),
+    ])
+    quiz = Quiz(lesson_id=1, course_id=seeded.course_id, title="Limits", passing_score=50)
+    db.add(quiz)
+    db.flush()
+    questions = [Question(quiz_id=quiz.id, question_text=f"q{i}", options='["a", "b"]', correct_answer="a")
+                 for i in range(5)]
+    db.add_all(questions)
+    db.commit()
+    student = db.get(User, seeded.student_ids[0])
+
+    answers = {str(question.id): "a" if i < 4 else "b" for i, question in enumerate(questions)}
+    submit_quiz_attempt(quiz.id, QuizAttemptCreate(quiz_id=quiz.id, answers=answers), db=db, current_user=student)
+    stats = db.query(UserAchievementStats).filter(UserAchievementStats.user_id == student.id).one()
+    assert (stats.quiz_attempts, stats.quiz_score_total) == (1, 80)
+    assert db.query(UserBadge).count() == 0
+    db.close()
+
+
+def test_losing_the_first_materialization_race_keeps_the_caller_transaction(session_factory, seed_course):
+    course_id, teacher_id, students = _seed(session_factory, seed_course)
+    engine = BadgeEngine()
+    first, second = session_factory(), session_factory()
+    engine._materialize(first, students[0])
+    first.commit()
+
+    # The second request saw no row when it looked; its insert conflicts and it recounts into the
+    # winner's without losing the attendance it is about to commit
+    second.add(Attendance(student_id=students[0], lesson_id=1, course_id=course_id, is_present=True,
+                          marked_by=teacher_id, attendance_date=datetime.utcnow()))
+    second.flush()
+    stats = engine._materialize(second, students[0])
+    second.commit()
+    assert (stats.attendance_total, stats.attendance_present) == (1, 1)
+    assert second.query(Attendance).count() == 1
+    assert second.query(UserAchievementStats).count() == 1
+    first.close()
+    second.close()
@@ -0,0 +1,35 @@
+import asyncio
+
+from app.services.chat_presence import PresenceTracker
+
+
+def test_typing_bursts_are_coalesced_into_throttled_snapshots():
+    frames = []
+    online = [{"user_id": 1, "full_name": "a"}, {"user_id": 2, "full_name": "b"}]
+
+    async def broadcast(frame, room_id):
+        frames.append((room_id, frame))
+
+    async def run():
+        tracker = PresenceTracker(broadcast, lambda room_id: online, min_interval=0.05, typing_ttl=0.2)
+        for _ in range(50):
+            tracker.set_typing("general", 1, True)
+            tracker.set_typing("general", 2, True)
+            await asyncio.sleep(0.001)
+        tracker.set_typing("general", 2, False)
+        await asyncio.sleep(0.1)
+        typing_frames = len(frames)
+        # No is_typing=false from user 1: a final snapshot follows its expiry
+        await asyncio.sleep(0.3)
+        return tracker, typing_frames
+
+    tracker, typing_frames = asyncio.run(run())
+
+    # ~100 events over ~60ms at one snapshot per 50ms
+    assert 1 <= typing_frames <= 4
+    assert tracker.events_coalesced >= 90
+    assert all(room_id == "general" for room_id, _ in frames)
+    assert [member["user_id"] for member in frames[typing_frames - 1][1]["typing"]] == [1]
+    assert frames[-1][1]["typing"] == [] and frames[-1][1]["online_count"] == 2
+    assert tracker.stats()["snapshots_sent"] == len(frames)
+    assert tracker.stats()["pending_flushes"] == 0
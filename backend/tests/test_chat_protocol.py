@@ -0,0 +1,46 @@
+import json
+from datetime import datetime, timezone
+
+import msgpack
+import pytest
+
+from app.services.chat_protocol import JSONCodec, MsgpackCodec
+
+FRAME = {
+    "type": "chat",
+    "user_id": 7,
+    "full_name": "Asha",
+    "message": "hello",
+    "room_id": "course-3",
+    "timestamp": datetime(2026, 1, 1, tzinfo=timezone.utc),
+    "message_id": 41,
+}
+
+
+def test_broadcast_encodes_once_per_protocol_and_sends_names_once_per_session():
+    cache = {}
+    first, second, verbose = MsgpackCodec(), MsgpackCodec(), JSONCodec()
+
+    payloads = first.encode(FRAME, cache)
+    assert [msgpack.unpackb(p, strict_map_key=False) for p in payloads] == [  # names are keyed by user id
+        {"t": "names", "n": {7: "Asha"}},
+        {"t": "chat", "u": 7, "m": "hello", "ts": 1767225600000, "id": 41},
+    ]
+    # The second session shares the encoded frame but still needs the name
+    assert second.encode(FRAME, cache)[-1] is payloads[-1]
+    assert len(second.encode(FRAME, cache)) == 1
+    assert json.loads(verbose.encode(FRAME, cache)[0])["timestamp"] == "2026-01-01T00:00:00+00:00"
+
+
+def test_decode_expands_keys_and_rejects_non_map_frames():
+    codec = MsgpackCodec()
+    assert codec.decode(msgpack.packb({"t": "typing", "ty": True})) == {"type": "typing", "is_typing": True}
+    assert codec.decode('{"type": "chat", "message": "hi"}') == {"type": "chat", "message": "hi"}
+
+    for bad in (msgpack.packb([1, 2]), msgpack.packb("chat"), b"\xc1", "[1, 2]", "\"chat\""):
+        with pytest.raises(ValueError):
+            codec.decode(bad)
+    with pytest.raises(ValueError):
+        JSONCodec().decode("[1, 2]")
+    with pytest.raises(ValueError):
+        JSONCodec().decode("not json")
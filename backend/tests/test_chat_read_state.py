@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.api import chat
+from app.models.chat_message import ChatMessage, ChatReadState
+from app.models.user import User
+from app.services.chat_read_state import ReadStateStore
+from app.services.chat_rooms import RoomMembershipCache, course_room_id
+
+
+def _post(Session, user_id, room_id, count):
+    db = Session()
+    messages = [ChatMessage(user_id=user_id, message="m", room_id=room_id) for _ in range(count)]
+    db.add_all(messages)
+    db.commit()
+    ids = [message.id for message in messages]
+    db.close()
+    return ids
+
+
+def test_watermarks_count_unread_and_flush_in_one_batch(session_factory, seed_course):
+    Session = session_factory
+    seeded = seed_course(students=2)
+    reader, writer = seeded.student_ids
+    general = _post(Session, writer, "general", 6)
+    store = ReadStateStore(Session, index_size=4)
+
+    # Only the newest four ids are indexed, so an old watermark reports a capped count
+    assert store.unread(reader, "general")["unread_count"] == 4
+    assert store.unread(reader, "general")["unread_capped"] is True
+
+    assert store.mark_read(reader, "general", general[3]) == general[3]
+    assert store.mark_read(reader, "general", general[1]) == general[3]  # never moves backwards
+    assert store.unread(reader, "general") == {
+        "room_id": "general",
+        "last_message_id": general[-1],
+        "last_read_message_id": general[3],
+        "unread_count": 2,
+        "unread_capped": False,
+    }
+
+    # New messages arrive through the index, not the database
+    [help_message] = _post(Session, writer, "help", 1)
+    store.unread(reader, "help")
+    [newer] = _post(Session, writer, "help", 1)
+    store.record_message("help", newer)
+    assert store.unread(reader, "help")["unread_count"] == 2
+    assert store.room_of(help_message) == "help"
+    store.mark_read(reader, "help", newer)
+
+    assert store.flush() == 2
+    assert store.flush() == 0
+    db = Session()
+    assert {(row.room_id, row.last_read_message_id) for row in db.query(ChatReadState)} == {
+        ("general", general[3]), ("help", newer)
+    }
+    db.close()
+
+    # Another worker starts from the stored watermarks
+    restarted = ReadStateStore(Session, index_size=4)
+    assert [count["unread_count"] for count in restarted.unread_for_rooms(reader, ["general", "help"])] == [2, 0]
+    assert store.stats()["rows_written"] == 2
+
+
+def test_acks_use_the_message_room_and_require_membership(session_factory, seed_course, monkeypatch):
+    seeded = seed_course(students=2, enrolled=[0])
+    member, outsider = seeded.student_ids
+    room = course_room_id(seeded.course_id)
+    [course_message] = _post(session_factory, seeded.teacher_id, room, 1)
+    [general_message] = _post(session_factory, seeded.teacher_id, "general", 1)
+    store = ReadStateStore(session_factory)
+    monkeypatch.setattr(chat, "read_state", store)
+    monkeypatch.setattr(chat, "room_memberships", RoomMembershipCache(session_factory))
+    db = session_factory()
+
+    def ack(user_id, message_id, room_id=None):
+        user = db.get(User, user_id)
+        return asyncio.run(chat.acknowledge_message(message_id, room_id, db=db, current_user=user))
+
+    assert ack(member, course_message)["room_id"] == room
+    assert ack(outsider, general_message, "general")["unread_count"] == 0
+    for user_id, message_id, room_id, status in [
+        (outsider, course_message, None, 403),  # not enrolled in the course
+        (member, course_message, "general", 400),  # the room must be the message's
+        (member, general_message, "made-up-room", 400),
+        (member, general_message + 100, None, 404),
+    ]:
+        with pytest.raises(HTTPException) as error:
+            ack(user_id, message_id, room_id)
+        assert error.value.status_code == status
+    assert store.stats()["rooms_indexed"] == 2
+    db.close()
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+
+from app.models.enrollment import Enrollment
+from app.models.user import User
+from app.services.chat_rooms import RoomMembershipCache, course_room_id
+
+
+def test_memberships_are_cached_until_invalidated(session_factory, seed_course):
+    Session = session_factory
+    seeded = seed_course(students=2, enrolled=[0])
+    room = course_room_id(seeded.course_id)
+    cache = RoomMembershipCache(Session)
+    emails = {student_id: f"s{i}@x" for i, student_id in enumerate(seeded.student_ids)}
+    enrolled, other = seeded.student_ids
+
+    assert cache.can_join(cache.identity(emails[enrolled]), room)
+    assert not cache.can_join(cache.identity(emails[other]), room)
+    assert cache.can_join(cache.identity("t@x"), room)
+    assert [r["id"] for r in cache.rooms(cache.identity(emails[enrolled]))][-1] == room
+
+    db = Session()
+    db.add(Enrollment(student_id=other, course_id=seeded.course_id))
+    db.get(User, enrolled).is_active = False
+    db.commit()
+    db.close()
+
+    # Served from the cache until the endpoints that changed them invalidate
+    assert not cache.can_join(cache.identity(emails[other]), room)
+    assert cache.identity(emails[enrolled]).is_active
+    cache.invalidate(other, enrolled, None)
+    assert cache.can_join(cache.identity(emails[other]), room)
+    assert not cache.identity(emails[enrolled]).is_active
+
+    cache.invalidate_course(seeded.course_id)
+    assert cache.stats()["cached_users"] == 0  # every cached user was in the course room
+    assert cache.identity("nobody@x") is None
+
+
+def test_async_identity_loads_misses_off_the_event_loop(session_factory, seed_course):
+    seed_course(students=1)
+    cache = RoomMembershipCache(session_factory)
+
+    async def run():
+        loop_thread = threading.get_ident()
+        load = cache._load
+        threads = []
+        cache._load = lambda email: threads.append(threading.get_ident()) or load(email)
+        first = await cache.identity_async("s0@x")
+        second = await cache.identity_async("s0@x")
+        return loop_thread, threads, first, second
+
+    loop_thread, threads, first, second = asyncio.run(run())
+    assert first is second
+    assert len(threads) == 1 and threads[0] != loop_thread
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta, timezone
+
+from app.models.lesson import Lesson, LessonReminder
+from app.models.notification import Notification
+from app.schemas.lesson import LessonCreate, LessonUpdate
+from app.services.class_reminders import ClassReminderScheduler
+
+
+def _lesson(Session, course_id, scheduled_at):
+    db = Session()
+    lesson = Lesson(course_id=course_id, title="Limits", content_type="text", scheduled_at=scheduled_at)
+    db.add(lesson)
+    db.commit()
+    lesson_id = lesson.id
+    db.close()
+    return lesson_id
+
+
+def test_rescheduled_lesson_fires_at_new_time_once_across_workers(session_factory, seed_course):
+    Session = session_factory
+    now = datetime.utcnow()
+    lesson_id = _lesson(Session, seed_course(students=5).course_id, now + timedelta(hours=3))
+    scheduler = ClassReminderScheduler(session_factory=Session, offsets_minutes=[60, 15])
+    scheduler.load_window(now)
+    assert scheduler.stats()["pending_reminders"] == 2
+
+    # Rescheduled an hour earlier: the old entries are superseded
+    new_time = now + timedelta(hours=2)
+    db = Session()
+    db.query(Lesson).filter(Lesson.id == lesson_id).update({"scheduled_at": new_time})
+    db.commit()
+    db.close()
+    scheduler.schedule(lesson_id, new_time, now)
+
+    assert scheduler.due(now + timedelta(minutes=59)) == []
+    due = scheduler.due(now + timedelta(hours=1, minutes=1))
+    assert [(reminder[2], reminder[3]) for reminder in due] == [(60, new_time)]
+    assert scheduler.fire(due[0], now + timedelta(hours=1, minutes=1)) == 5
+
+    # Another worker holding the same reminder finds it claimed
+    other = ClassReminderScheduler(session_factory=Session, offsets_minutes=[60, 15])
+    assert other.fire(due[0]) == 0
+
+    db = Session()
+    assert db.query(Notification).filter(Notification.notification_type == "class_reminder").count() == 5
+    assert db.query(LessonReminder).one().recipients == 5
+    db.close()
+
+
+def test_aware_lesson_times_are_stored_as_utc():
+    ist = timezone(timedelta(hours=5, minutes=30))
+    created = LessonCreate(course_id=1, title="Limits", content_type="text",
+                           scheduled_at=datetime(2026, 3, 1, 10, 0, tzinfo=ist))
+    assert created.scheduled_at == datetime(2026, 3, 1, 4, 30)
+    updated = LessonUpdate(scheduled_at="2026-03-01T10:00:00-02:00")
+    assert updated.scheduled_at == datetime(2026, 3, 1, 12, 0)
+    assert LessonUpdate(scheduled_at=datetime(2026, 3, 1, 10, 0)).scheduled_at == datetime(2026, 3, 1, 10, 0)
+    assert LessonUpdate(title="x").scheduled_at is None
+
+
+def test_late_reminder_states_the_time_actually_left(session_factory, seed_course):
+    now = datetime.utcnow()
+    scheduled_at = now + timedelta(minutes=55)
+    _lesson(session_factory, seed_course(students=1).course_id, scheduled_at)
+    scheduler = ClassReminderScheduler(session_factory=session_factory, offsets_minutes=[24 * 60, 60])
+    scheduler.load_window(now - timedelta(minutes=8))  # the 1 hour reminder is 3 minutes overdue
+
+    due = scheduler.due(now)
+    assert [reminder[2] for reminder in due] == [60]
+    assert scheduler.fire(due[0], now) == 1
+    db = session_factory()
+    message = db.query(Notification.message).filter(Notification.notification_type == "class_reminder").scalar()
+    assert message.startswith("Limits starts in 55 minutes, at ")
+    db.close()
@@ -0,0 +1,75 @@
+import pytest
+from app.models.gamification import CoinTransaction
+from app.models.user import User
+from app.services.coin_ledger import PENDING_KEY, InsufficientCoins, coin_ledger
+
+
+def test_changes_apply_to_the_stored_balance_and_are_recorded(session_factory):
+    Session = session_factory
+    db = Session()
+    db.add(User(email="s@x", full_name="s", hashed_password="x", sub_role="student", gyan_coins=20))
+    db.commit()
+    first, second = Session(), Session()
+    stale = first.query(User).one()
+    fresh = second.query(User).one()
+
+    # Two requests holding the same balance: neither change is lost
+    coin_ledger.change(first, stale, 30, "challenge_completed")
+    first.commit()
+    coin_ledger.change(second, fresh, -45, "reward_claimed")
+    second.commit()
+    assert fresh.gyan_coins == 5
+
+    with pytest.raises(InsufficientCoins):
+        coin_ledger.change(first, stale, -10, "streak_freeze")
+    first.rollback()
+    assert PENDING_KEY not in first.info
+
+    db.expire_all()
+    assert db.query(User.gyan_coins).scalar() == 5
+    rows = db.query(CoinTransaction).order_by(CoinTransaction.id).all()
+    assert [(row.delta, row.balance_after, row.reason) for row in rows] == [
+        (30, 50, "challenge_completed"), (-45, 5, "reward_claimed")
+    ]
+    for session in (db, first, second):
+        session.close()
+
+
+def test_history_pages_newest_first(session_factory):
+    Session = session_factory
+    db = Session()
+    user = User(email="s@x", full_name="s", hashed_password="x", sub_role="student", gyan_coins=0)
+    db.add(user)
+    db.commit()
+    for points in range(1, 6):
+        coin_ledger.change(db, user, points, "points_added")
+    coin_ledger.change(db, user, -4, "reward_claimed")
+    db.commit()
+
+    page = coin_ledger.history(db, user.id, limit=4)
+    assert [t.delta for t in page] == [-4, 5, 4, 3]
+    assert [t.delta for t in coin_ledger.history(db, user.id, limit=4, before_id=page[-1].id)] == [2, 1]
+    assert coin_ledger.total_earned(db, user.id) == 15
+    db.close()
+
+
+def test_reset_records_the_stored_balance_not_the_loaded_one(session_factory):
+    Session = session_factory
+    db = Session()
+    db.add(User(email="s@x", full_name="s", hashed_password="x", sub_role="student", gyan_coins=20))
+    db.commit()
+    first, second = Session(), Session()
+    stale = first.query(User).one()
+    coin_ledger.change(second, second.query(User).one(), 30, "quiz_passed")
+    second.commit()
+
+    transaction = coin_ledger.reset(first, stale, "progress_reset", "All progress reset")
+    first.commit()
+    assert (transaction.delta, transaction.balance_after, stale.gyan_coins) == (-50, 0, 0)
+    assert coin_ledger.reset(first, stale, "progress_reset") is None
+
+    db.expire_all()
+    assert db.query(User.gyan_coins).scalar() == 0
+    assert [row.delta for row in db.query(CoinTransaction).order_by(CoinTransaction.id)] == [30, -50]
+    for session in (db, first, second):
+        session.close()
@@ -0,0 +1,75 @@
+import asyncio
+
+from app.services.conversation_memory import ConversationStore
+
+
+class FakeRedis:
+    """The get/set subset of redis.asyncio the store uses, shared between stores like one server"""
+
+    def __init__(self):
+        self.data = {}
+        self.down = False
+
+    async def get(self, key):
+        if self.down:
+            raise ConnectionError("redis down")
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        if self.down:
+            raise ConnectionError("redis down")
+        self.data[key] = value
+
+
+def _worker(shared):
+    store = ConversationStore()
+    store._redis = shared
+    return store
+
+
+def test_workers_see_each_others_turns_through_redis():
+    shared = FakeRedis()
+    first, second = _worker(shared), _worker(shared)
+
+    async def run():
+        conversation = await first.load(1, "c")
+        await first.record_exchange(conversation, "what is a loop", "repeats a block")
+        conversation = await second.load(1, "c")
+        await second.record_exchange(conversation, "and a while loop?", "repeats while true")
+
+        # The first worker still holds its own copy but reads the newer one
+        seen = [turn.content for turn in (await first.load(1, "c")).turns]
+
+        shared.down = True
+        await first.record_exchange(await first.load(1, "c"), "for loops?", "iterate a sequence")
+        fallback = [turn.content for turn in (await first.load(1, "c")).turns]
+        other_user = await first.load(2, "c")
+        return seen, fallback, other_user
+
+    seen, fallback, other_user = asyncio.run(run())
+    assert seen == ["what is a loop", "repeats a block", "and a while loop?", "repeats while true"]
+    assert fallback[-2:] == ["for loops?", "iterate a sequence"]
+    assert len(other_user.turns) == 0  # conversation ids are scoped per user
+    assert first.stats()["backend_errors"] == 4
+
+
+def test_history_fits_the_budget_and_summarizes_older_turns():
+    store = ConversationStore()
+
+    async def run():
+        conversation = await store.load(1, "long")
+        for i in range(10):
+            await store.record_exchange(conversation, f"question {i} " + "detail " * 100, f"answer {i} " + "words " * 100)
+        return conversation
+
+    conversation = asyncio.run(run())
+    assert len(conversation.turns) == 12
+    # Eight turns were folded; the oldest notes no longer fit the summary budget
+    assert conversation.summary[0].startswith("Student: question 1")
+    assert conversation.summary[-1].startswith("Tutor: answer 3")
+
+    history = store.prompt_history(conversation, token_budget=400)
+    assert history[0]["role"] == "system"
+    assert "Tutor: answer 7" in history[0]["content"]
+    assert [message["content"].split()[:2] for message in history[1:]] == [["question", "9"], ["answer", "9"]]
+    assert sum(len(message["content"]) // 4 for message in history[1:]) <= 400
@@ -0,0 +1,43 @@
+import asyncio
+
+from fastapi import FastAPI, Request
+
+from app.services.http_clients import HTTPClientRegistry, UpstreamConfig
+
+
+def _echo_app():
+    echo = FastAPI()
+
+    @echo.get("/port")
+    async def port(request: Request):
+        await asyncio.sleep(0.02)
+        return {"client_port": request.client.port}
+
+    return echo
+
+
+def test_requests_reuse_pooled_connections_within_limits(serve):
+    base_url = serve(_echo_app())
+    registry = HTTPClientRegistry({
+        "echo": UpstreamConfig(base_url, timeout=5.0, max_connections=2, max_keepalive_connections=2)
+    })
+
+    async def run():
+        client = registry.get("echo")
+        assert registry.get("echo") is client
+        sequential = {(await client.get("/port")).json()["client_port"] for _ in range(5)}
+        responses = await asyncio.gather(*(client.get("/port") for _ in range(8)))
+        concurrent = {response.json()["client_port"] for response in responses}
+        await registry.aclose()
+        reopened = registry.get("echo")
+        await reopened.aclose()
+        return sequential, concurrent, reopened is not client
+
+    sequential, concurrent, reopened = asyncio.run(run())
+    assert len(sequential) == 1  # one keep-alive connection for back-to-back calls
+    assert len(concurrent) <= 2  # max_connections caps the pool under load
+    assert reopened
+
+    stats = registry.stats()["upstreams"]["echo"]
+    assert (stats["requests"], stats["errors"], stats["in_flight"]) == (13, 0, 0)
+    assert stats["status_counts"] == {"2xx": 13}
@@ -0,0 +1,93 @@
+import random
+from datetime import datetime
+
+from app.models.course import Course
+from app.models.gamification import CoinTransaction
+from app.models.user import User
+from app.services.leaderboard import Leaderboard, SortedSet
+
+
+def test_sorted_set_ranks_match_a_full_sort():
+    rng = random.Random(7)
+    board = SortedSet()
+    scores = {}
+    for step in range(5000):
+        member = rng.randrange(200)
+        if rng.random() < 0.85:
+            delta = rng.randrange(-20, 50)
+            board.incr(member, delta)
+            scores[member] = scores.get(member, 0) + delta
+        else:
+            board.remove(member)
+            scores.pop(member, None)
+        if step % 250 == 0:
+            order = sorted(scores, key=lambda m: (-scores[m], m))
+            assert [member for member, _ in board.range(0, len(order))] == order
+            assert all(board.rank(member) == position for position, member in enumerate(order))
+            start = rng.randrange(len(order) + 1)
+            assert [member for member, _ in board.range(start, start + 5)] == order[start:start + 5]
+
+
+def test_windows_and_scoped_boards_follow_coin_changes(session_factory, seed_course):
+    Session = session_factory
+    seeded = seed_course(students=4, enrolled=[0, 2], gyan_coins=[0, 10, 20, 30])
+    db = Session()
+    teacher = db.get(User, seeded.teacher_id)
+    course = db.get(Course, seeded.course_id)
+    students = [db.get(User, student_id) for student_id in seeded.student_ids]
+
+    boards = Leaderboard(session_factory=Session)
+    scope = f"course:{course.id}"
+    assert [row["user_id"] for row in boards.top(db, "all_time")] == [s.id for s in reversed(students)]
+    assert [row["user_id"] for row in boards.top(db, "all_time", scope)] == [students[2].id, students[0].id]
+
+    now = datetime.utcnow()
+    boards.record(students[0].id, "student", 50, now)
+    boards.record(students[3].id, "student", -30, now)  # spending lowers the balance, not coins earned
+    boards.record(teacher.id, "teacher", 100, now)  # only students are ranked
+
+    assert [(row["user_id"], row["score"]) for row in boards.top(db, "weekly")] == [(students[0].id, 50)]
+    # The course board was derived before the change and follows it
+    assert [(row["user_id"], row["score"]) for row in boards.top(db, "all_time", scope)] == [
+        (students[0].id, 50), (students[2].id, 20)
+    ]
+    mine = boards.around(db, students[1].id, "all_time", neighbors=1)
+    assert (mine["rank"], mine["score"], mine["total"]) == (3, 10, 4)
+    assert [row["user_id"] for row in mine["neighbors"]] == [students[2].id, students[1].id, students[3].id]
+    assert boards.around(db, students[1].id, "weekly")["rank"] is None
+
+    # Windows are rebuilt from the coin ledger; opening balances were not earned this week
+    db.add_all([
+        CoinTransaction(user_id=students[1].id, delta=15, balance_after=25, reason="quiz_passed", created_at=now),
+        CoinTransaction(user_id=students[1].id, delta=-5, balance_after=20, reason="reward_claimed", created_at=now),
+        CoinTransaction(user_id=students[2].id, delta=20, balance_after=20, reason="opening_balance", created_at=now),
+    ])
+    db.commit()
+    boards.rebuild(now)
+    assert [(row["user_id"], row["score"]) for row in boards.top(db, "weekly")] == [(students[1].id, 15)]
+    db.close()
+
+
+def test_scoped_boards_take_in_members_without_a_score_and_cache_empty_scopes(session_factory, seed_course):
+    seeded = seed_course(students=3, enrolled=[0, 1])
+    db = session_factory()
+    boards = Leaderboard(session_factory=session_factory)
+    course_scope = f"course:{seeded.course_id}"
+    empty = Course(title="Empty", description="d", teacher_id=seeded.teacher_id)
+    db.add(empty)
+    db.commit()
+
+    assert boards.top(db, "weekly", course_scope) == []
+    assert boards.top(db, "all_time", f"course:{empty.id}") == []
+    boards.record(seeded.student_ids[1], "student", 40)
+    boards.record(seeded.student_ids[2], "student", 90)  # not enrolled
+
+    # Enrolled with no coins earned this week when the board was derived
+    assert [(row["user_id"], row["score"]) for row in boards.top(db, "weekly", course_scope)] == [
+        (seeded.student_ids[1], 40)
+    ]
+    boards.record(seeded.student_ids[1], "student", 5)
+    assert boards.around(db, seeded.student_ids[1], "weekly", course_scope)["score"] == 45
+    assert boards.top(db, "all_time", f"course:{empty.id}") == []
+    assert boards.stats()["scoped_builds"] == 2
+    db.close()
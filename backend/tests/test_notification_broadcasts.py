@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from app.models.enrollment import Enrollment
+from app.models.notification import BroadcastReceipt, Notification, NotificationReadState
+from app.models.user import User
+from app.services import notification_broadcasts as broadcasts
+
+
+def test_set_based_insert_notifies_exactly_the_selected_users(session_factory, seed_course):
+    seeded = seed_course(students=4, enrolled=[0, 2, 3])
+    db = session_factory()
+
+    items = broadcasts.create_notifications_for(
+        db,
+        select(Enrollment.student_id).where(Enrollment.course_id == seeded.course_id),
+        "Quiz tomorrow",
+        "Chapter 3",
+        "assignment"
+    )
+    db.commit()
+
+    expected = {seeded.student_ids[i] for i in (0, 2, 3)}
+    rows = db.query(Notification).all()
+    assert {row.user_id for row in rows} == expected
+    assert sorted((item["id"], item["user_id"]) for item in items) == sorted((row.id, row.user_id) for row in rows)
+    assert all(item["source"] == "personal" and not item["is_read"] for item in items)
+    db.close()
+
+
+def _feed(db, user, **options):
+    return [(item["title"], item["is_read"]) for item in broadcasts.list_notifications(db, user, **options)
+            if item["source"] == "broadcast"]
+
+
+def test_broadcasts_are_stored_once_and_read_state_follows_watermarks(session_factory, seed_course):
+    seeded = seed_course(students=1)
+    db = session_factory()
+    student, teacher = db.get(User, seeded.student_ids[0]), db.get(User, seeded.teacher_id)
+    sent = {}
+    for title, sub_role in [("all", None), ("students", "student"), ("teachers", "teacher")]:
+        sent[title] = broadcasts.create_broadcast(db, teacher.id, title, "m", target_sub_role=sub_role)
+    late = User(email="late@x", full_name="l", hashed_password="x", sub_role="student",
+                created_at=datetime.utcnow() + timedelta(minutes=1))
+    db.add(late)
+    db.commit()
+
+    assert _feed(db, student) == [("students", False), ("all", False)]
+    assert _feed(db, teacher) == [("teachers", False), ("all", False)]
+    assert _feed(db, late) == []  # sent before they joined
+    assert broadcasts.recipient_count(db, sent["students"]) == 1
+
+    broadcasts.mark_broadcast_read(db, student, sent["students"])
+    broadcasts.dismiss_broadcast(db, student, sent["all"])
+    db.commit()
+    assert _feed(db, student) == [("students", True)]
+    assert _feed(db, student, unread_only=True) == []
+
+    broadcasts.mark_all_read(db, teacher)
+    broadcasts.mark_all_read(db, student)
+    db.commit()
+    # One watermark row per user; only the deletion receipt is still needed
+    assert db.query(NotificationReadState).count() == 2
+    assert [(r.broadcast_id, r.dismissed) for r in db.query(BroadcastReceipt)] == [(sent["all"].id, True)]
+    assert _feed(db, teacher) == [("teachers", True), ("all", True)]
+
+    broadcasts.create_broadcast(db, teacher.id, "newer", "m")
+    db.commit()
+    assert _feed(db, student, unread_only=True) == [("newer", False)]
+    db.close()
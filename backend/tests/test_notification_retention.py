@@ -0,0 +1,101 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models.notification import BroadcastNotification, BroadcastReceipt, Notification
+from app.models.user import User
+from app.services import notification_broadcasts as broadcasts
+from app.services import notification_retention as retention_module
+from app.services.notification_retention import NotificationRetention
+from app.services.unread_counters import UnreadCounters
+
+NOW = datetime(2026, 6, 1)
+
+
+@pytest.fixture
+def counters(session_factory, monkeypatch):
+    counters = UnreadCounters(session_factory)
+    monkeypatch.setattr(broadcasts, "unread_counters", counters)
+    monkeypatch.setattr(retention_module, "unread_counters", counters)
+    return counters
+
+
+def _notify(db, user_id, title, age_days, is_read):
+    db.add(Notification(user_id=user_id, title=title, message="m", notification_type="general",
+                        is_read=is_read, created_at=NOW - timedelta(days=age_days)))
+
+
+def test_only_old_read_notifications_expire_and_are_archived(session_factory, seed_course, counters, tmp_path):
+    student_id = seed_course(students=1).student_ids[0]
+    db = session_factory()
+    # Inserted out of created_at order: ids say nothing about age
+    for title, age_days, is_read in [("recent read", 1, True), ("old read", 120, True), ("old unread", 200, False),
+                                     ("older read", 300, True), ("recent unread", 2, False)]:
+        _notify(db, student_id, title, age_days, is_read)
+    db.commit()
+    retention = NotificationRetention(session_factory, retention_days=90, max_per_user=0,
+                                      archive_dir=str(tmp_path / "archive"), batch_size=1, batch_pause=0)
+
+    result = retention.run_once(now=NOW)
+    assert (result["expired"], result["archived"]) == (2, 2)
+    assert sorted(row.title for row in db.query(Notification)) == ["old unread", "recent read", "recent unread"]
+    with gzip.open(result["archive"], "rt", encoding="utf-8") as archive:
+        records = [json.loads(line) for line in archive]
+    assert sorted(record["title"] for record in records) == ["old read", "older read"]
+    assert all(record["kind"] == "notification" and record["user_id"] == student_id for record in records)
+    assert records[0]["created_at"] == (NOW - timedelta(days=300)).isoformat()
+    db.close()
+
+
+def test_cap_drops_the_oldest_and_takes_them_off_the_unread_counter(session_factory, seed_course, counters):
+    seeded = seed_course(students=2)
+    db = session_factory()
+    busy, quiet = (db.get(User, user_id) for user_id in seeded.student_ids)
+    for age_days in range(6):
+        _notify(db, busy.id, f"n{age_days}", age_days, is_read=age_days % 2 == 0)
+    _notify(db, quiet.id, "only", 10, is_read=False)
+    db.commit()
+    assert counters.unread_count(db, busy) == 3
+
+    result = NotificationRetention(session_factory, retention_days=0, max_per_user=2,
+                                   archive_dir="", batch_size=2, batch_pause=0).run_once(now=NOW)
+    assert (result["capped"], result["expired"]) == (4, 0)
+    assert sorted(row.title for row in db.query(Notification).filter(Notification.user_id == busy.id)) == ["n0", "n1"]
+    assert db.query(Notification).filter(Notification.user_id == quiet.id).count() == 1
+    db.expire_all()
+    assert counters.unread_count(db, busy) == 1  # n1
+    assert counters.reconcile() == 0
+    db.close()
+
+
+def test_old_broadcasts_expire_once_every_target_has_read_them(session_factory, seed_course, counters):
+    seeded = seed_course(students=2)
+    db = session_factory()
+    first, second = (db.get(User, user_id) for user_id in seeded.student_ids)
+    for user in (first, second, db.get(User, seeded.teacher_id)):
+        user.created_at = NOW - timedelta(days=400)
+    sent = {}
+    for title, sub_role in [("students", "student"), ("teachers", "teacher"), ("all", None)]:
+        sent[title] = broadcasts.create_broadcast(db, seeded.teacher_id, title, "m", target_sub_role=sub_role)
+        sent[title].created_at = NOW - timedelta(days=120)
+    db.commit()
+    broadcasts.mark_all_read(db, first)
+    broadcasts.mark_broadcast_read(db, second, sent["students"])
+    db.commit()
+
+    retention = NotificationRetention(session_factory, retention_days=90, max_per_user=0, archive_dir="",
+                                      batch_pause=0)
+    assert retention.run_once(now=NOW)["broadcasts_expired"] == 1
+    # The teacher has not read theirs, nor has the second student read the one for everyone
+    assert sorted(row.title for row in db.query(BroadcastNotification)) == ["all", "teachers"]
+    assert db.query(BroadcastReceipt).count() == 0
+    assert counters.unread_count(db, second) == 1
+
+    broadcasts.dismiss_broadcast(db, second, sent["all"])
+    broadcasts.mark_all_read(db, db.get(User, seeded.teacher_id))
+    db.commit()
+    assert retention.run_once(now=NOW)["broadcasts_expired"] == 2
+    assert db.query(BroadcastNotification).count() == 0
+    db.close()
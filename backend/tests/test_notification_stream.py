@@ -0,0 +1,132 @@
+import asyncio
+import json
+
+import pytest
+
+from app.api import teacher as teacher_api
+from app.models.notification import Notification
+from app.models.user import User
+from app.services import notification_broadcasts as broadcasts
+from app.services import notification_stream
+from app.services.notification_stream import NotificationHub
+from app.services.unread_counters import UnreadCounters
+
+
+class FakeSocket:
+    """The accept/send subset of a Starlette WebSocket, recording decoded frames"""
+
+    def __init__(self, broken=False):
+        self.scope = {"subprotocols": []}
+        self.frames = []
+        self.broken = broken
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def send_text(self, payload):
+        if self.broken:
+            raise RuntimeError("socket closed")
+        self.frames.append(json.loads(payload))
+
+
+@pytest.fixture
+def counters(session_factory, monkeypatch):
+    counters = UnreadCounters(session_factory)
+    monkeypatch.setattr(broadcasts, "unread_counters", counters)
+    monkeypatch.setattr(notification_stream, "unread_counters", counters)
+    return counters
+
+
+def _frames(socket):
+    return [(frame["type"], frame.get("notification", {}).get("title", frame.get("unread_count")))
+            for frame in socket.frames]
+
+
+def test_events_reach_every_socket_of_targeted_users_with_unread_counts(session_factory, seed_course, counters):
+    seeded = seed_course(students=2)
+    hub = NotificationHub(session_factory)
+    first, second, teacher = (hub.load_user(email) for email in ("s0@x", "s1@x", "t@x"))
+    phone, laptop, other, staff = (FakeSocket() for _ in range(4))
+    closed = FakeSocket(broken=True)
+    db = session_factory()
+
+    async def run():
+        for socket, user in [(phone, first), (laptop, first), (other, second), (staff, teacher), (closed, second)]:
+            await hub.connect(socket, user)
+        items = broadcasts.create_notifications(db, [first.id], "Graded", "m")
+        db.commit()
+        await hub.dispatch({"kind": "notifications", "items": items})
+        broadcast = broadcasts.create_broadcast(db, teacher.id, "Holiday", "m", target_sub_role="student")
+        db.commit()
+        await hub.dispatch({
+            "kind": "broadcast",
+            "target_role": broadcast.target_role,
+            "target_sub_role": broadcast.target_sub_role,
+            "item": notification_stream.notification_item(broadcast, source="broadcast", user_id=0),
+        })
+        broadcasts.mark_all_read(db, db.get(User, first.id))
+        db.commit()
+        await hub.dispatch({"kind": "unread", "user_ids": [first.id, seeded.teacher_id]})
+
+    asyncio.run(run())
+    expected = [("notification", "Graded"), ("unread_count", 1), ("notification", "Holiday"), ("unread_count", 2),
+                ("unread_count", 0)]
+    assert _frames(phone) == _frames(laptop) == expected
+    assert _frames(other) == [("notification", "Holiday"), ("unread_count", 1)]
+    assert _frames(staff) == [("unread_count", 0)]
+    assert phone.frames[2]["notification"]["user_id"] == first.id
+    # The broken socket was dropped on its first failed send
+    assert hub.stats()["connected_sockets"] == 4 and hub.send_errors == 1
+    db.close()
+
+
+def test_announcement_returns_the_created_notification_ids(session_factory, seed_course, counters):
+    seeded = seed_course(students=3, enrolled=[0, 2])
+    db = session_factory()
+    teacher = db.get(User, seeded.teacher_id)
+
+    response = asyncio.run(teacher_api.create_announcement(
+        seeded.course_id, "Exam moved", "Now on Friday", current_user=teacher, db=db
+    ))
+    announcement = response["announcement"]
+    rows = db.query(Notification).order_by(Notification.id).all()
+    assert announcement["notification_ids"] == [row.id for row in rows]
+    assert announcement["id"] == rows[0].id
+    assert announcement["recipients_count"] == 2
+    assert {row.user_id for row in rows} == {seeded.student_ids[0], seeded.student_ids[2]}
+    db.close()
+
+
+def test_published_events_are_held_until_delivered_and_cancelled_on_close(session_factory, seed_course, counters):
+    student_id = seed_course(students=1).student_ids[0]
+    hub = NotificationHub(session_factory)
+    socket = FakeSocket()
+    gate = asyncio.Event()
+
+    async def run():
+        await hub.run()
+        await hub.connect(socket, hub.load_user("s0@x"))
+        dispatch = hub.dispatch
+
+        async def slow_dispatch(event):
+            await gate.wait()
+            await dispatch(event)
+
+        hub.dispatch = slow_dispatch
+        await asyncio.to_thread(hub.publish_unread, [student_id])
+        await asyncio.sleep(0)
+        assert len(hub._pending) == 1
+        gate.set()
+        await asyncio.gather(*hub._pending)
+        await asyncio.sleep(0)  # done callbacks run on the next pass
+        assert not hub._pending and _frames(socket) == [("unread_count", 0)]
+
+        gate.clear()
+        await asyncio.to_thread(hub.publish_unread, [student_id])
+        await asyncio.sleep(0)
+        (stuck,) = hub._pending
+        await hub.aclose()
+        await asyncio.sleep(0)
+        assert stuck.cancelled() and not hub._pending
+
+    asyncio.run(run())
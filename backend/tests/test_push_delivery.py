@@ -0,0 +1,94 @@
+import asyncio
+
+import httpx
+from app.models.user import User
+from app.services.push_delivery import PushDeliveryService
+from fake_fcm_server import create_app
+
+
+def _seed(Session):
+    db = Session()
+    for i in range(250):
+        if i % 10 == 0:
+            token = f"invalid-{i}"
+        elif i % 25 == 1:
+            token = f"stale-{i}"
+        else:
+            token = f"flaky-{i}" if i % 40 == 7 else f"token-{i}"  # one per multicast of 40
+        db.add(User(email=f"u{i}@x", full_name="u", hashed_password="x", role="service_seeker",
+                    sub_role="student" if i % 2 else "teacher", fcm_token=token if i < 240 else None))
+    db.commit()
+    db.close()
+    return Session
+
+
+def test_multicast_delivery_retries_and_prunes_tokens(session_factory, serve):
+    Session = _seed(session_factory)
+    fake = create_app(latency=0.01, retry_after=0.01, fail_requests={2, 5})
+    base_url = serve(fake)
+    service = PushDeliveryService(Session, multicast_size=40, max_concurrency=3, rate_limit=10000, max_attempts=8, backoff_base=0.01)
+
+    async def run():
+        job = service.enqueue("Hello", "World")
+        async with httpx.AsyncClient(base_url=base_url) as client:
+            await service.deliver(client, job)
+        return job
+
+    job = asyncio.run(run())
+
+    assert job.status == "completed"
+    assert job.tokens == 240
+    assert job.pruned == 24
+    assert job.sent == 216 and job.failed == 0
+    assert max(fake.state.batch_sizes) <= 40
+    # Six multicasts; each retries its flaky token once, and two more retries follow the 503s
+    assert service.retries == 8
+    assert fake.state.requests == 14 and fake.state.rejected == 2
+    assert fake.state.deliveries["flaky-7"] == 2 and fake.state.deliveries["token-2"] == 1
+
+    db = Session()
+    tokens = {u.id: u.fcm_token for u in db.query(User).all()}
+    db.close()
+    assert not any(t and t.startswith("invalid-") for t in tokens.values())
+    assert not any(t and t.startswith("stale-") for t in tokens.values())
+    assert sum(1 for t in tokens.values() if t and t.startswith("fresh-")) == 10
+
+
+def test_targeted_job_only_reaches_matching_users(session_factory, serve):
+    Session = _seed(session_factory)
+    base_url = serve(create_app(latency=0.0))
+    service = PushDeliveryService(Session, multicast_size=50, rate_limit=10000)
+
+    async def run():
+        job = service.enqueue("Hi", "Students", target_sub_role="student")
+        async with httpx.AsyncClient(base_url=base_url) as client:
+            await service.deliver(client, job)
+        return job
+
+    job = asyncio.run(run())
+
+    assert job.tokens == 120
+    assert job.sent + job.pruned == 120
+
+
+def test_unreadable_or_short_responses_leave_tokens_to_retry(session_factory):
+    responses = [
+        httpx.Response(200, text='{"multicast_id": 1, "resu'),  # cut off mid-body
+        httpx.Response(200, json={"results": [{"message_id": "m1"}]}),  # one result for two tokens
+        httpx.Response(200, json={"results": [{"message_id": "m2"}]}),
+    ]
+    batches = []
+
+    def handler(request):
+        batches.append(httpx.Response(200, content=request.content).json()["registration_ids"])
+        return responses.pop(0)
+
+    service = PushDeliveryService(session_factory, rate_limit=10000, backoff_base=0.001)
+
+    async def run():
+        async with httpx.AsyncClient(base_url="http://fcm", transport=httpx.MockTransport(handler)) as client:
+            return await service.send_batch(client, ["a", "b"], {"notification": {}}, max_attempts=3)
+
+    result = asyncio.run(run())
+    assert (result.sent, result.failed, result.attempts) == (2, 0, 3)
+    assert batches == [["a", "b"], ["a", "b"], ["b"]]
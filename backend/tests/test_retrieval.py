@@ -0,0 +1,60 @@
+from app.models.lesson import Lesson
+from app.services import retrieval
+from app.services.retrieval import CourseIndexCache, chunk_text, estimate_tokens, index_lesson
+
+PHOTOSYNTHESIS = (
+    "Photosynthesis turns light energy into chemical energy. "
+    "Chlorophyll in the chloroplasts absorbs red and blue light. "
+    "The light reactions split water and release oxygen. "
+)
+RESPIRATION = (
+    "Cellular respiration releases energy from glucose. "
+    "Mitochondria produce ATP through the electron transport chain. "
+)
+
+
+def test_chunks_pack_whole_sentences_within_the_budget():
+    text = " ".join(f"Sentence number {i} talks about topic {i}." for i in range(40))
+    chunks = chunk_text(text, chunk_tokens=40)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 40 for chunk in chunks)
+    assert all(chunk.endswith(".") for chunk in chunks)
+    assert " ".join(chunks) == text
+
+
+def test_search_ranks_matching_passages_and_follows_lesson_edits(session_factory, seed_course, monkeypatch):
+    course_id = seed_course(students=0).course_id
+    db = session_factory()
+    lessons = [
+        Lesson(course_id=course_id, title="Photosynthesis", content_type="text", content_text=PHOTOSYNTHESIS * 3),
+        Lesson(course_id=course_id, title="Respiration", content_type="text", content_text=RESPIRATION * 3),
+    ]
+    db.add_all(lessons)
+    db.commit()
+    indexes = CourseIndexCache()
+    monkeypatch.setattr(retrieval, "course_indexes", indexes)  # invalidated by index_lesson
+
+    # Content written before indexing is chunked on first use
+    index = indexes.get(db, course_id)
+    assert {chunk.source_id for chunk in index.chunks} == {lesson.id for lesson in lessons}
+    best = index.search("how do mitochondria make ATP?")
+    assert best[0].source_id == lessons[1].id
+    assert all(chunk.source_id == lessons[1].id for chunk in best)
+
+    # Nothing matches: the opening of the lesson being asked about is the fallback
+    fallback = index.search("tell me a joke", lesson_id=lessons[0].id)
+    assert [(chunk.source_id, chunk.position) for chunk in fallback][0] == (lessons[0].id, 0)
+    assert index.search("tell me a joke") == []
+
+    budgeted = index.search("energy light glucose", top_k=10, token_budget=40)
+    assert sum(chunk.token_count for chunk in budgeted) <= 40
+
+    assert indexes.get(db, course_id) is index
+    version = indexes.version(db, course_id)
+    lessons[1].content_text = "Fermentation happens without oxygen."
+    index_lesson(db, lessons[1])
+    rebuilt = indexes.get(db, course_id)
+    assert rebuilt is not index and indexes.version(db, course_id) != version
+    assert rebuilt.search("mitochondria ATP") == []
+    assert indexes.stats()["builds"] == 2
+    db.close()
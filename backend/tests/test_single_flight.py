@@ -0,0 +1,62 @@
+import asyncio
+
+from app.services.single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call_and_survive_the_leader_leaving():
+    flights = SingleFlight()
+    calls = []
+
+    async def fetch(key):
+        calls.append(key)
+        await asyncio.sleep(0.05)
+        return f"answer for {key}"
+
+    async def run():
+        leader = asyncio.create_task(flights.do("q", lambda: fetch("q")))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(flights.do("q", lambda: fetch("q"))) for _ in range(4)]
+        other = asyncio.create_task(flights.do("other", lambda: fetch("other")))
+        await asyncio.sleep(0.01)
+        leader.cancel()  # the leading client disconnects
+        results = await asyncio.gather(*followers, other)
+        # Finished calls are not reused
+        again = await flights.do("q", lambda: fetch("q"))
+        return results, again
+
+    results, again = asyncio.run(run())
+    assert results == ["answer for q"] * 4 + ["answer for other"]
+    assert again == "answer for q"
+    assert calls == ["q", "other", "q"]
+    assert flights.stats() == {
+        "in_flight": 0, "leaders": 3, "coalesced": 4, "coalesced_rate": round(4 / 7, 3), "failures": 0
+    }
+
+
+def test_failures_reach_every_waiter():
+    flights = SingleFlight()
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        return await asyncio.gather(*(flights.do("q", failing) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert (flights.leaders, flights.coalesced, flights.failures) == (1, 2, 1)
+
+
+def test_manually_resolved_leader_feeds_joiners():
+    flights = SingleFlight()
+
+    async def run():
+        future = flights.lead("stream")
+        joined = flights.join("stream")
+        assert joined is future
+        future.set_result("complete answer")
+        assert await joined == "complete answer"
+        return flights.join("stream")
+
+    assert asyncio.run(run()) is None
@@ -0,0 +1,78 @@
+import random
+from datetime import date, timedelta
+
+from app.models.progress import UserActivity
+from app.models.user import User
+from app.services.study_activity import ALL_COURSES, StudyActivity
+
+
+def _runs(days):
+    """Reference: longest run and run ending at each day, by walking the days"""
+    longest = current = 0
+    ending = {}
+    for day in range(max(days) + 3):
+        current = current + 1 if day in days else 0
+        ending[day] = current
+        longest = max(longest, current)
+    return longest, ending
+
+
+def test_streaks_match_a_walk_over_the_days_marked_in_any_order(session_factory):
+    db = session_factory()
+    rng = random.Random(11)
+    start = date(2026, 1, 1)
+    activity = StudyActivity()
+
+    for trial in range(20):
+        user = User(email=f"s{trial}@x", full_name="s", hashed_password="x", sub_role="student")
+        db.add(user)
+        db.flush()
+        days = set(rng.sample(range(90), rng.randrange(1, 40)))
+        for day in rng.sample(sorted(days), len(days)):
+            activity.record(db, user.id, [7], on=start + timedelta(days=day))
+            db.flush()
+        db.commit()
+
+        longest, ending = _runs(days)
+        today = rng.randrange(92)
+        streaks = activity.streaks(db, user.id, [ALL_COURSES, 7, 8], today=start + timedelta(days=today))
+        assert streaks[ALL_COURSES] == streaks[7]
+        assert streaks[ALL_COURSES]["longest_streak"] == longest
+        assert streaks[ALL_COURSES]["current_streak"] == (ending[today] or ending.get(today - 1, 0))
+        assert streaks[ALL_COURSES]["last_active_on"] == start + timedelta(days=max(days))
+        assert streaks[8]["current_streak"] == 0
+
+        heatmap = activity.heatmap(db, user.id, days=30, today=start + timedelta(days=59))
+        assert heatmap["days"] == [1 if day in days else 0 for day in range(30, 60)]
+
+    # One overall and one course row per user; repeat activity on a marked day writes nothing
+    assert db.query(UserActivity).count() == 40
+    db.close()
+
+
+def test_a_first_insert_that_loses_the_race_marks_the_winners_row(session_factory, monkeypatch):
+    first, second = session_factory(), session_factory()
+    user = User(email="s@x", full_name="s", hashed_password="x", sub_role="student")
+    first.add(user)
+    first.commit()
+    activity = StudyActivity()
+    activity.record(first, user.id, [7], on=date(2026, 1, 1))
+    first.commit()
+
+    # The second request read before the first committed, so it finds no rows and inserts
+    locked = StudyActivity._locked
+    stale = iter([True])
+    monkeypatch.setattr(StudyActivity, "_locked", staticmethod(
+        lambda db, user_id, course_ids: locked(db, -1 if next(stale, False) else user_id, course_ids)
+    ))
+    second.add(User(email="other@x", full_name="o", hashed_password="x", sub_role="student"))
+    activity.record(second, user.id, [7], on=date(2026, 1, 2))
+    second.commit()
+
+    rows = activity.rows(second, user.id, [ALL_COURSES, 7])
+    assert {course_id: row.days for course_id, row in rows.items()} == {ALL_COURSES: b"\x03", 7: b"\x03"}
+    assert rows[7].longest_streak == 2
+    assert second.query(User).count() == 2  # the caller's own work survived the conflicts
+    assert activity.marked == 4
+    first.close()
+    second.close()
@@ -0,0 +1,52 @@
+import pytest
+
+from app.services.tutor_cache import TutorAnswerCache
+
+
+def _cached(cache, question, answer, lesson_id=5, fingerprint="v1"):
+    cache.put(cache.key_for(1, lesson_id, "beginner", question), fingerprint, {"answer": answer})
+
+
+def _lookup(cache, question, lesson_id=5, fingerprint="v1"):
+    return cache.get(cache.key_for(1, lesson_id, "beginner", question), fingerprint)
+
+
+def test_rephrased_questions_share_an_answer():
+    cache = TutorAnswerCache()
+    _cached(cache, "What is recursion?", "calls itself")
+    _cached(cache, "difference between mitosis and meiosis", "two divisions")
+
+    assert _lookup(cache, "explain recursion")["cache_match"] == "exact"
+    near = _lookup(cache, "Difference between mitosis and meiosis in cells?")
+    assert (near["answer"], near["cache_match"]) == ("two divisions", "near")
+    assert _lookup(cache, "what is a linked list") is None
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("solve the equation 2x + 3 = 7 for x step by step", "solve the equation 2x + 3 = 9 for x step by step"),
+    ("solve 2x + 3 = 7", "solve 2x - 3 = 7"),
+    ("what is 3.5 + 2", "what is 35 + 2"),
+    ("how do i convert celsius to fahrenheit", "how do i convert fahrenheit to celsius"),
+])
+def test_questions_with_different_operands_or_word_order_miss(cached, asked):
+    cache = TutorAnswerCache()
+    _cached(cache, cached, "cached answer")
+    assert _lookup(cache, asked) is None
+    assert _lookup(cache, cached)["answer"] == "cached answer"
+
+
+def test_lesson_changes_and_capacity_drop_entries():
+    cache = TutorAnswerCache(max_entries=2)
+    _cached(cache, "what is recursion", "a")
+    assert _lookup(cache, "what is recursion", fingerprint="v2") is None  # lesson content changed
+
+    _cached(cache, "what is recursion", "a")
+    _cached(cache, "what is a stack", "b", lesson_id=6)
+    cache.invalidate_lesson(1, 5)
+    assert _lookup(cache, "what is recursion") is None
+
+    _cached(cache, "what is a queue", "c", lesson_id=6)
+    _cached(cache, "what is a heap", "d", lesson_id=6)
+    assert _lookup(cache, "what is a stack", lesson_id=6) is None  # least recently used
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["evictions"] == 1
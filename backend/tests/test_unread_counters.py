@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from app.models.notification import NotificationReadState
+from app.models.user import User
+from app.services import notification_broadcasts as broadcasts
+from app.services.unread_counters import UnreadCounters
+
+
+@pytest.fixture
+def counters(session_factory, monkeypatch):
+    counters = UnreadCounters(session_factory)
+    monkeypatch.setattr(broadcasts, "unread_counters", counters)
+    return counters
+
+
+def _truth(db, user):
+    return len(broadcasts.list_notifications(db, user, unread_only=True, limit=1000))
+
+
+def test_counts_follow_creates_reads_and_targeting(session_factory, seed_course, counters):
+    seeded = seed_course(students=2)
+    db = session_factory()
+    first, second = (db.get(User, user_id) for user_id in seeded.student_ids)
+    teacher = db.get(User, seeded.teacher_id)
+    assert counters.unread_count(db, first) == 0  # materializes the counters
+
+    broadcasts.create_notifications(db, [first.id, first.id, second.id], "Quiz", "m")
+    sent = [
+        broadcasts.create_broadcast(db, teacher.id, "all", "m"),
+        broadcasts.create_broadcast(db, teacher.id, "students", "m", target_sub_role="student"),
+        broadcasts.create_broadcast(db, teacher.id, "teachers", "m", target_sub_role="teacher"),
+        broadcasts.create_broadcast(db, teacher.id, "admins", "m", target_role="admin"),
+    ]
+    late = User(email="late@x", full_name="l", hashed_password="x", sub_role="student",
+                created_at=datetime.utcnow() + timedelta(minutes=1))
+    db.add(late)
+    db.commit()
+
+    counts = counters.unread_counts(db, [first, second, teacher, late])
+    assert counts == {first.id: 4, second.id: 3, teacher.id: 2, late.id: 0}
+    assert all(counts[user.id] == _truth(db, user) for user in (first, second, teacher, late))
+    assert len(counters.broadcasts) == 4
+
+    broadcasts.mark_broadcast_read(db, first, sent[1])
+    broadcasts.dismiss_broadcast(db, second, sent[0])
+    db.commit()
+    assert counters.unread_count(db, first) == _truth(db, first) == 3
+    assert counters.unread_count(db, second) == _truth(db, second) == 2
+
+    broadcasts.mark_all_read(db, first)
+    db.commit()
+    assert counters.unread_count(db, first) == 0
+    broadcasts.create_broadcast(db, teacher.id, "newer", "m", target_sub_role="student")
+    db.commit()
+    assert counters.unread_count(db, first) == _truth(db, first) == 1
+    assert counters.unread_count(db, late) == _truth(db, late) == 0  # still before they joined
+    db.close()
+
+
+def test_reconcile_corrects_drifted_counters(session_factory, seed_course, counters):
+    student_id = seed_course(students=1).student_ids[0]
+    db = session_factory()
+    student = db.get(User, student_id)
+    broadcasts.create_notifications(db, [student.id], "Quiz", "m")
+    db.commit()
+    assert counters.unread_count(db, student) == 1
+
+    db.execute(update(NotificationReadState).values(unread_personal=7))
+    db.commit()
+    assert counters.unread_count(db, student) == 7
+    assert counters.reconcile() == 1
+    db.expire_all()
+    assert counters.unread_count(db, student) == 1
+    assert counters.stats()["drift_corrected"] == 1
+    db.close()
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from app.services import upstream_guard as guard_module
+from app.services.upstream_guard import (
+    CLOSED, HALF_OPEN, OPEN, CircuitBreaker, LLMError, RetryBudget, UpstreamGuard, UpstreamUnavailable,
+)
+
+
+@pytest.fixture(autouse=True)
+def _fast_backoff(monkeypatch):
+    monkeypatch.setattr(guard_module, "BACKOFF_BASE", 0.001)
+
+
+class Upstream:
+    """Fails with the given statuses in order, then answers"""
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.statuses:
+            raise LLMError(self.statuses.pop(0))
+        await asyncio.sleep(0.01)
+        return "ok"
+
+
+def test_transient_errors_are_retried_from_the_budget():
+    guard = UpstreamGuard(max_retries=2)
+    guard.retry_budget = RetryBudget(ratio=0.5, max_tokens=2)
+
+    assert asyncio.run(guard.call(Upstream(503, 429))) == "ok"
+    assert guard.retries == 2
+    # Client errors are neither retried nor held against the upstream
+    with pytest.raises(LLMError):
+        asyncio.run(guard.call(Upstream(400)))
+    assert guard.breaker.consecutive_failures == 0
+
+    # Two calls earned one retry token back; the second retry is denied
+    with pytest.raises(LLMError):
+        asyncio.run(guard.call(Upstream(500, 500, 500)))
+    assert (guard.retries, guard.retries_denied) == (3, 1)
+
+
+def test_breaker_opens_fails_fast_and_closes_after_one_probe():
+    guard = UpstreamGuard(max_retries=0)
+    guard.breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.05)
+
+    for _ in range(3):
+        with pytest.raises(LLMError):
+            asyncio.run(guard.call(Upstream(502)))
+    assert guard.breaker.state == OPEN
+
+    upstream = Upstream()
+    with pytest.raises(UpstreamUnavailable):
+        asyncio.run(guard.call(upstream))
+    assert upstream.calls == 0 and guard.rejected_open == 1
+
+    async def after_cool_down():
+        await asyncio.sleep(0.06)
+        probe = asyncio.create_task(guard.call(upstream))
+        await asyncio.sleep(0)
+        assert guard.breaker.state == HALF_OPEN
+        with pytest.raises(UpstreamUnavailable):
+            await guard.call(upstream)  # only one probe at a time
+        return await probe
+
+    assert asyncio.run(after_cool_down()) == "ok"
+    assert guard.breaker.state == CLOSED
+    assert upstream.calls == 1
+
+
+def test_callers_beyond_the_concurrency_limit_are_shed():
+    guard = UpstreamGuard(max_concurrency=1, queue_timeout=0.005)
+
+    async def run():
+        return await asyncio.gather(guard.call(Upstream()), guard.call(Upstream()), return_exceptions=True)
+
+    first, second = asyncio.run(run())
+    assert first == "ok"
+    assert isinstance(second, UpstreamUnavailable) and second.reason == "too many concurrent requests"
+    assert (guard.rejected_busy, guard.in_flight) == (1, 0)
+
+
+def test_client_errors_neither_close_the_circuit_nor_leak_the_probe():
+    guard = UpstreamGuard(max_retries=0)
+    guard.breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+
+    with pytest.raises(LLMError):
+        asyncio.run(guard.call(Upstream(502)))
+    with pytest.raises(LLMError):
+        asyncio.run(guard.call(Upstream(400)))
+    assert guard.breaker.consecutive_failures == 1  # not reset by a client error
+
+    with pytest.raises(LLMError):
+        asyncio.run(guard.call(Upstream(502)))
+    assert guard.breaker.state == OPEN
+
+    async def probe_with_a_bad_request():
+        await asyncio.sleep(0.06)
+        with pytest.raises(LLMError):
+            await guard.call(Upstream(400))
+        # Still half-open, and the released probe goes to the next caller
+        assert guard.breaker.state == HALF_OPEN
+        assert await guard.acquire() is True
+        guard.release(True)
+
+    asyncio.run(probe_with_a_bad_request())
+
+
+def test_only_the_probe_owner_frees_the_probe():
+    guard = UpstreamGuard()
+    guard.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+
+    async def run():
+        # A long stream admitted while closed outlives the outage that opens the circuit
+        assert await guard.acquire() is False
+        guard.breaker.record_failure()
+        await asyncio.sleep(0.02)
+        assert await guard.acquire() is True
+        guard.release(False)
+        assert not guard.breaker.allow()  # the probe is still in flight
+        guard.release(True)
+        assert guard.breaker.allow()
+
+    asyncio.run(run())
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Tutor prompt size and latency benchmark: whole lesson vs retrieved passages
+
+Builds a synthetic course (long lessons plus course notes), then for each
+question compares the old prompt, which pasted the full lesson and course
+description, with the retrieval prompt of top-k BM25 passages within the
+token budget. Both prompts are sent to an in-process fake LLM server whose
+first-token delay grows with prompt size, and the report gives prompt tokens,
+retrieval time, time to first token and total latency as JSON.
+
+Example:
+    python tutor_prompt_benchmark.py --lessons 12 --lesson-tokens 4000 --questions 40 --prefill-ms 150
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import socket
+import statistics
+import threading
+import time
+from typing import Dict, List
+
+import httpx
+import uvicorn
+
+from app.services import llm
+from app.services.retrieval import (
+    CONTEXT_TOKEN_BUDGET,
+    TOP_K,
+    CourseIndex,
+    estimate_tokens,
+    format_context,
+    make_chunks,
+    truncate_tokens,
+)
+from fake_llm_server import create_app
+
+TOPICS = {
+    "recursion": ["recursion", "base case", "call stack", "recursive call", "factorial"],
+    "sorting": ["merge sort", "quicksort", "pivot", "stable sort", "comparison"],
+    "graphs": ["graph", "vertex", "edge", "breadth first search", "adjacency list"],
+    "hashing": ["hash table", "collision", "bucket", "load factor", "hash function"],
+    "dynamic programming": ["memoization", "subproblem", "tabulation", "overlapping", "optimal substructure"],
+    "probability": ["probability", "random variable", "expectation", "variance", "distribution"],
+    "fractions": ["fraction", "numerator", "denominator", "common denominator", "simplify"],
+    "photosynthesis": ["photosynthesis", "chlorophyll", "sunlight", "glucose", "carbon dioxide"],
+}
+FILLER = [
+    "Students often find it useful to work through an example slowly.",
+    "Take a moment to write down what you already know before moving on.",
+    "This idea appears again later in the course in a slightly different form.",
+    "Practice problems at the end of the section reinforce the main points.",
+    "Remember that understanding the reasoning matters more than memorizing steps.",
+]
+
+
+def synthetic_text(topic: str, tokens: int, rng: random.Random) -> str:
+    terms = TOPICS[topic]
+    sentences = []
+    while estimate_tokens(" ".join(sentences)) < tokens:
+        if rng.random() < 0.5:
+            sentences.append(f"The {rng.choice(terms)} is closely related to the {rng.choice(terms)} in {topic}.")
+        else:
+            sentences.append(rng.choice(FILLER))
+        if rng.random() < 0.1:
+            sentences.append("\n\n")
+    return " ".join(sentences)
+
+
+def build_course(args, rng: random.Random):
+    topics = list(TOPICS)
+    lessons = []
+    chunks = []
+    for lesson_id in range(1, args.lessons + 1):
+        topic = topics[(lesson_id - 1) % len(topics)]
+        title = f"Lesson {lesson_id}: {topic.title()}"
+        text = synthetic_text(topic, args.lesson_tokens, rng)
+        lessons.append({"id": lesson_id, "topic": topic, "title": title, "text": text})
+        chunks.extend(make_chunks("lesson", lesson_id, title, text))
+    for note_id in range(1, args.notes + 1):
+        topic = rng.choice(topics)
+        chunks.extend(make_chunks("note", note_id, f"{topic.title()} notes", synthetic_text(topic, args.note_tokens, rng)))
+    description = synthetic_text(rng.choice(topics), args.description_tokens, rng)
+    return lessons, description, CourseIndex(chunks)
+
+
+def system_prompt(question: str, description: str, context: str) -> str:
+    return f"""You are an AI tutor helping a student with Computer Science Foundations.
+        The student is asking about: {question}
+        Difficulty level: intermediate
+
+        Course context: {description}
+        {context}
+
+        Provide a helpful, educational response that's appropriate for the student's level.
+        Include examples and explanations where appropriate."""
+
+
+def summarize(samples: List[float]) -> Dict:
+    ordered = sorted(samples)
+    return {
+        "mean": round(statistics.mean(ordered), 2),
+        "p50": round(ordered[len(ordered) // 2], 2),
+        "p99": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 2),
+    }
+
+
+async def measure(client: httpx.AsyncClient, messages: List[Dict]) -> Dict:
+    started = time.perf_counter()
+    first_token = None
+    async for _ in llm.stream_completion(client, messages, max_tokens=1500):
+        if first_token is None:
+            first_token = time.perf_counter() - started
+    return {"ttft_ms": first_token * 1000, "total_ms": (time.perf_counter() - started) * 1000}
+
+
+async def run(args, base_url: str) -> Dict:
+    rng = random.Random(args.seed)
+    lessons, description, index = build_course(args, rng)
+    results = {"full": {"prompt_tokens": [], "ttft_ms": [], "total_ms": []},
+               "retrieval": {"prompt_tokens": [], "ttft_ms": [], "total_ms": [], "retrieval_ms": []}}
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=60.0) as client:
+        for _ in range(args.questions):
+            lesson = rng.choice(lessons)
+            question = f"Can you explain how the {rng.choice(TOPICS[lesson['topic']])} works?"
+
+            full_context = f"Lesson: {lesson['title']}\nContent: {lesson['text']}"
+            started = time.perf_counter()
+            passages = index.search(question, lesson_id=lesson["id"], top_k=args.top_k, token_budget=args.token_budget)
+            retrieval_ms = (time.perf_counter() - started) * 1000
+            retrieved_context = f"Current lesson: {lesson['title']}\n\n{format_context(passages)}"
+
+            variants = {
+                "full": system_prompt(question, description, full_context),
+                "retrieval": system_prompt(question, truncate_tokens(description, 120), retrieved_context),
+            }
+            for name, prompt in variants.items():
+                messages = [{"role": "system", "content": prompt}, {"role": "user", "content": question}]
+                timing = await measure(client, messages)
+                results[name]["prompt_tokens"].append(estimate_tokens(prompt) + estimate_tokens(question))
+                results[name]["ttft_ms"].append(timing["ttft_ms"])
+                results[name]["total_ms"].append(timing["total_ms"])
+            results["retrieval"]["retrieval_ms"].append(retrieval_ms)
+
+    report = {
+        "config": vars(args),
+        "index": {"chunks": len(index.chunks), "terms": len(index.idf)},
+    }
+    for name, samples in results.items():
+        report[name] = {metric: summarize(values) for metric, values in samples.items()}
+    report["prompt_token_reduction"] = round(
+        1 - statistics.mean(results["retrieval"]["prompt_tokens"]) / statistics.mean(results["full"]["prompt_tokens"]), 3
+    )
+    return report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Tutor prompt retrieval benchmark")
+    parser.add_argument("--lessons", type=int, default=8)
+    parser.add_argument("--lesson-tokens", type=int, default=3000)
+    parser.add_argument("--notes", type=int, default=4)
+    parser.add_argument("--note-tokens", type=int, default=1500)
+    parser.add_argument("--description-tokens", type=int, default=300)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--token-budget", type=int, default=CONTEXT_TOKEN_BUDGET)
+    parser.add_argument("--first-token-ms", type=float, default=200.0)
+    parser.add_argument("--prefill-ms", type=float, default=100.0, help="fake upstream delay per 1000 prompt tokens")
+    parser.add_argument("--token-ms", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write the JSON report here as well")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    fake = create_app(args.first_token_ms / 1000, args.token_ms / 1000, 40, 0, args.prefill_ms / 1000)
+    server = uvicorn.Server(uvicorn.Config(fake, port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+
+    try:
+        report = asyncio.run(run(args, f"http://127.0.0.1:{port}"))
+    finally:
+        server.should_exit = True
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
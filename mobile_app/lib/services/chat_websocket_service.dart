@@ -152,6 +152,8 @@ class ChatWebSocketService {
           _messageController.add(message);
           break;
         case 'typing':
+        case 'presence':
+          // Server sends throttled per-room presence snapshots with typing members
           _typingController.add(message);
           break;
         case 'system':